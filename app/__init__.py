@@ -1,6 +1,7 @@
 # app/__init__.py
 
 import os
+import multiprocessing
 from datetime import datetime, timedelta
 from flask import Flask, render_template
 from flask_sqlalchemy import SQLAlchemy
@@ -132,8 +133,17 @@ def create_app(config_name='default'):
     def internal_error(e):
         return render_template('errors/500.html'), 500
 
-    # Iniciar scheduler
-    if not app.debug or os.getenv('WERKZEUG_RUN_MAIN') == 'true':
+    # Cache de vagas (write-through pelos eventos de Booking)
+    from app.services.availability_cache import availability_cache
+    availability_cache.init_app(app)
+
+    # Fila WhatsApp: mensagens enfileiradas sem commit do chamador
+    from app.services.outbound_queue import outbound_queue
+    outbound_queue.init_app(app)
+
+    # Iniciar scheduler (nunca nos processos filhos, ex: pool de encoding facial)
+    is_child_process = multiprocessing.parent_process() is not None
+    if (not app.debug or os.getenv('WERKZEUG_RUN_MAIN') == 'true') and not is_child_process:
         from app.utils.scheduler import init_scheduler
         init_scheduler(app)
 
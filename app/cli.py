@@ -279,22 +279,47 @@ def register_cli_commands(app):
         click.echo(f"Seed concluido: {created} exercicios criados, {skipped} ja existiam.")
 
     @app.cli.command('calculate-scores')
+    @click.option('--check-parity', is_flag=True,
+                  help='Compara o motor em lote com o calculo aluno a aluno (nao grava)')
+    @click.option('--limit', default=None, type=int, help='Alunos verificados em --check-parity')
     @with_appcontext
-    def calculate_scores():
+    def calculate_scores(check_parity, limit):
         """Calcula health scores de todos os alunos"""
         from app.services.health_score_calculator import HealthScoreCalculator
-        click.echo("Iniciando cálculo de health scores...")
         calculator = HealthScoreCalculator()
+
+        if check_parity:
+            click.echo("Comparando motor em lote com calculo individual...")
+            parity = calculator.verify_bulk_parity(limit=limit)
+            if parity['mismatches']:
+                click.echo(f"[ERRO] {len(parity['mismatches'])} de {parity['checked']} divergentes: "
+                           f"{parity['mismatches'][:20]}")
+                raise SystemExit(1)
+            click.echo(f"[OK] {parity['checked']} alunos identicos.")
+            return
+
+        click.echo("Iniciando cálculo de health scores...")
         results = calculator.calculate_all_students()
         click.echo(f"Concluído: {results['total']} processados, {results['updated']} atualizados, {results['critical']} críticos, {results['high_risk']} alto risco.")
 
     @app.cli.command('run-automations')
+    @click.option('--dry-run', is_flag=True, help='Apenas mostra as coortes de recuperação, sem enviar')
     @with_appcontext
-    def run_automations():
+    def run_automations(dry_run):
         """Executa réguas de relacionamento/automações de retenção"""
         from app.services.retention_automation import RetentionAutomation
-        click.echo("Executando automações de retenção...")
         automation = RetentionAutomation()
+
+        if dry_run:
+            preview = automation.preview_recovery()
+            for automation_type, counts in preview['counts'].items():
+                click.echo(f"{automation_type}: ausentes={counts['absent']} "
+                           f"contatados_recentemente={counts['recently_contacted']} "
+                           f"prontos={counts['ready']}")
+            click.echo(f"Tempos (ms): {preview['timings_ms']}")
+            return
+
+        click.echo("Executando automações de retenção...")
         results = automation.run_daily_automations()
         click.echo(f"Concluído: {results}")
 
@@ -485,4 +510,370 @@ def register_cli_commands(app):
             created += 1
 
         db.session.commit()
+
+        from app.services.lookup_cache import lookup_cache
+        lookup_cache.invalidate('whatsapp_template')
         click.echo(f"Seed concluído: {created} fluxos criados, {skipped} já existiam.")
+
+    @app.cli.group()
+    def face():
+        """Comandos para reconhecimento facial"""
+        pass
+
+    @face.command('benchmark-ann')
+    @click.option('--sizes', default='1000,10000,100000', help='Tamanhos de galeria (separados por virgula)')
+    @click.option('--queries', default=200, help='Consultas por tamanho')
+    @click.option('--nlist', default=0, help='Listas IVF (0 = automatico)')
+    @click.option('--nprobe', default=8, help='Listas visitadas por consulta')
+    @click.option('--rerank-k', default=10, help='Candidatos re-ranqueados com distancia exata')
+    def face_benchmark_ann(sizes, queries, nlist, nprobe, rerank_k):
+        """Compara recall e latencia da busca exata vs IVF em galerias sinteticas"""
+        from app.services.face_ann import benchmark_ann
+
+        sizes = [int(s) for s in sizes.split(',') if s.strip()]
+        click.echo(f"Benchmark IVF (nprobe={nprobe}, rerank_k={rerank_k}, {queries} consultas)...")
+
+        results = benchmark_ann(sizes=sizes, n_queries=queries, nlist=nlist,
+                                nprobe=nprobe, rerank_k=rerank_k)
+
+        click.echo(f"\n{'Galeria':>8} {'nlist':>6} {'Build':>9} {'Recall':>7} "
+                   f"{'Exato p50':>10} {'Exato p99':>10} {'IVF p50':>9} {'IVF p99':>9}")
+        click.echo("-" * 76)
+        for r in results:
+            click.echo(f"{r['size']:>8} {r['nlist']:>6} {r['build_ms']:>7.0f}ms {r['recall']:>7.3f} "
+                       f"{r['exact_p50_ms']:>8.2f}ms {r['exact_p99_ms']:>8.2f}ms "
+                       f"{r['ivf_p50_ms']:>7.2f}ms {r['ivf_p99_ms']:>7.2f}ms")
+
+    @face.command('benchmark-enrollment')
+    @click.option('--users', default=2000, help='Usuarios na galeria sintetica')
+    @click.option('--samples', default='1,3,5', help='Frames por cadastro (separados por virgula)')
+    @click.option('--attempts', default=2000, help='Check-ins simulados')
+    @click.option('--max-retries', default=3, help='Tentativas por check-in no totem')
+    @click.option('--frame-ms', default=400.0, help='Custo de captura + encoding por tentativa')
+    def face_benchmark_enrollment(users, samples, attempts, max_retries, frame_ms):
+        """Compara taxa de retry e tempo ate o check-in com cadastro de 1 vs N frames"""
+        from app.services.face_enrollment import benchmark_enrollment
+
+        samples = [int(s) for s in samples.split(',') if s.strip()]
+        click.echo(f"Benchmark de cadastro ({users} usuarios, {attempts} check-ins, "
+                   f"ate {max_retries} tentativas, {frame_ms:.0f}ms/frame)...")
+
+        results = benchmark_enrollment(n_users=users, samples=samples, attempts=attempts,
+                                       max_retries=max_retries, frame_ms=frame_ms)
+
+        click.echo(f"\n{'Frames':>6} {'Threshold':>10} {'Retry':>7} {'Tentativas':>11} "
+                   f"{'Falha':>7} {'Falso aceite':>13} {'Tempo medio':>12}")
+        click.echo("-" * 72)
+        for r in results:
+            click.echo(f"{r['samples']:>6} {r['mean_threshold']:>10.3f} {r['retry_rate']:>7.1%} "
+                       f"{r['mean_attempts']:>11.2f} {r['failure_rate']:>7.1%} "
+                       f"{r['false_accept_rate']:>13.2%} {r['mean_time_to_checkin_ms']:>10.0f}ms")
+
+    @face.command('migrate-encodings')
+    @click.option('--to', 'target', type=click.Choice(['v1', 'v2', 'v2n']), default=None,
+                  help='Formato de destino (padrao: FACE_ENCODING_VERSION/NORMALIZE)')
+    @click.option('--batch-size', default=500, help='Usuarios por commit')
+    @click.option('--dry-run', is_flag=True, help='Apenas conta, sem gravar')
+    @with_appcontext
+    def face_migrate_encodings(target, batch_size, dry_run):
+        """Converte encodings faciais armazenados para outro formato, em lotes"""
+        from flask import current_app
+        from app import db
+        from app.models.user import User
+        from app.services.face_gallery import face_gallery
+        from app.services.face_service import FaceRecognitionService
+
+        target = target or FaceRecognitionService.storage_version()
+        click.echo(f"Migrando encodings para {target} (lote={batch_size}"
+                   f"{', dry-run' if dry_run else ''})...")
+
+        converted = skipped = failed = 0
+        bytes_before = bytes_after = 0
+        last_id = 0
+
+        while True:
+            users = User.query.filter(
+                User.id > last_id,
+                User.face_encoding.isnot(None),
+                db.or_(User.face_encoding_version.is_(None),
+                       User.face_encoding_version != target)
+            ).order_by(User.id).limit(batch_size).all()
+
+            if not users:
+                break
+
+            for user in users:
+                last_id = user.id
+                # Normalizacao nao e reversivel
+                if user.face_encoding_version == 'v2n':
+                    skipped += 1
+                    continue
+                try:
+                    encoding = FaceRecognitionService._bytes_to_encoding(
+                        user.face_encoding, user.face_encoding_version
+                    )
+                    data = FaceRecognitionService._encoding_to_bytes(encoding, target)
+                except Exception as e:
+                    failed += 1
+                    click.echo(f"  Erro no usuario {user.id}: {e}")
+                    continue
+
+                bytes_before += len(user.face_encoding)
+                bytes_after += len(data)
+                converted += 1
+                if not dry_run:
+                    user.face_encoding = data
+                    user.face_encoding_version = target
+
+            if dry_run:
+                db.session.expunge_all()
+            else:
+                db.session.commit()
+            click.echo(f"  ... {converted} convertidos (ate id {last_id})")
+
+        if not dry_run and converted:
+            face_gallery.invalidate()
+
+        click.echo(f"\n[OK] Convertidos: {converted} | Ignorados (v2n): {skipped} | Erros: {failed}")
+        if converted:
+            click.echo(f"     Armazenamento: {bytes_before / 1024:.1f} KB -> {bytes_after / 1024:.1f} KB")
+
+        # v2n -> outro formato: a normalizacao nao e reversivel, so um novo cadastro resolve
+        if target != 'v2n':
+            normalized_ids = [uid for (uid,) in User.query.with_entities(User.id).filter(
+                User.face_encoding.isnot(None),
+                User.face_encoding_version == 'v2n'
+            ).order_by(User.id)]
+            if normalized_ids:
+                preview = ', '.join(str(uid) for uid in normalized_ids[:20])
+                more = f" (+{len(normalized_ids) - 20})" if len(normalized_ids) > 20 else ''
+                click.echo(f"\n[AVISO] {len(normalized_ids)} usuarios com encoding v2n (normalizado) "
+                           f"nao podem voltar para {target}.")
+                click.echo("        Com FACE_ENCODING_NORMALIZE desligado a galeria ignora estes "
+                           "encodings (os usuarios nao sao reconhecidos).")
+                click.echo(f"        Recadastre a face destes usuarios: {preview}{more}")
+        elif not current_app.config.get('FACE_ENCODING_NORMALIZE', False):
+            click.echo("\n[AVISO] Encodings v2n so sao usados pela galeria com "
+                       "FACE_ENCODING_NORMALIZE ligado.")
+
+    # ==================== ROLLUP DE ATIVIDADE ====================
+
+    @app.cli.group()
+    def activity():
+        """Comandos para o rollup diario de presenca (user_daily_activity)"""
+        pass
+
+    @activity.command('backfill')
+    @click.option('--since', default=None, help='Data inicial (YYYY-MM-DD); padrao: todo o historico')
+    @click.option('--until', default=None, help='Data final (YYYY-MM-DD)')
+    @with_appcontext
+    def activity_backfill(since, until):
+        """Reconstroi user_daily_activity a partir de bookings"""
+        from datetime import datetime
+        from app import db
+        from app.models.user_daily_activity import UserDailyActivity
+
+        since_date = datetime.strptime(since, '%Y-%m-%d').date() if since else None
+        until_date = datetime.strptime(until, '%Y-%m-%d').date() if until else None
+
+        click.echo(f"Reconstruindo rollup ({since or 'inicio'} ate {until or 'hoje'})...")
+        try:
+            rows = UserDailyActivity.rebuild(since_date, until_date)
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            click.echo(f"[ERRO] {e}")
+            raise SystemExit(1)
+
+        click.echo(f"[OK] {rows} linhas (usuario/dia) geradas.")
+
+    @app.cli.group()
+    def whatsapp():
+        """Comandos para a fila de envio WhatsApp (outbound_messages)"""
+        pass
+
+    @whatsapp.command('process-queue')
+    @click.option('--batch-size', default=None, type=int, help='Mensagens por lote (padrao: WHATSAPP_QUEUE_BATCH_SIZE)')
+    @click.option('--loop', is_flag=True, help='Continua rodando como worker dedicado')
+    @click.option('--interval', default=5.0, type=float, help='Pausa entre ciclos com --loop (segundos)')
+    @with_appcontext
+    def whatsapp_process_queue(batch_size, loop, interval):
+        """Envia as mensagens pendentes da fila"""
+        import time
+        from app.services.outbound_queue import outbound_queue
+
+        while True:
+            results = outbound_queue.drain(batch_size)
+            if results['claimed'] or not loop:
+                click.echo(f"Reservadas: {results['claimed']} | enviadas: {results['sent']} | "
+                           f"reagendadas: {results['retried']} | falhas: {results['failed']}")
+            if not loop:
+                break
+            time.sleep(interval)
+
+    @whatsapp.command('queue-stats')
+    @with_appcontext
+    def whatsapp_queue_stats():
+        """Mostra a contagem de mensagens por status"""
+        from app.services.outbound_queue import outbound_queue
+
+        for status, count in outbound_queue.get_stats()['by_status'].items():
+            click.echo(f"  {status}: {count}")
+
+    @whatsapp.command('benchmark')
+    @click.option('--messages', default=1000, type=int, help='Mensagens da campanha simulada')
+    @click.option('--latency-ms', default=5.0, type=float, help='Latencia do servidor stub por requisicao')
+    @with_appcontext
+    def whatsapp_benchmark(messages, latency_ms):
+        """Compara envio legado vs sessao keep-alive + log em lote (servidor stub local)"""
+        from app.services.megaapi import benchmark_campaign
+
+        click.echo(f"Campanha simulada: {messages} templates, stub com {latency_ms}ms de latencia")
+        for r in benchmark_campaign(messages=messages, latency_ms=latency_ms):
+            click.echo(f"  {r['mode']:<10} {r['elapsed_s']:>8.3f}s  {r['messages_per_sec']:>8.1f} msg/s  "
+                       f"{r['ms_per_message']:>7.3f} ms/msg  logs={r['logs_written']}  "
+                       f"send_count +{r['send_count_delta']}")
+
+    # ==================== DISPONIBILIDADE DE HORARIOS ====================
+
+    @app.cli.group()
+    def availability():
+        """Comandos para a disponibilidade de horarios do calendario"""
+        pass
+
+    @availability.command('benchmark')
+    @click.option('--days', default=30, type=int, help='Dias do intervalo consultado (a partir de hoje)')
+    @click.option('--user-id', default=None, type=int, help='Aluno usado em /api/slots (padrao: primeiro aluno)')
+    @click.option('--seed', 'seed_schedules', default=0, type=int,
+                  help='Cria N horarios sinteticos com reservas (apagados no fim)')
+    @click.option('--repeat', default=3, type=int, help='Execucoes por variante (usa a mediana)')
+    @with_appcontext
+    def availability_benchmark(days, user_id, seed_schedules, repeat):
+        """Compara as rotas de calendario legadas vs consultas em lote"""
+        from app.services.slot_availability import benchmark_availability
+
+        click.echo(f"Intervalo: {days} dias | horarios sinteticos: {seed_schedules} | repeticoes: {repeat}")
+        for r in benchmark_availability(days=days, user_id=user_id,
+                                        seed_schedules=seed_schedules, repeat=repeat):
+            click.echo(f"  {r['endpoint']:<8} {r['mode']:<7} {r['queries']:>6} queries  "
+                       f"{r['elapsed_ms']:>9.2f} ms  identico={'sim' if r['identical'] else 'NAO'}")
+
+    @availability.command('reconcile')
+    @click.option('--days', default=None, type=int, help='Janela a partir de hoje (padrao: AVAILABILITY_RECONCILE_DAYS)')
+    @with_appcontext
+    def availability_reconcile(days):
+        """Recarrega o cache de vagas a partir do banco"""
+        from flask import current_app
+        from app.services.availability_cache import availability_cache
+
+        if not availability_cache.enabled:
+            click.echo("Cache de vagas desligado (AVAILABILITY_CACHE_BACKEND=none).")
+            return
+
+        if availability_cache.backend.name == 'memory':
+            click.echo("Aviso: backend em memoria; apenas este processo e afetado.")
+
+        days = days or current_app.config.get('AVAILABILITY_RECONCILE_DAYS', 30)
+        results = availability_cache.reconcile(days)
+        click.echo(f"[OK] {results['keys']} contagens verificadas, {results['drift']} divergentes corrigidas.")
+        click.echo(f"     {availability_cache.get_stats()}")
+
+    # ==================== METRICAS ====================
+
+    @app.cli.group()
+    def metrics():
+        """Comandos para os snapshots de KPIs do dashboard"""
+        pass
+
+    @metrics.command('refresh')
+    @click.option('--rebuild', is_flag=True, help='Apaga os snapshots e recalcula todo o historico')
+    @with_appcontext
+    def metrics_refresh(rebuild):
+        """Grava os dias encerrados pendentes (e recalcula os recentes)"""
+        from app import db
+        from app.models import MetricSnapshot
+        from app.services.metric_snapshots import metric_snapshots
+
+        if rebuild:
+            deleted = MetricSnapshot.query.delete()
+            db.session.commit()
+            click.echo(f"{deleted} snapshots apagados.")
+
+        results = metric_snapshots.refresh()
+        if results['start'] is None:
+            click.echo("Nada a gravar: snapshots em dia.")
+        else:
+            click.echo(f"[OK] {results['start']} a {results['end']}: {results['rows']} linhas gravadas.")
+
+    # ==================== SPLIT DINAMICO ====================
+
+    @app.cli.group()
+    def split():
+        """Comandos para o split dinamico"""
+        pass
+
+    @split.command('check-occupancy')
+    @click.option('--days', default=30, type=int, help='Dias de lookback')
+    @with_appcontext
+    def split_check_occupancy(days):
+        """Compara a ocupacao em lote com o calculo anterior (um COUNT por ocorrencia)"""
+        from app.services.occupancy import occupancy_engine
+
+        results = occupancy_engine.compare_with_legacy(days)
+        click.echo(f"Horarios ativos: {results['schedules']} | lookback: {days} dias")
+        for mode in ('legacy', 'batch'):
+            click.echo(f"  {mode:<7} {results[mode]['queries']:>6} queries  {results[mode]['elapsed_ms']:>9.2f} ms")
+
+        if results['mismatches']:
+            click.echo(f"[ERRO] {len(results['mismatches'])} horarios divergentes: {results['mismatches'][:20]}")
+            raise SystemExit(1)
+        click.echo("[OK] Taxas identicas.")
+
+    @split.command('process-commissions')
+    @click.option('--chunk-size', default=None, type=int, help='Bookings por lote (padrao: SPLIT_COMMISSION_CHUNK_SIZE)')
+    @with_appcontext
+    def split_process_commissions(chunk_size):
+        """Gera comissoes dos bookings finalizados pendentes (em lotes)"""
+        from app.services.split_service import split_service
+
+        def report(stats):
+            done = stats['processed'] + stats['skipped'] + stats['errors']
+            click.echo(f"  lote {stats['chunks']}: {done}/{stats['total']} "
+                       f"(criadas={stats['processed']}, ignoradas={stats['skipped']}, erros={stats['errors']})")
+
+        stats = split_service.process_pending_bookings(chunk_size=chunk_size, progress=report)
+        click.echo(f"[OK] {stats['processed']} comissoes criadas, {stats['skipped']} ignoradas, "
+                   f"{stats['errors']} erros em {stats['chunks']} lotes.")
+
+    @split.command('statements')
+    @click.option('--month', default=None, type=int, help='Mes (padrao: mes anterior)')
+    @click.option('--year', default=None, type=int, help='Ano (padrao: ano do mes anterior)')
+    @click.option('--output-dir', default=None, help='Diretorio de saida (padrao: SPLIT_STATEMENTS_DIR ou instance/statements)')
+    @click.option('--workers', default=None, type=int, help='Processos (padrao: SPLIT_STATEMENTS_WORKERS; 0 = sem pool)')
+    @click.option('--format', 'formats', multiple=True, type=click.Choice(['pdf', 'csv']), help='Formatos (padrao: SPLIT_STATEMENTS_FORMATS)')
+    @with_appcontext
+    def split_statements(month, year, output_dir, workers, formats):
+        """Gera os extratos de todos os colaboradores com comissoes no mes"""
+        import os
+        from datetime import date, timedelta
+        from flask import current_app
+        from app.services.statement_export import generate_monthly_statements
+
+        previous = date.today().replace(day=1) - timedelta(days=1)
+        month = month or previous.month
+        year = year or previous.year
+        output_dir = (output_dir or current_app.config.get('SPLIT_STATEMENTS_DIR')
+                      or os.path.join(current_app.instance_path, 'statements'))
+        if workers is None:
+            workers = current_app.config.get('SPLIT_STATEMENTS_WORKERS', 2)
+        if not formats:
+            formats = [f.strip() for f in current_app.config.get('SPLIT_STATEMENTS_FORMATS', 'pdf').split(',') if f.strip()]
+
+        def report(results):
+            status = f"ERRO: {results['error']}" if results['error'] else 'ok'
+            click.echo(f"  colaborador {results['professional_id']}: {status} "
+                       f"({results['generated'] + results['failed']}/{results['total']})")
+
+        results = generate_monthly_statements(month, year, output_dir, workers=workers,
+                                              formats=tuple(formats), progress=report)
+        click.echo(f"[OK] {results['generated']} extratos gerados em {output_dir}, {results['failed']} falhas.")
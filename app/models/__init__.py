@@ -5,6 +5,7 @@ from app.models.package import Package
 from app.models.subscription import Subscription, SubscriptionStatus, PaymentStatus
 from app.models.payment import Payment, PaymentStatusEnum
 from app.models.booking import Booking, BookingStatus
+from app.models.user_daily_activity import UserDailyActivity
 from app.models.recurring_booking import RecurringBooking, FrequencyType
 from app.models.class_schedule import ClassSchedule
 from app.models.modality import Modality
@@ -12,6 +13,7 @@ from app.models.schedule_slot_gender import ScheduleSlotGender
 from app.models.achievement import Achievement, UserAchievement, CriteriaType
 from app.models.whatsapp_template import WhatsAppTemplate, TemplateCategory, TemplateTrigger
 from app.models.whatsapp_log import WhatsAppLog
+from app.models.outbound_message import OutboundMessage, OutboundStatus
 from app.models.system_config import SystemConfig
 
 # XP to Credits Conversion System
@@ -55,6 +57,9 @@ from app.models.expense import Expense, ExpenseCategory
 from app.models.consent_log import ConsentLog, ConsentType
 from app.models.audit_log import AuditLog, AuditAction
 
+# Metricas (snapshots diarios do dashboard)
+from app.models.metric_snapshot import MetricSnapshot
+
 # Split Bancario / Comissoes
 from app.models.commission import (
     CommissionEntry, CommissionStatus,
@@ -75,6 +80,7 @@ __all__ = [
     'PaymentStatusEnum',
     'Booking',
     'BookingStatus',
+    'UserDailyActivity',
     'RecurringBooking',
     'FrequencyType',
     'ClassSchedule',
@@ -87,6 +93,8 @@ __all__ = [
     'TemplateCategory',
     'TemplateTrigger',
     'WhatsAppLog',
+    'OutboundMessage',
+    'OutboundStatus',
     'SystemConfig',
     # XP to Credits Conversion
     'ConversionRule',
@@ -147,4 +155,6 @@ __all__ = [
     'ConsentType',
     'AuditLog',
     'AuditAction',
+    # Metricas
+    'MetricSnapshot',
 ]
@@ -1,6 +1,7 @@
 # app/models/achievement.py
 
 from app import db
+from collections import defaultdict, namedtuple
 from datetime import datetime
 import enum
 
@@ -16,6 +17,10 @@ class CriteriaType(enum.Enum):
     CUSTOM = "Lógica Personalizada / Manual"
 
 
+# Copia dos campos usados na avaliacao (guardada no cache de lookups)
+CachedAchievement = namedtuple('CachedAchievement', 'id criteria_type criteria_value modality_id xp_reward')
+
+
 class Achievement(db.Model):
     """
     Conquistas configuraveis pelo admin
@@ -49,6 +54,37 @@ class Achievement(db.Model):
     # Relacionamentos
     unlocks = db.relationship('UserAchievement', backref='achievement', lazy=True)
 
+    @property
+    def modality_id(self):
+        """criteria_extra['modality_id'] como inteiro (None se ausente/invalido)"""
+        modality_id = (self.criteria_extra or {}).get('modality_id')
+        try:
+            return int(modality_id) if modality_id else None
+        except (TypeError, ValueError):
+            return None
+
+    @classmethod
+    def get_active_by_type(cls):
+        """
+        Conquistas ativas indexadas por CriteriaType (ordem de id), via
+        cache em processo.
+
+        Retorna {CriteriaType: [CachedAchievement, ...]}. Rotas que alteram
+        conquistas devem chamar lookup_cache.invalidate('achievement').
+        """
+        from app.services.lookup_cache import lookup_cache
+
+        def load():
+            index = defaultdict(list)
+            for achievement in cls.query.filter_by(is_active=True).order_by(cls.id):
+                index[achievement.criteria_type].append(CachedAchievement(
+                    achievement.id, achievement.criteria_type, achievement.criteria_value,
+                    achievement.modality_id, achievement.xp_reward or 0
+                ))
+            return dict(index)
+
+        return lookup_cache.get_or_load('achievement', 'active_by_type', load)
+
     def __repr__(self):
         return f'<Achievement {self.name}>'
 
@@ -68,5 +104,10 @@ class UserAchievement(db.Model):
 
     user = db.relationship('User', backref='unlocked_achievements')
 
+    __table_args__ = (
+        # Uma linha por conquista: desbloqueio (e XP) so uma vez por usuario
+        db.Index('uq_user_achievements_user_achievement', 'user_id', 'achievement_id', unique=True),
+    )
+
     def __repr__(self):
         return f'<UserAchievement User {self.user_id} - Achievement {self.achievement_id}>'
@@ -94,16 +94,25 @@ class Booking(db.Model):
         # Adicionar XP ao usuario
         self.user.xp += self.xp_earned
 
+        from app.models.user import User
+        User.mark_health_score_dirty(self.user_id)
+
         db.session.commit()
 
+        from app.services.achievement_checker import AchievementChecker
+        AchievementChecker.on_checkin(self.user_id)
+
     @staticmethod
-    def auto_checkin_by_face(user_id, recognized_at=None):
+    def auto_checkin_by_face(user_id, recognized_at=None, commit=True):
         """
         Realiza check-in automatico baseado em reconhecimento facial.
 
         Args:
             user_id: ID do usuario reconhecido
             recognized_at: Timestamp do reconhecimento (padrao: now)
+            commit: Se False, apenas altera a sessao (o chamador faz commit,
+                    ex: check-in em lote numa unica transacao, e chama
+                    AchievementChecker.on_checkin depois)
 
         Returns:
             dict com success, booking, message, xp_earned
@@ -156,8 +165,12 @@ class Booking(db.Model):
         # Atribuir XP
         user.xp += 10
         user.face_last_recognized = recognized_at
+        User.mark_health_score_dirty(user_id)
 
-        db.session.commit()
+        if commit:
+            db.session.commit()
+            from app.services.achievement_checker import AchievementChecker
+            AchievementChecker.on_checkin(user_id)
 
         return {
             'success': True,
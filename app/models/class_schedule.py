@@ -1,8 +1,7 @@
 # app/models/class_schedule.py
 
 from app import db
-from datetime import datetime, timedelta
-from decimal import Decimal
+from datetime import datetime
 
 
 class ClassSchedule(db.Model):
@@ -63,43 +62,11 @@ class ClassSchedule(db.Model):
         """
         Calcula taxa de ocupacao media dos ultimos N dias.
 
-        Retorna percentual de 0 a 100.
+        Retorna percentual de 0 a 100. Para varios horarios use
+        occupancy_engine.rates (uma consulta para todos).
         """
-        from app.models.booking import Booking, BookingStatus
-
-        end_date = datetime.now().date()
-        start_date = end_date - timedelta(days=days)
-
-        # Contar dias em que este horario ocorreu
-        total_days = 0
-        total_booked = 0
-        total_capacity = 0
-
-        current = start_date
-        while current <= end_date:
-            if current.weekday() == self.weekday:
-                total_days += 1
-                total_capacity += self.capacity
-
-                # Contar bookings neste dia (CONFIRMED, COMPLETED, NO_SHOW)
-                booked = Booking.query.filter(
-                    Booking.schedule_id == self.id,
-                    Booking.date == current,
-                    Booking.status.in_([
-                        BookingStatus.CONFIRMED,
-                        BookingStatus.COMPLETED,
-                        BookingStatus.NO_SHOW
-                    ])
-                ).count()
-                total_booked += booked
-
-            current += timedelta(days=1)
-
-        if total_capacity == 0:
-            return Decimal('0.00')
-
-        rate = (Decimal(total_booked) / Decimal(total_capacity) * 100).quantize(Decimal('0.01'))
-        return rate
+        from app.services.occupancy import occupancy_engine
+        return occupancy_engine.rate(self, days)
 
     def __repr__(self):
         return f'<ClassSchedule {self.weekday_name} {self.start_time}>'
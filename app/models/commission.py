@@ -206,10 +206,16 @@ class CommissionEntry(db.Model):
     payout_batch_id = db.Column(db.Integer, db.ForeignKey('payout_batches.id'))
 
     # Auditoria
+    notes = db.Column(db.Text)  # Ex: "Aula de Incentivo (Subsidiada)"
     processed_at = db.Column(db.DateTime, default=datetime.utcnow)
     paid_at = db.Column(db.DateTime)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
+    # Uma comissao por booking (torna o processamento em lote idempotente)
+    __table_args__ = (
+        db.Index('uq_commission_entries_booking_id', 'booking_id', unique=True),
+    )
+
     # Relacionamentos
     booking = db.relationship('Booking', backref=db.backref('commission', uselist=False))
     professional = db.relationship('User', backref='commissions_earned')
@@ -0,0 +1,32 @@
+# app/models/metric_snapshot.py
+
+from app import db
+from datetime import datetime
+
+
+class MetricSnapshot(db.Model):
+    """
+    Agregado diario de um KPI do dashboard estrategico (uma linha por
+    metrica/dia).
+
+    Preenchido pelo job de snapshots (app/services/metric_snapshots.py)
+    apenas para dias encerrados; o dia corrente e sempre calculado na hora.
+    Dias recentes sao recalculados enquanto ainda podem mudar (ex: status
+    de leitura do WhatsApp).
+    """
+    __tablename__ = 'metric_snapshots'
+
+    id = db.Column(db.Integer, primary_key=True)
+    metric = db.Column(db.String(50), nullable=False)
+    day = db.Column(db.Date, nullable=False)
+    value = db.Column(db.Numeric(14, 2), nullable=False, default=0)
+
+    computed_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        db.UniqueConstraint('metric', 'day', name='uq_metric_snapshots_metric_day'),
+        db.Index('ix_metric_snapshots_day', 'day'),
+    )
+
+    def __repr__(self):
+        return f'<MetricSnapshot {self.metric} {self.day} = {self.value}>'
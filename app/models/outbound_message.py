@@ -0,0 +1,56 @@
+# app/models/outbound_message.py
+
+from app import db
+from datetime import datetime
+import enum
+
+
+class OutboundStatus(enum.Enum):
+    PENDING = "pending"      # Aguardando envio (ou nova tentativa)
+    SENDING = "sending"      # Reservada por um worker
+    SENT = "sent"
+    FAILED = "failed"        # Erro definitivo ou tentativas esgotadas
+
+
+class OutboundMessage(db.Model):
+    """
+    Fila persistente de mensagens WhatsApp.
+
+    megaapi.send_* grava aqui e retorna na hora; o worker
+    (app/services/outbound_queue.py) reserva lotes e faz o envio.
+    `idempotency_key` evita mensagens duplicadas quando o mesmo evento
+    e processado duas vezes (ex: webhook reenviado).
+    """
+    __tablename__ = 'outbound_messages'
+
+    id = db.Column(db.Integer, primary_key=True)
+
+    # Metodo do MegapiService e argumentos (JSON)
+    kind = db.Column(db.String(50), nullable=False)
+    payload = db.Column(db.JSON, nullable=False)
+
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=True)
+    phone = db.Column(db.String(20))
+    idempotency_key = db.Column(db.String(150), unique=True, nullable=True)
+
+    # Controle de envio
+    status = db.Column(db.Enum(OutboundStatus), default=OutboundStatus.PENDING, nullable=False)
+    attempts = db.Column(db.Integer, default=0, nullable=False)
+    max_attempts = db.Column(db.Integer, default=5, nullable=False)
+    next_attempt_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    locked_at = db.Column(db.DateTime)
+    claim_token = db.Column(db.String(32))  # Reserva do worker (UPDATE condicional)
+
+    # Resultado
+    message_id = db.Column(db.String(100))
+    last_error = db.Column(db.Text)
+    sent_at = db.Column(db.DateTime)
+
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        db.Index('ix_outbound_messages_status_next', 'status', 'next_attempt_at'),
+    )
+
+    def __repr__(self):
+        return f'<OutboundMessage {self.id} {self.kind} {self.status.value if self.status else None}>'
@@ -49,9 +49,14 @@ class SystemConfig(db.Model):
         Returns:
             Valor da configuracao ou default
         """
-        config = cls.query.filter_by(key=key).first()
-        if config:
-            return config.value
+        from app.services.lookup_cache import lookup_cache
+
+        value = lookup_cache.get_or_load(
+            'system_config', key,
+            lambda: db.session.query(cls.value).filter_by(key=key).scalar()
+        )
+        if value is not None:
+            return value
 
         # Retornar valor padrao do dicionario se existir
         if key in cls.DEFAULT_CONFIGS:
@@ -105,6 +110,9 @@ class SystemConfig(db.Model):
             db.session.add(config)
 
         db.session.commit()
+
+        from app.services.lookup_cache import lookup_cache
+        lookup_cache.invalidate('system_config')
         return config
 
     @classmethod
@@ -119,8 +127,9 @@ class SystemConfig(db.Model):
                 'description': data['description']
             }
 
-        # Sobrescrever com valores do banco
-        for config in cls.query.all():
+        # Sobrescrever com valores do banco (sem o carimbo interno do cache)
+        from app.services.lookup_cache import VERSION_KEY
+        for config in cls.query.filter(cls.key != VERSION_KEY):
             configs[config.key] = {
                 'value': config.value,
                 'description': config.description
@@ -142,6 +151,9 @@ class SystemConfig(db.Model):
 
         db.session.commit()
 
+        from app.services.lookup_cache import lookup_cache
+        lookup_cache.invalidate('system_config')
+
     @classmethod
     def calculate_credits(cls, price: float) -> int:
         """
@@ -62,6 +62,11 @@ class User(UserMixin, db.Model):
     face_registered_at = db.Column(db.DateTime, nullable=True)
     face_last_recognized = db.Column(db.DateTime, nullable=True)
     face_confidence_threshold = db.Column(db.Float, default=0.6)
+    face_sample_count = db.Column(db.Integer, nullable=True)  # Frames usados no centroide
+    face_encoding_spread = db.Column(db.Float, nullable=True)  # Distancia RMS das amostras ao centroide
+
+    # CRM: aluno com eventos (check-in, pagamento, treino) desde o ultimo health score
+    health_score_dirty_at = db.Column(db.DateTime, nullable=True, index=True)
 
     # Perfil
     photo_url = db.Column(db.String(255))
@@ -156,6 +161,17 @@ class User(UserMixin, db.Model):
             status=BookingStatus.COMPLETED
         ).count()
 
+    @staticmethod
+    def mark_health_score_dirty(user_id):
+        """
+        Marca o aluno para recalculo no proximo passe incremental de health
+        score. Apenas altera a sessao: entra no commit do evento que a chamou.
+        """
+        User.query.filter(User.id == user_id).update(
+            {User.health_score_dirty_at: datetime.utcnow()},
+            synchronize_session=False
+        )
+
     def add_xp(self, amount, source_type=None, source_id=None, description=None):
         """
         Adiciona XP ao usuario.
@@ -188,6 +204,9 @@ class User(UserMixin, db.Model):
 
         db.session.commit()
 
+        from app.services.achievement_checker import AchievementChecker
+        AchievementChecker.on_xp_change(self.id)
+
     def refresh_xp_cache(self):
         """Atualiza cache de XP disponivel para conversao"""
         from app.models.xp_ledger import XPLedger
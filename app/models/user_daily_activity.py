@@ -0,0 +1,289 @@
+# app/models/user_daily_activity.py
+
+from app import db
+from datetime import datetime
+from sqlalchemy import and_, event, func, case, inspect
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from app.models.booking import Booking, BookingStatus
+
+
+class UserDailyActivity(db.Model):
+    """
+    Rollup diario de presenca por aluno (uma linha por usuario/dia de aula).
+
+    Mantido na mesma transacao de qualquer mudanca de status de Booking
+    (listener before_flush abaixo) e reconstruivel com
+    `flask activity backfill`. Streak, frequencia e ausencia leem daqui
+    com uma consulta por faixa de datas em vez de varrer bookings.
+
+    Estornos (ex: COMPLETED -> CANCELLED) podem deixar linhas zeradas ate o
+    proximo backfill; as consultas filtram completed_count > 0.
+    """
+    __tablename__ = 'user_daily_activity'
+
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    activity_date = db.Column(db.Date, nullable=False)  # Booking.date
+
+    completed_count = db.Column(db.Integer, nullable=False, default=0)
+    no_show_count = db.Column(db.Integer, nullable=False, default=0)
+    cancelled_count = db.Column(db.Integer, nullable=False, default=0)
+    checkin_count = db.Column(db.Integer, nullable=False, default=0)  # concluidas com checkin_at
+    last_checkin_at = db.Column(db.DateTime, nullable=True)
+
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    __table_args__ = (
+        db.UniqueConstraint('user_id', 'activity_date', name='uq_user_daily_activity_user_date'),
+        db.Index('ix_user_daily_activity_date', 'activity_date'),
+    )
+
+    # Status de Booking -> coluna de contagem
+    STATUS_COLUMNS = {
+        BookingStatus.COMPLETED: 'completed_count',
+        BookingStatus.NO_SHOW: 'no_show_count',
+        BookingStatus.CANCELLED: 'cancelled_count',
+    }
+
+    # =========================================================================
+    # Consultas
+    # =========================================================================
+
+    @staticmethod
+    def completed_dates(user_id, limit=None):
+        """Dias com aula concluida do usuario, do mais recente ao mais antigo."""
+        query = db.session.query(UserDailyActivity.activity_date).filter(
+            UserDailyActivity.user_id == user_id,
+            UserDailyActivity.completed_count > 0
+        ).order_by(UserDailyActivity.activity_date.desc())
+        if limit:
+            query = query.limit(limit)
+        return [d for (d,) in query]
+
+    @staticmethod
+    def checkin_stats(since, user_ids=None):
+        """
+        Check-ins por aluno numa unica consulta agrupada.
+
+        A janela usa a mesma base do antigo filtro `Booking.checkin_at >= since`:
+        o horario do check-in (UTC, datetime.utcnow), nao a data da aula. Dias
+        contam `checkin_count` (concluidas com check-in registrado), entao aulas
+        concluidas sem check-in nao entram, como antes.
+
+        Args:
+            since: Inicio da janela (datetime UTC) para `completed_since`
+            user_ids: Lista ou subquery de ids (None = todos)
+
+        Returns:
+            {user_id: {'completed_since', 'last_checkin_at'}} apenas para
+            usuarios com ao menos um check-in
+        """
+        query = db.session.query(
+            UserDailyActivity.user_id,
+            func.sum(case(
+                (UserDailyActivity.last_checkin_at >= since, UserDailyActivity.checkin_count),
+                else_=0
+            )),
+            func.max(UserDailyActivity.last_checkin_at)
+        ).filter(
+            UserDailyActivity.checkin_count > 0,
+            UserDailyActivity.last_checkin_at.isnot(None)
+        )
+        if user_ids is not None:
+            query = query.filter(UserDailyActivity.user_id.in_(user_ids))
+
+        return {
+            uid: {
+                'completed_since': int(completed or 0),
+                'last_checkin_at': last_at,
+            }
+            for uid, completed, last_at in query.group_by(UserDailyActivity.user_id)
+        }
+
+    # =========================================================================
+    # Backfill
+    # =========================================================================
+
+    @staticmethod
+    def rebuild(since_date=None, until_date=None):
+        """
+        Reconstroi o rollup a partir de bookings (INSERT ... SELECT agrupado).
+        Nao faz commit.
+
+        Returns:
+            Quantidade de linhas geradas
+        """
+        def in_range(column, query):
+            if since_date:
+                query = query.filter(column >= since_date)
+            if until_date:
+                query = query.filter(column <= until_date)
+            return query
+
+        in_range(UserDailyActivity.activity_date, UserDailyActivity.query).delete(
+            synchronize_session=False
+        )
+
+        def count_status(status):
+            return func.sum(case((Booking.status == status, 1), else_=0))
+
+        source = in_range(Booking.date, db.session.query(
+            Booking.user_id,
+            Booking.date,
+            count_status(BookingStatus.COMPLETED),
+            count_status(BookingStatus.NO_SHOW),
+            count_status(BookingStatus.CANCELLED),
+            func.sum(case((and_(Booking.status == BookingStatus.COMPLETED,
+                                Booking.checkin_at.isnot(None)), 1), else_=0)),
+            func.max(case((Booking.status == BookingStatus.COMPLETED, Booking.checkin_at))),
+            func.now()
+        ).filter(
+            Booking.status.in_(list(UserDailyActivity.STATUS_COLUMNS))
+        )).group_by(Booking.user_id, Booking.date)
+
+        result = db.session.execute(
+            db.insert(UserDailyActivity).from_select(
+                ['user_id', 'activity_date', 'completed_count', 'no_show_count',
+                 'cancelled_count', 'checkin_count', 'last_checkin_at', 'updated_at'],
+                source
+            )
+        )
+        return result.rowcount
+
+    def __repr__(self):
+        return f'<UserDailyActivity user={self.user_id} {self.activity_date} completed={self.completed_count}>'
+
+
+# =============================================================================
+# Manutencao transacional
+# =============================================================================
+
+_TRACKED = ('user_id', 'date', 'status', 'checkin_at')
+
+
+@event.listens_for(Booking.checkin_at, 'set', active_history=True)
+@event.listens_for(Booking.status, 'set', active_history=True)
+@event.listens_for(Booking.date, 'set', active_history=True)
+@event.listens_for(Booking.user_id, 'set', active_history=True)
+def _load_previous_value(target, value, oldvalue, initiator):
+    """Forca o carregamento do valor anterior (necessario para o delta)."""
+    return value
+
+
+def _booking_state(booking, previous: bool):
+    """(user_id, date, status, checkin_at) atual ou anterior ao flush."""
+    state = inspect(booking)
+    values = []
+    for attr in _TRACKED:
+        history = state.attrs[attr].history
+        if previous:
+            value = (history.deleted or history.unchanged or [None])[0]
+        else:
+            value = (history.added or history.unchanged or [None])[0]
+        values.append(value)
+    return tuple(values)
+
+
+@event.listens_for(Session, 'before_flush')
+def _update_daily_activity(session, flush_context, instances):
+    """Aplica o delta das mudancas de Booking no rollup, no mesmo flush."""
+    deltas = {}
+    checkins = {}
+
+    def track(state, sign):
+        user_id, day, status, checkin_at = state
+        column = UserDailyActivity.STATUS_COLUMNS.get(status)
+        if column is None or user_id is None or day is None:
+            return
+        key = (user_id, day)
+        bucket = deltas.setdefault(key, {})
+        bucket[column] = bucket.get(column, 0) + sign
+        if status == BookingStatus.COMPLETED and checkin_at:
+            bucket['checkin_count'] = bucket.get('checkin_count', 0) + sign
+            if sign > 0:
+                checkins[key] = max(checkin_at, checkins.get(key, checkin_at))
+
+    for obj in session.new:
+        if isinstance(obj, Booking):
+            track(_booking_state(obj, previous=False), +1)
+
+    for obj in session.dirty:
+        if isinstance(obj, Booking) and session.is_modified(obj):
+            before = _booking_state(obj, previous=True)
+            after = _booking_state(obj, previous=False)
+            if before != after:
+                track(before, -1)
+                track(after, +1)
+
+    for obj in session.deleted:
+        if isinstance(obj, Booking):
+            track(_booking_state(obj, previous=True), -1)
+
+    if not deltas:
+        return
+
+    for (user_id, day), changes in deltas.items():
+        _upsert_activity(session, user_id, day, changes, checkins.get((user_id, day)))
+
+
+def _upsert_activity(session, user_id, day, changes, checkin_at):
+    """
+    Aplica o delta de (user_id, day) sem SELECT previo.
+
+    PostgreSQL/SQLite: INSERT ... ON CONFLICT DO UPDATE SET x = x + delta,
+    entao duas transacoes no mesmo dia nao disputam o INSERT (o que antes
+    levantava IntegrityError e abortava o commit do Booking). Outros
+    bancos: INSERT num SAVEPOINT e, se a linha ja existir, UPDATE.
+    """
+    table = UserDailyActivity.__table__
+    now = datetime.utcnow()
+
+    values = {
+        'user_id': user_id,
+        'activity_date': day,
+        'completed_count': 0,
+        'no_show_count': 0,
+        'cancelled_count': 0,
+        'checkin_count': 0,
+        'last_checkin_at': checkin_at,
+        'updated_at': now,
+    }
+    increments = {'updated_at': now}
+    for column, delta in changes.items():
+        values[column] = max(0, delta)
+        if delta:
+            increments[column] = table.c[column] + delta
+
+    def later_checkin(new_value):
+        current = table.c.last_checkin_at
+        return case((current.is_(None), new_value), (current < new_value, new_value), else_=current)
+
+    connection = session.connection()
+    dialect = connection.dialect.name
+
+    if dialect in ('postgresql', 'sqlite'):
+        if dialect == 'postgresql':
+            from sqlalchemy.dialects.postgresql import insert
+        else:
+            from sqlalchemy.dialects.sqlite import insert
+        stmt = insert(table).values(**values)
+        if checkin_at:
+            increments['last_checkin_at'] = later_checkin(stmt.excluded.last_checkin_at)
+        connection.execute(stmt.on_conflict_do_update(
+            index_elements=['user_id', 'activity_date'],
+            set_=increments
+        ))
+        return
+
+    try:
+        with connection.begin_nested():
+            connection.execute(table.insert().values(**values))
+    except IntegrityError:
+        if checkin_at:
+            increments['last_checkin_at'] = later_checkin(checkin_at)
+        connection.execute(table.update().where(
+            table.c.user_id == user_id,
+            table.c.activity_date == day
+        ).values(**increments))
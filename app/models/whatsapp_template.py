@@ -3,6 +3,7 @@
 from app import db
 from datetime import datetime
 import enum
+from collections import namedtuple
 
 
 class TemplateCategory(enum.Enum):
@@ -35,6 +36,10 @@ class TemplateTrigger(enum.Enum):
     CUSTOM = "Personalizado / Envio Manual"
 
 
+# Copia dos campos usados no envio (guardada no cache de lookups)
+CachedTemplate = namedtuple('CachedTemplate', 'id template_code trigger content megaapi_status')
+
+
 class WhatsAppTemplate(db.Model):
     """
     Templates de WhatsApp editaveis pelo admin
@@ -69,5 +74,31 @@ class WhatsAppTemplate(db.Model):
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, onupdate=datetime.utcnow)
 
+    @classmethod
+    def get_active(cls, template_code: str = None, trigger: 'TemplateTrigger' = None):
+        """
+        Template ativo por codigo ou gatilho, via cache em processo.
+
+        Retorna um CachedTemplate (copia somente leitura, segura entre
+        sessoes) ou None. Rotas que alteram templates devem chamar
+        lookup_cache.invalidate('whatsapp_template').
+        """
+        from app.services.lookup_cache import lookup_cache
+
+        def load():
+            query = cls.query.filter_by(is_active=True)
+            if template_code is not None:
+                query = query.filter_by(template_code=template_code)
+            if trigger is not None:
+                query = query.filter_by(trigger=trigger)
+            template = query.first()
+            if template is None:
+                return None
+            return CachedTemplate(template.id, template.template_code, template.trigger,
+                                  template.content, template.megaapi_status)
+
+        key = ('code', template_code) if template_code is not None else ('trigger', trigger)
+        return lookup_cache.get_or_load('whatsapp_template', key, load)
+
     def __repr__(self):
         return f'<WhatsAppTemplate {self.name}>'
@@ -6,6 +6,7 @@ from app.models import Achievement, CriteriaType, Modality, UserAchievement
 from app import db
 from app.services.image_handler import save_achievement_icon
 from app.routes.admin.dashboard import admin_required
+from app.services.lookup_cache import lookup_cache
 
 achievements_bp = Blueprint('admin_achievements', __name__, url_prefix='/admin/achievements')
 
@@ -61,6 +62,7 @@ def create_achievement():
 
         db.session.add(achievement)
         db.session.commit()
+        lookup_cache.invalidate('achievement')
 
         flash(f'Conquista "{achievement.name}" criada!', 'success')
         return redirect(url_for('admin_achievements.list_achievements'))
@@ -108,6 +110,7 @@ def edit_achievement(id):
         achievement.color = request.form.get('color', '#FFD700')
 
         db.session.commit()
+        lookup_cache.invalidate('achievement')
 
         flash(f'Conquista "{achievement.name}" atualizada!', 'success')
         return redirect(url_for('admin_achievements.list_achievements'))
@@ -128,6 +131,7 @@ def delete_achievement(id):
     achievement = Achievement.query.get_or_404(id)
     achievement.is_active = False
     db.session.commit()
+    lookup_cache.invalidate('achievement')
 
     flash(f'Conquista "{achievement.name}" desativada.', 'info')
     return redirect(url_for('admin_achievements.list_achievements'))
@@ -141,6 +145,7 @@ def activate_achievement(id):
     achievement = Achievement.query.get_or_404(id)
     achievement.is_active = True
     db.session.commit()
+    lookup_cache.invalidate('achievement')
 
     flash(f'Conquista "{achievement.name}" reativada.', 'success')
     return redirect(url_for('admin_achievements.list_achievements'))
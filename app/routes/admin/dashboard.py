@@ -36,16 +36,13 @@ def dashboard():
     total_students = User.query.filter_by(role='student', is_active=True).count()
     active_subscriptions = Subscription.query.filter_by(status=SubscriptionStatus.ACTIVE).count()
 
-    # Faturamento do mes
+    # Faturamento do mes e pendencias (mesmos agregados do relatorio financeiro)
+    from app.services.financial_aggregates import financial_aggregates
+    financial = financial_aggregates.build(months=1)
     start_of_month = datetime.now().replace(day=1, hour=0, minute=0, second=0, microsecond=0)
-    monthly_revenue = db.session.query(func.sum(Payment.amount)).filter(
-        Payment.status == PaymentStatusEnum.PAID,
-        Payment.paid_date >= start_of_month
-    ).scalar() or 0
-
-    # Pendencias
-    pending_payments = Payment.query.filter_by(status=PaymentStatusEnum.PENDING).count()
-    overdue_payments = Payment.query.filter_by(status=PaymentStatusEnum.OVERDUE).count()
+    monthly_revenue = financial.current_month_revenue
+    pending_payments = financial.pending_total_count
+    overdue_payments = financial.overdue_total_count
 
     # Aulas hoje
     today = datetime.now().date()
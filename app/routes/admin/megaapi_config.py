@@ -98,6 +98,22 @@ def check_status_ajax():
         
     return jsonify(get_instance_status())
 
+@megaapi_config_bp.route('/stats', methods=['GET'])
+@login_required
+@admin_required
+def dispatch_stats():
+    """Metricas de envio: mensagens/s, taxa de erro, retries, rate limit e fila"""
+    from app.services.outbound_queue import outbound_queue
+    from app.services.whatsapp_dispatcher import dispatcher
+    from app.services.whatsapp_log_writer import whatsapp_log_writer
+    return jsonify({
+        'dispatcher': dispatcher.get_stats(),
+        'http': megaapi.get_stats(),
+        'queue': outbound_queue.get_stats(),
+        'log_writer': whatsapp_log_writer.get_stats()
+    })
+
+
 @megaapi_config_bp.route('/', methods=['GET', 'POST'])
 @login_required
 @admin_required
@@ -142,7 +158,8 @@ def settings():
             try:
                 result = megaapi.send_custom_message(
                     phone=phone,
-                    message=message
+                    message=message,
+                    queue=False  # Teste: resposta imediata da API
                 )
                 flash(f'Mensagem enviada com sucesso! ID: {result.get("id", "N/A")}', 'success')
             except ValueError as e:
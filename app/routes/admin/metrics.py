@@ -26,17 +26,19 @@ def strategic_dashboard():
 @admin_required
 def get_kpis():
     """Retorna as 8 métricas estratégicas PRD com valores atuais e tendência."""
-    from app.models import User, Booking, BookingStatus, Payment, Subscription
-    from app.models.payment import PaymentStatusEnum
-    from app.models.crm import StudentHealthScore, Lead, LeadStatus
-    from app.models.whatsapp_log import WhatsAppLog
+    from app.models import User
+    from app.models.crm import StudentHealthScore
+    from app.services.metric_snapshots import metric_snapshots
 
     now = datetime.utcnow()
     ninety_days_ago = now - timedelta(days=90)
-    thirty_days_ago = now - timedelta(days=30)
     prev_thirty = now - timedelta(days=60)
 
-    # 1. Taxa de Churn (90 dias)
+    # Metricas aditivas: snapshots diarios (janela de 30 dias incluindo hoje
+    # e os 30 dias anteriores para a tendencia)
+    current, previous = metric_snapshots.windows(30)
+
+    # 1. Taxa de Churn (90 dias) - estado atual, calculado na hora
     total_students_90d = User.query.filter(
         User.role == 'student',
         User.created_at <= ninety_days_ago
@@ -50,43 +52,20 @@ def get_kpis():
 
     churn_rate = round((churned / total_students_90d * 100), 1) if total_students_90d > 0 else 0
 
-    # 2. Tempo de Check-in (média últimos 30 dias)
-    from app.models.face_recognition import FaceRecognitionLog
-    avg_checkin_time = 3.0  # default
-    try:
-        logs = FaceRecognitionLog.query.filter(
-            FaceRecognitionLog.created_at >= thirty_days_ago,
-            FaceRecognitionLog.recognized == True
-        ).all()
-        if logs and hasattr(logs[0], 'processing_time_ms'):
-            times = [l.processing_time_ms for l in logs if l.processing_time_ms]
-            avg_checkin_time = round(sum(times) / len(times) / 1000, 1) if times else 3.0
-    except Exception:
-        pass
+    # 2. Tempo de Check-in
+    # FaceRecognitionLog nao registra tempo de processamento; valor de referencia
+    avg_checkin_time = 3.0
 
     # 3. Taxa Resposta WhatsApp (30 dias)
-    total_wa_sent = WhatsAppLog.query.filter(
-        WhatsAppLog.sent_at >= thirty_days_ago,
-        WhatsAppLog.status.in_(['sent', 'delivered', 'read'])
-    ).count()
-
-    total_wa_read = WhatsAppLog.query.filter(
-        WhatsAppLog.sent_at >= thirty_days_ago,
-        WhatsAppLog.status == 'read'
-    ).count()
+    total_wa_sent = int(current['wa_sent'])
+    total_wa_read = int(current['wa_read'])
 
     wa_response_rate = round((total_wa_read / total_wa_sent * 100), 1) if total_wa_sent > 0 else 0
 
     # 4. Conversão Landing > Checkout (30 dias)
     # Aproximação: novos alunos que compraram / total leads novos
-    new_students_30d = User.query.filter(
-        User.role == 'student',
-        User.created_at >= thirty_days_ago
-    ).count()
-
-    new_leads_30d = Lead.query.filter(
-        Lead.created_at >= thirty_days_ago
-    ).count() or 1  # avoid div zero
+    new_students_30d = int(current['new_students'])
+    new_leads_30d = int(current['leads_created']) or 1  # avoid div zero
 
     landing_conversion = round((new_students_30d / max(new_leads_30d, 1) * 100), 1)
 
@@ -95,15 +74,9 @@ def get_kpis():
     credit_release_time = 5  # segundos (NuPay instant)
 
     # 6. NPS (Net Promoter Score)
-    from app.models.crm import AutomationLog
-    nps_responses = AutomationLog.query.filter(
-        AutomationLog.automation_type.like('NPS_RESPONSE_%'),
-        AutomationLog.sent_at >= thirty_days_ago
-    ).all()
-
-    promoters = sum(1 for r in nps_responses if 'EXCELENTE' in r.automation_type)
-    passives = sum(1 for r in nps_responses if 'BOA' in r.automation_type)
-    detractors = sum(1 for r in nps_responses if 'REGULAR' in r.automation_type or 'RUIM' in r.automation_type)
+    promoters = int(current['nps_promoters'])
+    passives = int(current['nps_passives'])
+    detractors = int(current['nps_detractors'])
     total_nps = promoters + passives + detractors
     nps_score = round(((promoters - detractors) / total_nps * 100), 0) if total_nps > 0 else 0
 
@@ -116,14 +89,8 @@ def get_kpis():
     avg_health = round(avg_health, 1)
 
     # 8. Conversão Lead > Aluno (30 dias)
-    won_leads = Lead.query.filter(
-        Lead.status == LeadStatus.WON,
-        Lead.converted_at >= thirty_days_ago
-    ).count()
-
-    total_leads_period = Lead.query.filter(
-        Lead.created_at >= thirty_days_ago
-    ).count() or 1
+    won_leads = int(current['leads_won'])
+    total_leads_period = int(current['leads_created']) or 1
 
     lead_conversion = round((won_leads / max(total_leads_period, 1) * 100), 1)
 
@@ -140,16 +107,8 @@ def get_kpis():
     ).count()
     prev_churn = round((prev_churned / max(prev_students, 1) * 100), 1)
 
-    prev_wa_sent = WhatsAppLog.query.filter(
-        WhatsAppLog.sent_at >= prev_thirty,
-        WhatsAppLog.sent_at < thirty_days_ago,
-        WhatsAppLog.status.in_(['sent', 'delivered', 'read'])
-    ).count()
-    prev_wa_read = WhatsAppLog.query.filter(
-        WhatsAppLog.sent_at >= prev_thirty,
-        WhatsAppLog.sent_at < thirty_days_ago,
-        WhatsAppLog.status == 'read'
-    ).count()
+    prev_wa_sent = int(previous['wa_sent'])
+    prev_wa_read = int(previous['wa_read'])
     prev_wa_rate = round((prev_wa_read / max(prev_wa_sent, 1) * 100), 1)
 
     kpis = [
@@ -267,53 +226,17 @@ def get_kpis():
 @admin_required
 def get_trends():
     """Retorna dados de tendência mensal (últimos 6 meses) para gráficos."""
-    from app.models import User, Payment, Subscription
-    from app.models.payment import PaymentStatusEnum
-    from app.models.crm import Lead, LeadStatus
+    from app.services.metric_snapshots import metric_snapshots
 
-    now = datetime.utcnow()
     months = []
-
-    for i in range(5, -1, -1):
-        month_start = (now - timedelta(days=30 * i)).replace(day=1, hour=0, minute=0, second=0)
-        if i > 0:
-            month_end = (now - timedelta(days=30 * (i - 1))).replace(day=1, hour=0, minute=0, second=0)
-        else:
-            month_end = now
-
-        # Novos alunos no mês
-        new_students = User.query.filter(
-            User.role == 'student',
-            User.created_at >= month_start,
-            User.created_at < month_end
-        ).count()
-
-        # Revenue no mês
-        revenue = db.session.query(
-            func.coalesce(func.sum(Payment.amount), 0)
-        ).filter(
-            Payment.status == PaymentStatusEnum.PAID,
-            Payment.paid_date >= month_start,
-            Payment.paid_date < month_end
-        ).scalar() or 0
-
-        # Leads convertidos
-        leads_won = Lead.query.filter(
-            Lead.status == LeadStatus.WON,
-            Lead.converted_at >= month_start,
-            Lead.converted_at < month_end
-        ).count()
-
-        # Total leads
-        leads_total = Lead.query.filter(
-            Lead.created_at >= month_start,
-            Lead.created_at < month_end
-        ).count()
+    for month_start, totals in metric_snapshots.monthly(6):
+        leads_won = int(totals['leads_won'])
+        leads_total = int(totals['leads_created'])
 
         months.append({
             'label': month_start.strftime('%b/%y'),
-            'new_students': new_students,
-            'revenue': float(revenue),
+            'new_students': int(totals['new_students']),
+            'revenue': float(totals['revenue_paid']),
             'leads_won': leads_won,
             'leads_total': leads_total,
             'conversion': round((leads_won / max(leads_total, 1) * 100), 1)
@@ -335,98 +258,15 @@ def financial_reports():
 @admin_required
 def get_financial_data():
     """Dados financeiros: revenue por pacote, auto vs manual, churn, LTV."""
-    from app.models import User, Payment, Subscription, Package
-    from app.models.payment import PaymentStatusEnum
+    from app.models import Subscription
     from app.models.subscription import SubscriptionStatus
+    from app.services.financial_aggregates import financial_aggregates
 
     now = datetime.utcnow()
     thirty_days_ago = now - timedelta(days=30)
 
-    # 1. Revenue por pacote (últimos 30 dias)
-    revenue_by_package = db.session.query(
-        Package.name,
-        func.sum(Payment.amount).label('total'),
-        func.count(Payment.id).label('count')
-    ).join(Subscription, Payment.subscription_id == Subscription.id
-    ).join(Package, Subscription.package_id == Package.id
-    ).filter(
-        Payment.status == PaymentStatusEnum.PAID,
-        Payment.paid_date >= thirty_days_ago
-    ).group_by(Package.name).all()
-
-    packages_data = [
-        {'name': r[0], 'revenue': float(r[1] or 0), 'count': int(r[2])}
-        for r in revenue_by_package
-    ]
-
-    # 2. Automático vs Manual (últimos 30 dias)
-    auto_payments = Payment.query.filter(
-        Payment.status == PaymentStatusEnum.PAID,
-        Payment.paid_date >= thirty_days_ago,
-        Payment.payment_method.in_(['nupay_pix', 'nupay_recurring'])
-    ).count()
-
-    manual_payments = Payment.query.filter(
-        Payment.status == PaymentStatusEnum.PAID,
-        Payment.paid_date >= thirty_days_ago,
-        Payment.payment_method == 'manual'
-    ).count()
-
-    auto_revenue = db.session.query(
-        func.coalesce(func.sum(Payment.amount), 0)
-    ).filter(
-        Payment.status == PaymentStatusEnum.PAID,
-        Payment.paid_date >= thirty_days_ago,
-        Payment.payment_method.in_(['nupay_pix', 'nupay_recurring'])
-    ).scalar() or 0
-
-    manual_revenue = db.session.query(
-        func.coalesce(func.sum(Payment.amount), 0)
-    ).filter(
-        Payment.status == PaymentStatusEnum.PAID,
-        Payment.paid_date >= thirty_days_ago,
-        Payment.payment_method == 'manual'
-    ).scalar() or 0
-
-    # 3. Revenue mensal (últimos 6 meses)
-    monthly_revenue = []
-    for i in range(5, -1, -1):
-        m_start = (now - timedelta(days=30 * i)).replace(day=1, hour=0, minute=0, second=0)
-        if i > 0:
-            m_end = (now - timedelta(days=30 * (i - 1))).replace(day=1, hour=0, minute=0, second=0)
-        else:
-            m_end = now
-
-        rev = db.session.query(
-            func.coalesce(func.sum(Payment.amount), 0)
-        ).filter(
-            Payment.status == PaymentStatusEnum.PAID,
-            Payment.paid_date >= m_start,
-            Payment.paid_date < m_end
-        ).scalar() or 0
-
-        pending = db.session.query(
-            func.coalesce(func.sum(Payment.amount), 0)
-        ).filter(
-            Payment.status == PaymentStatusEnum.PENDING,
-            Payment.due_date >= m_start.date(),
-            Payment.due_date < m_end.date()
-        ).scalar() or 0
-
-        overdue = db.session.query(
-            func.coalesce(func.sum(Payment.amount), 0)
-        ).filter(
-            Payment.status == PaymentStatusEnum.OVERDUE,
-            Payment.due_date >= m_start.date(),
-            Payment.due_date < m_end.date()
-        ).scalar() or 0
-
-        monthly_revenue.append({
-            'label': m_start.strftime('%b/%y'),
-            'paid': float(rev),
-            'pending': float(pending),
-            'overdue': float(overdue)
-        })
+    # 1-3. Pagamentos: pacotes, automatico vs manual e meses (duas consultas)
+    financial = financial_aggregates.build(months=6, window_days=30)
 
     # 4. Churn analysis
     total_active = Subscription.query.filter(Subscription.status == SubscriptionStatus.ACTIVE).count()
@@ -436,11 +276,7 @@ def get_financial_data():
     ).count()
 
     # 5. LTV (Lifetime Value) estimado
-    avg_ticket = db.session.query(
-        func.avg(Payment.amount)
-    ).filter(
-        Payment.status == PaymentStatusEnum.PAID
-    ).scalar() or 0
+    avg_ticket = financial.avg_ticket
 
     avg_months = db.session.query(
         func.avg(
@@ -454,41 +290,44 @@ def get_financial_data():
     avg_months_val = float(avg_months) / 30 if avg_months else 1
     ltv = float(avg_ticket) * avg_months_val
 
-    # 6. Totais
-    total_revenue_30d = db.session.query(
-        func.coalesce(func.sum(Payment.amount), 0)
-    ).filter(
-        Payment.status == PaymentStatusEnum.PAID,
-        Payment.paid_date >= thirty_days_ago
-    ).scalar() or 0
-
-    total_pending = db.session.query(
-        func.coalesce(func.sum(Payment.amount), 0)
-    ).filter(
-        Payment.status == PaymentStatusEnum.PENDING
-    ).scalar() or 0
-
-    total_overdue = db.session.query(
-        func.coalesce(func.sum(Payment.amount), 0)
-    ).filter(
-        Payment.status == PaymentStatusEnum.OVERDUE
-    ).scalar() or 0
-
     return jsonify({
         'summary': {
-            'revenue_30d': float(total_revenue_30d),
-            'pending': float(total_pending),
-            'overdue': float(total_overdue),
+            'revenue_30d': float(financial.window_revenue),
+            'pending': float(financial.pending_total),
+            'overdue': float(financial.overdue_total),
             'ltv': round(ltv, 2),
             'avg_ticket': round(float(avg_ticket), 2),
             'active_subs': total_active,
             'churn_30d': cancelled_30d,
             'churn_rate': round((cancelled_30d / max(total_active + cancelled_30d, 1) * 100), 1)
         },
-        'packages': packages_data,
-        'payment_methods': {
-            'auto': {'count': auto_payments, 'revenue': float(auto_revenue)},
-            'manual': {'count': manual_payments, 'revenue': float(manual_revenue)}
-        },
-        'monthly': monthly_revenue
+        'packages': financial.packages(),
+        'payment_methods': financial.payment_methods(),
+        'monthly': financial.monthly()
     })
+
+
+@metrics_bp.route('/api/financeiro.csv')
+@login_required
+@admin_required
+def export_financial_csv():
+    """Exporta o resumo mensal (pago, pendente, vencido) em CSV."""
+    import csv
+    import io
+    from flask import Response, request
+    from app.services.financial_aggregates import financial_aggregates
+
+    months = min(max(request.args.get('months', 12, type=int), 1), 36)
+    financial = financial_aggregates.build(months=months)
+
+    output = io.StringIO()
+    csv.writer(output, delimiter=';').writerows(financial.csv_rows())
+
+    filename = f"financeiro_{financial.months[0]:%Y-%m}_{financial.months[-1]:%Y-%m}.csv"
+    return Response(
+        output.getvalue(),
+        mimetype='text/csv',
+        headers={
+            'Content-Disposition': f'attachment; filename="{filename}"'
+        }
+    )
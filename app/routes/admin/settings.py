@@ -56,6 +56,15 @@ def index():
     return render_template('admin/settings/index.html', configs=configs)
 
 
+@settings_bp.route('/cache-stats')
+@login_required
+@admin_required
+def cache_stats():
+    """Estatisticas do cache de configuracoes/templates deste worker"""
+    from app.services.lookup_cache import lookup_cache
+    return lookup_cache.get_stats()
+
+
 @settings_bp.route('/credits-calculator')
 @login_required
 @admin_required
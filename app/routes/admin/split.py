@@ -512,26 +512,49 @@ def collaborator_statement(user_id):
 @login_required
 @admin_required
 def export_statement_pdf(user_id):
-    """Exporta extrato em PDF."""
+    """Exporta extrato em PDF (gerado em arquivo temporario e enviado em blocos)."""
+    import os
     from flask import Response
-    from app.services.pdf_generator import pdf_generator
+    from app.services.statement_export import statement_filename, write_statement_pdf, iter_file_chunks
 
     month = request.args.get('month', type=int)
     year = request.args.get('year', type=int)
 
-    statement = split_service.get_collaborator_statement(user_id, month, year)
-    pdf_bytes = pdf_generator.generate_statement_pdf(statement)
+    path, statement = write_statement_pdf(user_id, month, year)
+
+    response = Response(
+        iter_file_chunks(path),
+        mimetype='application/pdf',
+        headers={
+            'Content-Disposition': f'attachment; filename="{statement_filename(statement, "pdf")}"',
+            'Content-Length': str(os.path.getsize(path))
+        }
+    )
+    # Resposta nunca iterada (ex: HEAD) nao passa pelo finally do gerador
+    response.call_on_close(lambda: os.path.exists(path) and os.remove(path))
+    return response
+
 
-    prof_name = statement['professional']['name'].replace(' ', '_')
-    m = statement['period']['month']
-    y = statement['period']['year']
-    filename = f"extrato_{prof_name}_{m:02d}_{y}.pdf"
+@split_bp.route('/collaborators/<int:user_id>/statement/csv')
+@login_required
+@admin_required
+def export_statement_csv(user_id):
+    """Exporta extrato em CSV (linhas enviadas conforme sao lidas)."""
+    from flask import Response, stream_with_context
+    from app.services.statement_export import statement_filename, iter_statement_csv
+
+    month = request.args.get('month', type=int)
+    year = request.args.get('year', type=int)
+
+    statement = split_service.get_statement_header(user_id, month, year)
+    period = statement['period']
+    entries = split_service.iter_statement_entries(user_id, period['month'], period['year'])
 
     return Response(
-        pdf_bytes,
-        mimetype='application/pdf',
+        stream_with_context(iter_statement_csv(statement, entries)),
+        mimetype='text/csv',
         headers={
-            'Content-Disposition': f'attachment; filename="{filename}"'
+            'Content-Disposition': f'attachment; filename="{statement_filename(statement, "csv")}"'
         }
     )
 
@@ -139,24 +139,29 @@ def face_enrollment(id):
 def enroll_face_admin(id):
     """API para admin cadastrar face de qualquer usuario."""
     from app.services.face_service import FaceRecognitionService
+    from app.services.face_encoder_pool import EncoderPoolBusy
 
     user = User.query.get_or_404(id)
     data = request.get_json()
 
-    if not data or 'image' not in data:
+    if not data or not (data.get('image') or data.get('images')):
         return jsonify({
             'success': False,
             'error': 'Imagem nao fornecida'
         }), 400
 
     face_service = FaceRecognitionService(tolerance=0.6)
-    result = face_service.enroll_face(user.id, data['image'])
+    try:
+        result = face_service.enroll_face(user.id, data.get('images') or data['image'])
+    except EncoderPoolBusy as e:
+        return jsonify({'success': False, 'error': str(e)}), 503
 
     if result['success']:
         return jsonify({
             'success': True,
             'message': f'Face de {user.name} cadastrada com sucesso!',
-            'confidence': result['confidence']
+            'confidence': result['confidence'],
+            'sample_count': result['sample_count']
         }), 201
     else:
         return jsonify({
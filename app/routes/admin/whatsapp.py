@@ -5,6 +5,7 @@ from flask_login import login_required, current_user
 from app.models import WhatsAppTemplate, WhatsAppLog, TemplateCategory, TemplateTrigger
 from app import db
 from app.routes.admin.dashboard import admin_required
+from app.services.lookup_cache import lookup_cache
 import re
 
 whatsapp_bp = Blueprint('admin_whatsapp', __name__, url_prefix='/admin/whatsapp')
@@ -42,6 +43,7 @@ def create_template():
 
         db.session.add(template)
         db.session.commit()
+        lookup_cache.invalidate('whatsapp_template')
 
         flash(f'Template "{template.name}" criado! Aguardando aprovacao da Megaapi.', 'info')
         return redirect(url_for('admin_whatsapp.list_templates'))
@@ -76,6 +78,7 @@ def edit_template(id):
             template.is_active = False
 
         db.session.commit()
+        lookup_cache.invalidate('whatsapp_template')
 
         flash(f'Template "{template.name}" atualizado!', 'success')
         return redirect(url_for('admin_whatsapp.list_templates'))
@@ -94,6 +97,7 @@ def delete_template(id):
     template = WhatsAppTemplate.query.get_or_404(id)
     template.is_active = False
     db.session.commit()
+    lookup_cache.invalidate('whatsapp_template')
 
     flash(f'Template "{template.name}" desativado.', 'info')
     return redirect(url_for('admin_whatsapp.list_templates'))
@@ -112,6 +116,7 @@ def activate_template(id):
 
     template.is_active = True
     db.session.commit()
+    lookup_cache.invalidate('whatsapp_template')
 
     flash(f'Template "{template.name}" ativado!', 'success')
     return redirect(url_for('admin_whatsapp.list_templates'))
@@ -177,6 +182,7 @@ def sync_megaapi_status():
         except:
             pass
 
+    lookup_cache.invalidate('whatsapp_template')
     flash(f'{updated} template(s) aprovado(s)!', 'success')
     return redirect(url_for('admin_whatsapp.list_templates'))
 
@@ -190,6 +196,7 @@ def manual_approve_template(id):
     template.megaapi_status = 'approved'
     template.is_active = True
     db.session.commit()
+    lookup_cache.invalidate('whatsapp_template')
 
     flash(f'Template "{template.name}" aprovado manualmente!', 'success')
     return redirect(url_for('admin_whatsapp.list_templates'))
@@ -258,6 +265,7 @@ def toggle_flow(id):
     flow = WhatsAppTemplate.query.get_or_404(id)
     flow.is_active = not flow.is_active
     db.session.commit()
+    lookup_cache.invalidate('whatsapp_template')
 
     status = 'ativado' if flow.is_active else 'desativado'
     flash(f'Fluxo "{flow.name}" {status}!', 'success')
@@ -405,25 +413,23 @@ def send_campaign(campaign_id):
     campaign.status = CampaignStatus.SENDING
     campaign.sent_at = datetime.utcnow()
 
-    sent = 0
-    errors = 0
-    for user in recipients:
-        if not user.phone:
-            errors += 1
-            continue
-        try:
-            from app.services.megaapi import send_custom_message
-            send_custom_message(user.phone, campaign.message)
-            sent += 1
-        except Exception:
-            errors += 1
-
-    campaign.total_sent = sent
-    campaign.total_errors = errors
+    # Disparo concorrente (rate limit e retry ficam no MegapiService)
+    from app.services.megaapi import megaapi
+    from app.services.whatsapp_dispatcher import dispatcher
+
+    messages = [
+        {'phone': user.phone, 'message': campaign.message, 'user_id': user.id}
+        for user in recipients if user.phone
+    ]
+    report = dispatcher.dispatch(messages, lambda m: megaapi.send_custom_message(**m))
+
+    campaign.total_sent = report['metrics']['sent']
+    campaign.total_errors = report['metrics']['failed'] + (len(recipients) - len(messages))
     campaign.status = CampaignStatus.COMPLETED
     db.session.commit()
 
-    flash(f'Campanha enviada! {sent} mensagens enviadas, {errors} erros.', 'success')
+    flash(f'Campanha enviada! {campaign.total_sent} mensagens enviadas, '
+          f'{campaign.total_errors} erros.', 'success')
     return redirect(url_for('admin_whatsapp.list_campaigns'))
 
 
@@ -2,7 +2,7 @@ from flask import Blueprint, jsonify, request
 from flask_login import login_required, current_user
 from datetime import datetime, timedelta
 from sqlalchemy import func
-from app.models import User, StudentHealthScore, Booking, AutomationLog, SystemConfig
+from app.models import User, StudentHealthScore, AutomationLog, SystemConfig, UserDailyActivity
 from app import db
 
 crm_api_bp = Blueprint('crm_api', __name__, url_prefix='/api/crm')
@@ -66,27 +66,23 @@ def students_at_risk():
     cutoff_30d = datetime.utcnow() - timedelta(days=30)
     data = []
 
+    # Ultimo checkin e frequencia dos ultimos 30 dias de todos de uma vez (rollup diario)
+    checkin_stats = UserDailyActivity.checkin_stats(
+        cutoff_30d, [score.user_id for score in scores]
+    )
+
     for score in scores:
         user = score.user
-
-        # Ultimo checkin
-        last_checkin = Booking.query.filter(
-            Booking.user_id == user.id,
-            Booking.status == 'COMPLETED'
-        ).order_by(Booking.checked_in_at.desc()).first()
+        stats = checkin_stats.get(user.id, {})
 
         last_checkin_date = None
         days_since = -1
-        if last_checkin and last_checkin.checked_in_at:
-            last_checkin_date = last_checkin.checked_in_at.isoformat()
-            days_since = (datetime.utcnow() - last_checkin.checked_in_at).days
+        if stats.get('last_checkin_at'):
+            last_checkin_date = stats['last_checkin_at'].isoformat()
+            days_since = (datetime.utcnow() - stats['last_checkin_at']).days
 
         # Frequencia real nos ultimos 30 dias
-        freq_30d = Booking.query.filter(
-            Booking.user_id == user.id,
-            Booking.status == 'COMPLETED',
-            Booking.checked_in_at >= cutoff_30d
-        ).count()
+        freq_30d = stats.get('completed_since', 0)
 
         data.append({
             'id': user.id,
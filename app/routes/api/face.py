@@ -1,6 +1,7 @@
 # app/routes/api/face.py
 
 import logging
+import time
 from functools import wraps
 from datetime import datetime, timedelta
 
@@ -8,6 +9,8 @@ from flask import Blueprint, request, jsonify
 from flask_login import login_required, current_user
 
 from app.services.face_service import FaceRecognitionService
+from app.services.face_encoder_pool import EncoderPoolBusy
+from app.services.face_pipeline import MAX_IMAGE_BYTES
 
 logger = logging.getLogger(__name__)
 
@@ -21,6 +24,14 @@ _rate_limit_store = {}
 RATE_LIMIT_MAX = 10  # tentativas
 RATE_LIMIT_WINDOW = 60  # segundos
 
+# Reconhecimento em lote (totem com fila)
+BATCH_MAX_FRAMES = 8
+BATCH_MAX_FACES = 20
+
+# Limite do frame em base64: 4/3 do binario + folga para o prefixo data:image/...
+MAX_IMAGE_BASE64_CHARS = MAX_IMAGE_BYTES * 4 // 3 + 256
+MAX_IMAGE_MB = MAX_IMAGE_BYTES // (1024 * 1024)
+
 
 def rate_limit(f):
     """Decorator para rate limiting por IP (max 10 req/min)"""
@@ -48,6 +59,18 @@ def rate_limit(f):
     return decorated
 
 
+@face_api_bp.errorhandler(EncoderPoolBusy)
+def encoder_pool_busy(e):
+    """Backpressure do pool de encoding: 503 com Retry-After."""
+    logger.warning(f"Pool de encoding facial ocupado: {e}")
+    response = jsonify({
+        'success': False,
+        'error': str(e)
+    })
+    response.headers['Retry-After'] = str(e.retry_after)
+    return response, 503
+
+
 @face_api_bp.route('/enroll', methods=['POST'])
 @login_required
 def enroll_face():
@@ -56,17 +79,20 @@ def enroll_face():
 
     Request JSON:
         {"image": "base64_string", "user_id": int (opcional)}
+        ou {"images": ["base64", ...], ...} para cadastro com varios frames
+        (centroide + threshold ajustado pela dispersao)
 
     Apenas admin pode cadastrar face de outros usuarios.
     """
     data = request.get_json()
-    if not data or 'image' not in data:
+    if not data or not (data.get('image') or data.get('images')):
         return jsonify({
             'success': False,
             'error': 'Imagem nao fornecida. Envie {"image": "base64_string"}'
         }), 400
 
-    image_data = data['image']
+    image_data = data.get('images') or data['image']
+    frames = image_data if isinstance(image_data, list) else [image_data]
     target_user_id = data.get('user_id', current_user.id)
 
     # Verificar permissao
@@ -76,11 +102,11 @@ def enroll_face():
             'error': 'Nao autorizado. Apenas admin pode cadastrar face de outros usuarios.'
         }), 403
 
-    # Verificar tamanho da imagem (base64 ~33% maior que original)
-    if len(image_data) > 7 * 1024 * 1024:  # ~5MB em base64
+    # Verificar formato e tamanho da imagem (base64 ~33% maior que original)
+    if any(not isinstance(frame, str) or len(frame) > MAX_IMAGE_BASE64_CHARS for frame in frames):
         return jsonify({
             'success': False,
-            'error': 'Imagem muito grande. Maximo: 5MB'
+            'error': f'Imagem invalida ou muito grande. Maximo: {MAX_IMAGE_MB}MB por frame'
         }), 400
 
     # Verificar se ja tem face cadastrada
@@ -109,7 +135,9 @@ def enroll_face():
             'success': True,
             'message': result['message'],
             'user_id': target_user_id,
-            'confidence': result['confidence']
+            'confidence': result['confidence'],
+            'sample_count': result['sample_count'],
+            'threshold': result['threshold']
         }), 201
     else:
         return jsonify({
@@ -182,6 +210,7 @@ def recognize_face():
             'photo_url': user.photo_url
         },
         'confidence': round(match['confidence'], 1),
+        'timings': match.get('timings', {}),
         'should_checkin': active_booking is not None and active_booking.status == BookingStatus.CONFIRMED,
         'booking_id': active_booking.id if active_booking else None
     }
@@ -192,6 +221,113 @@ def recognize_face():
     return jsonify(response), 200
 
 
+@face_api_bp.route('/recognize-batch', methods=['POST'])
+@rate_limit
+def recognize_faces_batch():
+    """
+    Reconhece todas as faces de um frame (ou de N frames) de uma vez.
+
+    Request JSON:
+        {"image": "base64_string"} ou {"images": ["base64", ...]}
+        "auto_checkin": bool (opcional)
+
+    Check-ins automaticos de todas as faces reconhecidas sao feitos
+    numa unica transacao.
+    """
+    from app import db
+    from app.models.booking import Booking
+
+    data = request.get_json()
+    if not data or not (data.get('image') or data.get('images')):
+        return jsonify({
+            'success': False,
+            'error': 'Imagem nao fornecida. Envie {"image": ...} ou {"images": [...]}'
+        }), 400
+
+    images = data.get('images') or [data['image']]
+    if not isinstance(images, list) or len(images) > BATCH_MAX_FRAMES:
+        return jsonify({
+            'success': False,
+            'error': f'Envie no maximo {BATCH_MAX_FRAMES} frames por requisicao'
+        }), 400
+
+    if any(not isinstance(img, str) or len(img) > MAX_IMAGE_BASE64_CHARS for img in images):
+        return jsonify({
+            'success': False,
+            'error': f'Imagem invalida ou muito grande. Maximo: {MAX_IMAGE_MB}MB por frame'
+        }), 400
+
+    started = time.perf_counter()
+    result = face_service.recognize_faces_batch(
+        images,
+        ip_address=request.remote_addr,
+        user_agent=request.headers.get('User-Agent', '')[:200],
+        max_faces=BATCH_MAX_FACES
+    )
+    timings = result['timings']
+
+    # Check-in de todos os reconhecidos numa unica transacao
+    checkins = {}
+    if data.get('auto_checkin', False):
+        t0 = time.perf_counter()
+        recognized_at = datetime.utcnow()
+        try:
+            for face in result['faces']:
+                user_id = face['user_id']
+                if user_id and user_id not in checkins:
+                    checkin = Booking.auto_checkin_by_face(user_id, recognized_at, commit=False)
+                    checkins[user_id] = {
+                        'success': checkin['success'],
+                        'message': checkin['message'],
+                        'booking_id': checkin['booking'].id if checkin['booking'] else None,
+                        'xp_earned': checkin['xp_earned']
+                    }
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            logger.error(f"Erro no check-in em lote: {e}")
+            checkins = {
+                user_id: {'success': False, 'message': f'Erro no check-in: {str(e)}'}
+                for user_id in checkins
+            }
+        else:
+            from app.services.achievement_checker import AchievementChecker
+            AchievementChecker.on_checkin([uid for uid, c in checkins.items() if c['success']])
+        timings['checkin_ms'] = round((time.perf_counter() - t0) * 1000, 2)
+
+    timings['total_ms'] = round((time.perf_counter() - started) * 1000, 2)
+
+    faces = []
+    for face in result['faces']:
+        user = face['user']
+        entry = {
+            'image_index': face['image_index'],
+            'location': face['location'],
+            'recognized': user is not None,
+            'confidence': round(face['confidence'], 1),
+            'timing_ms': face['timing_ms']
+        }
+        if user is not None:
+            entry['user'] = {
+                'id': user.id,
+                'name': user.name,
+                'email': user.email,
+                'role': user.role,
+                'photo_url': user.photo_url
+            }
+            if user.id in checkins:
+                entry['checkin'] = checkins[user.id]
+        faces.append(entry)
+
+    return jsonify({
+        'success': any(f['recognized'] for f in faces),
+        'total_faces': len(faces),
+        'recognized': sum(1 for f in faces if f['recognized']),
+        'faces': faces,
+        'timings': timings
+    }), 200
+
+
 @face_api_bp.route('/status/<int:user_id>', methods=['GET'])
 @login_required
 def face_status(user_id):
@@ -244,12 +380,61 @@ def remove_face():
         return jsonify(result), 400
 
 
+@face_api_bp.route('/gallery/stats', methods=['GET'])
+@login_required
+def gallery_stats():
+    """
+    Estatisticas da galeria facial em memoria (admin only).
+    """
+    if not current_user.is_admin:
+        return jsonify({
+            'success': False,
+            'error': 'Nao autorizado'
+        }), 403
+
+    from app.services.face_gallery import face_gallery
+    return jsonify(face_gallery.get_stats()), 200
+
+
+@face_api_bp.route('/encoder/stats', methods=['GET'])
+@login_required
+def encoder_pool_stats():
+    """
+    Contadores do pool de processos de encoding (admin only).
+    """
+    if not current_user.is_admin:
+        return jsonify({
+            'success': False,
+            'error': 'Nao autorizado'
+        }), 403
+
+    from app.services.face_encoder_pool import face_encoder_pool
+    return jsonify(face_encoder_pool.get_stats()), 200
+
+
+@face_api_bp.route('/logs/stats', methods=['GET'])
+@login_required
+def log_writer_stats():
+    """
+    Contadores do gravador assincrono de logs de reconhecimento (admin only).
+    """
+    if not current_user.is_admin:
+        return jsonify({
+            'success': False,
+            'error': 'Nao autorizado'
+        }), 403
+
+    from app.services.face_log_writer import face_log_writer
+    return jsonify(face_log_writer.get_stats()), 200
+
+
 def _auto_checkin(user_id: int, booking) -> dict:
     """
     Realiza check-in automatico via reconhecimento facial.
     """
     from app import db
     from app.models.booking import BookingStatus
+    from app.models.user import User
 
     try:
         if booking.status != BookingStatus.CONFIRMED:
@@ -264,6 +449,7 @@ def _auto_checkin(user_id: int, booking) -> dict:
 
         # Adicionar XP
         booking.user.xp += 10
+        User.mark_health_score_dirty(booking.user_id)
 
         db.session.commit()
 
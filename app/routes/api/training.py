@@ -351,6 +351,7 @@ def complete_session(session_id):
         )
         db.session.add(ts)
 
+    User.mark_health_score_dirty(current_user.id)
     db.session.commit()
 
     return jsonify({
@@ -266,6 +266,7 @@ def log_ems_session(booking_id):
     # Marcar aula como concluída se já começou
     if booking.status == BookingStatus.CONFIRMED:
         booking.status = BookingStatus.COMPLETED
+        User.mark_health_score_dirty(booking.user_id)
     
     db.session.add(log)
     db.session.commit()
@@ -498,21 +499,26 @@ def face_enrollment(id):
 def enroll_face(id):
     """API para instrutor cadastrar face do aluno"""
     from app.services.face_service import FaceRecognitionService
+    from app.services.face_encoder_pool import EncoderPoolBusy
     
     student = User.query.get_or_404(id)
     data = request.get_json()
     
-    if not data or 'image' not in data:
+    if not data or not (data.get('image') or data.get('images')):
         return jsonify({'success': False, 'error': 'Imagem nao fornecida'}), 400
         
     face_service = FaceRecognitionService(tolerance=0.6)
-    result = face_service.enroll_face(student.id, data['image'])
+    try:
+        result = face_service.enroll_face(student.id, data.get('images') or data['image'])
+    except EncoderPoolBusy as e:
+        return jsonify({'success': False, 'error': str(e)}), 503
     
     if result['success']:
         return jsonify({
             'success': True,
             'message': f'Face de {student.name} cadastrada com sucesso!',
-            'confidence': result['confidence']
+            'confidence': result['confidence'],
+            'sample_count': result['sample_count']
         }), 201
     else:
         return jsonify({'success': False, 'error': result['message']}), 400
@@ -669,8 +675,12 @@ def process_qr_checkin():
         return jsonify({'success': False, 'error': 'Nenhuma aula agendada para este aluno hoje'})
 
     booking.status = BookingStatus.COMPLETED
+    User.mark_health_score_dirty(booking.user_id)
     db.session.commit()
 
+    from app.services.achievement_checker import AchievementChecker
+    AchievementChecker.on_checkin(booking.user_id)
+
     return jsonify({
         'success': True,
         'student_name': student.name,
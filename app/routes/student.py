@@ -6,7 +6,8 @@ from flask import abort
 from app.models import (
     Subscription, Payment, Booking, BookingStatus, SubscriptionStatus,
     PaymentStatusEnum, ClassSchedule, User, RecurringBooking, FrequencyType,
-    ConversionRule, CreditWallet, ScheduleSlotGender, Gender, ScreeningType
+    ConversionRule, CreditWallet, Gender, ScreeningType,
+    UserDailyActivity
 )
 from app.models.crm import StudentHealthScore, AutomationLog
 from app.models.xp_ledger import XPLedger
@@ -548,6 +549,15 @@ def progress():
     """Historico e evolucao do aluno."""
     from app.models.training import TrainingSession
 
+    # Dias com atividade (rollup diario): uma unica consulta para frequencia,
+    # streaks e total de aulas
+    activity = db.session.query(
+        UserDailyActivity.activity_date, UserDailyActivity.completed_count
+    ).filter(
+        UserDailyActivity.user_id == current_user.id,
+        UserDailyActivity.completed_count > 0
+    ).order_by(UserDailyActivity.activity_date.desc()).all()
+
     # Frequencia mensal (ultimos 6 meses)
     monthly_attendance = []
     today = datetime.now().date()
@@ -559,12 +569,7 @@ def progress():
         else:
             month_end = month_start.replace(month=month_start.month + 1, day=1)
 
-        completed = Booking.query.filter(
-            Booking.user_id == current_user.id,
-            Booking.status == BookingStatus.COMPLETED,
-            Booking.date >= month_start,
-            Booking.date < month_end
-        ).count()
+        completed = sum(count for day, count in activity if month_start <= day < month_end)
 
         month_names = ['Jan', 'Fev', 'Mar', 'Abr', 'Mai', 'Jun',
                        'Jul', 'Ago', 'Set', 'Out', 'Nov', 'Dez']
@@ -598,15 +603,10 @@ def progress():
     ).order_by(UserAchievement.unlocked_at.desc()).all()
 
     # Streak atual e maior streak
-    all_completed = Booking.query.filter(
-        Booking.user_id == current_user.id,
-        Booking.status == BookingStatus.COMPLETED
-    ).order_by(Booking.date.desc()).all()
-
     current_streak = 0
     max_streak = 0
-    if all_completed:
-        dates = sorted(set(b.date for b in all_completed), reverse=True)
+    if activity:
+        dates = [day for day, _ in activity]
         current_date = today
         for d in dates:
             diff = (current_date - d).days
@@ -616,7 +616,7 @@ def progress():
             else:
                 break
 
-        dates_asc = sorted(set(b.date for b in all_completed))
+        dates_asc = dates[::-1]
         streak = 1
         for i in range(1, len(dates_asc)):
             if (dates_asc[i] - dates_asc[i-1]).days <= 1:
@@ -626,7 +626,7 @@ def progress():
                 streak = 1
         max_streak = max(max_streak, streak)
 
-    total_classes = len(all_completed)
+    total_classes = sum(count for _, count in activity)
     total_xp = current_user.xp
 
     total_training_sessions = TrainingSession.query.filter(
@@ -978,6 +978,8 @@ def convert_xp(rule_id):
 def api_availability_summary():
     """Retorna o resumo de vagas do mes para pintar o calendario (Heatmap)"""
     from app.models.health import ScreeningStatus
+    from app.services.slot_availability import slot_availability
+
     start_date_str = request.args.get('start_date')
     end_date_str = request.args.get('end_date')
 
@@ -990,59 +992,7 @@ def api_availability_summary():
     except ValueError:
         return jsonify({'error': 'Invalid date format'}), 400
 
-    summary = {}
-    current_date = start_date
-    today = datetime.now().date()
-
-    while current_date <= end_date:
-        # Nao processar datas passadas
-        if current_date < today:
-            current_date += timedelta(days=1)
-            continue
-
-        weekday = current_date.weekday()
-        weekday_db = 0 if weekday == 6 else weekday + 1
-
-        schedules = ClassSchedule.query.filter_by(
-            weekday=weekday_db,
-            is_active=True,
-            is_approved=True
-        ).all()
-
-        total_spots_day = 0
-        total_capacity = 0
-
-        for sched in schedules:
-            current_bookings = Booking.query.filter_by(
-                schedule_id=sched.id,
-                date=current_date,
-                status=BookingStatus.CONFIRMED
-            ).count()
-
-            spots = sched.capacity - current_bookings
-            total_spots_day += max(0, spots)
-            total_capacity += sched.capacity
-
-        date_str = current_date.strftime('%Y-%m-%d')
-
-        if total_capacity == 0:
-            status = 'none'
-        elif total_spots_day == 0:
-            status = 'full'
-        elif total_spots_day <= (total_capacity * 0.2):
-            status = 'few'
-        else:
-            status = 'available'
-
-        if status != 'none':
-            summary[date_str] = {
-                'spots': total_spots_day,
-                'status': status
-            }
-
-        current_date += timedelta(days=1)
-
-    return jsonify(summary)
+    return jsonify(slot_availability.get_summary(start_date, end_date))
 
 
 @student_bp.route('/api/slots')
@@ -1050,6 +1000,7 @@ def api_availability_summary():
 def api_get_slots():
     """Retorna os horarios detalhados para uma data ou intervalo"""
     from app.models.health import ScreeningType, ScreeningStatus
+    from app.services.slot_availability import slot_availability
 
     start_date_str = request.args.get('start_date')
     end_date_str = request.args.get('end_date')
@@ -1063,10 +1014,6 @@ def api_get_slots():
     except ValueError:
         return jsonify({'error': 'Invalid date format'}), 400
 
-    slots_data = []
-    current_date = start_date
-    today = datetime.now().date()
-
     parq_ok = current_user.get_screening_status(ScreeningType.PARQ) == ScreeningStatus.APTO
     ems_ok = current_user.has_valid_screening(ScreeningType.EMS)
 
@@ -1082,88 +1029,10 @@ def api_get_slots():
     if not has_credits:
         has_credits = Booking.query.filter_by(user_id=current_user.id).count() == 0
 
-    while current_date <= end_date:
-        if current_date < today:
-            current_date += timedelta(days=1)
-            continue
-
-        weekday = current_date.weekday()
-        weekday_db = 0 if weekday == 6 else weekday + 1
-
-        schedules = ClassSchedule.query.filter_by(
-            weekday=weekday_db,
-            is_active=True,
-            is_approved=True
-        ).order_by(ClassSchedule.start_time).all()
-
-        day_slots = []
-        for sched in schedules:
-            current_bookings = Booking.query.filter_by(
-                schedule_id=sched.id,
-                date=current_date,
-                status=BookingStatus.CONFIRMED
-            ).count()
-
-            available_spots = sched.capacity - current_bookings
-
-            user_booked = Booking.query.filter_by(
-                user_id=current_user.id,
-                schedule_id=sched.id,
-                date=current_date,
-                status=BookingStatus.CONFIRMED
-            ).first() is not None
-
-            gender_restricted = False
-            gender_message = ""
-            if sched.modality.requires_gender_segregation:
-                can_book, msg = GenderDistributionService.can_user_book_slot(current_user, sched.id, current_date)
-                if not can_book:
-                    gender_restricted = True
-                    gender_message = msg
-
-            requires_ems = (
-                "Eletroestimulacao" in sched.modality.name or
-                "FES" in sched.modality.name or
-                "Eletrolipo" in sched.modality.name
-            )
-
-            # Verificar genero do slot para exibicao
-            slot_gender_val = None
-            if sched.modality.requires_gender_segregation:
-                sg = ScheduleSlotGender.get_slot_gender(sched.id, current_date)
-                if sg:
-                    slot_gender_val = sg.value
-
-            day_slots.append({
-                'id': sched.id,
-                'start_time': sched.start_time.strftime('%H:%M'),
-                'end_time': sched.end_time.strftime('%H:%M'),
-                'modality_name': sched.modality.name,
-                'modality_icon': sched.modality.icon or '',
-                'modality_requires_gender': sched.modality.requires_gender_segregation,
-                'slot_gender': slot_gender_val,
-                'instructor_name': sched.instructor.name,
-                'available_spots': available_spots,
-                'capacity': sched.capacity,
-                'user_booked': user_booked,
-                'gender_restricted': gender_restricted,
-                'gender_message': gender_message,
-                'requires_ems': requires_ems,
-                'ems_ok': ems_ok,
-                'parq_ok': parq_ok,
-                'has_credits': has_credits,
-                'credits_cost': sched.modality.credits_cost
-            })
-
-        if day_slots:
-            slots_data.append({
-                'date': current_date.strftime('%Y-%m-%d'),
-                'date_formatted': current_date.strftime('%d/%m/%Y'),
-                'weekday_name': ['Segunda', 'Terca', 'Quarta', 'Quinta', 'Sexta', 'Sabado', 'Domingo'][current_date.weekday()],
-                'slots': day_slots
-            })
-
-        current_date += timedelta(days=1)
+    slots_data = slot_availability.get_slots(
+        current_user, start_date, end_date,
+        ems_ok=ems_ok, parq_ok=parq_ok, has_credits=has_credits
+    )
 
     return jsonify({'data': slots_data})
 
@@ -122,6 +122,9 @@ def _process_payment_completed(payment, data):
     user = subscription.user
     package = subscription.package
 
+    # Recalcular health score (componente financeiro) no proximo passe incremental
+    User.mark_health_score_dirty(user.id)
+
     if subscription.is_blocked:
         subscription.unblock()
         logger.info(f"Subscription #{subscription.id} desbloqueada")
@@ -149,7 +152,8 @@ def _process_payment_completed(payment, data):
             message=(f"Pagamento confirmado! Você tem *{credits}* créditos "
                      f"até *{validade}*. Bora treinar!"),
             buttons=buttons,
-            user_id=user.id
+            user_id=user.id,
+            idempotency_key=f'payment_completed:{payment.id}'
         )
     except Exception as e:
         logger.error(f"Erro ao enviar WhatsApp de confirmacao: {str(e)}")
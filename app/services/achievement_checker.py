@@ -1,16 +1,42 @@
 # app/services/achievement_checker.py
 
-from app.models import Achievement, UserAchievement, User, Booking, BookingStatus, CriteriaType, ClassSchedule
+from app.models import (
+    Achievement, UserAchievement, User, Booking, BookingStatus, CriteriaType, ClassSchedule,
+    Subscription
+)
 from app import db
-from datetime import datetime, timedelta
+from collections import defaultdict
+from datetime import datetime, time, timedelta
 from sqlalchemy import func
+import logging
+
+logger = logging.getLogger(__name__)
 
 
 class AchievementChecker:
     """
     Verifica e desbloqueia conquistas automaticamente
+
+    A avaliacao e feita por tipo de criterio, para todos os usuarios de uma
+    vez: cada tipo vira uma consulta agrupada (aulas concluidas, aulas por
+    modalidade, aulas matinais, compras, dias do streak) e os limites de
+    cada conquista sao comparados em memoria, pulando as ja desbloqueadas.
+
+    Check-in e ganho de XP disparam on_checkin/on_xp_change, que avaliam
+    apenas o usuario afetado e so os tipos de criterio que o evento pode
+    mudar. A varredura periodica (check_all_users) fica como reconciliacao.
     """
 
+    # Tipos de criterio que cada evento pode alterar
+    CHECKIN_CRITERIA = frozenset({
+        CriteriaType.BOOKINGS_COUNT,
+        CriteriaType.STREAK_DAYS,
+        CriteriaType.SPECIFIC_MODALITY,
+        CriteriaType.EARLY_MORNING,
+        CriteriaType.XP_THRESHOLD,   # check-in tambem rende XP
+    })
+    XP_CRITERIA = frozenset({CriteriaType.XP_THRESHOLD})
+
     @staticmethod
     def check_user_achievements(user_id):
         """
@@ -20,147 +46,219 @@ class AchievementChecker:
         if not user:
             return []
 
-        # Buscar conquistas ativas
-        achievements = Achievement.query.filter_by(is_active=True).all()
-
-        # Conquistas ja desbloqueadas
-        unlocked_ids = [ua.achievement_id for ua in user.unlocked_achievements]
-
-        newly_unlocked = []
-
-        for achievement in achievements:
-            # Pular se ja desbloqueou
-            if achievement.id in unlocked_ids:
-                continue
-
-            # Verificar criterio
-            if AchievementChecker._check_criteria(user, achievement):
-                # Desbloquear!
-                user_achievement = UserAchievement(
-                    user_id=user.id,
-                    achievement_id=achievement.id,
-                    unlocked_at=datetime.utcnow(),
-                    notified=False
-                )
+        pending = AchievementChecker.evaluate(users=[(user.id, user.xp)])
+        return AchievementChecker._apply(pending).get(user.id, [])
 
-                db.session.add(user_achievement)
-
-                # Adicionar XP
-                user.xp += achievement.xp_reward
-
-                newly_unlocked.append(achievement)
+    @staticmethod
+    def check_all_users():
+        """
+        Verifica conquistas para todos os usuarios (rodar periodicamente)
+        """
+        pending = AchievementChecker.evaluate()
+        return sum(len(unlocked) for unlocked in AchievementChecker._apply(pending).values())
 
-        db.session.commit()
+    # =========================================================================
+    # Eventos
+    # =========================================================================
 
-        # Enviar notificacoes WhatsApp
-        AchievementChecker._notify_achievements(user, newly_unlocked)
+    @staticmethod
+    def on_checkin(user_ids):
+        """Check-in concluido (ja commitado) para um ou mais usuarios."""
+        if isinstance(user_ids, int):
+            user_ids = [user_ids]
+        AchievementChecker._handle_event(user_ids, AchievementChecker.CHECKIN_CRITERIA)
 
-        return newly_unlocked
+    @staticmethod
+    def on_xp_change(user_id):
+        """XP do usuario mudou (ja commitado)."""
+        AchievementChecker._handle_event([user_id], AchievementChecker.XP_CRITERIA)
 
     @staticmethod
-    def _notify_achievements(user, achievements):
+    def _handle_event(user_ids, criteria_types):
         """
-        Envia notificacoes WhatsApp para conquistas desbloqueadas
+        Avalia so os usuarios e tipos afetados. Nunca propaga erro: a
+        varredura periodica recupera o que ficar para tras.
         """
-        if not achievements:
+        from flask import current_app
+
+        if not user_ids or not current_app.config.get('ACHIEVEMENT_EVENTS_ENABLED', True):
+            return
+        # Nenhuma conquista ativa desses tipos: nada a consultar
+        index = Achievement.get_active_by_type()
+        if not any(index.get(criteria_type) for criteria_type in criteria_types):
             return
 
         try:
-            from app.services.megaapi import megaapi
+            users = db.session.query(User.id, User.xp).filter(
+                User.id.in_(list(user_ids))
+            ).order_by(User.id).all()
+            pending = AchievementChecker.evaluate(users=users, criteria_types=criteria_types)
+            AchievementChecker._apply(pending)
+        except Exception as e:
+            db.session.rollback()
+            logger.error(f"Erro ao avaliar conquistas (usuarios {list(user_ids)}): {e}")
+
+    # =========================================================================
+    # Avaliacao em lote
+    # =========================================================================
 
-            for achievement in achievements:
-                try:
-                    megaapi.send_template_message(
-                        phone=user.phone,
-                        template_name='conquista_desbloqueada',
-                        variables=[
-                            user.name.split()[0],
-                            achievement.icon_url or '',
-                            achievement.name,
-                            str(achievement.xp_reward),
-                            'Academia Fitness'
-                        ],
-                        user_id=user.id
-                    )
+    @staticmethod
+    def evaluate(users=None, today=None, criteria_types=None):
+        """
+        Conquistas que cada usuario passou a atender (sem gravar nada).
 
-                    # Marcar como notificado
-                    ua = UserAchievement.query.filter_by(
-                        user_id=user.id,
-                        achievement_id=achievement.id
-                    ).first()
-                    if ua:
-                        ua.notified = True
+        Args:
+            users: Lista de (user_id, xp); None = alunos ativos
+            today: Referencia do streak (padrao: hoje)
+            criteria_types: Restringe a esses tipos de criterio (None = todos)
 
-                except Exception as e:
-                    print(f"Erro ao notificar conquista: {e}")
+        Returns:
+            {user_id: [CachedAchievement, ...]} apenas para quem desbloqueou
+            algo, na ordem de avaliacao (id da conquista)
+        """
+        index = Achievement.get_active_by_type()
+        if criteria_types is not None:
+            index = {t: items for t, items in index.items() if t in criteria_types}
+        achievements = sorted((a for items in index.values() for a in items), key=lambda a: a.id)
+        if not achievements:
+            return {}
 
-            db.session.commit()
+        if users is None:
+            users = db.session.query(User.id, User.xp).filter_by(
+                role='student', is_active=True
+            ).order_by(User.id).all()
+            filter_ids = None
+        else:
+            # Usuarios explicitos (eventos): consultas filtradas por eles
+            filter_ids = [uid for uid, _ in users]
+        if not users:
+            return {}
+
+        facts = AchievementChecker._collect_facts(index, filter_ids, today)
+
+        # Anti-join: pares (usuario, conquista) ja desbloqueados
+        unlocked = defaultdict(set)
+        query = db.session.query(UserAchievement.user_id, UserAchievement.achievement_id).filter(
+            UserAchievement.achievement_id.in_([a.id for a in achievements])
+        )
+        if filter_ids is not None:
+            query = query.filter(UserAchievement.user_id.in_(filter_ids))
+        for uid, achievement_id in query:
+            unlocked[uid].add(achievement_id)
+
+        pending = {}
+        for uid, xp in users:
+            xp = xp or 0
+            already = unlocked.get(uid, ())
+            gained = []
+            for achievement in achievements:
+                if achievement.id in already:
+                    continue
+                if AchievementChecker._meets(achievement, uid, xp, facts):
+                    gained.append(achievement)
+                    # XP da conquista ja conta para as proximas (XP_THRESHOLD)
+                    xp += achievement.xp_reward
+            if gained:
+                pending[uid] = gained
 
-        except ImportError:
-            # MegaAPI nao configurado
-            pass
+        return pending
 
     @staticmethod
-    def _check_criteria(user, achievement):
+    def _collect_facts(by_type, user_ids=None, today=None):
         """
-        Verifica se usuario atende criterio da conquista
+        Uma consulta agrupada por tipo de criterio presente em `by_type`
+        ({CriteriaType: [CachedAchievement]}).
+
+        HAVING usa o menor limite do tipo: quem fica de fora nao atinge
+        nenhuma conquista daquele tipo.
         """
+        def min_value(criteria_type):
+            return min(a.criteria_value for a in by_type[criteria_type])
+
+        def grouped(query, user_column, *extra_group):
+            if user_ids is not None:
+                query = query.filter(user_column.in_(user_ids))
+            return query.group_by(user_column, *extra_group)
+
+        facts = {}
+        count = func.count(Booking.id)
+
+        if CriteriaType.BOOKINGS_COUNT in by_type:
+            facts['completed'] = dict(grouped(
+                db.session.query(Booking.user_id, count).filter(
+                    Booking.status == BookingStatus.COMPLETED
+                ), Booking.user_id
+            ).having(count >= min_value(CriteriaType.BOOKINGS_COUNT)))
+
+        if CriteriaType.SPECIFIC_MODALITY in by_type:
+            modality_ids = {a.modality_id for a in by_type[CriteriaType.SPECIFIC_MODALITY]} - {None}
+            facts['modality'] = {}
+            if modality_ids:
+                rows = grouped(
+                    db.session.query(Booking.user_id, ClassSchedule.modality_id, count).join(
+                        ClassSchedule, Booking.schedule_id == ClassSchedule.id
+                    ).filter(
+                        Booking.status == BookingStatus.COMPLETED,
+                        ClassSchedule.modality_id.in_(modality_ids)
+                    ), Booking.user_id, ClassSchedule.modality_id
+                )
+                facts['modality'] = {(uid, mid): total for uid, mid, total in rows}
+
+        if CriteriaType.EARLY_MORNING in by_type:
+            facts['early'] = dict(grouped(
+                db.session.query(Booking.user_id, count).join(
+                    ClassSchedule, Booking.schedule_id == ClassSchedule.id
+                ).filter(
+                    Booking.status == BookingStatus.COMPLETED,
+                    ClassSchedule.start_time < time(7, 0)
+                ), Booking.user_id
+            ).having(count >= min_value(CriteriaType.EARLY_MORNING)))
+
+        if CriteriaType.PURCHASE_COUNT in by_type:
+            purchases = func.count(Subscription.id)
+            facts['purchases'] = dict(grouped(
+                db.session.query(Subscription.user_id, purchases), Subscription.user_id
+            ).having(purchases >= min_value(CriteriaType.PURCHASE_COUNT)))
+
+        if CriteriaType.STREAK_DAYS in by_type:
+            facts['streak'] = AchievementChecker._streaks(
+                max(a.criteria_value for a in by_type[CriteriaType.STREAK_DAYS]), user_ids, today
+            )
+
+        return facts
+
+    @staticmethod
+    def _meets(achievement, user_id, xp, facts):
+        """Compara o criterio da conquista com os agregados ja carregados."""
         criteria_type = achievement.criteria_type
-        criteria_value = achievement.criteria_value
-        criteria_extra = achievement.criteria_extra or {}
+        value = achievement.criteria_value
 
         # BOOKINGS_COUNT - X aulas completadas
         if criteria_type == CriteriaType.BOOKINGS_COUNT:
-            count = Booking.query.filter_by(
-                user_id=user.id,
-                status=BookingStatus.COMPLETED
-            ).count()
-            return count >= criteria_value
+            return facts['completed'].get(user_id, 0) >= value
 
         # STREAK_DAYS - X dias consecutivos
         elif criteria_type == CriteriaType.STREAK_DAYS:
-            current_streak = AchievementChecker._calculate_streak(user)
-            return current_streak >= criteria_value
+            return facts['streak'].get(user_id, 0) >= value
 
         # XP_THRESHOLD - Atingir X XP
         elif criteria_type == CriteriaType.XP_THRESHOLD:
-            return user.xp >= criteria_value
+            return xp >= value
 
         # SPECIFIC_MODALITY - X aulas de uma modalidade
         elif criteria_type == CriteriaType.SPECIFIC_MODALITY:
-            modality_id = criteria_extra.get('modality_id')
+            modality_id = achievement.modality_id
             if not modality_id:
                 return False
-
-            count = db.session.query(func.count(Booking.id)).join(
-                ClassSchedule, Booking.schedule_id == ClassSchedule.id
-            ).filter(
-                Booking.user_id == user.id,
-                Booking.status == BookingStatus.COMPLETED,
-                ClassSchedule.modality_id == modality_id
-            ).scalar()
-
-            return count >= criteria_value
+            return facts['modality'].get((user_id, modality_id), 0) >= value
 
         # EARLY_MORNING - X aulas antes das 7h
         elif criteria_type == CriteriaType.EARLY_MORNING:
-            from datetime import time
-
-            count = db.session.query(func.count(Booking.id)).join(
-                ClassSchedule, Booking.schedule_id == ClassSchedule.id
-            ).filter(
-                Booking.user_id == user.id,
-                Booking.status == BookingStatus.COMPLETED,
-                ClassSchedule.start_time < time(7, 0)
-            ).scalar()
-
-            return count >= criteria_value
+            return facts['early'].get(user_id, 0) >= value
 
         # PURCHASE_COUNT - X compras realizadas
         elif criteria_type == CriteriaType.PURCHASE_COUNT:
-            from app.models import Subscription
-            count = Subscription.query.filter_by(user_id=user.id).count()
-            return count >= criteria_value
+            return facts['purchases'].get(user_id, 0) >= value
 
         # REFERRAL_COUNT - Indicar X amigos
         elif criteria_type == CriteriaType.REFERRAL_COUNT:
@@ -175,25 +273,37 @@ class AchievementChecker:
         return False
 
     @staticmethod
-    def _calculate_streak(user):
+    def _streaks(max_days, user_ids=None, today=None):
         """
-        Calcula streak de dias consecutivos com aula
+        Streak de dias consecutivos com aula, por usuario.
+
+        So os ultimos `max_days` dias importam para a maior conquista de
+        streak, entao a consulta fica limitada a essa janela (o valor e
+        truncado nela).
         """
-        # Buscar datas unicas com aula completada
-        dates = db.session.query(Booking.date).filter_by(
-            user_id=user.id,
-            status=BookingStatus.COMPLETED
-        ).distinct().order_by(Booking.date.desc()).all()
+        today = today or datetime.now().date()
+        query = db.session.query(Booking.user_id, Booking.date).filter(
+            Booking.status == BookingStatus.COMPLETED,
+            Booking.date >= today - timedelta(days=max(max_days, 1))
+        )
+        if user_ids is not None:
+            query = query.filter(Booking.user_id.in_(user_ids))
+
+        dates_by_user = defaultdict(set)
+        for uid, day in query.distinct():
+            dates_by_user[uid].add(day)
+
+        return {
+            uid: AchievementChecker._streak_from_dates(sorted(dates, reverse=True), today)
+            for uid, dates in dates_by_user.items()
+        }
 
+    @staticmethod
+    def _streak_from_dates(dates, today):
+        """Dias consecutivos a partir de hoje ou ontem (datas em ordem decrescente)."""
         if not dates:
             return 0
 
-        dates = [d[0] for d in dates]
-
-        # Verificar sequencia de dias consecutivos
-        streak = 0
-        today = datetime.now().date()
-
         # Comecar de hoje ou ontem
         if dates[0] == today:
             streak = 1
@@ -213,22 +323,176 @@ class AchievementChecker:
 
         return streak
 
+    # =========================================================================
+    # Gravacao
+    # =========================================================================
+
+    # Linhas por INSERT ... ON CONFLICT (limite de parametros do SQLite)
+    UNLOCK_CHUNK = 500
+
     @staticmethod
-    def check_all_users():
+    def _insert_unlocks(rows):
         """
-        Verifica conquistas para todos os usuarios (rodar periodicamente)
+        Insere os desbloqueios ignorando os que ja existem (unique em
+        user_id + achievement_id): uma avaliacao do check-in e a varredura
+        de outro worker podem chegar ao mesmo desbloqueio ao mesmo tempo.
+
+        Returns:
+            Conjunto de (user_id, achievement_id) realmente inseridos
+        """
+        from sqlalchemy.exc import IntegrityError
+
+        table = UserAchievement.__table__
+        dialect = db.session.get_bind().dialect.name
+        inserted = set()
+
+        if dialect in ('postgresql', 'sqlite'):
+            if dialect == 'postgresql':
+                from sqlalchemy.dialects.postgresql import insert
+            else:
+                from sqlalchemy.dialects.sqlite import insert
+            for i in range(0, len(rows), AchievementChecker.UNLOCK_CHUNK):
+                stmt = insert(table).values(rows[i:i + AchievementChecker.UNLOCK_CHUNK])
+                stmt = stmt.on_conflict_do_nothing(
+                    index_elements=['user_id', 'achievement_id']
+                ).returning(table.c.user_id, table.c.achievement_id)
+                inserted.update(tuple(row) for row in db.session.execute(stmt))
+            return inserted
+
+        # Outros bancos: um SAVEPOINT por linha
+        for row in rows:
+            try:
+                with db.session.begin_nested():
+                    db.session.execute(table.insert().values(**row))
+                inserted.add((row['user_id'], row['achievement_id']))
+            except IntegrityError:
+                pass
+        return inserted
+
+    @staticmethod
+    def _unlock(pending):
+        """
+        Insere os desbloqueios e o XP das recompensas (um commit).
+
+        XP e notificacao valem apenas para as linhas inseridas por esta
+        chamada; desbloqueios ja gravados por outra avaliacao sao ignorados.
+
+        Returns:
+            {user_id: [conquistas desbloqueadas agora]}
+        """
+        if not pending:
+            return {}
+
+        now = datetime.utcnow()
+        rows = [
+            {
+                'user_id': uid,
+                'achievement_id': achievement.id,
+                'unlocked_at': now,
+                'notified': False,
+            }
+            for uid, achievements in pending.items()
+            for achievement in achievements
+        ]
+
+        try:
+            inserted = AchievementChecker._insert_unlocks(rows)
+
+            unlocked = {}
+            xp_by_amount = defaultdict(list)
+            for uid, achievements in pending.items():
+                new = [a for a in achievements if (uid, a.id) in inserted]
+                if not new:
+                    continue
+                unlocked[uid] = new
+                reward = sum(a.xp_reward or 0 for a in new)
+                if reward:
+                    xp_by_amount[reward].append(uid)
+
+            # Um UPDATE por valor de recompensa (usuarios com o mesmo ganho juntos)
+            for reward, uids in xp_by_amount.items():
+                User.query.filter(User.id.in_(uids)).update(
+                    {User.xp: func.coalesce(User.xp, 0) + reward}, synchronize_session=False
+                )
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+
+        return unlocked
+
+    @staticmethod
+    def _apply(pending):
         """
-        users = User.query.filter_by(role='student', is_active=True).all()
+        Grava os desbloqueios e notifica cada usuario.
 
-        total_unlocked = 0
-        for user in users:
+        Returns:
+            {user_id: [Achievement, ...]} (objetos do banco, para notificar/exibir)
+        """
+        if not pending:
+            return {}
+
+        pending = AchievementChecker._unlock(pending)
+        if not pending:
+            return {}
+
+        ids = {a.id for unlocked in pending.values() for a in unlocked}
+        by_id = {a.id: a for a in Achievement.query.filter(Achievement.id.in_(ids))}
+        result = {
+            uid: [by_id[a.id] for a in unlocked if a.id in by_id]
+            for uid, unlocked in pending.items()
+        }
+
+        for user in User.query.filter(User.id.in_(list(result))).all():
             try:
-                newly_unlocked = AchievementChecker.check_user_achievements(user.id)
-                total_unlocked += len(newly_unlocked)
+                AchievementChecker._notify_achievements(user, result[user.id])
             except Exception as e:
-                print(f"Erro ao verificar conquistas do usuario {user.id}: {e}")
+                logger.exception(f"Erro ao notificar conquistas do usuario {user.id}: {e}")
+
+        return result
+
+    @staticmethod
+    def _notify_achievements(user, achievements):
+        """
+        Envia notificacoes WhatsApp para conquistas desbloqueadas
+        """
+        if not achievements:
+            return
 
-        return total_unlocked
+        try:
+            from app.services.megaapi import megaapi
+
+            for achievement in achievements:
+                try:
+                    megaapi.send_template_message(
+                        phone=user.phone,
+                        template_name='conquista_desbloqueada',
+                        variables=[
+                            user.name.split()[0],
+                            achievement.icon_url or '',
+                            achievement.name,
+                            str(achievement.xp_reward),
+                            'Academia Fitness'
+                        ],
+                        user_id=user.id
+                    )
+
+                    # Marcar como notificado
+                    ua = UserAchievement.query.filter_by(
+                        user_id=user.id,
+                        achievement_id=achievement.id
+                    ).first()
+                    if ua:
+                        ua.notified = True
+
+                except Exception as e:
+                    print(f"Erro ao notificar conquista: {e}")
+
+            db.session.commit()
+
+        except ImportError:
+            # MegaAPI nao configurado
+            pass
 
 
 # Singleton
@@ -0,0 +1,457 @@
+# app/services/availability_cache.py
+"""
+Cache de reservas confirmadas por (schedule_id, date).
+
+O calendario do aluno e consultado o tempo todo (principalmente quando
+abre uma turma concorrida) e cada chamada de /student/api/slots recontava
+as mesmas vagas para todos os alunos. Aqui as contagens ficam num backend
+compartilhado:
+
+- leitura: SlotAvailabilityService pede as chaves do intervalo; as que
+  faltam sao carregadas com uma consulta agrupada e gravadas no cache
+- escrita: listeners de sessao acompanham toda mudanca de Booking
+  (book_class, cancel_booking, RecurringBooking.create_next_booking,
+  bulk_cancel do instrutor, mark_no_shows do scheduler...) e aplicam
+  +1/-1 nas chaves existentes somente depois do COMMIT (rollback descarta)
+- versao por chave: toda escrita incrementa a versao da chave, mesmo sem
+  contagem em cache. A carga le as versoes antes da consulta e so grava as
+  chaves cuja versao nao mudou; uma reserva confirmada entre a consulta e
+  a gravacao nao deixa a contagem anterior presa no cache ate o TTL
+- reconciliacao: job periodico recarrega a janela dos proximos dias e
+  corrige o que tiver divergido (ex: escrita fora do ORM)
+
+Backends: 'redis' (qualquer servidor compativel, compartilhado entre
+workers) ou 'memory' (por processo: reservas feitas em outro worker
+gunicorn nao chegam ao cache deste, so serve com um unico worker). 'none'
+(padrao sem AVAILABILITY_CACHE_URL) desliga o cache.
+
+O cache serve apenas para exibicao: a validacao da reserva continua
+contando no banco, com lock no horario.
+"""
+
+import logging
+import threading
+import time
+from collections import Counter
+from datetime import date, datetime, timedelta
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session
+
+from app.models.booking import Booking, BookingStatus
+
+try:
+    import redis
+except ImportError:
+    redis = None
+
+logger = logging.getLogger(__name__)
+
+Key = Tuple[int, date]
+
+_DELTAS_KEY = 'availability_deltas'
+
+
+# =============================================================================
+# Backends
+# =============================================================================
+
+class MemoryBackend:
+    """Dicionario em processo com expiracao por entrada."""
+
+    name = 'memory'
+
+    def __init__(self):
+        self._entries = {}
+        self._versions = {}
+        self._lock = threading.Lock()
+
+    def get_many(self, keys: Iterable[Key]) -> Dict[Key, int]:
+        now = time.monotonic()
+        found = {}
+        for key in keys:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] > now:
+                found[key] = entry[1]
+        return found
+
+    def versions(self, keys: Iterable[Key]) -> Dict[Key, int]:
+        now = time.monotonic()
+        with self._lock:
+            found = {}
+            for key in keys:
+                entry = self._versions.get(key)
+                found[key] = entry[1] if entry is not None and entry[0] > now else 0
+            return found
+
+    def set_many(self, values: Dict[Key, int], ttl: int,
+                 versions: Optional[Dict[Key, int]] = None) -> int:
+        """Grava as contagens; com `versions`, so as chaves cuja versao nao mudou."""
+        now = time.monotonic()
+        expires = now + ttl
+        written = 0
+        with self._lock:
+            for key, value in values.items():
+                if versions is not None:
+                    entry = self._versions.get(key)
+                    current = entry[1] if entry is not None and entry[0] > now else 0
+                    if current != versions.get(key, 0):
+                        continue
+                self._entries[key] = (expires, value)
+                written += 1
+        return written
+
+    def incr_many(self, deltas: Dict[Key, int], ttl: int):
+        """
+        Soma o delta apenas em chaves presentes (as ausentes serao carregadas
+        do banco) e incrementa a versao de todas.
+        """
+        now = time.monotonic()
+        with self._lock:
+            for key, delta in deltas.items():
+                entry = self._entries.get(key)
+                if entry is not None and entry[0] > now:
+                    self._entries[key] = (entry[0], entry[1] + delta)
+                version = self._versions.get(key)
+                current = version[1] if version is not None and version[0] > now else 0
+                self._versions[key] = (now + ttl, current + 1)
+            if len(self._versions) > 2 * len(self._entries) + 1000:
+                self._versions = {k: v for k, v in self._versions.items() if v[0] > now}
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._versions.clear()
+
+    def size(self) -> int:
+        return len(self._entries)
+
+
+class RedisBackend:
+    """Redis (ou compativel) compartilhado entre workers."""
+
+    name = 'redis'
+
+    # INCRBY somente se a chave existir, para nao criar contagem parcial;
+    # a versao (KEYS[2]) e incrementada sempre
+    _INCR_IF_EXISTS = (
+        "redis.call('incr', KEYS[2]) "
+        "redis.call('expire', KEYS[2], ARGV[2]) "
+        "if redis.call('exists', KEYS[1]) == 1 then "
+        "return redis.call('incrby', KEYS[1], ARGV[1]) end "
+        "return nil"
+    )
+
+    # SET somente se a versao ainda for a lida antes da consulta ao banco
+    _SET_IF_VERSION = (
+        "local version = redis.call('get', KEYS[2]) or '0' "
+        "if version == ARGV[2] then "
+        "redis.call('set', KEYS[1], ARGV[1], 'EX', ARGV[3]) return 1 end "
+        "return 0"
+    )
+
+    def __init__(self, url: str, prefix: str = 'avail'):
+        if redis is None:
+            raise RuntimeError("Pacote 'redis' nao instalado")
+        self.prefix = prefix
+        self.client = redis.Redis.from_url(url, socket_timeout=0.5, socket_connect_timeout=0.5)
+        self._incr = self.client.register_script(self._INCR_IF_EXISTS)
+        self._set_if_version = self.client.register_script(self._SET_IF_VERSION)
+
+    def _key(self, key: Key) -> str:
+        schedule_id, day = key
+        return f"{self.prefix}:{schedule_id}:{day.isoformat()}"
+
+    def _version_key(self, key: Key) -> str:
+        schedule_id, day = key
+        return f"{self.prefix}:v:{schedule_id}:{day.isoformat()}"
+
+    def get_many(self, keys: Iterable[Key]) -> Dict[Key, int]:
+        keys = list(keys)
+        if not keys:
+            return {}
+        values = self.client.mget([self._key(k) for k in keys])
+        return {k: int(v) for k, v in zip(keys, values) if v is not None}
+
+    def versions(self, keys: Iterable[Key]) -> Dict[Key, int]:
+        keys = list(keys)
+        if not keys:
+            return {}
+        values = self.client.mget([self._version_key(k) for k in keys])
+        return {k: int(v) if v is not None else 0 for k, v in zip(keys, values)}
+
+    def set_many(self, values: Dict[Key, int], ttl: int,
+                 versions: Optional[Dict[Key, int]] = None) -> int:
+        pipe = self.client.pipeline(transaction=False)
+        for key, value in values.items():
+            if versions is None:
+                pipe.set(self._key(key), value, ex=ttl)
+            else:
+                self._set_if_version(keys=[self._key(key), self._version_key(key)],
+                                     args=[value, versions.get(key, 0), ttl], client=pipe)
+        return sum(1 for written in pipe.execute() if written)
+
+    def incr_many(self, deltas: Dict[Key, int], ttl: int):
+        pipe = self.client.pipeline(transaction=False)
+        for key, delta in deltas.items():
+            self._incr(keys=[self._key(key), self._version_key(key)], args=[delta, ttl], client=pipe)
+        pipe.execute()
+
+    def clear(self):
+        keys = list(self.client.scan_iter(match=f"{self.prefix}:*", count=1000))
+        for i in range(0, len(keys), 1000):
+            self.client.delete(*keys[i:i + 1000])
+
+    def size(self) -> int:
+        versions = f"{self.prefix}:v:"
+        return sum(1 for key in self.client.scan_iter(match=f"{self.prefix}:*", count=1000)
+                   if not key.decode().startswith(versions))
+
+
+# =============================================================================
+# Cache
+# =============================================================================
+
+class AvailabilityCache:
+    """Contagens de reservas confirmadas por horario/dia com write-through."""
+
+    def __init__(self):
+        self.backend = None
+        self.ttl = 300
+        self._lock = threading.Lock()
+        self._stats = {
+            'hits': 0,
+            'misses': 0,
+            'writes': 0,
+            'errors': 0,
+            'reconciled': 0,
+            'drift': 0,
+            'stale_fills': 0,
+        }
+
+    def init_app(self, app):
+        """Escolhe o backend conforme AVAILABILITY_CACHE_BACKEND."""
+        config = app.config
+        self.ttl = config.get('AVAILABILITY_CACHE_TTL', 300)
+        kind = (config.get('AVAILABILITY_CACHE_BACKEND') or 'none').lower()
+
+        if kind == 'redis':
+            try:
+                self.backend = RedisBackend(config.get('AVAILABILITY_CACHE_URL', 'redis://localhost:6379/0'))
+            except Exception as e:
+                # Memoria por processo divergiria entre workers: melhor sem cache
+                logger.warning(f"Cache de vagas: Redis indisponivel ({e}), cache desligado")
+                self.backend = None
+        elif kind == 'memory':
+            self.backend = MemoryBackend()
+        else:
+            self.backend = None
+
+    @property
+    def enabled(self) -> bool:
+        return self.backend is not None and self.ttl > 0
+
+    def _count(self, key: str, amount: int = 1):
+        with self._lock:
+            self._stats[key] += amount
+
+    # =========================================================================
+    # Leitura
+    # =========================================================================
+
+    def get_counts(self, keys: List[Key],
+                   loader: Callable[[date, date], Dict[Key, int]]) -> Dict[Key, int]:
+        """
+        Contagens para as chaves pedidas.
+
+        `loader(start, end)` faz a consulta agrupada no banco; e chamado
+        uma vez, so para o intervalo das chaves ausentes.
+        """
+        if not keys:
+            return {}
+        if not self.enabled:
+            return loader(min(k[1] for k in keys), max(k[1] for k in keys))
+
+        try:
+            counts = self.backend.get_many(keys)
+        except Exception as e:
+            self._count('errors')
+            logger.warning(f"Cache de vagas: falha na leitura ({e})")
+            return loader(min(k[1] for k in keys), max(k[1] for k in keys))
+
+        missing = [k for k in keys if k not in counts]
+        self._count('hits', len(keys) - len(missing))
+        if missing:
+            self._count('misses', len(missing))
+            try:
+                versions = self.backend.versions(missing)
+            except Exception as e:
+                self._count('errors')
+                logger.warning(f"Cache de vagas: falha na leitura ({e})")
+                versions = None
+
+            loaded = loader(min(k[1] for k in missing), max(k[1] for k in missing))
+            fresh = {k: loaded.get(k, 0) for k in missing}
+            counts.update(fresh)
+            if versions is not None:
+                try:
+                    # Chave alterada durante a consulta: nao grava (a proxima leitura recarrega)
+                    written = self.backend.set_many(fresh, self.ttl, versions)
+                    self._count('stale_fills', len(fresh) - written)
+                except Exception as e:
+                    self._count('errors')
+                    logger.warning(f"Cache de vagas: falha ao gravar ({e})")
+
+        return counts
+
+    # =========================================================================
+    # Escrita
+    # =========================================================================
+
+    def apply(self, deltas: Dict[Key, int]):
+        """Aplica deltas de reservas confirmadas (chamado apos o commit)."""
+        deltas = {k: v for k, v in deltas.items() if v}
+        if not deltas or not self.enabled:
+            return
+        try:
+            self.backend.incr_many(deltas, self.ttl)
+            self._count('writes', len(deltas))
+        except Exception as e:
+            # Fica divergente ate expirar ou ate a proxima reconciliacao
+            self._count('errors')
+            logger.warning(f"Cache de vagas: falha no write-through ({e})")
+
+    def clear(self):
+        if self.backend is not None:
+            self.backend.clear()
+
+    def reconcile(self, days: int = 30, today: Optional[date] = None) -> Dict:
+        """
+        Recarrega do banco a janela [hoje, hoje + days) dos horarios ativos.
+
+        Returns:
+            dict com chaves verificadas e quantas estavam divergentes
+        """
+        from app.services.slot_availability import slot_availability, weekday_db
+
+        if not self.enabled:
+            return {'keys': 0, 'drift': 0}
+
+        today = today or datetime.now().date()
+        schedules = slot_availability.load_schedules(with_relations=False)
+        keys = []
+        for offset in range(days):
+            day = today + timedelta(days=offset)
+            keys.extend((sched.id, day) for sched in schedules.get(weekday_db(day), ()))
+        if not keys:
+            return {'keys': 0, 'drift': 0}
+
+        versions = self.backend.versions(keys)
+        loaded = slot_availability.booking_counts(today, today + timedelta(days=days - 1))
+        fresh = {k: loaded.get(k, 0) for k in keys}
+        cached = self.backend.get_many(keys)
+        drift = sum(1 for k, v in cached.items() if fresh[k] != v)
+
+        self.backend.set_many(fresh, self.ttl, versions)
+        self._count('reconciled', len(keys))
+        self._count('drift', drift)
+        if drift:
+            logger.warning(f"Cache de vagas: {drift} contagens divergentes corrigidas")
+        return {'keys': len(keys), 'drift': drift}
+
+    # =========================================================================
+    # Estatisticas
+    # =========================================================================
+
+    def get_stats(self) -> Dict:
+        with self._lock:
+            stats = dict(self._stats)
+        lookups = stats['hits'] + stats['misses']
+        stats['hit_rate'] = round(stats['hits'] / lookups, 4) if lookups else 0.0
+        stats['backend'] = self.backend.name if self.backend is not None else 'none'
+        try:
+            stats['entries'] = self.backend.size() if self.backend is not None else 0
+        except Exception:
+            stats['entries'] = None
+        return stats
+
+
+# Singleton
+availability_cache = AvailabilityCache()
+
+
+# =============================================================================
+# Write-through: deltas de Booking aplicados apos o commit
+# =============================================================================
+
+_TRACKED = ('schedule_id', 'date', 'status')
+
+
+@event.listens_for(Booking.schedule_id, 'set', active_history=True)
+@event.listens_for(Booking.date, 'set', active_history=True)
+@event.listens_for(Booking.status, 'set', active_history=True)
+def _load_previous_value(target, value, oldvalue, initiator):
+    """Forca o carregamento do valor anterior (necessario para o delta)."""
+    return value
+
+
+def _slot_state(booking, previous: bool):
+    """(schedule_id, date, status) atual ou anterior ao flush."""
+    state = inspect(booking)
+    values = []
+    for attr in _TRACKED:
+        history = state.attrs[attr].history
+        if previous:
+            value = (history.deleted or history.unchanged or [None])[0]
+        else:
+            value = (history.added or history.unchanged or [None])[0]
+        values.append(value)
+    return tuple(values)
+
+
+@event.listens_for(Session, 'before_flush')
+def _collect_availability_deltas(session, flush_context, instances):
+    """Acumula na sessao o delta de reservas confirmadas por horario/dia."""
+    if not availability_cache.enabled:
+        return
+
+    deltas = Counter()
+
+    def track(state, sign):
+        schedule_id, day, status = state
+        if status == BookingStatus.CONFIRMED and schedule_id is not None and day is not None:
+            deltas[(schedule_id, day)] += sign
+
+    for obj in session.new:
+        if isinstance(obj, Booking):
+            schedule_id, day, status = _slot_state(obj, previous=False)
+            # Sem status explicito vale o default da coluna (CONFIRMED)
+            track((schedule_id, day, status or BookingStatus.CONFIRMED), +1)
+
+    for obj in session.dirty:
+        if isinstance(obj, Booking) and session.is_modified(obj):
+            before = _slot_state(obj, previous=True)
+            after = _slot_state(obj, previous=False)
+            if before != after:
+                track(before, -1)
+                track(after, +1)
+
+    for obj in session.deleted:
+        if isinstance(obj, Booking):
+            track(_slot_state(obj, previous=True), -1)
+
+    if deltas:
+        session.info.setdefault(_DELTAS_KEY, Counter()).update(deltas)
+
+
+@event.listens_for(Session, 'after_commit')
+def _apply_availability_deltas(session):
+    deltas = session.info.pop(_DELTAS_KEY, None)
+    if deltas:
+        availability_cache.apply(deltas)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_availability_deltas(session):
+    session.info.pop(_DELTAS_KEY, None)
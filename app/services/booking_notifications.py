@@ -11,16 +11,20 @@ from app.models.notification import Notification, NotificationType
 logger = logging.getLogger(__name__)
 
 
-def _send_whatsapp(booking, message: str) -> bool:
-    """Dispara mensagem WhatsApp se o usuário tiver telefone configurado."""
+def _send_whatsapp(booking, message: str, event: str) -> bool:
+    """
+    Enfileira mensagem WhatsApp se o usuário tiver telefone configurado.
+    `event` compõe a chave de idempotência (um envio por evento/booking).
+    """
     try:
         if not booking.user or not booking.user.phone:
             return False
         from app.services.megaapi import megaapi
-        megaapi.send_message(
+        megaapi.send_custom_message(
             phone=booking.user.phone,
             message=message,
             user_id=booking.user_id,
+            idempotency_key=f'booking_{event}:{booking.id}',
         )
         return True
     except Exception as e:
@@ -57,7 +61,7 @@ def notify_booking_confirmed(booking) -> None:
             f"📅 {date_fmt} às {time_fmt}\n"
             f"🏋️ {modality}\n\n"
             f"Para cancelar acesse o app."
-        ))
+        ), 'confirmed')
     except Exception as e:
         logger.error(f"[booking_notifications] notify_booking_confirmed erro: {e}")
 
@@ -99,7 +103,7 @@ def notify_booking_cancelled(booking, cancelled_by: str = 'client') -> None:
         )
         db.session.commit()
 
-        _send_whatsapp(booking, wa_msg)
+        _send_whatsapp(booking, wa_msg, 'cancelled')
     except Exception as e:
         logger.error(f"[booking_notifications] notify_booking_cancelled erro: {e}")
 
@@ -127,6 +131,6 @@ def notify_no_show(booking) -> None:
             f"😕 Olá {first_name}, sentimos sua falta!\n\n"
             f"Você não compareceu à aula de *{modality}* em {date_fmt}.\n"
             f"Que tal agendar uma nova aula? Acesse o app e escolha seu horário."
-        ))
+        ), 'no_show')
     except Exception as e:
         logger.error(f"[booking_notifications] notify_no_show erro: {e}")
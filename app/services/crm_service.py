@@ -2,7 +2,7 @@
 
 from datetime import datetime, timedelta
 from app import db
-from app.models import Booking, BookingStatus, ConversionRule, User
+from app.models import ConversionRule, User, UserDailyActivity
 from app.models.xp_ledger import XPLedger
 from sqlalchemy import func
 
@@ -10,23 +10,12 @@ class CRMService:
     @staticmethod
     def get_current_streak(user_id):
         """Calcula o streak de dias consecutivos de aulas completadas."""
-        total_classes = Booking.query.filter_by(
-            user_id=user_id,
-            status=BookingStatus.COMPLETED
-        ).count()
+        # Dias distintos com aula concluida (rollup diario, mais recentes primeiro)
+        dates = UserDailyActivity.completed_dates(user_id, limit=60)
 
-        if total_classes == 0:
+        if not dates:
             return 0
 
-        recent_bookings = Booking.query.filter(
-            Booking.user_id == user_id,
-            Booking.status == BookingStatus.COMPLETED
-        ).order_by(Booking.date.desc()).limit(60).all()
-
-        if not recent_bookings:
-            return 0
-
-        dates = sorted(set(b.date for b in recent_bookings), reverse=True)
         streak = 0
         current_date = datetime.now().date()
         
@@ -15,13 +15,12 @@ O objetivo e:
 """
 
 import logging
-from datetime import datetime, date, timedelta
+from datetime import datetime
 from decimal import Decimal
 from typing import List, Dict, Tuple, Optional
 
 from app import db
 from app.models.class_schedule import ClassSchedule
-from app.models.booking import Booking, BookingStatus
 from app.models.commission import (
     SplitConfiguration, SplitSettings, DemandLevel
 )
@@ -63,40 +62,41 @@ class DynamicSplitAlgorithm:
         Returns:
             Taxa de ocupacao (0-100)
         """
+        from app.services.occupancy import occupancy_engine
+
         if days is None:
             days = self.lookback_days
 
-        end_date = date.today()
-        start_date = end_date - timedelta(days=days)
-
-        # Contar ocorrencias do horario no periodo
-        total_slots = 0
-        total_booked = 0
+        return occupancy_engine.rate(schedule, days)
 
-        current = start_date
-        while current <= end_date:
-            # Verificar se e o dia da semana do schedule
-            # weekday() retorna 0=Segunda, mas nosso modelo usa 0=Domingo
-            current_weekday = (current.weekday() + 1) % 7
+    def calculate_occupancy_rates(
+        self,
+        schedules: List[ClassSchedule],
+        days: int = None
+    ) -> Dict[int, Decimal]:
+        """
+        Taxas de ocupacao de varios horarios com uma unica consulta.
 
-            if current_weekday == schedule.weekday:
-                total_slots += schedule.capacity
+        Returns:
+            dict schedule_id -> taxa (0-100)
+        """
+        from app.services.occupancy import occupancy_engine
 
-                # Contar bookings (qualquer status exceto CANCELLED)
-                booked = Booking.query.filter(
-                    Booking.schedule_id == schedule.id,
-                    Booking.date == current,
-                    Booking.status != BookingStatus.CANCELLED
-                ).count()
-                total_booked += booked
+        if days is None:
+            days = self.lookback_days
 
-            current += timedelta(days=1)
+        return occupancy_engine.rates(schedules, days)
 
-        if total_slots == 0:
-            return Decimal('0.00')
+    @staticmethod
+    def _active_schedules() -> List[ClassSchedule]:
+        """Horarios ativos com configuracao, modalidade e instrutor carregados."""
+        from sqlalchemy.orm import joinedload
 
-        rate = (Decimal(total_booked) / Decimal(total_slots) * 100)
-        return rate.quantize(Decimal('0.01'))
+        return ClassSchedule.query.options(
+            joinedload(ClassSchedule.split_config),
+            joinedload(ClassSchedule.modality),
+            joinedload(ClassSchedule.instructor)
+        ).filter_by(is_active=True).all()
 
     def classify_demand(self, occupancy_rate: Decimal) -> DemandLevel:
         """
@@ -133,18 +133,20 @@ class DynamicSplitAlgorithm:
         settings = self.get_settings()
         return settings.get_split_for_demand(demand_level)
 
-    def analyze_schedule(self, schedule: ClassSchedule) -> Dict:
+    def analyze_schedule(self, schedule: ClassSchedule, occupancy: Decimal = None) -> Dict:
         """
         Analisa um horario e gera sugestao de split.
 
         Args:
             schedule: Horario a analisar
+            occupancy: Taxa ja calculada (ex: em lote); calcula se None
 
         Returns:
             Dict com analise e sugestao
         """
         # Calcular ocupacao
-        occupancy = self.calculate_occupancy_rate(schedule)
+        if occupancy is None:
+            occupancy = self.calculate_occupancy_rate(schedule)
 
         # Classificar demanda
         demand = self.classify_demand(occupancy)
@@ -199,11 +201,12 @@ class DynamicSplitAlgorithm:
         Returns:
             Lista de analises
         """
-        schedules = ClassSchedule.query.filter_by(is_active=True).all()
+        schedules = self._active_schedules()
+        rates = self.calculate_occupancy_rates(schedules)
 
         analyses = []
         for schedule in schedules:
-            analysis = self.analyze_schedule(schedule)
+            analysis = self.analyze_schedule(schedule, rates[schedule.id])
             analyses.append(analysis)
 
         # Ordenar por necessidade de ajuste e ocupacao
@@ -231,7 +234,8 @@ class DynamicSplitAlgorithm:
 
         self.lookback_days = settings.suggestion_lookback_days
 
-        schedules = ClassSchedule.query.filter_by(is_active=True).all()
+        schedules = self._active_schedules()
+        rates = self.calculate_occupancy_rates(schedules)
 
         stats = {
             'total_schedules': len(schedules),
@@ -243,7 +247,7 @@ class DynamicSplitAlgorithm:
         for schedule in schedules:
             try:
                 # Analisar horario
-                occupancy = self.calculate_occupancy_rate(schedule)
+                occupancy = rates[schedule.id]
                 demand = self.classify_demand(occupancy)
                 academy_pct, prof_pct = self.get_suggested_split(demand)
 
@@ -0,0 +1,180 @@
+# app/services/face_encoder_pool.py
+"""
+Pool de processos para deteccao/encoding facial (dlib).
+
+O HOG e a ResNet do dlib sao CPU-bound e seguravam a thread do Flask
+durante toda a chamada. Com FACE_ENCODER_WORKERS > 0 o pipeline de
+app/services/face_pipeline.py roda num ProcessPoolExecutor com workers
+aquecidos (modelos ja carregados). A fila e limitada: quando o pool esta
+saturado ou nao responde no prazo, a requisicao recebe 503 em vez de
+prender mais um worker web.
+
+Com FACE_ENCODER_WORKERS = 0 (padrao) o pipeline roda inline.
+"""
+
+import atexit
+import logging
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeout
+from typing import Dict
+
+from app.services.face_pipeline import extract_face_encodings
+
+logger = logging.getLogger(__name__)
+
+
+class EncoderPoolBusy(Exception):
+    """Pool de encoding indisponivel no momento (responder 503)."""
+
+    retry_after = 2
+
+
+class EncoderPoolSaturated(EncoderPoolBusy):
+    """Fila do pool cheia."""
+
+
+class EncoderPoolTimeout(EncoderPoolBusy):
+    """Worker nao respondeu dentro do timeout."""
+
+
+def _warm_worker():
+    """Inicializador dos processos: carrega os modelos do dlib uma vez."""
+    try:
+        import numpy as np
+        import face_recognition
+
+        blank = np.zeros((64, 64, 3), dtype=np.uint8)
+        face_recognition.face_locations(blank, model='hog')
+        face_recognition.face_encodings(blank, [(8, 56, 56, 8)], model='large')
+    except Exception as e:
+        logger.warning(f"Falha ao aquecer worker de encoding facial: {e}")
+
+
+class FaceEncoderPool:
+    """
+    Executor de extract_face_encodings com backpressure.
+
+    Cada tarefa ocupa uma vaga ate terminar (inclusive apos timeout),
+    entao `max_pending` limita de fato o trabalho acumulado no pool.
+    """
+
+    def __init__(self):
+        self.workers = 0
+        self.max_pending = 0
+        self.timeout = 10.0
+        self._executor = None
+        self._slots = None
+        self._in_flight = 0
+        self._configured = False
+        self._lock = threading.Lock()
+        # Contadores alterados por threads de request e callbacks do executor
+        self._stats_lock = threading.Lock()
+        self._stats = {
+            'inline': 0,
+            'submitted': 0,
+            'completed': 0,
+            'rejected': 0,
+            'timeouts': 0,
+            'errors': 0,
+        }
+
+    def _count(self, key: str, amount: int = 1):
+        with self._stats_lock:
+            self._stats[key] += amount
+
+    def _track_in_flight(self, delta: int):
+        with self._stats_lock:
+            self._in_flight += delta
+
+    def configure(self, app):
+        """Le a configuracao e cria o pool (idempotente)."""
+        with self._lock:
+            if self._configured:
+                return
+
+            self.workers = app.config.get('FACE_ENCODER_WORKERS', 0)
+            self.max_pending = app.config.get('FACE_ENCODER_MAX_PENDING') or self.workers * 2
+            self.timeout = app.config.get('FACE_ENCODER_TIMEOUT', 10.0)
+
+            if self.workers > 0:
+                context = multiprocessing.get_context(
+                    app.config.get('FACE_ENCODER_START_METHOD', 'spawn')
+                )
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=context,
+                    initializer=_warm_worker
+                )
+                self._slots = threading.BoundedSemaphore(self.max_pending)
+                atexit.register(self.shutdown)
+                logger.info(f"Pool de encoding facial: {self.workers} processos, "
+                            f"fila={self.max_pending}, timeout={self.timeout}s")
+
+            self._configured = True
+
+    def shutdown(self):
+        """Encerra os processos do pool."""
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    def extract(self, img_bytes: bytes, **kwargs) -> Dict:
+        """
+        Executa extract_face_encodings no pool (ou inline).
+
+        Raises:
+            EncoderPoolSaturated: fila cheia
+            EncoderPoolTimeout: sem resposta dentro de FACE_ENCODER_TIMEOUT
+        """
+        if not self._configured:
+            from flask import current_app
+            self.configure(current_app._get_current_object())
+
+        if self._executor is None:
+            self._count('inline')
+            return extract_face_encodings(img_bytes, **kwargs)
+
+        if not self._slots.acquire(blocking=False):
+            self._count('rejected')
+            raise EncoderPoolSaturated('Reconhecimento facial sobrecarregado. Tente novamente.')
+
+        self._track_in_flight(1)
+        try:
+            future = self._executor.submit(extract_face_encodings, img_bytes, **kwargs)
+        except Exception:
+            self._track_in_flight(-1)
+            self._slots.release()
+            raise
+        future.add_done_callback(self._release_slot)
+        self._count('submitted')
+
+        try:
+            result = future.result(timeout=self.timeout)
+        except FutureTimeout:
+            future.cancel()
+            self._count('timeouts')
+            raise EncoderPoolTimeout('Reconhecimento facial demorou demais. Tente novamente.')
+        except Exception:
+            self._count('errors')
+            raise
+
+        self._count('completed')
+        return result
+
+    def _release_slot(self, _future):
+        self._track_in_flight(-1)
+        self._slots.release()
+
+    def get_stats(self) -> Dict:
+        """Retorna contadores do pool."""
+        with self._stats_lock:
+            stats = dict(self._stats)
+            stats['in_flight'] = self._in_flight
+        stats['workers'] = self.workers
+        stats['max_pending'] = self.max_pending
+        return stats
+
+
+# Singleton
+face_encoder_pool = FaceEncoderPool()
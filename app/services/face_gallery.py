@@ -0,0 +1,410 @@
+# app/services/face_gallery.py
+"""
+Galeria de encodings faciais em memoria.
+
+Mantem uma matriz contigua (N x 128) com os encodings de todos os usuarios
+ativos com face cadastrada, um vetor paralelo de user_ids e um vetor de
+thresholds individuais. A galeria e carregada uma unica vez por processo e
+atualizada incrementalmente por enroll_face/remove_face, evitando o full
+scan da tabela users a cada frame do totem.
+
+A matriz e float32 e as normas ao quadrado ficam pre-calculadas, entao a
+distancia euclidiana de todas as linhas sai de um unico produto matriz-vetor
+(|m|^2 - 2 m.q + |q|^2). Com FACE_ENCODING_NORMALIZE as linhas e as consultas
+sao normalizadas (|m| = 1) e a mesma conta equivale a distancia do cosseno.
+
+O modo vem so da flag: thresholds individuais e a tolerancia sao distancias
+na escala do modo ativo, entao a galeria nunca troca de escala sozinha.
+Encodings gravados como 'v2n' ja estao normalizados e a normalizacao nao e
+reversivel: com a flag desligada essas linhas ficam fora da galeria (com
+aviso) ate o usuario ser recadastrado ou a flag ser ligada apos migrar
+todos os encodings (flask face migrate-encodings --to v2n).
+
+Com FACE_MATCH_MODE='ivf' e galerias acima de FACE_ANN_MIN_GALLERY, a busca
+passa pelo indice aproximado de app/services/face_ann.py.
+"""
+
+import logging
+import threading
+import time
+from typing import Dict, List, Optional
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+from app.services.face_ann import IVFIndex
+
+logger = logging.getLogger(__name__)
+
+ENCODING_SIZE = 128
+
+
+class FaceGalleryIndex:
+    """
+    Indice vetorizado de faces cadastradas (process-wide).
+
+    - matrix: float32 (N x 128), uma linha por usuario
+    - sq_norms: float32 (N,), |m|^2 de cada linha
+    - user_ids: int64 (N,), alinhado com matrix
+    - thresholds: float64 (N,), NaN = usar tolerance do servico
+    """
+
+    def __init__(self, max_age_seconds: int = 300):
+        """
+        Args:
+            max_age_seconds: Idade maxima do indice antes de um rebuild
+                             automatico (mantem workers diferentes coerentes
+                             com cadastros feitos em outro processo).
+        """
+        self.max_age_seconds = max_age_seconds
+        self.mode = 'exact'
+        self.normalize = False  # FACE_ENCODING_NORMALIZE
+        self.ann_min_size = 2000
+        self.ann_params = {}
+        self._ivf = None
+        self._lock = threading.RLock()
+        self._loaded = False
+        self._loaded_at = 0.0
+        self._reset_arrays()
+        self._stats = {
+            'hits': 0,
+            'misses': 0,
+            'rebuilds': 0,
+            'last_rebuild_ms': 0.0,
+            'last_rebuild_at': None,
+            'upserts': 0,
+            'removals': 0,
+            'ann_queries': 0,
+            'ann_fallbacks': 0,
+            'skipped_rows': 0,
+        }
+
+    def _reset_arrays(self):
+        if np is None:
+            self.matrix = None
+            self.sq_norms = None
+            self.user_ids = None
+            self.thresholds = None
+            return
+        self.matrix = np.empty((0, ENCODING_SIZE), dtype=np.float32)
+        self.sq_norms = np.empty((0,), dtype=np.float32)
+        self.user_ids = np.empty((0,), dtype=np.int64)
+        self.thresholds = np.empty((0,), dtype=np.float64)
+
+    def _accepts(self, version: Optional[str]) -> bool:
+        """Linha comparavel no modo atual? ('v2n' so no modo normalizado)"""
+        return self.normalize or version != 'v2n'
+
+    def _prepare(self, vectors):
+        """Converte para float32 (e normaliza, com FACE_ENCODING_NORMALIZE)."""
+        vectors = np.atleast_2d(np.asarray(vectors, dtype=np.float32))
+        if self.normalize:
+            norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+            vectors = vectors / np.where(norms > 0, norms, 1.0)
+        return vectors
+
+    @staticmethod
+    def _row_norms(matrix):
+        return np.einsum('ij,ij->i', matrix, matrix)
+
+    def _distances(self, queries):
+        """Distancias (M x N) entre consultas preparadas e a galeria."""
+        d2 = (
+            self._row_norms(queries)[:, None]
+            + self.sq_norms[None, :]
+            - 2.0 * (queries @ self.matrix.T)
+        )
+        return np.sqrt(np.maximum(d2, 0.0))
+
+    # =========================================================================
+    # Carga
+    # =========================================================================
+
+    def _load_config(self):
+        """Le o modo de busca da configuracao da aplicacao."""
+        try:
+            from flask import current_app
+            config = current_app.config
+        except RuntimeError:
+            return
+
+        self.mode = config.get('FACE_MATCH_MODE', 'exact')
+        self.normalize = config.get('FACE_ENCODING_NORMALIZE', False)
+        self.ann_min_size = config.get('FACE_ANN_MIN_GALLERY', 2000)
+        self.ann_params = {
+            'nlist': config.get('FACE_ANN_NLIST', 0),
+            'nprobe': config.get('FACE_ANN_NPROBE', 8),
+            'rerank_k': config.get('FACE_ANN_RERANK_K', 10),
+        }
+
+    def _build_ann(self):
+        """(Re)constroi o indice IVF se o modo estiver ativo."""
+        if self.mode == 'ivf' and self.user_ids.size >= self.ann_min_size:
+            self._ivf = IVFIndex(**self.ann_params).build(self.matrix)
+        else:
+            self._ivf = None
+
+    def rebuild(self) -> int:
+        """
+        Recarrega a galeria inteira do banco.
+
+        Returns:
+            Quantidade de encodings carregados
+        """
+        from app.models.user import User
+        from app.services.face_service import FaceRecognitionService
+
+        start = time.perf_counter()
+        self._load_config()
+
+        rows = User.query.with_entities(
+            User.id, User.face_encoding, User.face_encoding_version,
+            User.face_confidence_threshold
+        ).filter(
+            User.face_encoding.isnot(None),
+            User.is_active == True
+        ).all()
+
+        ids, encodings, thresholds = [], [], []
+        skipped = 0
+        for user_id, blob, version, threshold in rows:
+            if not self._accepts(version):
+                skipped += 1
+                continue
+            try:
+                enc = FaceRecognitionService._bytes_to_encoding(blob, version)
+            except Exception as e:
+                logger.warning(f"Encoding invalido para user {user_id}: {e}")
+                continue
+            if enc.shape != (ENCODING_SIZE,):
+                logger.warning(f"Encoding com tamanho invalido para user {user_id}: {enc.shape}")
+                continue
+            ids.append(user_id)
+            encodings.append(enc)
+            thresholds.append(threshold if threshold else np.nan)
+
+        if skipped:
+            logger.warning(
+                f"Galeria facial: {skipped} encodings 'v2n' ignorados com "
+                f"FACE_ENCODING_NORMALIZE desligado (recadastrar a face ou migrar "
+                f"todos com flask face migrate-encodings --to v2n e ligar a flag)"
+            )
+
+        with self._lock:
+            if encodings:
+                self.matrix = np.ascontiguousarray(self._prepare(np.vstack(encodings)))
+            else:
+                self.matrix = np.empty((0, ENCODING_SIZE), dtype=np.float32)
+            self.sq_norms = self._row_norms(self.matrix)
+            self.user_ids = np.asarray(ids, dtype=np.int64)
+            self.thresholds = np.asarray(thresholds, dtype=np.float64)
+            self._build_ann()
+            self._loaded = True
+            self._loaded_at = time.monotonic()
+            self._stats['skipped_rows'] = skipped
+
+            elapsed_ms = (time.perf_counter() - start) * 1000
+            self._stats['rebuilds'] += 1
+            self._stats['last_rebuild_ms'] = round(elapsed_ms, 2)
+            self._stats['last_rebuild_at'] = time.time()
+
+        logger.info(f"Galeria facial carregada: {len(ids)} encodings em {elapsed_ms:.1f}ms")
+        return len(ids)
+
+    def invalidate(self):
+        """Forca rebuild na proxima consulta."""
+        with self._lock:
+            self._loaded = False
+
+    def _ensure_loaded(self):
+        """Carrega a galeria se necessario, contabilizando hit/miss."""
+        expired = (
+            self.max_age_seconds
+            and time.monotonic() - self._loaded_at > self.max_age_seconds
+        )
+        if self._loaded and not expired:
+            self._stats['hits'] += 1
+            return
+        self._stats['misses'] += 1
+        self.rebuild()
+
+    # =========================================================================
+    # Atualizacao incremental
+    # =========================================================================
+
+    def upsert(self, user_id: int, encoding, threshold: float = None, version: str = None):
+        """
+        Insere ou substitui o encoding de um usuario.
+
+        `version` e o formato gravado (face_encoding_version); um encoding
+        'v2n' com FACE_ENCODING_NORMALIZE desligado nao entra na galeria
+        (e remove a linha anterior do usuario, se houver).
+        """
+        if np is None:
+            return
+        if not self._accepts(version):
+            self.remove(user_id)
+            with self._lock:
+                self._stats['skipped_rows'] += 1
+            return
+        thr = threshold if threshold else np.nan
+
+        with self._lock:
+            if not self._loaded:
+                # Sera carregado completo na proxima consulta
+                return
+            enc = self._prepare(np.asarray(encoding).reshape(1, ENCODING_SIZE))
+            sq_norm = self._row_norms(enc)
+            pos = np.flatnonzero(self.user_ids == user_id)
+            if pos.size:
+                row = int(pos[0])
+                self.matrix[row] = enc[0]
+                self.sq_norms[row] = sq_norm[0]
+                self.thresholds[row] = thr
+            else:
+                row = self.user_ids.size
+                self.matrix = np.ascontiguousarray(np.vstack([self.matrix, enc]))
+                self.sq_norms = np.append(self.sq_norms, sq_norm)
+                self.user_ids = np.append(self.user_ids, np.int64(user_id))
+                self.thresholds = np.append(self.thresholds, thr)
+
+            if self._ivf is not None:
+                self._ivf.set_row(row, enc[0])
+            elif self.mode == 'ivf' and self.user_ids.size >= self.ann_min_size:
+                self._build_ann()
+            self._stats['upserts'] += 1
+
+    def remove(self, user_id: int):
+        """Remove o encoding de um usuario da galeria."""
+        if np is None:
+            return
+        with self._lock:
+            if not self._loaded:
+                return
+            keep = self.user_ids != user_id
+            if keep.all():
+                return
+            self.matrix = np.ascontiguousarray(self.matrix[keep])
+            self.sq_norms = self.sq_norms[keep]
+            self.user_ids = self.user_ids[keep]
+            self.thresholds = self.thresholds[keep]
+            if self._ivf is not None:
+                self._ivf.keep_rows(keep)
+            self._stats['removals'] += 1
+
+    # =========================================================================
+    # Consulta
+    # =========================================================================
+
+    def match(self, encoding, tolerance: float = 0.6) -> Optional[Dict]:
+        """
+        Busca o usuario mais proximo de um encoding.
+
+        Mesma semantica do caminho antigo: menor distancia euclidiana,
+        aceita se distancia <= threshold do usuario (ou tolerance).
+
+        Returns:
+            dict com user_id, distance, threshold, matched ou None se a
+            galeria estiver vazia
+        """
+        with self._lock:
+            self._ensure_loaded()
+            if self.user_ids.size == 0:
+                return None
+
+            query = self._prepare(encoding)[0]
+
+            if self._ivf is not None:
+                rows, distances = self._ivf.search(self.matrix, query)
+                self._stats['ann_queries'] += 1
+                if rows.size == 0:
+                    self._stats['ann_fallbacks'] += 1
+                    rows = None
+            else:
+                rows = None
+
+            if rows is None:
+                rows = np.arange(self.user_ids.size)
+                distances = self._distances(query[None, :])[0]
+
+            thresholds = self.thresholds[rows]
+            thresholds = np.where(np.isnan(thresholds), tolerance, thresholds)
+            accepted = distances <= thresholds
+
+            best = int(np.argmin(distances))
+            return {
+                'user_id': int(self.user_ids[rows[best]]),
+                'distance': float(distances[best]),
+                'threshold': float(thresholds[best]),
+                'matched': bool(accepted[best]),
+            }
+
+    def match_batch(self, encodings, tolerance: float = 0.6) -> List[Optional[Dict]]:
+        """
+        Busca o usuario mais proximo de varios encodings de uma vez.
+
+        No modo exato monta uma unica matriz de distancias (M x N) com um
+        produto de matrizes; no modo IVF cada consulta passa pelo indice.
+
+        Returns:
+            Lista alinhada com `encodings` (mesmo formato de match())
+        """
+        if len(encodings) == 0:
+            return []
+
+        with self._lock:
+            self._ensure_loaded()
+            if self.user_ids.size == 0:
+                return [None] * len(encodings)
+
+            if self._ivf is not None:
+                # match() reentra no RLock e contabiliza hit novamente
+                return [self.match(q, tolerance) for q in encodings]
+
+            queries = self._prepare(encodings)
+            distances = self._distances(queries)
+
+            thresholds = np.where(np.isnan(self.thresholds), tolerance, self.thresholds)
+            best = np.argmin(distances, axis=1)
+            best_distances = distances[np.arange(queries.shape[0]), best]
+            best_thresholds = thresholds[best]
+            accepted = best_distances <= best_thresholds
+
+            return [
+                {
+                    'user_id': int(self.user_ids[b]),
+                    'distance': float(d),
+                    'threshold': float(t),
+                    'matched': bool(a),
+                }
+                for b, d, t, a in zip(best, best_distances, best_thresholds, accepted)
+            ]
+
+    # =========================================================================
+    # Estatisticas
+    # =========================================================================
+
+    @property
+    def size(self) -> int:
+        return 0 if self.user_ids is None else int(self.user_ids.size)
+
+    def get_stats(self) -> Dict:
+        """Retorna estatisticas de uso do indice."""
+        with self._lock:
+            stats = dict(self._stats)
+            lookups = stats['hits'] + stats['misses']
+            stats['hit_rate'] = round(stats['hits'] / lookups * 100, 1) if lookups else 0.0
+            stats['size'] = self.size
+            stats['loaded'] = self._loaded
+            stats['mode'] = 'ivf' if self._ivf is not None else 'exact'
+            stats['normalized'] = self.normalize
+            stats['memory_bytes'] = (
+                int(self.matrix.nbytes + self.sq_norms.nbytes) if self.matrix is not None else 0
+            )
+            return stats
+
+
+# Singleton (um indice por processo)
+face_gallery = FaceGalleryIndex()
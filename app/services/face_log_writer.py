@@ -0,0 +1,211 @@
+# app/services/face_log_writer.py
+"""
+Escrita assincrona e em lote de FaceRecognitionLog.
+
+Cada tentativa de reconhecimento gerava um INSERT + COMMIT sincrono dentro
+da requisicao do totem. Aqui as tentativas vao para uma fila em memoria
+(limitada) e um worker em background faz bulk insert a cada N registros
+ou T milissegundos. Na parada do processo a fila e descarregada.
+"""
+
+import atexit
+import logging
+import queue
+import threading
+import time
+from datetime import datetime
+from typing import Dict, List
+
+logger = logging.getLogger(__name__)
+
+
+class FaceLogWriter:
+    """
+    Sink de logs de reconhecimento facial com fila limitada.
+
+    Se a fila estiver cheia o registro e descartado (contador `dropped`)
+    em vez de bloquear o totem.
+    """
+
+    def __init__(self, batch_size: int = 50, flush_interval_ms: int = 500,
+                 max_queue: int = 10000):
+        """
+        Args:
+            batch_size: Registros por bulk insert
+            flush_interval_ms: Intervalo maximo entre flushes
+            max_queue: Capacidade da fila em memoria
+        """
+        self.batch_size = batch_size
+        self.flush_interval_ms = flush_interval_ms
+        self.max_queue = max_queue
+
+        self._queue = None
+        self._app = None
+        self._thread = None
+        self._stop = threading.Event()
+        self._start_lock = threading.Lock()
+        self._write_lock = threading.Lock()
+        self._atexit_registered = False
+        self._stats = {
+            'enqueued': 0,
+            'flushed': 0,
+            'dropped': 0,
+            'failed': 0,
+            'batches': 0,
+            'last_flush_ms': 0.0,
+        }
+
+    # =========================================================================
+    # Ciclo de vida
+    # =========================================================================
+
+    def start(self, app):
+        """Inicia o worker em background (idempotente)."""
+        with self._start_lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+
+            self._app = app
+            self.batch_size = app.config.get('FACE_LOG_BATCH_SIZE', self.batch_size)
+            self.flush_interval_ms = app.config.get('FACE_LOG_FLUSH_MS', self.flush_interval_ms)
+            self.max_queue = app.config.get('FACE_LOG_QUEUE_SIZE', self.max_queue)
+            if self._queue is None:
+                self._queue = queue.Queue(maxsize=self.max_queue)
+
+            self._stop.clear()
+            self._thread = threading.Thread(
+                target=self._run, name='face-log-writer', daemon=True
+            )
+            self._thread.start()
+
+            # Descarregar a fila ao encerrar o processo
+            if not self._atexit_registered:
+                atexit.register(self.shutdown)
+                self._atexit_registered = True
+
+            logger.info(f"FaceLogWriter iniciado (batch={self.batch_size}, "
+                        f"intervalo={self.flush_interval_ms}ms, fila={self.max_queue})")
+
+    def shutdown(self, timeout: float = 5.0):
+        """Para o worker e grava o que restou na fila."""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=timeout)
+            self._thread = None
+        self.flush()
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    # =========================================================================
+    # Produtor
+    # =========================================================================
+
+    def submit(self, user_id, confidence, success, ip_address=None,
+               user_agent=None, error=None) -> bool:
+        """
+        Enfileira uma tentativa de reconhecimento.
+
+        Returns:
+            False se a fila estiver cheia (registro descartado)
+        """
+        if not self.running:
+            from flask import current_app
+            self.start(current_app._get_current_object())
+
+        row = {
+            'user_id': user_id,
+            'timestamp': datetime.utcnow(),
+            'confidence_score': confidence,
+            'success': success,
+            'ip_address': ip_address,
+            'user_agent': user_agent,
+            'error_message': error,
+        }
+
+        try:
+            self._queue.put_nowait(row)
+        except queue.Full:
+            self._stats['dropped'] += 1
+            return False
+
+        self._stats['enqueued'] += 1
+        return True
+
+    # =========================================================================
+    # Consumidor
+    # =========================================================================
+
+    def _run(self):
+        """Loop do worker: agrupa registros por tamanho ou tempo."""
+        batch = []
+        deadline = time.monotonic() + self.flush_interval_ms / 1000
+
+        while not self._stop.is_set():
+            timeout = max(0.0, deadline - time.monotonic())
+            try:
+                batch.append(self._queue.get(timeout=timeout))
+            except queue.Empty:
+                pass
+
+            if len(batch) >= self.batch_size or time.monotonic() >= deadline:
+                if batch:
+                    self._write(batch)
+                    batch = []
+                deadline = time.monotonic() + self.flush_interval_ms / 1000
+
+        if batch:
+            self._write(batch)
+
+    def flush(self) -> int:
+        """Grava imediatamente tudo o que estiver na fila."""
+        if self._queue is None:
+            return 0
+
+        rows = []
+        while True:
+            try:
+                rows.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+
+        for i in range(0, len(rows), self.batch_size):
+            self._write(rows[i:i + self.batch_size])
+        return len(rows)
+
+    def _write(self, rows: List[Dict]):
+        """Bulk insert de um lote de logs."""
+        from app import db
+        from app.models.face_recognition import FaceRecognitionLog
+
+        start = time.perf_counter()
+        with self._write_lock, self._app.app_context():
+            try:
+                db.session.bulk_insert_mappings(FaceRecognitionLog, rows)
+                db.session.commit()
+                self._stats['flushed'] += len(rows)
+                self._stats['batches'] += 1
+            except Exception as e:
+                db.session.rollback()
+                self._stats['failed'] += len(rows)
+                logger.error(f"Erro ao gravar lote de {len(rows)} logs de reconhecimento: {e}")
+            finally:
+                db.session.remove()
+
+        self._stats['last_flush_ms'] = round((time.perf_counter() - start) * 1000, 2)
+
+    # =========================================================================
+    # Estatisticas
+    # =========================================================================
+
+    def get_stats(self) -> Dict:
+        """Retorna contadores do sink."""
+        stats = dict(self._stats)
+        stats['queue_size'] = self._queue.qsize() if self._queue is not None else 0
+        stats['running'] = self.running
+        return stats
+
+
+# Singleton
+face_log_writer = FaceLogWriter()
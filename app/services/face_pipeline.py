@@ -0,0 +1,178 @@
+# app/services/face_pipeline.py
+"""
+Pre-processamento de imagens para reconhecimento facial.
+
+Pipeline de passada unica:
+1. Decodifica o base64 uma vez e le apenas o cabecalho da imagem
+   (resolucao, modo, tamanho) para validar qualidade
+2. Gera uma copia reduzida para deteccao (JPEG via `draft`, demais
+   formatos via `reduce`/`thumbnail`) - o HOG roda na imagem pequena
+3. Se houver face, recorta cada rosto da imagem original e extrai o
+   encoding apenas do recorte
+
+Nao depende do banco nem do contexto Flask, para poder rodar tambem nos
+processos do pool de encoding.
+"""
+
+import base64
+import io
+import time
+from typing import Dict
+
+try:
+    import numpy as np
+    from PIL import Image
+except ImportError:
+    np = None
+    Image = None
+
+try:
+    import face_recognition
+except ImportError:
+    face_recognition = None
+
+MAX_IMAGE_BYTES = 5 * 1024 * 1024
+DEFAULT_DETECTION_MAX_SIDE = 640
+CROP_MARGIN = 0.25
+
+
+def decode_image_payload(image_data) -> bytes:
+    """
+    Converte bytes ou base64 (com ou sem prefixo data:image/...) em bytes.
+    """
+    if isinstance(image_data, str):
+        # Remover prefixo data:image/...;base64,
+        if ',' in image_data:
+            image_data = image_data.split(',')[1]
+        return base64.b64decode(image_data)
+    if isinstance(image_data, bytes):
+        return image_data
+    raise TypeError(f"Formato de imagem nao suportado: {type(image_data)}")
+
+
+def check_image_quality(img, n_bytes: int) -> Dict:
+    """
+    Valida qualidade a partir do cabecalho da imagem (sem decodificar pixels).
+
+    Returns:
+        dict com valid, issues, resolution
+    """
+    issues = []
+    width, height = img.size
+
+    # Resolucao minima (aceita 320x240 de webcam)
+    if width < 320 or height < 240:
+        issues.append(f'Resolucao muito baixa ({width}x{height}). Minimo: 320x240')
+
+    # Tamanho maximo (5MB)
+    if n_bytes > MAX_IMAGE_BYTES:
+        issues.append('Imagem muito grande. Maximo: 5MB')
+
+    # Verificar modo de cor
+    if img.mode not in ('RGB', 'RGBA', 'L'):
+        issues.append(f'Modo de cor nao suportado: {img.mode}')
+
+    return {
+        'valid': len(issues) == 0,
+        'issues': issues,
+        'resolution': (width, height)
+    }
+
+
+def _detection_image(img_bytes: bytes, max_side: int):
+    """
+    Abre uma copia reduzida da imagem para deteccao.
+
+    Returns:
+        (imagem RGB reduzida, fator de escala para a original)
+    """
+    img = Image.open(io.BytesIO(img_bytes))
+    width, height = img.size
+    longest = max(width, height)
+
+    if max_side and longest > max_side:
+        # JPEG: decodifica direto em 1/2, 1/4 ou 1/8 (DCT scaling)
+        target = (max(1, width * max_side // longest), max(1, height * max_side // longest))
+        img.draft('RGB', target)
+
+    img = img.convert('RGB')
+
+    if max_side and max(img.size) > max_side:
+        # reduce() por fator inteiro + resize final ate max_side
+        img.thumbnail((max_side, max_side), reducing_gap=2.0)
+
+    return img, width / img.size[0]
+
+
+def extract_face_encodings(img_bytes: bytes, max_faces: int = 1,
+                           detection_max_side: int = DEFAULT_DETECTION_MAX_SIDE,
+                           validate: bool = True) -> Dict:
+    """
+    Detecta faces numa imagem reduzida e extrai encodings dos recortes
+    em resolucao original.
+
+    Args:
+        img_bytes: Bytes da imagem ja decodificados do base64
+        max_faces: Maximo de faces a codificar (as demais sao apenas contadas)
+        detection_max_side: Maior lado da imagem usada na deteccao (0 = original)
+        validate: Se True, valida qualidade antes de detectar
+
+    Returns:
+        dict com quality, face_count, locations (coordenadas da original),
+        encodings e timings (ms por etapa)
+    """
+    timings = {'decode_ms': 0.0, 'detect_ms': 0.0, 'encode_ms': 0.0}
+    result = {
+        'quality': None,
+        'face_count': 0,
+        'locations': [],
+        'encodings': [],
+        'timings': timings,
+    }
+
+    # 1. Cabecalho + validacao + copia reduzida
+    t0 = time.perf_counter()
+    header = Image.open(io.BytesIO(img_bytes))
+    result['quality'] = check_image_quality(header, len(img_bytes))
+    if validate and not result['quality']['valid']:
+        timings['decode_ms'] = round((time.perf_counter() - t0) * 1000, 2)
+        return result
+
+    small, scale = _detection_image(img_bytes, detection_max_side)
+    small_array = np.asarray(small)
+    t1 = time.perf_counter()
+    timings['decode_ms'] = round((t1 - t0) * 1000, 2)
+
+    # 2. Deteccao na imagem reduzida
+    small_locations = face_recognition.face_locations(small_array, model='hog')
+    t2 = time.perf_counter()
+    timings['detect_ms'] = round((t2 - t1) * 1000, 2)
+
+    result['face_count'] = len(small_locations)
+    if not small_locations or max_faces <= 0:
+        return result
+
+    # 3. Encoding a partir do recorte da original
+    full = Image.open(io.BytesIO(img_bytes))
+    full_width, full_height = full.size
+
+    for top, right, bottom, left in small_locations[:max_faces]:
+        top, right = int(top * scale), int(right * scale)
+        bottom, left = int(bottom * scale), int(left * scale)
+
+        margin_y = int((bottom - top) * CROP_MARGIN)
+        margin_x = int((right - left) * CROP_MARGIN)
+        box = (
+            max(0, left - margin_x), max(0, top - margin_y),
+            min(full_width, right + margin_x), min(full_height, bottom + margin_y)
+        )
+        crop = np.asarray(full.crop(box).convert('RGB'))
+        location = (top - box[1], right - box[0], bottom - box[1], left - box[0])
+
+        encodings = face_recognition.face_encodings(crop, [location], model='large')
+        if encodings:
+            result['locations'].append((top, right, bottom, left))
+            result['encodings'].append(encodings[0])
+
+    timings['encode_ms'] = round((time.perf_counter() - t2) * 1000, 2)
+    return result
@@ -4,27 +4,48 @@ from __future__ import annotations
 
 import logging
 import io
-import base64
+import time
 from typing import Optional, Dict, List, Tuple
 from datetime import datetime
 
 try:
     import numpy as np
     from PIL import Image
-    import face_recognition
-    FACE_RECOGNITION_AVAILABLE = True
 except ImportError:
     np = None
     Image = None
+
+try:
+    import face_recognition
+    FACE_RECOGNITION_AVAILABLE = True
+except ImportError:
     face_recognition = None
     FACE_RECOGNITION_AVAILABLE = False
 
+from flask import current_app
+
 from app import db
 from app.models.user import User
 from app.models.face_recognition import FaceRecognitionLog
+from app.services.face_gallery import face_gallery
+from app.services.face_log_writer import face_log_writer
+from app.services.face_pipeline import (
+    DEFAULT_DETECTION_MAX_SIDE, check_image_quality, decode_image_payload
+)
+from app.services.face_encoder_pool import face_encoder_pool, EncoderPoolBusy
+from app.services.face_enrollment import summarize_samples, tune_threshold
 
 logger = logging.getLogger(__name__)
 
+ENCODING_SIZE = 128
+
+# Formatos de armazenamento de users.face_encoding (face_encoding_version)
+ENCODING_FORMATS = {
+    'v1': 'float64',   # legado: 1024 bytes
+    'v2': 'float32',   # 512 bytes
+    'v2n': 'float32',  # 512 bytes, normalizado (norma L2 = 1)
+}
+
 
 class FaceRecognitionService:
     """
@@ -42,16 +63,37 @@ class FaceRecognitionService:
         """
         self.tolerance = tolerance
 
+    @property
+    def detection_max_side(self) -> int:
+        """Maior lado da imagem usada na deteccao (FACE_DETECTION_MAX_SIDE)."""
+        return current_app.config.get('FACE_DETECTION_MAX_SIDE', DEFAULT_DETECTION_MAX_SIDE)
+
+    @staticmethod
+    def storage_version() -> str:
+        """Formato usado em novos cadastros (FACE_ENCODING_VERSION/NORMALIZE)."""
+        version = current_app.config.get('FACE_ENCODING_VERSION', 'v2')
+        if version == 'v2' and current_app.config.get('FACE_ENCODING_NORMALIZE', False):
+            return 'v2n'
+        return version if version in ENCODING_FORMATS else 'v1'
+
     def enroll_face(self, user_id: int, image_data) -> Dict:
         """
         Registra a face de um usuario no sistema.
 
+        Aceita um frame ou uma lista de frames. Com varios frames o encoding
+        salvo e o centroide das amostras validas e o threshold do usuario e
+        ajustado pela dispersao entre elas (ver face_enrollment.py).
+
         Args:
             user_id: ID do usuario
-            image_data: Bytes da imagem ou base64 string
+            image_data: Bytes da imagem ou base64 string (ou lista deles)
 
         Returns:
-            dict com success, message, confidence, encoding_size
+            dict com success, message, confidence, encoding_size,
+            sample_count, rejected_frames, spread, threshold
+
+        Raises:
+            EncoderPoolBusy: pool de encoding saturado ou sem resposta
         """
         if not FACE_RECOGNITION_AVAILABLE:
             return {
@@ -70,71 +112,71 @@ class FaceRecognitionService:
                 'encoding_size': 0
             }
 
-        try:
-            # Converter para numpy array
-            image_array = self._image_to_array(image_data)
-
-            # Validar qualidade
-            quality = self.validate_image_quality(image_data)
-            if not quality['valid']:
-                return {
-                    'success': False,
-                    'message': 'Qualidade da imagem insuficiente: ' + ', '.join(quality['issues']),
-                    'confidence': 0,
-                    'encoding_size': 0
-                }
-
-            # Detectar faces
-            face_locations = face_recognition.face_locations(image_array, model='hog')
-
-            if len(face_locations) == 0:
-                logger.warning(f"Enrollment: nenhuma face detectada para user {user_id}")
-                return {
-                    'success': False,
-                    'message': 'Nenhuma face detectada na imagem. Tente novamente com melhor iluminacao.',
-                    'confidence': 0,
-                    'encoding_size': 0
-                }
-
-            if len(face_locations) > 1:
-                logger.warning(f"Enrollment: {len(face_locations)} faces detectadas para user {user_id}")
-                return {
-                    'success': False,
-                    'message': f'Foram detectadas {len(face_locations)} faces. A imagem deve conter apenas uma face.',
-                    'confidence': 0,
-                    'encoding_size': 0
-                }
-
-            # Extrair encoding (128 dimensoes)
-            encodings = face_recognition.face_encodings(image_array, face_locations, model='large')
+        frames = image_data if isinstance(image_data, (list, tuple)) else [image_data]
+        frames = frames[:current_app.config.get('FACE_ENROLL_MAX_SAMPLES', 10)]
 
-            if len(encodings) == 0:
+        try:
+            encodings, errors = [], []
+            for frame in frames:
+                encoding, error = self._extract_enrollment_encoding(user_id, frame)
+                if encoding is not None:
+                    encodings.append(encoding)
+                else:
+                    errors.append(error)
+
+            if not encodings:
                 return {
                     'success': False,
-                    'message': 'Nao foi possivel extrair caracteristicas da face. Tente outra foto.',
+                    'message': errors[0] if errors else 'Imagem nao fornecida',
                     'confidence': 0,
                     'encoding_size': 0
                 }
 
-            encoding = encodings[0]
+            # Dispersao na escala da galeria (normalizada com 'v2n')
+            version = self.storage_version()
+            if version == 'v2n':
+                encodings = [e / np.linalg.norm(e) for e in encodings if np.linalg.norm(e) > 0]
+
+            summary = summarize_samples(encodings)
+            encoding = summary['centroid']
+            config = current_app.config
+            threshold = tune_threshold(
+                summary['spread'], summary['sample_count'],
+                default=self.tolerance,
+                multiplier=config.get('FACE_THRESHOLD_SPREAD_MULTIPLIER', 1.5),
+                min_threshold=config.get('FACE_THRESHOLD_MIN', 0.45),
+                max_threshold=config.get('FACE_THRESHOLD_MAX', 0.65),
+            )
 
             # Salvar encoding no usuario
-            user.face_encoding = self._encoding_to_bytes(encoding)
-            user.face_encoding_version = 'v1'
+            user.face_encoding = self._encoding_to_bytes(encoding, version)
+            user.face_encoding_version = version
+            user.face_sample_count = summary['sample_count']
+            user.face_encoding_spread = summary['spread']
+            user.face_confidence_threshold = threshold
             user.face_registered_at = datetime.utcnow()
 
             db.session.commit()
 
+            face_gallery.upsert(user.id, encoding, threshold, version)
+
             confidence = 100.0  # Enrollment sempre tem confianca maxima
-            logger.info(f"Face registrada com sucesso para user {user_id}")
+            logger.info(f"Face registrada com sucesso para user {user_id} "
+                        f"({summary['sample_count']} amostras, threshold={threshold})")
 
             return {
                 'success': True,
                 'message': 'Face cadastrada com sucesso!',
                 'confidence': confidence,
-                'encoding_size': len(encoding)
+                'encoding_size': len(encoding),
+                'sample_count': summary['sample_count'],
+                'rejected_frames': len(errors) + summary['rejected'],
+                'spread': summary['spread'],
+                'threshold': threshold
             }
 
+        except EncoderPoolBusy:
+            raise
         except Exception as e:
             db.session.rollback()
             logger.error(f"Erro no enrollment para user {user_id}: {str(e)}")
@@ -145,6 +187,42 @@ class FaceRecognitionService:
                 'encoding_size': 0
             }
 
+    def _extract_enrollment_encoding(self, user_id: int, image_data) -> Tuple:
+        """
+        Extrai o encoding de um frame de cadastro.
+
+        Returns:
+            (encoding, None) ou (None, mensagem de erro)
+        """
+        # Decodificar uma vez, validar pelo cabecalho e detectar na imagem reduzida
+        extracted = face_encoder_pool.extract(
+            decode_image_payload(image_data),
+            max_faces=1,
+            detection_max_side=self.detection_max_side
+        )
+
+        quality = extracted['quality']
+        if not quality['valid']:
+            return None, 'Qualidade da imagem insuficiente: ' + ', '.join(quality['issues'])
+
+        face_count = extracted['face_count']
+
+        if face_count == 0:
+            logger.warning(f"Enrollment: nenhuma face detectada para user {user_id}")
+            return None, 'Nenhuma face detectada na imagem. Tente novamente com melhor iluminacao.'
+
+        if face_count > 1:
+            logger.warning(f"Enrollment: {face_count} faces detectadas para user {user_id}")
+            return None, f'Foram detectadas {face_count} faces. A imagem deve conter apenas uma face.'
+
+        # Encoding (128 dimensoes) extraido do recorte em resolucao original
+        encodings = extracted['encodings']
+
+        if len(encodings) == 0:
+            return None, 'Nao foi possivel extrair caracteristicas da face. Tente outra foto.'
+
+        return encodings[0], None
+
     def recognize_face(self, image_data, ip_address: str = None,
                        user_agent: str = None) -> Optional[Dict]:
         """
@@ -157,17 +235,25 @@ class FaceRecognitionService:
 
         Returns:
             dict com user_id, user, confidence, distance ou None
+
+        Raises:
+            EncoderPoolBusy: pool de encoding saturado ou sem resposta
         """
         if not FACE_RECOGNITION_AVAILABLE:
             logger.error("face_recognition nao disponivel")
             return None
 
         try:
-            # Extrair encoding da imagem recebida
-            image_array = self._image_to_array(image_data)
-            face_locations = face_recognition.face_locations(image_array, model='hog')
+            # Extrair encoding da imagem recebida (deteccao na imagem reduzida)
+            extracted = face_encoder_pool.extract(
+                decode_image_payload(image_data),
+                max_faces=1,
+                detection_max_side=self.detection_max_side,
+                validate=False
+            )
+            timings = extracted['timings']
 
-            if len(face_locations) == 0:
+            if extracted['face_count'] == 0:
                 self._log_attempt(
                     user_id=None, confidence=0, success=False,
                     ip_address=ip_address, user_agent=user_agent,
@@ -176,7 +262,7 @@ class FaceRecognitionService:
                 return None
 
             # Usar a primeira face detectada
-            encodings = face_recognition.face_encodings(image_array, face_locations[:1], model='large')
+            encodings = extracted['encodings']
             if len(encodings) == 0:
                 self._log_attempt(
                     user_id=None, confidence=0, success=False,
@@ -187,13 +273,12 @@ class FaceRecognitionService:
 
             unknown_encoding = encodings[0]
 
-            # Buscar todos os usuarios com face cadastrada
-            users_with_face = User.query.filter(
-                User.face_encoding.isnot(None),
-                User.is_active == True
-            ).all()
+            # Comparar com a galeria em memoria (uma unica operacao vetorizada)
+            t0 = time.perf_counter()
+            result = self._match_encoding(unknown_encoding)
+            timings['match_ms'] = round((time.perf_counter() - t0) * 1000, 2)
 
-            if not users_with_face:
+            if result is None:
                 self._log_attempt(
                     user_id=None, confidence=0, success=False,
                     ip_address=ip_address, user_agent=user_agent,
@@ -201,33 +286,9 @@ class FaceRecognitionService:
                 )
                 return None
 
-            # Comparar com todos os encodings cadastrados
-            known_encodings = []
-            known_users = []
-            for user in users_with_face:
-                try:
-                    enc = self._bytes_to_encoding(user.face_encoding)
-                    known_encodings.append(enc)
-                    known_users.append(user)
-                except Exception as e:
-                    logger.warning(f"Encoding invalido para user {user.id}: {e}")
-                    continue
-
-            if not known_encodings:
-                return None
-
-            # Calcular distancias
-            distances = face_recognition.face_distance(known_encodings, unknown_encoding)
-
-            # Encontrar menor distancia
-            min_idx = np.argmin(distances)
-            min_distance = distances[min_idx]
-            best_user = known_users[min_idx]
+            best_user, min_distance, threshold = result
 
-            # Usar threshold do usuario ou padrao
-            threshold = best_user.face_confidence_threshold or self.tolerance
-
-            if min_distance <= threshold:
+            if best_user is not None:
                 confidence = (1 - min_distance) * 100
 
                 # Atualizar ultimo reconhecimento
@@ -248,18 +309,25 @@ class FaceRecognitionService:
                     'user_id': best_user.id,
                     'user': best_user,
                     'confidence': confidence,
-                    'distance': float(min_distance)
+                    'distance': float(min_distance),
+                    'timings': timings
                 }
             else:
-                # Nenhum match suficientemente proximo
+                # Nenhum match suficientemente proximo (ou so candidatos invalidos)
+                if min_distance > threshold:
+                    error = f'Melhor match: distancia {min_distance:.3f} > threshold {threshold}'
+                else:
+                    error = 'Usuario inativo ou sem face cadastrada'
                 self._log_attempt(
                     user_id=None, confidence=(1 - min_distance) * 100,
                     success=False, ip_address=ip_address,
                     user_agent=user_agent,
-                    error=f'Melhor match: distancia {min_distance:.3f} > threshold {threshold}'
+                    error=error
                 )
                 return None
 
+        except EncoderPoolBusy:
+            raise
         except Exception as e:
             logger.error(f"Erro no reconhecimento: {str(e)}")
             self._log_attempt(
@@ -269,50 +337,196 @@ class FaceRecognitionService:
             )
             return None
 
-    def validate_image_quality(self, image_data) -> Dict:
+    def recognize_faces_batch(self, images: List, ip_address: str = None,
+                              user_agent: str = None, max_faces: int = 20) -> Dict:
         """
-        Valida qualidade da imagem antes de processar.
+        Reconhece todas as faces de um ou mais frames em uma unica chamada.
+
+        Todas as faces detectadas sao comparadas com a galeria numa unica
+        matriz de distancias.
+
+        Args:
+            images: Lista de imagens (bytes ou base64)
+            ip_address: IP do cliente (para log)
+            user_agent: User-Agent do cliente (para log)
+            max_faces: Maximo de faces processadas no lote
 
         Returns:
-            dict com valid, issues, resolution
+            dict com faces (lista por face detectada) e timings (ms por etapa)
         """
-        issues = []
+        timings = {'decode_ms': 0.0, 'detect_ms': 0.0, 'encode_ms': 0.0, 'match_ms': 0.0}
+        faces = []
 
-        try:
-            # Converter para PIL Image
-            if isinstance(image_data, str):
-                # Base64
-                if ',' in image_data:
-                    image_data = image_data.split(',')[1]
-                img_bytes = base64.b64decode(image_data)
-            elif isinstance(image_data, bytes):
-                img_bytes = image_data
+        if not FACE_RECOGNITION_AVAILABLE:
+            logger.error("face_recognition nao disponivel")
+            return {'faces': faces, 'timings': timings}
+
+        all_encodings = []
+        for image_index, image_data in enumerate(images):
+            if len(all_encodings) >= max_faces:
+                break
+            try:
+                extracted = face_encoder_pool.extract(
+                    decode_image_payload(image_data),
+                    max_faces=max_faces - len(all_encodings),
+                    detection_max_side=self.detection_max_side,
+                    validate=False
+                )
+            except EncoderPoolBusy:
+                raise
+            except Exception as e:
+                logger.error(f"Erro no reconhecimento em lote (frame {image_index}): {e}")
+                self._log_attempt(
+                    user_id=None, confidence=0, success=False,
+                    ip_address=ip_address, user_agent=user_agent,
+                    error=str(e)
+                )
+                continue
+
+            face_locations = extracted['locations']
+            encodings = extracted['encodings']
+            decode_ms = extracted['timings']['decode_ms']
+            detect_ms = extracted['timings']['detect_ms']
+            encode_ms = extracted['timings']['encode_ms']
+            timings['decode_ms'] += decode_ms
+            timings['detect_ms'] += detect_ms
+            timings['encode_ms'] += encode_ms
+
+            if not encodings:
+                self._log_attempt(
+                    user_id=None, confidence=0, success=False,
+                    ip_address=ip_address, user_agent=user_agent,
+                    error='Nenhuma face detectada'
+                )
+                continue
+
+            for location, encoding in zip(face_locations, encodings):
+                all_encodings.append(encoding)
+                faces.append({
+                    'image_index': image_index,
+                    'location': list(location),
+                    'user_id': None,
+                    'user': None,
+                    'confidence': 0,
+                    'distance': None,
+                    'timing_ms': {
+                        'decode': round(decode_ms, 2),
+                        'detect': round(detect_ms, 2),
+                        'encode': round(encode_ms / len(encodings), 2),
+                    }
+                })
+
+        if not all_encodings:
+            return {'faces': faces, 'timings': self._round_timings(timings)}
+
+        t0 = time.perf_counter()
+        matches = face_gallery.match_batch(np.vstack(all_encodings), tolerance=self.tolerance)
+        matched_ids = {m['user_id'] for m in matches if m and m['matched']}
+        users = {
+            u.id: u for u in User.query.filter(User.id.in_(matched_ids)).all()
+        } if matched_ids else {}
+        match_ms = (time.perf_counter() - t0) * 1000
+        timings['match_ms'] = match_ms
+
+        now = datetime.utcnow()
+        for face, match in zip(faces, matches):
+            face['timing_ms']['match'] = round(match_ms / len(faces), 2)
+
+            if match is None:
+                self._log_attempt(
+                    user_id=None, confidence=0, success=False,
+                    ip_address=ip_address, user_agent=user_agent,
+                    error='Nenhum usuario com face cadastrada'
+                )
+                continue
+
+            distance = match['distance']
+            face['distance'] = distance
+            face['confidence'] = (1 - distance) * 100
+            user = users.get(match['user_id']) if match['matched'] else None
+            error = f'Melhor match: distancia {distance:.3f} > threshold {match["threshold"]}'
+
+            if match['matched'] and not (user and user.is_active and user.face_encoding is not None):
+                # Usuario desativado ou removido desde a ultima carga
+                face_gallery.remove(match['user_id'])
+                user = None
+                error = 'Usuario inativo ou sem face cadastrada'
+
+            if user:
+                face['user_id'] = user.id
+                face['user'] = user
+                user.face_last_recognized = now
+                self._log_attempt(
+                    user_id=user.id, confidence=face['confidence'],
+                    success=True, ip_address=ip_address,
+                    user_agent=user_agent
+                )
             else:
-                return {'valid': False, 'issues': ['Formato de imagem invalido'], 'resolution': (0, 0)}
+                self._log_attempt(
+                    user_id=None, confidence=face['confidence'],
+                    success=False, ip_address=ip_address,
+                    user_agent=user_agent,
+                    error=error
+                )
 
-            img = Image.open(io.BytesIO(img_bytes))
-            width, height = img.size
+        db.session.commit()
 
-            # Resolucao minima
-            if width < 640 or height < 480:
-                # Aceitar mas avisar para resolucoes menores (320x240 de webcam)
-                if width < 320 or height < 240:
-                    issues.append(f'Resolucao muito baixa ({width}x{height}). Minimo: 320x240')
+        return {'faces': faces, 'timings': self._round_timings(timings)}
 
-            # Tamanho maximo (5MB)
-            if len(img_bytes) > 5 * 1024 * 1024:
-                issues.append('Imagem muito grande. Maximo: 5MB')
+    @staticmethod
+    def _round_timings(timings: Dict) -> Dict:
+        return {key: round(value, 2) for key, value in timings.items()}
 
-            # Verificar modo de cor
-            if img.mode not in ('RGB', 'RGBA', 'L'):
-                issues.append(f'Modo de cor nao suportado: {img.mode}')
+    def _match_encoding(self, encoding) -> Optional[Tuple]:
+        """
+        Compara um encoding com a galeria em memoria.
 
-            return {
-                'valid': len(issues) == 0,
-                'issues': issues,
-                'resolution': (width, height)
-            }
+        Candidatos desativados desde a ultima carga sao descartados; apos
+        tres seguidos a galeria e recarregada do banco e a busca repetida
+        uma vez.
+
+        Returns:
+            (user ou None, distancia, threshold) ou None se galeria vazia.
+            user e None quando o melhor candidato nao passa no threshold
+            ou continua invalido apos a recarga (distancia <= threshold).
+        """
+        match = None
+        for reload in (False, True):
+            if reload:
+                face_gallery.invalidate()
+            for _ in range(3):
+                match = face_gallery.match(encoding, tolerance=self.tolerance)
+                if match is None:
+                    return None
+
+                if not match['matched']:
+                    return None, match['distance'], match['threshold']
+
+                user = User.query.get(match['user_id'])
+                if user and user.is_active and user.face_encoding is not None:
+                    return user, match['distance'], match['threshold']
+
+                face_gallery.remove(match['user_id'])
+
+        return None, match['distance'], match['threshold']
+
+    def validate_image_quality(self, image_data) -> Dict:
+        """
+        Valida qualidade da imagem antes de processar.
+
+        Le apenas o cabecalho da imagem (nao decodifica os pixels).
 
+        Returns:
+            dict com valid, issues, resolution
+        """
+        try:
+            img_bytes = decode_image_payload(image_data)
+        except TypeError:
+            return {'valid': False, 'issues': ['Formato de imagem invalido'], 'resolution': (0, 0)}
+
+        try:
+            img = Image.open(io.BytesIO(img_bytes))
+            return check_image_quality(img, len(img_bytes))
         except Exception as e:
             return {
                 'valid': False,
@@ -339,10 +553,13 @@ class FaceRecognitionService:
 
         user.face_encoding = None
         user.face_encoding_version = None
+        user.face_sample_count = None
+        user.face_encoding_spread = None
         user.face_registered_at = None
         user.face_last_recognized = None
 
         db.session.commit()
+        face_gallery.remove(user_id)
         logger.info(f"Face removida para user {user_id} (LGPD)")
 
         return {
@@ -377,7 +594,19 @@ class FaceRecognitionService:
 
     def _log_attempt(self, user_id, confidence, success,
                      ip_address=None, user_agent=None, error=None):
-        """Registra tentativa de reconhecimento no log."""
+        """
+        Registra tentativa de reconhecimento no log.
+
+        Por padrao enfileira no FaceLogWriter (bulk insert em background);
+        com FACE_LOG_ASYNC desligado grava de forma sincrona.
+        """
+        if current_app.config.get('FACE_LOG_ASYNC', True):
+            face_log_writer.submit(
+                user_id=user_id, confidence=confidence, success=success,
+                ip_address=ip_address, user_agent=user_agent, error=error
+            )
+            return
+
         try:
             log = FaceRecognitionLog(
                 user_id=user_id,
@@ -394,44 +623,28 @@ class FaceRecognitionService:
             db.session.rollback()
 
     @staticmethod
-    def _image_to_array(image_data) -> np.ndarray:
+    def _encoding_to_bytes(encoding: np.ndarray, version: str = 'v1') -> bytes:
         """
-        Converte bytes ou base64 para numpy array.
+        Serializa numpy array para bytes no formato `version`.
 
-        Suporta:
-        - Bytes diretos
-        - Base64 string
-        - Base64 com prefixo data:image/...
+        v1 = float64, v2 = float32, v2n = float32 normalizado.
         """
-        if isinstance(image_data, str):
-            # Remover prefixo data:image/...;base64,
-            if ',' in image_data:
-                image_data = image_data.split(',')[1]
-            img_bytes = base64.b64decode(image_data)
-        elif isinstance(image_data, bytes):
-            img_bytes = image_data
-        else:
-            raise TypeError(f"Formato de imagem nao suportado: {type(image_data)}")
-
-        # Converter para PIL e depois para numpy
-        img = Image.open(io.BytesIO(img_bytes))
-
-        # Converter para RGB se necessario
-        if img.mode == 'RGBA':
-            img = img.convert('RGB')
-        elif img.mode == 'L':
-            img = img.convert('RGB')
-        elif img.mode != 'RGB':
-            img = img.convert('RGB')
-
-        return np.array(img)
+        enc = np.asarray(encoding, dtype=ENCODING_FORMATS[version])
+        if version == 'v2n':
+            norm = np.linalg.norm(enc)
+            if norm > 0:
+                enc = enc / norm
+        return enc.tobytes()
 
     @staticmethod
-    def _encoding_to_bytes(encoding: np.ndarray) -> bytes:
-        """Serializa numpy array para bytes."""
-        return encoding.tobytes()
+    def _bytes_to_encoding(data: bytes, version: str = None) -> np.ndarray:
+        """
+        Desserializa bytes para numpy array (128 floats).
 
-    @staticmethod
-    def _bytes_to_encoding(data: bytes) -> np.ndarray:
-        """Desserializa bytes para numpy array (128 floats)."""
-        return np.frombuffer(data, dtype=np.float64)
+        Sem versao (ou versao desconhecida) o dtype e inferido pelo tamanho:
+        1024 bytes = float64 (v1), 512 bytes = float32 (v2).
+        """
+        dtype = ENCODING_FORMATS.get(version)
+        if dtype is None:
+            dtype = 'float32' if len(data) == ENCODING_SIZE * 4 else 'float64'
+        return np.frombuffer(data, dtype=dtype)
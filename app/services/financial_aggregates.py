@@ -0,0 +1,236 @@
+# app/services/financial_aggregates.py
+"""
+Agregados financeiros de `payments` em duas varreduras.
+
+/admin/metrics/api/financeiro fazia ~25 SUM/COUNT separados (pago,
+pendente e vencido para cada um dos 6 meses, automatico vs manual,
+totais) e o dashboard admin mais tres. Os meses eram calculados com
+`timedelta(days=30 * i)`, que desliza em relacao ao calendario.
+
+Aqui:
+- pagos: GROUP BY (dia, metodo, pacote) dentro da janela e um unico
+  grupo para o historico anterior (ticket medio)
+- em aberto: GROUP BY (status, vencimento) para PENDING/OVERDUE
+
+Os meses sao de calendario (UTC, como paid_date) e o resultado e
+colunar (FinancialColumns), usado pela API de metricas, pelo dashboard
+admin e pela exportacao CSV.
+"""
+
+import logging
+from collections import defaultdict
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+from typing import Dict, List, Optional
+
+from sqlalchemy import and_, case, func
+
+from app import db
+
+logger = logging.getLogger(__name__)
+
+# payment_method -> grupo exibido no relatorio
+METHOD_GROUPS = {
+    'nupay_pix': 'auto',
+    'nupay_recurring': 'auto',
+    'manual': 'manual',
+}
+
+
+def _as_date(value) -> date:
+    """func.date() devolve string no SQLite e date no PostgreSQL."""
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    return date.fromisoformat(str(value)[:10])
+
+
+def _next_month(day: date) -> date:
+    return date(day.year + 1, 1, 1) if day.month == 12 else date(day.year, day.month + 1, 1)
+
+
+class FinancialColumns:
+    """
+    Resultado colunar: uma posicao por mes em `months` e nas listas
+    paid / paid_count / pending / overdue; demais campos sao totais.
+    """
+
+    CSV_HEADER = ['mes', 'pago', 'qtd_pagos', 'pendente', 'vencido']
+
+    def __init__(self, months: List[date], window_days: int):
+        self.months = months
+        self.window_days = window_days
+        size = len(months)
+
+        # Colunas mensais
+        self.paid = [Decimal(0)] * size
+        self.paid_count = [0] * size
+        self.pending = [Decimal(0)] * size
+        self.overdue = [Decimal(0)] * size
+
+        # Janela movel (ultimos `window_days` dias, incluindo hoje)
+        self.window_revenue = Decimal(0)
+        self.window_count = 0
+        self.by_method = {group: {'count': 0, 'revenue': Decimal(0)} for group in set(METHOD_GROUPS.values())}
+        self.by_package = defaultdict(lambda: {'count': 0, 'revenue': Decimal(0)})
+
+        # Totais gerais
+        self.paid_total = Decimal(0)
+        self.paid_total_count = 0
+        self.pending_total = Decimal(0)
+        self.pending_total_count = 0
+        self.overdue_total = Decimal(0)
+        self.overdue_total_count = 0
+
+    @property
+    def labels(self) -> List[str]:
+        return [m.strftime('%b/%y') for m in self.months]
+
+    @property
+    def avg_ticket(self) -> Decimal:
+        if not self.paid_total_count:
+            return Decimal(0)
+        return self.paid_total / self.paid_total_count
+
+    @property
+    def current_month_revenue(self) -> Decimal:
+        return self.paid[-1] if self.paid else Decimal(0)
+
+    def monthly(self) -> List[Dict]:
+        """Formato da chave 'monthly' de /api/financeiro."""
+        return [
+            {
+                'label': label,
+                'paid': float(paid),
+                'pending': float(pending),
+                'overdue': float(overdue)
+            }
+            for label, paid, pending, overdue in zip(self.labels, self.paid, self.pending, self.overdue)
+        ]
+
+    def packages(self) -> List[Dict]:
+        return [
+            {'name': name, 'revenue': float(values['revenue']), 'count': values['count']}
+            for name, values in sorted(self.by_package.items())
+        ]
+
+    def payment_methods(self) -> Dict:
+        return {
+            group: {'count': values['count'], 'revenue': float(values['revenue'])}
+            for group, values in self.by_method.items()
+        }
+
+    def csv_rows(self) -> List[List]:
+        """Linhas (com cabecalho) para exportacao CSV."""
+        rows = [self.CSV_HEADER]
+        for month, paid, count, pending, overdue in zip(
+            self.months, self.paid, self.paid_count, self.pending, self.overdue
+        ):
+            rows.append([month.strftime('%Y-%m'), f'{paid:.2f}', count, f'{pending:.2f}', f'{overdue:.2f}'])
+        return rows
+
+
+class FinancialAggregateService:
+    """Monta FinancialColumns com duas consultas agrupadas."""
+
+    def build(self, months: int = 6, window_days: int = 30,
+              today: Optional[date] = None) -> FinancialColumns:
+        """
+        Args:
+            months: Meses de calendario (o atual por ultimo)
+            window_days: Tamanho da janela movel (receita, metodo, pacote)
+            today: Data de referencia (UTC)
+        """
+        from app.models import Payment, Subscription, Package
+        from app.models.payment import PaymentStatusEnum
+        from app.services.metric_snapshots import month_starts
+
+        today = today or datetime.utcnow().date()
+        starts = month_starts(today, months)
+        result = FinancialColumns(starts, window_days)
+        index = {start: i for i, start in enumerate(starts)}
+
+        first_day = starts[0]
+        window_start = today - timedelta(days=window_days - 1)
+        scan_start = min(first_day, window_start)
+        months_end = _next_month(starts[-1])
+
+        # 1. Pagos: (dia, metodo, pacote) na janela; historico anterior num grupo so
+        paid_day = case(
+            (Payment.paid_date >= datetime.combine(scan_start, datetime.min.time()),
+             func.date(Payment.paid_date)),
+            else_=None
+        )
+        paid_rows = db.session.query(
+            paid_day, Payment.payment_method, Subscription.package_id,
+            func.count(Payment.id), func.sum(Payment.amount)
+        ).outerjoin(
+            Subscription, Payment.subscription_id == Subscription.id
+        ).filter(
+            Payment.status == PaymentStatusEnum.PAID
+        ).group_by(paid_day, Payment.payment_method, Subscription.package_id).all()
+
+        package_names = {}
+        if any(row[2] is not None for row in paid_rows):
+            package_names = dict(db.session.query(Package.id, Package.name))
+
+        for row_day, method, package_id, count, amount in paid_rows:
+            amount = Decimal(amount or 0)
+            result.paid_total += amount
+            result.paid_total_count += count
+            if row_day is None:
+                continue
+
+            day = _as_date(row_day)
+            if day > today:
+                continue
+
+            month = index.get(day.replace(day=1))
+            if month is not None:
+                result.paid[month] += amount
+                result.paid_count[month] += count
+
+            if day >= window_start:
+                result.window_revenue += amount
+                result.window_count += count
+                group = METHOD_GROUPS.get(method)
+                if group:
+                    result.by_method[group]['count'] += count
+                    result.by_method[group]['revenue'] += amount
+                if package_id in package_names:
+                    bucket = result.by_package[package_names[package_id]]
+                    bucket['count'] += count
+                    bucket['revenue'] += amount
+
+        # 2. Em aberto: (status, vencimento) - vencimentos fora dos meses num grupo so
+        due_day = case(
+            (and_(Payment.due_date >= first_day, Payment.due_date < months_end), Payment.due_date),
+            else_=None
+        )
+        open_rows = db.session.query(
+            Payment.status, due_day, func.count(Payment.id), func.sum(Payment.amount)
+        ).filter(
+            Payment.status.in_([PaymentStatusEnum.PENDING, PaymentStatusEnum.OVERDUE])
+        ).group_by(Payment.status, due_day).all()
+
+        for status, row_day, count, amount in open_rows:
+            amount = Decimal(amount or 0)
+            is_pending = status == PaymentStatusEnum.PENDING
+            if is_pending:
+                result.pending_total += amount
+                result.pending_total_count += count
+            else:
+                result.overdue_total += amount
+                result.overdue_total_count += count
+
+            if row_day is not None:
+                month = index[_as_date(row_day).replace(day=1)]
+                column = result.pending if is_pending else result.overdue
+                column[month] += amount
+
+        return result
+
+
+# Singleton
+financial_aggregates = FinancialAggregateService()
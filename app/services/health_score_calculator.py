@@ -1,8 +1,10 @@
 from datetime import datetime, timedelta
+import numpy as np
 from sqlalchemy import func
 from app.models import (
-    User, Booking, StudentHealthScore, Package,
-    FaceRecognitionLog, TrainingSession
+    User, UserDailyActivity, StudentHealthScore,
+    Subscription, SubscriptionStatus, FaceRecognitionLog, TrainingSession,
+    HealthScreening, ScreeningType, ScreeningStatus
 )
 from app.models.crm import RiskLevel
 from app import db
@@ -10,6 +12,22 @@ import logging
 
 logger = logging.getLogger(__name__)
 
+# (limite, pontos): check-ins em 30 dias > limite
+FREQUENCY_POINTS = (
+    (12, 40),  # 4+ por semana
+    (8, 30),   # 3x por semana
+    (4, 20),   # 2x por semana
+    (0, 10),   # <= 1x por semana
+)
+
+# (limite, pontos): meses de casa >= limite
+TENURE_POINTS = (
+    (12, 10),
+    (6, 7),
+    (3, 5),
+    (1, 3),
+)
+
 class HealthScoreCalculator:
     """
     Calcula o Health Score de alunos baseado em 4 componentes:
@@ -29,41 +47,95 @@ class HealthScoreCalculator:
     def __init__(self):
         self.lookback_days = 30
     
-    def calculate_all_students(self):
+    def calculate_all_students(self, now: datetime = None):
         """
         Calcula score de todos os alunos ativos.
         Deve ser executado diariamente via scheduler.
+
+        Usa o motor em lote (calculate_scores_bulk): um punhado de consultas
+        agregadas para todos os alunos e um único bulk insert, em vez de ~10
+        consultas + 1 commit por aluno.
         """
         logger.info("Iniciando cálculo de health scores...")
-        
-        students = User.query.filter_by(role='student', is_active=True).all()
+        now = now or datetime.utcnow()
         
         results = {
-            'total': len(students),
+            'total': 0,
             'updated': 0,
             'critical': 0,
             'high_risk': 0
         }
         
-        for student in students:
-            try:
-                score_data = self.calculate_student_score(student.id)
-                self._save_score(student.id, score_data)
-                
-                results['updated'] += 1
-                
-                if score_data['risk_level'] == RiskLevel.CRITICAL:
-                    results['critical'] += 1
-                elif score_data['risk_level'] == RiskLevel.HIGH:
-                    results['high_risk'] += 1
-                    
-            except Exception as e:
-                logger.error(f"Erro ao calcular score do aluno {student.id}: {e}")
+        try:
+            scores = self.calculate_scores_bulk(now=now)
+            results['total'] = len(scores)
+            # Execucao completa tambem reconcilia o passe incremental
+            self._clear_dirty(None, now)
+            self._save_scores_bulk(scores, now)
+        except Exception as e:
+            db.session.rollback()
+            logger.error(f"Erro ao calcular health scores em lote: {e}")
+            return results
+        
+        results['updated'] = len(scores)
+        for score_data in scores.values():
+            if score_data['risk_level'] == RiskLevel.CRITICAL:
+                results['critical'] += 1
+            elif score_data['risk_level'] == RiskLevel.HIGH:
+                results['high_risk'] += 1
         
         logger.info(f"Health scores atualizados: {results}")
         return results
     
-    def calculate_student_score(self, user_id: int) -> dict:
+    def recalculate_dirty(self, batch_size: int = 500) -> dict:
+        """
+        Passe incremental: recalcula apenas alunos marcados por eventos
+        (User.mark_health_score_dirty) desde o ultimo calculo.
+
+        Marcas feitas durante o passe (depois de `now`) sao preservadas
+        para o proximo.
+
+        Returns:
+            dict com dirty, updated, critical, high_risk
+        """
+        now = datetime.utcnow()
+        results = {'dirty': 0, 'updated': 0, 'critical': 0, 'high_risk': 0}
+
+        user_ids = [uid for (uid,) in User.query.with_entities(User.id).filter(
+            User.health_score_dirty_at.isnot(None),
+            User.health_score_dirty_at <= now
+        ).order_by(User.health_score_dirty_at).limit(batch_size)]
+        if not user_ids:
+            return results
+
+        results['dirty'] = len(user_ids)
+        try:
+            # Inativos/nao alunos nao geram score, mas tambem saem da fila
+            scores = self.calculate_scores_bulk(user_ids=user_ids, now=now)
+            self._clear_dirty(user_ids, now)
+            self._save_scores_bulk(scores, now)
+        except Exception as e:
+            db.session.rollback()
+            logger.error(f"Erro no recalculo incremental de health scores: {e}")
+            return results
+
+        results['updated'] = len(scores)
+        for score_data in scores.values():
+            if score_data['risk_level'] == RiskLevel.CRITICAL:
+                results['critical'] += 1
+            elif score_data['risk_level'] == RiskLevel.HIGH:
+                results['high_risk'] += 1
+        return results
+
+    @staticmethod
+    def _clear_dirty(user_ids, now: datetime):
+        """Remove a marca de quem foi recalculado (sem commit)."""
+        query = User.query.filter(User.health_score_dirty_at <= now)
+        if user_ids is not None:
+            query = query.filter(User.id.in_(user_ids))
+        query.update({User.health_score_dirty_at: None}, synchronize_session=False)
+    
+    def calculate_student_score(self, user_id: int, now: datetime = None) -> dict:
         """
         Calcula score de um aluno específico.
         
@@ -78,22 +150,29 @@ class HealthScoreCalculator:
                 'details': dict
             }
         """
+        now = now or datetime.utcnow()
         user = User.query.get(user_id)
         if not user:
             raise ValueError(f"Usuário {user_id} não encontrado")
         
         # 1. Frequency Score (40 pontos)
-        frequency_score, freq_details = self._calculate_frequency(user_id)
+        frequency_score, freq_details = self._calculate_frequency(user_id, now)
         
         # 2. Engagement Score (30 pontos)
-        engagement_score, eng_details = self._calculate_engagement(user_id)
+        engagement_score, eng_details = self._calculate_engagement(user_id, now)
         
         # 3. Financial Score (20 pontos)
-        financial_score, fin_details = self._calculate_financial(user_id)
+        financial_score, fin_details = self._calculate_financial(user_id, now)
         
         # 4. Tenure Score (10 pontos)
-        tenure_score, ten_details = self._calculate_tenure(user)
+        tenure_score, ten_details = self._calculate_tenure(user, now)
         
+        return self._compose(frequency_score, engagement_score, financial_score, tenure_score,
+                             freq_details, eng_details, fin_details, ten_details)
+    
+    def _compose(self, frequency_score, engagement_score, financial_score, tenure_score,
+                 freq_details, eng_details, fin_details, ten_details) -> dict:
+        """Monta o resultado final a partir dos 4 componentes."""
         # Score total
         total_score = (
             frequency_score + 
@@ -120,57 +199,44 @@ class HealthScoreCalculator:
             }
         }
     
-    def _calculate_frequency(self, user_id: int) -> tuple:
+    def _calculate_frequency(self, user_id: int, now: datetime) -> tuple:
         """
         Calcula score de frequência (0-40).
         Baseado em check-ins nos últimos 30 dias.
         """
-        cutoff_date = datetime.utcnow() - timedelta(days=self.lookback_days)
-        
-        # Conta check-ins
-        checkins = Booking.query.filter(
-            Booking.user_id == user_id,
-            Booking.status == 'COMPLETED',
-            Booking.checked_in_at >= cutoff_date
-        ).count()
+        cutoff_date = now - timedelta(days=self.lookback_days)
         
-        # Lógica de pontuação
-        if checkins == 0:
-            score = 0
-        elif checkins <= 4:  # <= 1x por semana
-            score = 10
-        elif checkins <= 8:  # 2x por semana
-            score = 20
-        elif checkins <= 12:  # 3x por semana
-            score = 30
-        else:  # 4+ por semana
-            score = 40
+        # Check-ins na janela e último check-in (rollup diário)
+        stats = UserDailyActivity.checkin_stats(cutoff_date, [user_id]).get(user_id, {})
+        checkins = stats.get('completed_since', 0)
         
-        # Último check-in
-        last_checkin = Booking.query.filter(
-            Booking.user_id == user_id,
-            Booking.status == 'COMPLETED'
-        ).order_by(Booking.checked_in_at.desc()).first()
+        score = self._frequency_points(checkins)
         
+        return score, self._frequency_details(checkins, stats.get('last_checkin_at'), now)
+    
+    @staticmethod
+    def _frequency_points(checkins: int) -> int:
+        """Pontuação por check-ins em 30 dias (ver FREQUENCY_POINTS)."""
+        return next((points for limit, points in FREQUENCY_POINTS if checkins > limit), 0)
+    
+    @staticmethod
+    def _frequency_details(checkins: int, last_checkin_at, now: datetime) -> dict:
         days_since_last = None
-        if last_checkin and last_checkin.checked_in_at:
-            days_since_last = (datetime.utcnow() - last_checkin.checked_in_at).days
+        if last_checkin_at:
+            days_since_last = (now - last_checkin_at).days
         
-        details = {
+        return {
             'checkins_30d': checkins,
             'days_since_last_checkin': days_since_last,
             'avg_per_week': round(checkins / 4.3, 1)
         }
-        
-        return score, details
     
-    def _calculate_engagement(self, user_id: int) -> tuple:
+    def _calculate_engagement(self, user_id: int, now: datetime) -> tuple:
         """
         Calcula score de engajamento (0-30).
         Baseado em interações com o sistema.
         """
-        cutoff_date = datetime.utcnow() - timedelta(days=self.lookback_days)
-        score = 0
+        cutoff_date = now - timedelta(days=self.lookback_days)
         
         # Visualizou treino?
         viewed_training = TrainingSession.query.filter(
@@ -178,6 +244,29 @@ class HealthScoreCalculator:
             TrainingSession.viewed_at >= cutoff_date
         ).count() > 0
         
+        # Completou avaliação física (Screening)?
+        # Mesmo critério de User.has_valid_screening, com o `now` do cálculo
+        has_screening_parq = HealthScreening.query.filter(
+            HealthScreening.user_id == user_id,
+            HealthScreening.screening_type == ScreeningType.PARQ,
+            HealthScreening.status == ScreeningStatus.APTO,
+            HealthScreening.expires_at > now
+        ).count() > 0
+        
+        # Usou reconhecimento facial?
+        used_facial = FaceRecognitionLog.query.filter(
+            FaceRecognitionLog.user_id == user_id,
+            FaceRecognitionLog.timestamp >= cutoff_date,
+            FaceRecognitionLog.success == True
+        ).count() > 0
+        
+        return self._engagement_result(viewed_training, has_screening_parq, used_facial)
+    
+    @staticmethod
+    def _engagement_result(viewed_training: bool, has_screening_parq: bool,
+                           used_facial: bool) -> tuple:
+        score = 0
+        
         if viewed_training:
             score += 10
         
@@ -186,26 +275,9 @@ class HealthScoreCalculator:
         respond_score = 10
         score += respond_score
         
-        # Completou avaliação física (Screening)?
-        # Usando user.has_valid_screening via ScreeningService ou User model method
-        user = User.query.get(user_id)
-        from app.models.health import ScreeningType
-        has_screening_parq = False
-        try:
-             has_screening_parq = user.has_valid_screening(ScreeningType.PARQ)
-        except:
-             pass
-             
         if has_screening_parq:
             score += 5
         
-        # Usou reconhecimento facial?
-        used_facial = FaceRecognitionLog.query.filter(
-            FaceRecognitionLog.user_id == user_id,
-            FaceRecognitionLog.timestamp >= cutoff_date,
-            FaceRecognitionLog.success == True
-        ).count() > 0
-        
         if used_facial:
             score += 5
         
@@ -218,78 +290,192 @@ class HealthScoreCalculator:
         
         return score, details
     
-    def _calculate_financial(self, user_id: int) -> tuple:
+    def _calculate_financial(self, user_id: int, now: datetime) -> tuple:
         """
         Calcula score financeiro (0-20).
         Baseado em status de pagamento.
         """
-        user = User.query.get(user_id)
-        
-        # Verificar se tem pacote ativo
-        active_package = Package.query.filter(
-            Package.user_id == user_id,
-            Package.is_active == True,
-            Package.expires_at > datetime.utcnow()
-        ).first()
-        
-        if not active_package:
+        # Pacote ativo = assinatura ativa e não vencida (a que vence por último)
+        active_subscription = Subscription.query.filter(
+            Subscription.user_id == user_id,
+            Subscription.status == SubscriptionStatus.ACTIVE,
+            Subscription.end_date >= now.date()
+        ).order_by(Subscription.end_date.desc()).first()
+        
+        return self._financial_result(
+            active_subscription.end_date if active_subscription else None, now
+        )
+    
+    @staticmethod
+    def _financial_result(end_date, now: datetime) -> tuple:
+        if end_date is None:
             score = 0
             status = 'SEM_PACOTE'
             days_to_expiration = None
         else:
-            # Verificar atraso de pagamento (assumindo payment_status no Package)
-            # Na verdade, Package geralmente não tem payment_status, mas Subscription ou Payment tem.
-            # O prompt assume Package.payment_status. Vou verificar app/models/package.py
-            # Se não tiver, vou ajustar para Payment table.
-            
-            # Ajuste: Verificar Payment mais recente associado ao pacote ou usuario
-            from app.models.payment import Payment, PaymentStatusEnum
-            
             # Assumindo que se o pacote está ativo, está pago, a menos que haja controle de parcelas.
             # Vamos simplificar: Se está ativo e não expirado = 20 pontos.
-            # Se expirado recentemente = 10 pontos.
-            
             score = 20
             status = 'EM_DIA'
-            days_to_expiration = (active_package.expires_at - datetime.utcnow()).days
+            days_to_expiration = (end_date - now.date()).days
             
             # TODO: Refinar com lógica de inadimplência real se houver tabela de mensalidades/cobranças
         
         details = {
             'payment_status': status,
-            'has_active_package': active_package is not None,
+            'has_active_package': end_date is not None,
             'days_to_expiration': days_to_expiration
         }
         
         return score, details
     
-    def _calculate_tenure(self, user: User) -> tuple:
+    def _calculate_tenure(self, user: User, now: datetime) -> tuple:
         """
         Calcula score de tempo de casa (0-10).
         """
         if not user.created_at:
             return 0, {'months': 0}
         
-        days_since_join = (datetime.utcnow() - user.created_at).days
-        months = days_since_join / 30
-        
-        if months >= 12:
-            score = 10
-        elif months >= 6:
-            score = 7
-        elif months >= 3:
-            score = 5
-        elif months >= 1:
-            score = 3
-        else:
-            score = 0
-        
-        details = {
+        months = self._tenure_months(user.created_at, now)
+        return self._tenure_points(months), self._tenure_details(months)
+    
+    @staticmethod
+    def _tenure_months(created_at: datetime, now: datetime) -> float:
+        days_since_join = (now - created_at).days
+        return days_since_join / 30
+    
+    @staticmethod
+    def _tenure_points(months: float) -> int:
+        """Pontuação por meses de casa (ver TENURE_POINTS)."""
+        return next((points for limit, points in TENURE_POINTS if months >= limit), 0)
+    
+    @staticmethod
+    def _tenure_details(months: float) -> dict:
+        return {
             'months': round(months, 1),
             'loyalty_level': 'HIGH' if months >= 12 else 'MEDIUM' if months >= 6 else 'LOW'
         }
+    
+    # =========================================================================
+    # Motor em lote
+    # =========================================================================
+    
+    def calculate_scores_bulk(self, user_ids=None, now: datetime = None) -> dict:
+        """
+        Calcula o score de todos os alunos ativos (ou de `user_ids`) com
+        consultas agregadas (GROUP BY user_id) e pontuação vetorizada.
         
-        return score, details
+        Resultado idêntico a calculate_student_score para o mesmo `now`
+        (ver verify_bulk_parity).
+        
+        Returns:
+            {user_id: score_data} no mesmo formato de calculate_student_score
+        """
+        now = now or datetime.utcnow()
+        cutoff_date = now - timedelta(days=self.lookback_days)
+        
+        students_query = User.query.with_entities(User.id, User.created_at).filter(
+            User.role == 'student',
+            User.is_active == True
+        )
+        if user_ids is not None:
+            students_query = students_query.filter(User.id.in_(list(user_ids)))
+        students = students_query.order_by(User.id).all()
+        if not students:
+            return {}
+        
+        student_ids = students_query.with_entities(User.id).scalar_subquery()
+        
+        # 1. Frequência: check-ins em 30 dias e último check-in (rollup diário)
+        checkin_stats = UserDailyActivity.checkin_stats(cutoff_date, student_ids)
+        checkins_30d = {uid: st['completed_since'] for uid, st in checkin_stats.items()}
+        last_checkin = {uid: st['last_checkin_at'] for uid, st in checkin_stats.items()}
+        
+        # 2. Engajamento: treino visto, PAR-Q válido, reconhecimento facial
+        viewed_training = {uid for (uid,) in db.session.query(TrainingSession.user_id).filter(
+            TrainingSession.viewed_at >= cutoff_date,
+            TrainingSession.user_id.in_(student_ids)
+        ).distinct()}
+        
+        valid_screening = {uid for (uid,) in db.session.query(HealthScreening.user_id).filter(
+            HealthScreening.screening_type == ScreeningType.PARQ,
+            HealthScreening.status == ScreeningStatus.APTO,
+            HealthScreening.expires_at > now,
+            HealthScreening.user_id.in_(student_ids)
+        ).distinct()}
+        
+        used_facial = {uid for (uid,) in db.session.query(FaceRecognitionLog.user_id).filter(
+            FaceRecognitionLog.timestamp >= cutoff_date,
+            FaceRecognitionLog.success == True,
+            FaceRecognitionLog.user_id.in_(student_ids)
+        ).distinct()}
+        
+        # 3. Financeiro: assinatura ativa que vence por último
+        active_until = dict(db.session.query(
+            Subscription.user_id, func.max(Subscription.end_date)
+        ).filter(
+            Subscription.status == SubscriptionStatus.ACTIVE,
+            Subscription.end_date >= now.date(),
+            Subscription.user_id.in_(student_ids)
+        ).group_by(Subscription.user_id).all())
+        
+        # Pontuação vetorizada
+        ids = [uid for uid, _ in students]
+        checkins = np.array([checkins_30d.get(uid, 0) for uid in ids])
+        frequency_scores = np.select(
+            [checkins > limit for limit, _ in FREQUENCY_POINTS],
+            [points for _, points in FREQUENCY_POINTS], default=0
+        )
+        
+        viewed = np.array([uid in viewed_training for uid in ids], dtype=bool)
+        screened = np.array([uid in valid_screening for uid in ids], dtype=bool)
+        facial = np.array([uid in used_facial for uid in ids], dtype=bool)
+        engagement_scores = 10 + 10 * viewed + 5 * screened + 5 * facial
+        
+        has_package = np.array([uid in active_until for uid in ids], dtype=bool)
+        financial_scores = np.where(has_package, 20, 0)
+        
+        has_created = np.array([created_at is not None for _, created_at in students], dtype=bool)
+        months = np.array([
+            self._tenure_months(created_at, now) if created_at else 0.0
+            for _, created_at in students
+        ])
+        tenure_scores = np.where(has_created, np.select(
+            [months >= limit for limit, _ in TENURE_POINTS],
+            [points for _, points in TENURE_POINTS], default=0
+        ), 0)
+        
+        scores = {}
+        for i, (uid, created_at) in enumerate(students):
+            scores[uid] = self._compose(
+                int(frequency_scores[i]),
+                int(engagement_scores[i]),
+                int(financial_scores[i]),
+                int(tenure_scores[i]),
+                self._frequency_details(int(checkins[i]), last_checkin.get(uid), now),
+                self._engagement_result(bool(viewed[i]), bool(screened[i]), bool(facial[i]))[1],
+                self._financial_result(active_until.get(uid), now)[1],
+                self._tenure_details(float(months[i])) if created_at else {'months': 0}
+            )
+        
+        return scores
+    
+    def verify_bulk_parity(self, limit: int = None, now: datetime = None) -> dict:
+        """
+        Compara o motor em lote com o cálculo aluno a aluno.
+        
+        Returns:
+            dict com checked e mismatches (lista de user_ids divergentes)
+        """
+        now = now or datetime.utcnow()
+        bulk = self.calculate_scores_bulk(now=now)
+        user_ids = sorted(bulk)[:limit] if limit else sorted(bulk)
+        
+        mismatches = [
+            uid for uid in user_ids
+            if self.calculate_student_score(uid, now=now) != bulk[uid]
+        ]
+        return {'checked': len(user_ids), 'mismatches': mismatches}
     
     def _determine_risk_level(self, total_score: float) -> RiskLevel:
         """Determina o nível de risco baseado no score total."""
@@ -302,21 +488,29 @@ class HealthScoreCalculator:
         else:
             return RiskLevel.CRITICAL
 
-    def _save_score(self, user_id: int, score_data: dict):
+    def _save_score(self, user_id: int, score_data: dict, now: datetime = None):
         """Salva score no banco de dados."""
-        risk = score_data['risk_level']
-
-        score_record = StudentHealthScore(
-            user_id=user_id,
-            calculated_at=datetime.utcnow(),
-            frequency_score=score_data['frequency_score'],
-            engagement_score=score_data['engagement_score'],
-            financial_score=score_data['financial_score'],
-            tenure_score=score_data['tenure_score'],
-            total_score=score_data['total_score'],
-            risk_level=risk,
-            requires_attention=(risk in (RiskLevel.HIGH, RiskLevel.CRITICAL))
-        )
+        db.session.add(StudentHealthScore(**self._score_row(user_id, score_data, now)))
+        db.session.commit()
 
-        db.session.add(score_record)
+    def _save_scores_bulk(self, scores: dict, now: datetime = None):
+        """Grava todos os scores com um único bulk insert e um commit."""
+        rows = [self._score_row(uid, data, now) for uid, data in scores.items()]
+        if rows:
+            db.session.bulk_insert_mappings(StudentHealthScore, rows)
         db.session.commit()
+
+    @staticmethod
+    def _score_row(user_id: int, score_data: dict, now: datetime = None) -> dict:
+        risk = score_data['risk_level']
+        return {
+            'user_id': user_id,
+            'calculated_at': now or datetime.utcnow(),
+            'frequency_score': score_data['frequency_score'],
+            'engagement_score': score_data['engagement_score'],
+            'financial_score': score_data['financial_score'],
+            'tenure_score': score_data['tenure_score'],
+            'total_score': score_data['total_score'],
+            'risk_level': risk,
+            'requires_attention': risk in (RiskLevel.HIGH, RiskLevel.CRITICAL)
+        }
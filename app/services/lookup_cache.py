@@ -0,0 +1,163 @@
+# app/services/lookup_cache.py
+"""
+Cache em processo (TTL) para SystemConfig e WhatsAppTemplate.
+
+SystemConfig.get ia ao banco em toda chamada (Booking.can_cancel por
+booking renderizado, NuPayService com 3 leituras por instancia) e cada
+envio de template buscava o WhatsAppTemplate. Os valores mudam raramente
+e so pelo painel admin.
+
+Coerencia entre workers: cada invalidacao grava um novo carimbo de
+versao na linha `cache_version` de system_config. Os processos conferem
+o carimbo no maximo a cada LOOKUP_CACHE_VERSION_CHECK_SECONDS e, se ele
+mudou, descartam o cache local inteiro. Sem app context (ou com
+LOOKUP_CACHE_TTL = 0) o cache fica desligado.
+"""
+
+import logging
+import threading
+import time
+import uuid
+from typing import Callable, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+VERSION_KEY = 'cache_version'
+_UNSET = object()
+
+
+class LookupCache:
+    """Dicionario (namespace, chave) -> valor com expiracao e carimbo de versao."""
+
+    def __init__(self):
+        self._entries = {}
+        self._lock = threading.Lock()
+        self._version = _UNSET
+        self._version_checked_at = 0.0
+        self._stats = {
+            'hits': 0,
+            'misses': 0,
+            'invalidations': 0,
+            'version_reloads': 0,
+        }
+
+    @staticmethod
+    def _settings():
+        from flask import current_app, has_app_context
+        if not has_app_context():
+            return 0, 0
+        config = current_app.config
+        return (config.get('LOOKUP_CACHE_TTL', 300),
+                config.get('LOOKUP_CACHE_VERSION_CHECK_SECONDS', 5))
+
+    # =========================================================================
+    # Leitura
+    # =========================================================================
+
+    def get_or_load(self, namespace: str, key, loader: Callable):
+        """
+        Retorna o valor em cache ou executa `loader()` e guarda o resultado
+        (inclusive None, para nao repetir buscas sem resultado).
+        """
+        ttl, check_interval = self._settings()
+        if ttl <= 0:
+            return loader()
+
+        self._check_version(check_interval)
+
+        now = time.monotonic()
+        entry = self._entries.get((namespace, key))
+        if entry is not None and entry[0] > now:
+            self._stats['hits'] += 1
+            return entry[1]
+
+        self._stats['misses'] += 1
+        value = loader()
+        with self._lock:
+            self._entries[(namespace, key)] = (now + ttl, value)
+        return value
+
+    def _check_version(self, interval: float):
+        """Descarta o cache local se outro processo invalidou."""
+        now = time.monotonic()
+        if now - self._version_checked_at < interval:
+            return
+        self._version_checked_at = now
+
+        version = self._read_version()
+        if version != self._version:
+            with self._lock:
+                if self._version is not _UNSET:
+                    self._entries.clear()
+                    self._stats['version_reloads'] += 1
+                self._version = version
+
+    @staticmethod
+    def _read_version() -> Optional[str]:
+        from app import db
+        from app.models.system_config import SystemConfig
+        try:
+            return db.session.query(SystemConfig.value).filter_by(key=VERSION_KEY).scalar()
+        except Exception as e:
+            logger.warning(f"Falha ao ler versao do cache: {e}")
+            return None
+
+    # =========================================================================
+    # Invalidacao
+    # =========================================================================
+
+    def invalidate(self, namespace: Optional[str] = None):
+        """
+        Limpa o namespace (ou tudo) neste processo e publica novo carimbo
+        de versao para os demais workers. Faz commit: chamar depois de
+        gravar a alteracao.
+        """
+        with self._lock:
+            if namespace is None:
+                self._entries.clear()
+            else:
+                for cache_key in [k for k in self._entries if k[0] == namespace]:
+                    del self._entries[cache_key]
+        self._stats['invalidations'] += 1
+
+        from flask import has_app_context
+        if has_app_context():
+            self._version = self._bump_version()
+            self._version_checked_at = time.monotonic()
+
+    @staticmethod
+    def _bump_version() -> Optional[str]:
+        from app import db
+        from app.models.system_config import SystemConfig
+
+        stamp = uuid.uuid4().hex[:16]
+        try:
+            updated = SystemConfig.query.filter_by(key=VERSION_KEY).update({'value': stamp})
+            if not updated:
+                db.session.add(SystemConfig(
+                    key=VERSION_KEY, value=stamp,
+                    description='Versao do cache de configuracoes (uso interno)'
+                ))
+            db.session.commit()
+            return stamp
+        except Exception as e:
+            db.session.rollback()
+            logger.error(f"Falha ao publicar versao do cache: {e}")
+            return None
+
+    # =========================================================================
+    # Estatisticas
+    # =========================================================================
+
+    def get_stats(self) -> Dict:
+        """Contadores de acerto do cache neste processo."""
+        stats = dict(self._stats)
+        lookups = stats['hits'] + stats['misses']
+        stats['hit_rate'] = round(stats['hits'] / lookups, 4) if lookups else 0.0
+        stats['entries'] = len(self._entries)
+        stats['version'] = None if self._version is _UNSET else self._version
+        return stats
+
+
+# Singleton
+lookup_cache = LookupCache()
@@ -2,12 +2,60 @@
 
 import requests
 import os
+import functools
+import inspect
+import logging
+import threading
+import time
 from typing import Dict, List, Optional
+from requests.adapters import HTTPAdapter
+from urllib3.exceptions import NewConnectionError
 from datetime import datetime
+from sqlalchemy import func
 from app import db
+from app.services.whatsapp_dispatcher import TokenBucket, backoff_delay
 
+logger = logging.getLogger(__name__)
 
-from dataclasses import dataclass, field
+# Status HTTP que valem nova tentativa (limite do provedor / instabilidade)
+RETRY_STATUS = {429, 500, 502, 503, 504}
+
+# Envios (POST) so sao repetidos quando o provedor certamente nao os recebeu:
+# 429 (recusado pelo limite) e falha ao abrir a conexao. Timeout de leitura e
+# 5xx podem chegar depois da mensagem aceita, e repetir duplicaria o WhatsApp.
+RETRY_STATUS_UNSAFE = {429}
+SAFE_METHODS = {'GET', 'HEAD', 'OPTIONS'}
+
+
+def _never_reached_provider(error: Exception) -> bool:
+    """True se a requisicao falhou antes de a conexao ser aberta."""
+    if isinstance(error, requests.exceptions.ConnectTimeout):
+        return True
+    if isinstance(error, requests.exceptions.ConnectionError):
+        reason = getattr(error.args[0], 'reason', None) if error.args else None
+        return isinstance(reason, NewConnectionError)
+    return False
+
+
+def is_retryable_send_error(error: BaseException) -> bool:
+    """
+    True se vale reenviar: a Megaapi recusou pelo limite (429) ou a conexao
+    nem foi aberta. Os send_* relancam o erro HTTP como Exception, entao a
+    cadeia de excecoes (__cause__/__context__) e percorrida.
+    """
+    seen = set()
+    while error is not None and id(error) not in seen:
+        seen.add(id(error))
+        if isinstance(error, requests.exceptions.HTTPError):
+            response = error.response
+            return response is not None and response.status_code in RETRY_STATUS_UNSAFE
+        if isinstance(error, requests.exceptions.RequestException):
+            return _never_reached_provider(error)
+        error = error.__cause__ or error.__context__
+    return False
+
+
+from dataclasses import dataclass, field, asdict, is_dataclass
 
 
 @dataclass
@@ -32,6 +80,52 @@ class ListMessage:
     sections: List[ListSection] = field(default_factory=list)
 
 
+def _to_json(value):
+    """Converte argumentos de envio (ex: lista de Button) para JSON."""
+    if is_dataclass(value):
+        return asdict(value)
+    if isinstance(value, (list, tuple)):
+        return [_to_json(v) for v in value]
+    return value
+
+
+def queueable(method):
+    """
+    Envia pela fila persistente (outbound_messages) quando ativa.
+
+    Parametros extras aceitos pelo metodo decorado:
+        queue: None = WHATSAPP_QUEUE_ENABLED; False forca envio direto
+        idempotency_key: evita enfileirar o mesmo evento duas vezes
+
+    Com a fila, retorna {'success': True, 'queued': True, 'outbound_id'}.
+    """
+    signature = inspect.signature(method)
+
+    @functools.wraps(method)
+    def wrapper(self, *args, queue: Optional[bool] = None,
+                idempotency_key: Optional[str] = None, **kwargs):
+        from app.services.outbound_queue import outbound_queue
+
+        if queue is None:
+            queue = outbound_queue.enabled()
+        if not queue:
+            return method(self, *args, **kwargs)
+
+        arguments = signature.bind(self, *args, **kwargs).arguments
+        payload = {name: _to_json(value) for name, value in arguments.items() if name != 'self'}
+        payload['phone'] = self._format_phone(payload['phone'])  # ValueError na hora, como no envio direto
+        message = outbound_queue.enqueue(
+            method.__name__,
+            payload,
+            user_id=payload.get('user_id'),
+            phone=payload.get('phone'),
+            idempotency_key=idempotency_key
+        )
+        return {'success': True, 'queued': True, 'outbound_id': message.id}
+
+    return wrapper
+
+
 class MegapiService:
     """
     Servico completo de integracao com Megaapi (WhatsApp Business)
@@ -46,6 +140,130 @@ class MegapiService:
             'Content-Type': 'application/json'
         }
 
+        # Sessao persistente (keep-alive) compartilhada por todos os envios,
+        # com pool de conexoes do tamanho do dispatcher (sem novo TCP/TLS por POST).
+        # Headers vao por requisicao: o token pode ser trocado pelo admin.
+        pool_size = int(os.getenv('MEGAAPI_POOL_SIZE', 16))
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=2, pool_maxsize=pool_size, pool_block=True)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+
+        # Ritmo do provedor: vale para todas as threads do processo
+        self.rate_limiter = TokenBucket(
+            rate=float(os.getenv('MEGAAPI_RATE_PER_SECOND', 10)),
+            capacity=float(os.getenv('MEGAAPI_RATE_BURST', 20))
+        )
+        self.max_retries = int(os.getenv('MEGAAPI_MAX_RETRIES', 3))
+        self.backoff_base = float(os.getenv('MEGAAPI_BACKOFF_BASE', 0.5))
+
+        self._stats_lock = threading.Lock()
+        self._stats = {'requests': 0, 'retries': 0, 'errors': 0, 'throttled_s': 0.0}
+
+    # ================= HTTP =================
+
+    def _request(self, method: str, url: str, timeout: float, **kwargs) -> requests.Response:
+        """
+        Requisicao na sessao compartilhada, respeitando o rate limit.
+
+        Repete ate `max_retries` vezes com backoff exponencial com jitter
+        (ou o Retry-After do provedor):
+        - GET: erros de conexao, timeouts, 429 e 5xx
+        - POST (envios): apenas 429 e falha ao conectar, quando a mensagem
+          certamente nao chegou ao provedor. A Megaapi nao documenta chave
+          de idempotencia, entao timeout de leitura e 5xx levantam na hora
+          em vez de arriscar mensagem duplicada para o aluno.
+        Demais erros HTTP levantam na hora.
+
+        Raises:
+            requests.exceptions.RequestException
+        """
+        safe = method.upper() in SAFE_METHODS
+        retry_status = RETRY_STATUS if safe else RETRY_STATUS_UNSAFE
+        attempt = 0
+        while True:
+            waited = self.rate_limiter.acquire()
+            try:
+                response = self.session.request(method, url, headers=self.headers,
+                                                timeout=timeout, **kwargs)
+                retryable = response.status_code in retry_status
+                error = None
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+                response, error = None, e
+                retryable = safe or _never_reached_provider(e)
+
+            with self._stats_lock:
+                self._stats['requests'] += 1
+                self._stats['throttled_s'] += waited
+                if retryable and attempt < self.max_retries:
+                    self._stats['retries'] += 1
+                elif retryable or error is not None or not response.ok:
+                    self._stats['errors'] += 1
+
+            if not retryable or attempt >= self.max_retries:
+                if error is not None:
+                    raise error
+                response.raise_for_status()
+                return response
+
+            delay = backoff_delay(attempt, self.backoff_base)
+            retry_after = response.headers.get('Retry-After') if response is not None else None
+            if retry_after and retry_after.isdigit():
+                delay = max(delay, float(retry_after))
+            logger.info(f"Megaapi: nova tentativa em {delay:.2f}s ({error or response.status_code})")
+            time.sleep(delay)
+            attempt += 1
+
+    def _post(self, url: str, payload: Dict, timeout: float = 30) -> Dict:
+        """POST JSON; retorna o corpo da resposta."""
+        return self._request('POST', url, timeout, json=payload).json()
+
+    def _get(self, url: str, timeout: float = 10) -> Dict:
+        """GET; retorna o corpo da resposta."""
+        return self._request('GET', url, timeout).json()
+
+    def get_stats(self) -> Dict:
+        """Contadores de requisicoes HTTP do processo."""
+        with self._stats_lock:
+            stats = dict(self._stats)
+        stats['throttled_s'] = round(stats['throttled_s'], 3)
+        return stats
+
+    # ================= ENVIOS =================
+
+    def deliver(self, kind: str, payload: Dict) -> Dict:
+        """
+        Envio direto de uma mensagem da fila (usado pelo worker).
+
+        Args:
+            kind: Nome do metodo send_* enfileirado
+            payload: Argumentos gravados em outbound_messages.payload
+
+        Returns:
+            {'success': True, 'message_id', 'response'} ou
+            {'success': False, 'retryable', 'error'}. `retryable` so e True
+            quando a mensagem certamente nao chegou ao provedor (429 ou falha
+            ao conectar); timeout de leitura, 5xx e erros permanentes (ex:
+            template inexistente) nao devem ser reenviados.
+        """
+        method = getattr(type(self), kind, None)
+        try:
+            if method is None or not hasattr(method, '__wrapped__'):
+                raise ValueError(f"Tipo de mensagem desconhecido na fila: {kind}")
+
+            payload = dict(payload)
+            if kind == 'send_buttons':
+                payload['buttons'] = [Button(**b) for b in payload['buttons']]
+            result = method.__wrapped__(self, **payload)
+        except Exception as e:
+            return {'success': False, 'retryable': is_retryable_send_error(e), 'error': str(e)}
+
+        result = result or {}
+        if result.get('success') is False:
+            return {'success': False, 'retryable': bool(result.get('retryable')), 'error': result.get('error')}
+        return {'success': True, 'message_id': result.get('message_id') or result.get('id'), 'response': result}
+
+    @queueable
     def send_template_message(
         self,
         phone: str,
@@ -65,13 +283,12 @@ class MegapiService:
         Returns:
             Resposta da API
         """
-        from app.models import WhatsAppLog, WhatsAppTemplate
+        from flask import current_app
+        from app.models import WhatsAppTemplate
+        from app.services.whatsapp_log_writer import whatsapp_log_writer
 
-        # Buscar template no BD
-        template = WhatsAppTemplate.query.filter_by(
-            template_code=template_name,
-            is_active=True
-        ).first()
+        # Buscar template (cache de lookups; invalidado pelas rotas de templates)
+        template = WhatsAppTemplate.get_active(template_code=template_name)
 
         if not template:
             raise Exception(f"Template '{template_name}' nao encontrado ou inativo")
@@ -100,15 +317,7 @@ class MegapiService:
         }
 
         try:
-            response = requests.post(
-                f"{self.base_url}/messages/template",
-                headers=self.headers,
-                json=payload,
-                timeout=30
-            )
-            response.raise_for_status()
-
-            result = response.json()
+            result = self._post(f"{self.base_url}/messages/template", payload)
 
             # Salvar log
             self._log_message(
@@ -117,12 +326,20 @@ class MegapiService:
                 user_id=user_id,
                 status='sent',
                 message_id=result.get('id'),
-                response_json=result
+                response_json=result,
+                content=f"{template_name}: {', '.join(map(str, variables))}",
+                template_id=template.id
             )
 
-            # Incrementar contador
-            template.send_count += 1
-            db.session.commit()
+            # Incrementar contador (somado em memoria e gravado no flush dos logs)
+            if current_app.config.get('WHATSAPP_LOG_ASYNC', True):
+                whatsapp_log_writer.count_template(template.id)
+            else:
+                WhatsAppTemplate.query.filter_by(id=template.id).update(
+                    {WhatsAppTemplate.send_count: func.coalesce(WhatsAppTemplate.send_count, 0) + 1},
+                    synchronize_session=False
+                )
+                db.session.commit()
 
             return result
 
@@ -133,11 +350,14 @@ class MegapiService:
                 template_name=template_name,
                 user_id=user_id,
                 status='failed',
-                error_message=str(e)
+                error_message=str(e),
+                content=f"{template_name}: {', '.join(map(str, variables))}",
+                template_id=template.id
             )
 
             raise Exception(f"Erro ao enviar mensagem WhatsApp: {str(e)}")
 
+    @queueable
     def send_custom_message(
         self,
         phone: str,
@@ -155,15 +375,7 @@ class MegapiService:
         }
 
         try:
-            response = requests.post(
-                f"{self.base_url}/messages/text",
-                headers=self.headers,
-                json=payload,
-                timeout=30
-            )
-            response.raise_for_status()
-
-            result = response.json()
+            result = self._post(f"{self.base_url}/messages/text", payload)
 
             self._log_message(
                 phone=phone,
@@ -171,7 +383,8 @@ class MegapiService:
                 user_id=user_id,
                 status='sent',
                 message_id=result.get('id'),
-                response_json=result
+                response_json=result,
+                content=message
             )
 
             return result
@@ -182,11 +395,13 @@ class MegapiService:
                 template_name='custom_text',
                 user_id=user_id,
                 status='failed',
-                error_message=str(e)
+                error_message=str(e),
+                content=message
             )
 
             raise Exception(f"Erro ao enviar mensagem: {str(e)}")
 
+    @queueable
     def send_buttons(
         self,
         phone: str,
@@ -219,15 +434,7 @@ class MegapiService:
         try:
             url = f"{self.base_url}/sendMessage/{self.instance_key}/buttonsMessage"
 
-            response = requests.post(
-                url,
-                headers=self.headers,
-                json=payload,
-                timeout=30
-            )
-            response.raise_for_status()
-
-            result = response.json()
+            result = self._post(url, payload)
 
             self._log_message(
                 phone=phone,
@@ -235,7 +442,8 @@ class MegapiService:
                 user_id=user_id,
                 status='sent',
                 message_id=result.get('id'),
-                response_json=result
+                response_json=result,
+                content=message
             )
 
             return result
@@ -246,11 +454,13 @@ class MegapiService:
                 template_name='button_message',
                 user_id=user_id,
                 status='failed',
-                error_message=str(e)
+                error_message=str(e),
+                content=message
             )
 
             raise Exception(f"Erro ao enviar button message: {str(e)}")
 
+    @queueable
     def send_list_message(
         self,
         phone: str,
@@ -304,15 +514,7 @@ class MegapiService:
             # Endpoint para List Message
             url = f"{self.base_url}/sendMessage/{self.instance_key}/listMessage"
 
-            response = requests.post(
-                url,
-                headers=self.headers,
-                json=payload,
-                timeout=30
-            )
-            response.raise_for_status()
-
-            result = response.json()
+            result = self._post(url, payload)
 
             self._log_message(
                 phone=phone,
@@ -320,7 +522,8 @@ class MegapiService:
                 user_id=user_id,
                 status='sent',
                 message_id=result.get('id'),
-                response_json=result
+                response_json=result,
+                content=text
             )
 
             return result
@@ -331,7 +534,8 @@ class MegapiService:
                 template_name='list_message',
                 user_id=user_id,
                 status='failed',
-                error_message=str(e)
+                error_message=str(e),
+                content=text
             )
 
             raise Exception(f"Erro ao enviar list message: {str(e)}")
@@ -357,47 +561,34 @@ class MegapiService:
             ]
 
         Returns:
-            Resumo do envio
+            Resumo do envio (inclui metricas do disparo)
         """
+        from app.services.whatsapp_dispatcher import dispatcher
 
-        results = {
+        report = dispatcher.dispatch(recipients, lambda recipient: self.send_template_message(
+            phone=recipient["phone"],
+            template_name=recipient["template_name"],
+            variables=recipient["variables"],
+            user_id=recipient.get("user_id")
+        ))
+
+        return {
             "total": len(recipients),
-            "success": 0,
-            "failed": 0,
-            "errors": []
+            "success": report["metrics"]["sent"],
+            "failed": report["metrics"]["failed"],
+            "errors": [
+                {"phone": entry["message"]["phone"], "error": entry["error"]}
+                for entry in report["results"] if not entry["success"]
+            ],
+            "metrics": report["metrics"]
         }
 
-        for recipient in recipients:
-            try:
-                self.send_template_message(
-                    phone=recipient["phone"],
-                    template_name=recipient["template_name"],
-                    variables=recipient["variables"],
-                    user_id=recipient.get("user_id")
-                )
-                results["success"] += 1
-
-            except Exception as e:
-                results["failed"] += 1
-                results["errors"].append({
-                    "phone": recipient["phone"],
-                    "error": str(e)
-                })
-
-        return results
-
     def get_message_status(self, message_id: str) -> Dict:
         """
         Consulta status de mensagem enviada
         """
         try:
-            response = requests.get(
-                f"{self.base_url}/messages/{message_id}",
-                headers=self.headers,
-                timeout=10
-            )
-            response.raise_for_status()
-            return response.json()
+            return self._get(f"{self.base_url}/messages/{message_id}")
 
         except requests.exceptions.RequestException as e:
             raise Exception(f"Erro ao consultar status: {str(e)}")
@@ -407,19 +598,14 @@ class MegapiService:
         Consulta status de aprovacao de um template
         """
         try:
-            response = requests.get(
-                f"{self.base_url}/templates/{template_code}",
-                headers=self.headers,
-                timeout=10
-            )
-            response.raise_for_status()
+            data = self._get(f"{self.base_url}/templates/{template_code}")
 
-            data = response.json()
             return data.get('status', 'unknown')
 
         except:
             return 'unknown'
 
+    @queueable
     def send_template(
         self,
         phone: str,
@@ -465,15 +651,7 @@ class MegapiService:
         try:
             url = f"{self.base_url}/sendMessage/{self.instance_key}/templateMessage"
 
-            response = requests.post(
-                url,
-                headers=self.headers,
-                json=payload,
-                timeout=30
-            )
-            response.raise_for_status()
-
-            result = response.json()
+            result = self._post(url, payload)
 
             self._log_message(
                 phone=phone,
@@ -494,7 +672,7 @@ class MegapiService:
                 status='failed',
                 error_message=str(e)
             )
-            return {'success': False, 'error': str(e)}
+            return {'success': False, 'error': str(e), 'retryable': is_retryable_send_error(e)}
 
     def _format_phone(self, phone: str) -> str:
         """
@@ -523,26 +701,178 @@ class MegapiService:
         status: str = 'sent',
         message_id: Optional[str] = None,
         response_json: Optional[Dict] = None,
-        error_message: Optional[str] = None
+        error_message: Optional[str] = None,
+        content: Optional[str] = None,
+        template_id: Optional[int] = None
     ):
         """
         Salva log de mensagem no banco
+
+        Com WHATSAPP_LOG_ASYNC (padrao) o registro vai para o
+        WhatsAppLogWriter (bulk insert em background); senao grava na hora.
         """
+        from flask import current_app
         from app.models import WhatsAppLog
+        from app.models.whatsapp_log import MessageStatus
+        from app.services.whatsapp_log_writer import whatsapp_log_writer
+
+        # whatsapp_logs.user_id e obrigatorio (ex: mensagem de teste do admin)
+        if user_id is None:
+            return
+
+        now = datetime.utcnow()
+        row = {
+            'user_id': user_id,
+            'phone': phone,
+            'template_id': template_id,
+            'message_content': content or template_name,
+            'status': MessageStatus.SENT if status == 'sent' else MessageStatus.FAILED,
+            'megaapi_message_id': message_id,
+            'error_message': error_message,
+            'sent_at': now if status == 'sent' else None,
+            'created_at': now,
+        }
 
-        log = WhatsAppLog(
-            user_id=user_id,
-            phone=phone,
-            template_name=template_name,
-            status=status,
-            message_id=message_id,
-            response_json=response_json,
-            error_message=error_message,
-            sent_at=datetime.utcnow()
-        )
+        if current_app.config.get('WHATSAPP_LOG_ASYNC', True):
+            whatsapp_log_writer.submit(row)
+            return
 
-        db.session.add(log)
+        try:
+            db.session.add(WhatsAppLog(**row))
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            logger.error(f"Erro ao salvar log de WhatsApp: {e}")
+
+
+# =============================================================================
+# Benchmark
+# =============================================================================
+
+def _start_stub_server(latency_ms: float):
+    """Servidor HTTP local (keep-alive) que imita a Megaapi."""
+    import json
+    from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+    class StubHandler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+        disable_nagle_algorithm = True  # Sem atraso de ACK em conexao keep-alive
+        counter = 0
+
+        def do_POST(self):
+            self.rfile.read(int(self.headers.get('Content-Length', 0)))
+            if latency_ms:
+                time.sleep(latency_ms / 1000)
+            StubHandler.counter += 1
+            body = json.dumps({'id': f'stub-{StubHandler.counter}'}).encode()
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), StubHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f'http://127.0.0.1:{server.server_port}'
+
+
+def benchmark_campaign(messages: int = 1000, latency_ms: float = 5.0,
+                       user_id: Optional[int] = None) -> List[Dict]:
+    """
+    Campanha simulada de templates contra um servidor HTTP local.
+
+    legado: requests.post sem sessao (TCP novo por POST), log e contador
+            do template com commit por mensagem
+    otimizado: sessao keep-alive + WhatsAppLogWriter (bulk insert) +
+               contador agregado
+    Os dois rodam em sequencia na mesma thread, isolando o custo de
+    conexao e de banco. Template e logs do benchmark sao apagados no fim.
+
+    Returns:
+        Lista com tempo, msgs/s, logs gravados e incremento do contador
+    """
+    from app.models import User, WhatsAppLog, WhatsAppTemplate
+    from app.models.whatsapp_log import MessageStatus
+    from app.models.whatsapp_template import TemplateCategory, TemplateTrigger
+    from app.services.whatsapp_log_writer import whatsapp_log_writer
+
+    user_id = user_id or db.session.query(User.id).order_by(User.id).limit(1).scalar()
+    if user_id is None:
+        raise ValueError("Benchmark precisa de ao menos um usuario cadastrado")
+
+    template = WhatsAppTemplate(
+        name='Benchmark campanha', template_code='benchmark_campaign',
+        category=list(TemplateCategory)[0], trigger=list(TemplateTrigger)[0],
+        content='Ola {{1}}', megaapi_status='approved', is_active=True, send_count=0
+    )
+    db.session.add(template)
+    db.session.commit()
+    template_id = template.id
+
+    server, base_url = _start_stub_server(latency_ms)
+    phone, variables = '11999999999', ['Aluno']
+    results = []
+
+    def measure(name, send_one, finish=None):
+        start = time.perf_counter()
+        for _ in range(messages):
+            send_one()
+        if finish:
+            finish()
+        elapsed = time.perf_counter() - start
+
+        count_before = results[-1]['_count'] if results else 0
+        db.session.expire_all()
+        send_count = db.session.get(WhatsAppTemplate, template_id).send_count or 0
+        results.append({
+            'mode': name,
+            'messages': messages,
+            'elapsed_s': round(elapsed, 3),
+            'messages_per_sec': round(messages / elapsed, 1),
+            'ms_per_message': round(elapsed / messages * 1000, 3),
+            'logs_written': WhatsAppLog.query.filter_by(template_id=template_id).count(),
+            'send_count_delta': send_count - count_before,
+            '_count': send_count,
+        })
+        WhatsAppLog.query.filter_by(template_id=template_id).delete()
+        db.session.commit()
+
+    # Legado: uma conexao e dois commits por mensagem
+    def legacy_send():
+        tpl = WhatsAppTemplate.query.filter_by(template_code='benchmark_campaign', is_active=True).first()
+        response = requests.post(f"{base_url}/messages/template", headers=megaapi.headers,
+                                 json={'phone': megaapi._format_phone(phone), 'variables': variables},
+                                 timeout=30)
+        response.raise_for_status()
+        result = response.json()
+        db.session.add(WhatsAppLog(
+            user_id=user_id, phone=phone, template_id=tpl.id, message_content='benchmark',
+            status=MessageStatus.SENT, megaapi_message_id=result.get('id'), sent_at=datetime.utcnow()
+        ))
         db.session.commit()
+        tpl.send_count += 1
+        db.session.commit()
+
+    original_url, original_limiter = megaapi.base_url, megaapi.rate_limiter
+    megaapi.base_url, megaapi.rate_limiter = base_url, TokenBucket(rate=0)
+    try:
+        measure('legado', legacy_send)
+        measure('otimizado', lambda: megaapi.send_template_message(
+            phone, 'benchmark_campaign', variables, user_id=user_id, queue=False
+        ), finish=whatsapp_log_writer.shutdown)  # Espera o lote em andamento
+    finally:
+        megaapi.base_url, megaapi.rate_limiter = original_url, original_limiter
+        server.shutdown()
+        WhatsAppLog.query.filter_by(template_id=template_id).delete()
+        WhatsAppTemplate.query.filter_by(id=template_id).delete()
+        db.session.commit()
+
+    for r in results:
+        r.pop('_count')
+    return results
 
 
 # Singleton
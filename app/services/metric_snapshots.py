@@ -0,0 +1,297 @@
+# app/services/metric_snapshots.py
+"""
+Snapshots diarios dos KPIs do dashboard estrategico (tabela metric_snapshots).
+
+/admin/metrics/api/kpis fazia ~20 COUNT/SUM a cada carregamento e trazia
+para o Python todas as respostas de NPS do periodo; /api/trends repetia
+4 consultas por mes. Aqui cada metrica aditiva vira um balde diario:
+
+- refresh (job do scheduler): calcula os dias encerrados que ainda nao
+  estao gravados, com uma consulta agrupada por dia para cada fonte, e
+  recalcula os ultimos METRIC_SNAPSHOT_SETTLE_DAYS (status de leitura do
+  WhatsApp, conversao de leads e pagamentos ainda mudam nesses dias)
+- leitura: os dias encerrados vem da tabela; o dia corrente (e qualquer
+  dia ainda nao gravado) e calculado na hora
+
+Datas em UTC, como as colunas de origem (datetime.utcnow). Metricas de
+estado atual (churn, health score medio) nao sao aditivas e continuam
+sendo calculadas na rota.
+"""
+
+import logging
+from collections import defaultdict
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import func
+
+from app import db
+from app.models.metric_snapshot import MetricSnapshot
+
+logger = logging.getLogger(__name__)
+
+METRICS = (
+    'new_students',
+    'leads_created',
+    'leads_won',
+    'wa_sent',
+    'wa_read',
+    'nps_promoters',
+    'nps_passives',
+    'nps_detractors',
+    'revenue_paid',
+)
+
+# Classificacao das respostas de NPS (AutomationLog.automation_type)
+NPS_BUCKETS = (
+    ('EXCELENTE', 'nps_promoters'),
+    ('BOA', 'nps_passives'),
+    ('REGULAR', 'nps_detractors'),
+    ('RUIM', 'nps_detractors'),
+)
+
+Daily = Dict[date, Dict[str, Decimal]]
+
+
+def _as_date(value) -> date:
+    """func.date() devolve string no SQLite e date no PostgreSQL."""
+    if isinstance(value, date):
+        return value
+    return date.fromisoformat(str(value)[:10])
+
+
+def month_starts(today: date, count: int) -> List[date]:
+    """Primeiro dia dos ultimos `count` meses de calendario (o atual por ultimo)."""
+    year, month = today.year, today.month
+    starts = []
+    for _ in range(count):
+        starts.append(date(year, month, 1))
+        year, month = (year, month - 1) if month > 1 else (year - 1, 12)
+    return starts[::-1]
+
+
+class MetricSnapshotService:
+    """Calculo, gravacao e leitura dos baldes diarios de KPIs."""
+
+    # =========================================================================
+    # Calculo a partir das tabelas de origem
+    # =========================================================================
+
+    @staticmethod
+    def _grouped(column, aggregate, start: date, end: date, *filters):
+        """[(dia, valor)] de `aggregate` agrupado por func.date(column) em [start, end]."""
+        day = func.date(column)
+        return db.session.query(day, aggregate).filter(
+            column >= datetime.combine(start, datetime.min.time()),
+            column < datetime.combine(end + timedelta(days=1), datetime.min.time()),
+            *filters
+        ).group_by(day).all()
+
+    def compute(self, start: date, end: date) -> Daily:
+        """
+        Valores de todas as metricas para cada dia de [start, end].
+
+        Uma consulta agrupada por fonte (usuarios, leads criados, leads
+        convertidos, WhatsApp, NPS, pagamentos), independente do tamanho
+        do intervalo. Dias sem movimento ficam com zero.
+        """
+        from app.models import User, Payment
+        from app.models.payment import PaymentStatusEnum
+        from app.models.crm import Lead, LeadStatus, AutomationLog
+        from app.models.whatsapp_log import WhatsAppLog, MessageStatus
+
+        result: Daily = {}
+        day = start
+        while day <= end:
+            result[day] = {metric: Decimal(0) for metric in METRICS}
+            day += timedelta(days=1)
+
+        def add(metric, rows):
+            for row_day, value in rows:
+                if row_day is not None:
+                    result[_as_date(row_day)][metric] += Decimal(value or 0)
+
+        add('new_students', self._grouped(
+            User.created_at, func.count(User.id), start, end,
+            User.role == 'student'
+        ))
+        add('leads_created', self._grouped(
+            Lead.created_at, func.count(Lead.id), start, end
+        ))
+        add('leads_won', self._grouped(
+            Lead.converted_at, func.count(Lead.id), start, end,
+            Lead.status == LeadStatus.WON
+        ))
+        add('revenue_paid', self._grouped(
+            Payment.paid_date, func.sum(Payment.amount), start, end,
+            Payment.status == PaymentStatusEnum.PAID
+        ))
+
+        # WhatsApp: enviados (sent/delivered/read) e lidos na mesma consulta
+        wa_day = func.date(WhatsAppLog.sent_at)
+        wa_rows = db.session.query(
+            wa_day, WhatsAppLog.status, func.count(WhatsAppLog.id)
+        ).filter(
+            WhatsAppLog.sent_at >= datetime.combine(start, datetime.min.time()),
+            WhatsAppLog.sent_at < datetime.combine(end + timedelta(days=1), datetime.min.time()),
+            WhatsAppLog.status.in_([MessageStatus.SENT, MessageStatus.DELIVERED, MessageStatus.READ])
+        ).group_by(wa_day, WhatsAppLog.status).all()
+        add('wa_sent', [(d, count) for d, _, count in wa_rows])
+        add('wa_read', [(d, count) for d, status, count in wa_rows if status == MessageStatus.READ])
+
+        # NPS: contagem por tipo de resposta, classificada aqui
+        nps_day = func.date(AutomationLog.sent_at)
+        nps_rows = db.session.query(
+            nps_day, AutomationLog.automation_type, func.count(AutomationLog.id)
+        ).filter(
+            AutomationLog.automation_type.like('NPS_RESPONSE_%'),
+            AutomationLog.sent_at >= datetime.combine(start, datetime.min.time()),
+            AutomationLog.sent_at < datetime.combine(end + timedelta(days=1), datetime.min.time())
+        ).group_by(nps_day, AutomationLog.automation_type).all()
+        for row_day, automation_type, count in nps_rows:
+            for token, metric in NPS_BUCKETS:
+                if token in automation_type:
+                    add(metric, [(row_day, count)])
+                    break
+
+        return result
+
+    # =========================================================================
+    # Gravacao (job)
+    # =========================================================================
+
+    def refresh(self, today: Optional[date] = None) -> Dict:
+        """
+        Grava os dias encerrados pendentes e recalcula os recentes.
+
+        Intervalo: do primeiro dia nao gravado (limitado a
+        METRIC_SNAPSHOT_BACKFILL_DAYS) ou de hoje - SETTLE_DAYS, o que vier
+        antes, ate ontem. O intervalo e apagado e regravado numa transacao.
+
+        Returns:
+            dict com start, end e linhas gravadas
+        """
+        from flask import current_app
+
+        config = current_app.config
+        today = today or datetime.utcnow().date()
+        end = today - timedelta(days=1)
+        settle_start = today - timedelta(days=max(config.get('METRIC_SNAPSHOT_SETTLE_DAYS', 2), 1))
+        backfill_start = today - timedelta(days=config.get('METRIC_SNAPSHOT_BACKFILL_DAYS', 400))
+
+        last = db.session.query(func.max(MetricSnapshot.day)).scalar()
+        if last is None:
+            start = backfill_start
+        else:
+            start = min(_as_date(last) + timedelta(days=1), settle_start)
+            start = max(start, backfill_start)
+
+        if start > end:
+            return {'start': None, 'end': None, 'rows': 0}
+
+        values = self.compute(start, end)
+        now = datetime.utcnow()
+        rows = [
+            {'metric': metric, 'day': day, 'value': value, 'computed_at': now}
+            for day, metrics in values.items()
+            for metric, value in metrics.items()
+        ]
+
+        try:
+            MetricSnapshot.query.filter(
+                MetricSnapshot.day >= start,
+                MetricSnapshot.day <= end
+            ).delete(synchronize_session=False)
+            db.session.bulk_insert_mappings(MetricSnapshot, rows)
+            db.session.commit()
+        except Exception as e:
+            # Outro worker gravando o mesmo intervalo (chave unica metric/day)
+            db.session.rollback()
+            logger.warning(f"Snapshots de metricas nao gravados ({start} a {end}): {e}")
+            return {'start': start, 'end': end, 'rows': 0}
+
+        return {'start': start, 'end': end, 'rows': len(rows)}
+
+    # =========================================================================
+    # Leitura
+    # =========================================================================
+
+    def daily(self, start: date, end: date, today: Optional[date] = None) -> Daily:
+        """
+        Metricas por dia em [start, end].
+
+        Dias encerrados vem dos snapshots; dias sem snapshot e o dia
+        corrente sao calculados com uma unica passada de `compute`.
+        """
+        today = today or datetime.utcnow().date()
+        result: Daily = defaultdict(lambda: {metric: Decimal(0) for metric in METRICS})
+
+        closed_end = min(end, today - timedelta(days=1))
+        stored = set()
+        if start <= closed_end:
+            for metric, day, value in db.session.query(
+                MetricSnapshot.metric, MetricSnapshot.day, MetricSnapshot.value
+            ).filter(
+                MetricSnapshot.day >= start,
+                MetricSnapshot.day <= closed_end
+            ):
+                day = _as_date(day)
+                stored.add(day)
+                if metric in METRICS:
+                    result[day][metric] = Decimal(value or 0)
+
+        missing = []
+        day = start
+        while day <= end:
+            if day not in stored:
+                missing.append(day)
+            day += timedelta(days=1)
+
+        if missing:
+            live = self.compute(missing[0], missing[-1])
+            for day in missing:
+                result[day] = live[day]
+
+        return dict(result)
+
+    def totals(self, start: date, end: date, today: Optional[date] = None) -> Dict[str, Decimal]:
+        """Soma de cada metrica em [start, end]."""
+        totals = {metric: Decimal(0) for metric in METRICS}
+        for metrics in self.daily(start, end, today).values():
+            for metric, value in metrics.items():
+                totals[metric] += value
+        return totals
+
+    def windows(self, days: int, today: Optional[date] = None) -> Tuple[Dict, Dict]:
+        """
+        Totais da janela atual (ultimos `days` dias, incluindo hoje) e da
+        janela imediatamente anterior, lidos numa unica chamada a `daily`.
+        """
+        today = today or datetime.utcnow().date()
+        current_start = today - timedelta(days=days - 1)
+        previous_start = current_start - timedelta(days=days)
+
+        current = {metric: Decimal(0) for metric in METRICS}
+        previous = {metric: Decimal(0) for metric in METRICS}
+        for day, metrics in self.daily(previous_start, today, today).items():
+            bucket = current if day >= current_start else previous
+            for metric, value in metrics.items():
+                bucket[metric] += value
+        return current, previous
+
+    def monthly(self, months: int, today: Optional[date] = None) -> List[Tuple[date, Dict[str, Decimal]]]:
+        """Totais por mes de calendario dos ultimos `months` meses (o atual ate hoje)."""
+        today = today or datetime.utcnow().date()
+        starts = month_starts(today, months)
+        buckets = {start: {metric: Decimal(0) for metric in METRICS} for start in starts}
+
+        for day, metrics in self.daily(starts[0], today, today).items():
+            bucket = buckets[day.replace(day=1)]
+            for metric, value in metrics.items():
+                bucket[metric] += value
+        return [(start, buckets[start]) for start in starts]
+
+
+# Singleton
+metric_snapshots = MetricSnapshotService()
@@ -33,10 +33,7 @@ class NotificationService:
 
         trigger = TemplateTrigger.XP_CONVERSION_AUTO if is_automatic else TemplateTrigger.XP_CONVERSION_MANUAL
 
-        template = WhatsAppTemplate.query.filter_by(
-            trigger=trigger,
-            is_active=True
-        ).first()
+        template = WhatsAppTemplate.get_active(trigger=trigger)
 
         if not template:
             logger.info(f"Template para {trigger.value} nao configurado")
@@ -86,10 +83,7 @@ class NotificationService:
         else:
             trigger = TemplateTrigger.CREDITS_EXPIRING
 
-        template = WhatsAppTemplate.query.filter_by(
-            trigger=trigger,
-            is_active=True
-        ).first()
+        template = WhatsAppTemplate.get_active(trigger=trigger)
 
         if not template:
             logger.info(f"Template para {trigger.value} nao configurado")
@@ -130,10 +124,7 @@ class NotificationService:
         if not user or not user.phone:
             return False
 
-        template = WhatsAppTemplate.query.filter_by(
-            trigger=TemplateTrigger.CREDITS_EXPIRED,
-            is_active=True
-        ).first()
+        template = WhatsAppTemplate.get_active(trigger=TemplateTrigger.CREDITS_EXPIRED)
 
         if not template:
             return False
@@ -171,10 +162,7 @@ class NotificationService:
         if not user or not user.phone:
             return False
 
-        template = WhatsAppTemplate.query.filter_by(
-            trigger=TemplateTrigger.XP_GOAL_NEAR,
-            is_active=True
-        ).first()
+        template = WhatsAppTemplate.get_active(trigger=TemplateTrigger.XP_GOAL_NEAR)
 
         if not template:
             return False
@@ -258,10 +246,7 @@ class NotificationService:
         else:
             trigger = TemplateTrigger.HEALTH_SCREENING_EXPIRING
 
-        template = WhatsAppTemplate.query.filter_by(
-            trigger=trigger,
-            is_active=True
-        ).first()
+        template = WhatsAppTemplate.get_active(trigger=trigger)
 
         if not template:
             return False
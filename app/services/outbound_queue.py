@@ -0,0 +1,291 @@
+# app/services/outbound_queue.py
+"""
+Fila persistente de envios WhatsApp (tabela outbound_messages).
+
+Com WHATSAPP_QUEUE_ENABLED os metodos megaapi.send_* apenas gravam a
+mensagem e retornam; checkout, webhooks e agendamentos deixam de esperar
+a Megaapi. O worker (job do scheduler ou `flask whatsapp process-queue`)
+reserva lotes com um UPDATE condicional (status ainda pendente), envia pelo
+WhatsAppDispatcher e reagenda com backoff exponencial apenas as falhas em
+que a mensagem nao chegou a Megaapi (429 ou conexao recusada). Timeout de
+leitura, 5xx e erros permanentes vao direto para FAILED: o provedor pode
+ter aceitado a mensagem, e reenviar duplicaria o WhatsApp do aluno.
+
+enqueue nao faz commit: a mensagem entra na transacao do chamador e so
+existe se ela for confirmada (rollback descarta o envio junto com o resto).
+Chamadores que apenas enviam (ex: respostas do webhook) nao fazem commit;
+para eles o fim do app context confirma as mensagens pendentes, desde que
+nao tenha havido excecao.
+"""
+
+import logging
+import threading
+import uuid
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+
+from sqlalchemy import and_, event, func, or_
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from app import db
+from app.models.outbound_message import OutboundMessage, OutboundStatus
+from app.services.whatsapp_dispatcher import backoff_delay
+
+logger = logging.getLogger(__name__)
+
+_PENDING_KEY = 'outbound_pending'
+
+
+class OutboundQueue:
+    """Enfileiramento e processamento de outbound_messages."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stats = {
+            'enqueued': 0,
+            'duplicates': 0,
+            'claimed': 0,
+            'sent': 0,
+            'retried': 0,
+            'failed': 0,
+        }
+
+    def _count(self, key: str, amount: int = 1):
+        with self._lock:
+            self._stats[key] += amount
+
+    def init_app(self, app):
+        """Confirma no fim do app context as mensagens que o chamador nao confirmou."""
+
+        @app.teardown_appcontext
+        def commit_pending_outbound(exc):
+            if exc is not None or not db.session.info.get(_PENDING_KEY):
+                return
+            try:
+                db.session.commit()
+            except Exception as e:
+                db.session.rollback()
+                logger.error(f"Fila WhatsApp: mensagens enfileiradas perdidas no commit final: {e}")
+
+    @staticmethod
+    def enabled() -> bool:
+        """Fila ativa? (fora de app context o envio e sempre direto)"""
+        from flask import current_app, has_app_context
+        return has_app_context() and current_app.config.get('WHATSAPP_QUEUE_ENABLED', False)
+
+    def enqueue(self, kind: str, payload: Dict, user_id: Optional[int] = None,
+                phone: Optional[str] = None, idempotency_key: Optional[str] = None) -> OutboundMessage:
+        """
+        Grava uma mensagem na fila, na transacao do chamador (add + flush,
+        sem commit).
+
+        Se `idempotency_key` ja existir, retorna a mensagem existente
+        sem criar outra.
+        """
+        from flask import current_app
+
+        if idempotency_key:
+            existing = OutboundMessage.query.filter_by(idempotency_key=idempotency_key).first()
+            if existing:
+                self._count('duplicates')
+                return existing
+
+        values = {
+            'kind': kind,
+            'payload': payload,
+            'user_id': user_id,
+            'phone': phone,
+            'idempotency_key': idempotency_key,
+            'status': OutboundStatus.PENDING,
+            'attempts': 0,
+            'max_attempts': current_app.config.get('WHATSAPP_QUEUE_MAX_ATTEMPTS', 5),
+            'next_attempt_at': datetime.utcnow(),
+        }
+
+        if idempotency_key is None:
+            message = OutboundMessage(**values)
+            db.session.add(message)
+            db.session.flush()
+        elif self._insert_once(values):
+            message = OutboundMessage.query.filter_by(idempotency_key=idempotency_key).one()
+        else:
+            self._count('duplicates')
+            return OutboundMessage.query.filter_by(idempotency_key=idempotency_key).first()
+
+        db.session.info[_PENDING_KEY] = True
+        self._count('enqueued')
+        return message
+
+    @staticmethod
+    def _insert_once(values: Dict) -> bool:
+        """
+        INSERT que ignora uma idempotency_key ja gravada por outra transacao,
+        sem abortar a transacao do chamador.
+
+        PostgreSQL/SQLite: ON CONFLICT DO NOTHING. Outros bancos: SAVEPOINT
+        (no SQLite o SAVEPOINT como primeira escrita da transacao seria
+        confirmado sozinho pelo pysqlite, por isso nao e usado la).
+
+        Returns:
+            True se a linha foi inserida
+        """
+        table = OutboundMessage.__table__
+        dialect = db.session.get_bind().dialect.name
+
+        if dialect in ('postgresql', 'sqlite'):
+            if dialect == 'postgresql':
+                from sqlalchemy.dialects.postgresql import insert
+            else:
+                from sqlalchemy.dialects.sqlite import insert
+            result = db.session.execute(
+                insert(table).values(**values).on_conflict_do_nothing(index_elements=['idempotency_key'])
+            )
+            return result.rowcount == 1
+
+        try:
+            with db.session.begin_nested():
+                db.session.execute(table.insert().values(**values))
+        except IntegrityError:
+            return False
+        return True
+
+    def claim_batch(self, limit: int, now: Optional[datetime] = None) -> List[OutboundMessage]:
+        """
+        Reserva ate `limit` mensagens prontas para envio.
+
+        Sem lock de linha (o SQLite ignora FOR UPDATE SKIP LOCKED): os
+        candidatos sao marcados com um UPDATE condicional que so altera
+        linhas ainda disponiveis, com um token proprio da chamada. Se dois
+        workers escolherem as mesmas linhas, cada uma fica com quem a
+        atualizou primeiro, e cada worker envia apenas as linhas com o seu
+        token. Reservas mais antigas que WHATSAPP_QUEUE_LOCK_TIMEOUT
+        (worker que morreu) voltam a valer.
+        """
+        from flask import current_app
+
+        now = now or datetime.utcnow()
+        stale = now - timedelta(seconds=current_app.config.get('WHATSAPP_QUEUE_LOCK_TIMEOUT', 300))
+        available = or_(
+            and_(OutboundMessage.status == OutboundStatus.PENDING,
+                 OutboundMessage.next_attempt_at <= now),
+            and_(OutboundMessage.status == OutboundStatus.SENDING,
+                 OutboundMessage.locked_at < stale)
+        )
+
+        candidates = [message_id for (message_id,) in db.session.query(OutboundMessage.id).filter(
+            available
+        ).order_by(OutboundMessage.next_attempt_at, OutboundMessage.id).limit(limit)]
+        if not candidates:
+            db.session.commit()
+            return []
+
+        token = uuid.uuid4().hex
+        db.session.query(OutboundMessage).filter(
+            OutboundMessage.id.in_(candidates), available
+        ).update({
+            OutboundMessage.status: OutboundStatus.SENDING,
+            OutboundMessage.locked_at: now,
+            OutboundMessage.claim_token: token,
+            OutboundMessage.attempts: OutboundMessage.attempts + 1,
+        }, synchronize_session=False)
+        db.session.commit()
+
+        messages = OutboundMessage.query.filter(
+            OutboundMessage.id.in_(candidates),
+            OutboundMessage.claim_token == token
+        ).order_by(OutboundMessage.next_attempt_at, OutboundMessage.id).all()
+        self._count('claimed', len(messages))
+        return messages
+
+    def process(self, batch_size: Optional[int] = None) -> Dict:
+        """
+        Reserva um lote, envia em paralelo e registra o resultado.
+
+        Returns:
+            dict com claimed, sent, retried, failed e metricas do disparo
+        """
+        from flask import current_app
+        from app.services.megaapi import megaapi
+        from app.services.whatsapp_dispatcher import dispatcher
+
+        config = current_app.config
+        batch_size = batch_size or config.get('WHATSAPP_QUEUE_BATCH_SIZE', 100)
+        retry_base = config.get('WHATSAPP_QUEUE_RETRY_BASE_SECONDS', 30)
+
+        messages = self.claim_batch(batch_size)
+        summary = {'claimed': len(messages), 'sent': 0, 'retried': 0, 'failed': 0}
+        if not messages:
+            return summary
+
+        items = [{'id': m.id, 'kind': m.kind, 'payload': m.payload} for m in messages]
+        report = dispatcher.dispatch(items, lambda item: megaapi.deliver(item['kind'], item['payload']),
+                                     inline=False)
+
+        by_id = {m.id: m for m in messages}
+        now = datetime.utcnow()
+        for entry in report['results']:
+            message = by_id[entry['message']['id']]
+            message.locked_at = None
+            message.claim_token = None
+
+            result = entry['result'] or {}
+            if entry['success']:
+                message.status = OutboundStatus.SENT
+                message.sent_at = now
+                message.message_id = result.get('message_id')
+                message.last_error = None
+                summary['sent'] += 1
+            elif result.get('retryable') and message.attempts < message.max_attempts:
+                message.status = OutboundStatus.PENDING
+                message.next_attempt_at = now + timedelta(
+                    seconds=retry_base * (2 ** (message.attempts - 1)) + backoff_delay(0, retry_base)
+                )
+                message.last_error = entry['error']
+                summary['retried'] += 1
+            else:
+                message.status = OutboundStatus.FAILED
+                message.last_error = entry['error']
+                summary['failed'] += 1
+                logger.error(f"Mensagem {message.id} ({message.kind}) falhou na tentativa "
+                             f"{message.attempts}, sem reenvio: {entry['error']}")
+
+        db.session.commit()
+
+        for key in ('sent', 'retried', 'failed'):
+            self._count(key, summary[key])
+        summary['metrics'] = report['metrics']
+        return summary
+
+    def drain(self, batch_size: Optional[int] = None, max_batches: int = 50) -> Dict:
+        """Processa lotes ate a fila de mensagens prontas esvaziar."""
+        totals = {'claimed': 0, 'sent': 0, 'retried': 0, 'failed': 0}
+        for _ in range(max_batches):
+            summary = self.process(batch_size)
+            for key in totals:
+                totals[key] += summary[key]
+            if not summary['claimed']:
+                break
+        return totals
+
+    def get_stats(self) -> Dict:
+        """Contagem por status na tabela + contadores do processo."""
+        with self._lock:
+            stats = dict(self._stats)
+        stats['by_status'] = {
+            status.value: count for status, count in db.session.query(
+                OutboundMessage.status, func.count(OutboundMessage.id)
+            ).group_by(OutboundMessage.status)
+        }
+        return stats
+
+
+# Singleton
+outbound_queue = OutboundQueue()
+
+
+@event.listens_for(Session, 'after_transaction_end')
+def _clear_pending_outbound(session, transaction):
+    """Commit ou rollback da transacao externa encerra as mensagens pendentes."""
+    if transaction.parent is None:
+        session.info.pop(_PENDING_KEY, None)
@@ -8,6 +8,7 @@ Utiliza ReportLab para gerar PDFs profissionais.
 import io
 from datetime import datetime
 from decimal import Decimal
+from typing import Iterable, Iterator
 
 from reportlab.lib import colors
 from reportlab.lib.pagesizes import A4
@@ -22,6 +23,11 @@ from reportlab.lib.enums import TA_CENTER, TA_RIGHT, TA_LEFT
 class StatementPDFGenerator:
     """Gerador de PDF para extratos de colaboradores."""
 
+    # Linhas por tabela de detalhamento (cada uma e dividida entre paginas)
+    DETAIL_CHUNK_ROWS = 200
+    DETAIL_HEADER = ['Data', 'Horario', 'Cliente', 'Modalidade', 'Status', 'Bruto', 'Split', 'Liquido']
+    DETAIL_COL_WIDTHS = [1.8*cm, 1.5*cm, 3.5*cm, 2.5*cm, 1.2*cm, 2*cm, 1.3*cm, 2.2*cm]
+
     def __init__(self):
         self.styles = getSampleStyleSheet()
         self._setup_custom_styles()
@@ -76,38 +82,60 @@ class StatementPDFGenerator:
             bytes do PDF gerado
         """
         buffer = io.BytesIO()
+        self.write_statement_pdf(statement, statement['entries'], buffer)
+
+        pdf_bytes = buffer.getvalue()
+        buffer.close()
+
+        return pdf_bytes
+
+    def write_statement_pdf(self, statement: dict, entries: Iterable[dict], target):
+        """
+        Escreve o PDF do extrato de forma incremental.
+
+        As linhas de detalhe sao consumidas do iteravel `entries` (ex:
+        SplitService.iter_statement_entries) conforme o documento e
+        paginado, em tabelas de DETAIL_CHUNK_ROWS linhas; o extrato
+        inteiro nunca fica montado em memoria.
+
+        Args:
+            statement: Cabecalho do extrato (professional, period, summary)
+            entries: Linhas de detalhe no formato de statement['entries']
+            target: Caminho do arquivo ou objeto file-like (binario)
+        """
         doc = SimpleDocTemplate(
-            buffer,
+            target,
             pagesize=A4,
             rightMargin=2*cm,
             leftMargin=2*cm,
             topMargin=2*cm,
             bottomMargin=2*cm
         )
+        doc.build(_FlowableStream(self._statement_flowables(statement, entries)))
 
-        elements = []
-
+    def _statement_flowables(self, statement: dict, entries: Iterable[dict]) -> Iterator:
+        """Flowables do extrato, na ordem do documento."""
         # Cabecalho
-        elements.append(Paragraph(
+        yield Paragraph(
             "EXTRATO DE COMISSOES",
             self.styles['TitleCustom']
-        ))
+        )
 
-        elements.append(Paragraph(
+        yield Paragraph(
             f"Periodo: {statement['period']['month']:02d}/{statement['period']['year']}",
             self.styles['SubtitleCustom']
-        ))
+        )
 
-        elements.append(Spacer(1, 10*mm))
+        yield Spacer(1, 10*mm)
 
         # Dados do Colaborador
-        elements.append(Paragraph("DADOS DO COLABORADOR", self.styles['SectionHeader']))
+        yield Paragraph("DADOS DO COLABORADOR", self.styles['SectionHeader'])
 
         prof = statement['professional']
         prof_data = [
             ['Nome:', prof['name']],
             ['E-mail:', prof['email']],
-            ['CPF:', prof.get('cpf', 'Nao informado')],
+            ['CPF:', prof.get('cpf') or 'Nao informado'],
             ['Tipo:', prof.get('type', 'instructor').replace('_', ' ').title()]
         ]
 
@@ -119,12 +147,12 @@ class StatementPDFGenerator:
             ('BOTTOMPADDING', (0, 0), (-1, -1), 5),
             ('TOPPADDING', (0, 0), (-1, -1), 5),
         ]))
-        elements.append(prof_table)
+        yield prof_table
 
-        elements.append(Spacer(1, 10*mm))
+        yield Spacer(1, 10*mm)
 
         # Resumo Financeiro
-        elements.append(Paragraph("RESUMO FINANCEIRO", self.styles['SectionHeader']))
+        yield Paragraph("RESUMO FINANCEIRO", self.styles['SectionHeader'])
 
         summary = statement['summary']
         summary_data = [
@@ -155,105 +183,140 @@ class StatementPDFGenerator:
             # Grid
             ('GRID', (0, 0), (-1, -1), 0.5, colors.HexColor('#bdc3c7')),
         ]))
-        elements.append(summary_table)
+        yield summary_table
 
-        elements.append(Spacer(1, 10*mm))
+        yield Spacer(1, 10*mm)
 
         # Detalhamento
-        elements.append(Paragraph("DETALHAMENTO", self.styles['SectionHeader']))
-
-        if statement['entries']:
-            # Header da tabela
-            detail_data = [
-                ['Data', 'Horario', 'Cliente', 'Modalidade', 'Status', 'Bruto', 'Split', 'Liquido']
-            ]
-
-            # Linhas
-            for e in statement['entries']:
-                date_str = e['date'].strftime('%d/%m') if e['date'] else '-'
-                time_str = e['time'].strftime('%H:%M') if e['time'] else '-'
-
-                # Truncar nome do cliente se muito longo
-                client = e['client_name'][:15] + '...' if len(e['client_name']) > 18 else e['client_name']
-
-                # Truncar modalidade
-                modality = e['modality'][:10] + '...' if len(e['modality']) > 13 else e['modality']
-
-                status = 'OK' if e['status'] == 'COMPLETED' else 'NS'
-
-                detail_data.append([
-                    date_str,
-                    time_str,
-                    client,
-                    modality,
-                    status,
-                    f"R${e['credit_value']:.2f}",
-                    f"{int(e['split_pct'])}%",
-                    f"R${e['amount']:.2f}"
-                ])
+        yield Paragraph("DETALHAMENTO", self.styles['SectionHeader'])
+
+        if summary['total_entries']:
+            # Tabelas de ate DETAIL_CHUNK_ROWS linhas (cabecalho repetido a cada pagina)
+            rows = []
+            for e in entries:
+                rows.append(self._detail_row(e))
+                if len(rows) >= self.DETAIL_CHUNK_ROWS:
+                    yield self._detail_table(rows)
+                    rows = []
+            if rows:
+                yield self._detail_table(rows)
 
             # Linha de total
-            detail_data.append([
-                '', '', '', '', 'TOTAL',
-                f"R${summary['total_gross']:.2f}",
-                '',
-                f"R${summary['total_professional']:.2f}"
-            ])
-
-            detail_table = Table(
-                detail_data,
-                colWidths=[1.8*cm, 1.5*cm, 3.5*cm, 2.5*cm, 1.2*cm, 2*cm, 1.3*cm, 2.2*cm]
+            total_table = Table(
+                [['', '', '', '', 'TOTAL',
+                  f"R${summary['total_gross']:.2f}",
+                  '',
+                  f"R${summary['total_professional']:.2f}"]],
+                colWidths=self.DETAIL_COL_WIDTHS
             )
-            detail_table.setStyle(TableStyle([
-                # Header
-                ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#34495e')),
-                ('TEXTCOLOR', (0, 0), (-1, 0), colors.white),
-                ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-                ('FONTSIZE', (0, 0), (-1, 0), 8),
-                ('ALIGN', (0, 0), (-1, 0), 'CENTER'),
-                # Body
-                ('FONTNAME', (0, 1), (-1, -2), 'Helvetica'),
-                ('FONTSIZE', (0, 1), (-1, -1), 8),
-                ('ALIGN', (5, 1), (-1, -1), 'RIGHT'),
-                ('ALIGN', (4, 1), (4, -1), 'CENTER'),
-                # Total row
-                ('FONTNAME', (0, -1), (-1, -1), 'Helvetica-Bold'),
-                ('BACKGROUND', (0, -1), (-1, -1), colors.HexColor('#ecf0f1')),
-                # Alternating rows
-                ('ROWBACKGROUNDS', (0, 1), (-1, -2), [colors.white, colors.HexColor('#f8f9fa')]),
-                # Grid
+            total_table.setStyle(TableStyle([
+                ('FONTNAME', (0, 0), (-1, -1), 'Helvetica-Bold'),
+                ('FONTSIZE', (0, 0), (-1, -1), 8),
+                ('ALIGN', (5, 0), (-1, -1), 'RIGHT'),
+                ('ALIGN', (4, 0), (4, -1), 'CENTER'),
+                ('BACKGROUND', (0, 0), (-1, -1), colors.HexColor('#ecf0f1')),
                 ('GRID', (0, 0), (-1, -1), 0.5, colors.HexColor('#bdc3c7')),
-                # Padding
                 ('BOTTOMPADDING', (0, 0), (-1, -1), 5),
                 ('TOPPADDING', (0, 0), (-1, -1), 5),
             ]))
-            elements.append(detail_table)
+            yield total_table
         else:
-            elements.append(Paragraph(
+            yield Paragraph(
                 "Nenhuma comissao registrada neste periodo.",
                 self.styles['CenterAlign']
-            ))
+            )
 
-        elements.append(Spacer(1, 15*mm))
+        yield Spacer(1, 15*mm)
 
         # Rodape
-        elements.append(Paragraph(
+        yield Paragraph(
             f"Documento gerado em {datetime.now().strftime('%d/%m/%Y %H:%M')}",
             self.styles['CenterAlign']
-        ))
+        )
 
-        elements.append(Paragraph(
+        yield Paragraph(
             "Este documento e valido como comprovante de comissoes.",
             self.styles['CenterAlign']
-        ))
+        )
 
-        # Build PDF
-        doc.build(elements)
+    @staticmethod
+    def _detail_row(e: dict) -> list:
+        """Linha da tabela de detalhamento."""
+        date_str = e['date'].strftime('%d/%m') if e['date'] else '-'
+        time_str = e['time'].strftime('%H:%M') if e['time'] else '-'
+
+        # Truncar nome do cliente se muito longo
+        client = e['client_name'][:15] + '...' if len(e['client_name']) > 18 else e['client_name']
+
+        # Truncar modalidade
+        modality = e['modality'][:10] + '...' if len(e['modality']) > 13 else e['modality']
+
+        # booking_status e gravado com o valor do enum ('completed' / 'no_show')
+        status = 'OK' if (e['status'] or '').lower() == 'completed' else 'NS'
+
+        return [
+            date_str,
+            time_str,
+            client,
+            modality,
+            status,
+            f"R${e['credit_value']:.2f}",
+            f"{int(e['split_pct'])}%",
+            f"R${e['amount']:.2f}"
+        ]
 
-        pdf_bytes = buffer.getvalue()
-        buffer.close()
+    def _detail_table(self, rows: list) -> Table:
+        """Tabela de detalhamento com cabecalho repetido nas quebras de pagina."""
+        detail_table = Table(
+            [self.DETAIL_HEADER] + rows,
+            colWidths=self.DETAIL_COL_WIDTHS,
+            repeatRows=1
+        )
+        detail_table.setStyle(TableStyle([
+            # Header
+            ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#34495e')),
+            ('TEXTCOLOR', (0, 0), (-1, 0), colors.white),
+            ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+            ('FONTSIZE', (0, 0), (-1, 0), 8),
+            ('ALIGN', (0, 0), (-1, 0), 'CENTER'),
+            # Body
+            ('FONTNAME', (0, 1), (-1, -1), 'Helvetica'),
+            ('FONTSIZE', (0, 1), (-1, -1), 8),
+            ('ALIGN', (5, 1), (-1, -1), 'RIGHT'),
+            ('ALIGN', (4, 1), (4, -1), 'CENTER'),
+            # Alternating rows
+            ('ROWBACKGROUNDS', (0, 1), (-1, -1), [colors.white, colors.HexColor('#f8f9fa')]),
+            # Grid
+            ('GRID', (0, 0), (-1, -1), 0.5, colors.HexColor('#bdc3c7')),
+            # Padding
+            ('BOTTOMPADDING', (0, 0), (-1, -1), 5),
+            ('TOPPADDING', (0, 0), (-1, -1), 5),
+        ]))
+        return detail_table
 
-        return pdf_bytes
+
+class _FlowableStream(list):
+    """
+    Lista de flowables alimentada sob demanda por um gerador.
+
+    doc.build consome a lista pela frente (len / [0] / del [0]); aqui
+    ela e reabastecida quando fica curta, mantendo alguns itens a frente
+    para o keepWithNext dos titulos.
+    """
+
+    LOOKAHEAD = 3
+
+    def __init__(self, source: Iterable):
+        super().__init__()
+        self._source = iter(source)
+
+    def __len__(self):
+        while super().__len__() < self.LOOKAHEAD and self._source is not None:
+            try:
+                self.append(next(self._source))
+            except StopIteration:
+                self._source = None
+        return super().__len__()
 
 
 # Instancia global
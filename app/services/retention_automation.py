@@ -1,6 +1,8 @@
+import time
 from datetime import datetime, timedelta
 from flask import current_app
-from app.models import User, Booking, StudentHealthScore, Lead, AutomationLog
+from sqlalchemy import func, or_, and_
+from app.models import User, StudentHealthScore, Lead, AutomationLog, UserDailyActivity
 from app.models.system_config import SystemConfig
 from app.services.megaapi import megaapi, Button, ListMessage, ListSection
 from app import db
@@ -8,6 +10,15 @@ import logging
 
 logger = logging.getLogger(__name__)
 
+# (automation_type, dias sem check-in, cooldown em dias entre recuperações)
+RECOVERY_COHORTS = (
+    ('RECOVERY_LIGHT', 5, 3),
+    ('RECOVERY_CRITICAL', 10, 5),
+    ('LAST_ATTEMPT', 20, 10),
+)
+RECOVERY_TYPES = [automation_type for automation_type, _, _ in RECOVERY_COHORTS]
+
+
 class RetentionAutomation:
     """
     Automações de retenção baseadas em réguas de relacionamento.
@@ -60,20 +71,15 @@ class RetentionAutomation:
         else:
             logger.info("Automação de engajamento desativada via config")
 
-        # 3. Recuperação leve (5 dias sem check-in)
+        # 3-5. Recuperação (5/10/20 dias sem check-in) - coortes em passada única
         if recovery_enabled:
-            results['recovery_light_sent'] = self.send_light_recovery()
+            batches = self.build_recovery_batches()['batches']
+            results['recovery_light_sent'] = self.send_light_recovery(batches['RECOVERY_LIGHT'])
+            results['recovery_critical_sent'] = self.send_critical_recovery(batches['RECOVERY_CRITICAL'])
+            results['last_attempt_sent'] = self.send_last_attempt(batches['LAST_ATTEMPT'])
         else:
             logger.info("Automação de recuperação desativada via config")
 
-        # 4. Recuperação crítica (10 dias sem check-in) - PRD D+10
-        if recovery_enabled:
-            results['recovery_critical_sent'] = self.send_critical_recovery()
-
-        # 5. Última tentativa (20 dias sem check-in)
-        if recovery_enabled:
-            results['last_attempt_sent'] = self.send_last_attempt()
-
         # 6. Renovação de Plano (3 dias antes) - PRD
         if recovery_enabled:
             results['plan_renewal_sent'] = self.send_plan_renewal()
@@ -100,7 +106,7 @@ class RetentionAutomation:
             User.is_active == True
         ).all()
         
-        sent_count = 0
+        messages = []
         
         for student in new_students:
             try:
@@ -129,21 +135,17 @@ Para aproveitar ao máximo sua experiência:
 Escolha uma opção abaixo ou me mande uma mensagem se tiver dúvidas!
                 """.strip()
                 
-                result = megaapi.send_buttons(
-                    phone=student.phone,
-                    message=message,
-                    buttons=buttons,
-                    user_id=student.id
-                )
-                
-                if result.get('success'):
-                    self._log_automation('WELCOME', student.id)
-                    sent_count += 1
-                    
+                messages.append({
+                    'phone': student.phone,
+                    'message': message,
+                    'buttons': buttons,
+                    'user_id': student.id
+                })
+
             except Exception as e:
                 logger.error(f"Erro ao enviar boas-vindas para {student.id}: {e}")
-        
-        return sent_count
+
+        return self._dispatch('WELCOME', messages, megaapi.send_buttons)
     
     def send_engagement_survey(self) -> int:
         """Pesquisa de satisfação após 15 dias."""
@@ -157,7 +159,7 @@ Escolha uma opção abaixo ou me mande uma mensagem se tiver dúvidas!
             User.is_active == True
         ).all()
         
-        sent_count = 0
+        messages = []
         
         for student in students:
             try:
@@ -181,65 +183,125 @@ Escolha uma opção abaixo ou me mande uma mensagem se tiver dúvidas!
                 
                 text = f"Olá {student.name.split()[0]}! Já faz 15 dias que você está conosco. Como você avalia sua experiência até agora?"
                 
-                result = megaapi.send_list_message(
-                    phone=student.phone,
-                    text=text,
-                    button_text="Avaliar",
-                    sections=sections,
-                    user_id=student.id
-                )
-                
-                if result.get('success'):
-                    self._log_automation('ENGAGEMENT_SURVEY', student.id)
-                    sent_count += 1
-                    
+                messages.append({
+                    'phone': student.phone,
+                    'text': text,
+                    'button_text': "Avaliar",
+                    'sections': sections,
+                    'user_id': student.id
+                })
+
             except Exception as e:
                 logger.error(f"Erro ao enviar pesquisa para {student.id}: {e}")
-        
-        return sent_count
+
+        return self._dispatch('ENGAGEMENT_SURVEY', messages, megaapi.send_list_message)
     
-    def send_light_recovery(self) -> int:
-        """Recuperação leve: 5 dias sem check-in."""
-        five_days_ago = datetime.utcnow() - timedelta(days=5)
-        
-        # Alunos ativos que não tiveram check-in nos ultimos 5 dias 
-        # e o ultimo check-in foi exatamente ha 5 dias (para evitar reenvio manual diario se nao fizermos controle fino)
-        # Melhor usar AutomationLog para nao repetir.
-        
-        students_absent = db.session.query(User).filter(
+    # ================= DETECTOR DE AUSÊNCIA =================
+
+    def build_recovery_batches(self, now: datetime = None) -> dict:
+        """
+        Detector de ausência em passada única para as 3 réguas de recuperação.
+
+        1. Uma consulta agrupada (rollup diário) traz apenas os alunos cujo
+           último check-in foi há exatamente 5, 10 ou 20 dias, contados como
+           antes: (utcnow - checkin_at).days, tudo no relógio UTC
+        2. Uma consulta IN pré-carrega os envios de recuperação recentes
+           desses alunos (AutomationLog)
+        3. Os alunos são separados por coorte, já sem quem está em cooldown
+
+        Returns:
+            dict com batches ({automation_type: [User]}), counts e timings_ms
+        """
+        now = now or datetime.utcnow()
+        timings = {}
+
+        # 1. Dias desde o último check-in, filtrado nas faixas-alvo
+        t0 = time.perf_counter()
+        last_checkin = db.session.query(
+            UserDailyActivity.user_id,
+            func.max(UserDailyActivity.last_checkin_at).label('last_at')
+        ).filter(
+            UserDailyActivity.checkin_count > 0
+        ).group_by(UserDailyActivity.user_id).subquery()
+
+        target_days = {days: automation_type for automation_type, days, _ in RECOVERY_COHORTS}
+        # (now - last).days == N  <=>  now - (N+1) dias < last <= now - N dias
+        in_target = or_(*[
+            and_(last_checkin.c.last_at > now - timedelta(days=days + 1),
+                 last_checkin.c.last_at <= now - timedelta(days=days))
+            for days in target_days
+        ])
+
+        rows = db.session.query(User, last_checkin.c.last_at).join(
+            last_checkin, last_checkin.c.user_id == User.id
+        ).filter(
             User.role == 'student',
             User.is_active == True,
-            User.phone.isnot(None)
+            User.phone.isnot(None),
+            in_target
         ).all()
+        timings['absence_query_ms'] = round((time.perf_counter() - t0) * 1000, 2)
+
+        # 2. Último envio de recuperação de cada candidato
+        t0 = time.perf_counter()
+        max_cooldown = max(cooldown for _, _, cooldown in RECOVERY_COHORTS)
+        last_sent = {}
+        if rows:
+            last_sent = dict(db.session.query(
+                AutomationLog.user_id, func.max(AutomationLog.sent_at)
+            ).filter(
+                AutomationLog.user_id.in_([student.id for student, _ in rows]),
+                AutomationLog.automation_type.in_(RECOVERY_TYPES),
+                AutomationLog.sent_at >= now - timedelta(days=max_cooldown)
+            ).group_by(AutomationLog.user_id).all())
+        timings['log_preload_ms'] = round((time.perf_counter() - t0) * 1000, 2)
+
+        # 3. Coortes
+        t0 = time.perf_counter()
+        cooldowns = {automation_type: cooldown for automation_type, _, cooldown in RECOVERY_COHORTS}
+        batches = {automation_type: [] for automation_type, _, _ in RECOVERY_COHORTS}
+        counts = {automation_type: {'absent': 0, 'recently_contacted': 0, 'ready': 0}
+                  for automation_type, _, _ in RECOVERY_COHORTS}
+
+        for student, last_at in rows:
+            automation_type = target_days[(now - last_at).days]
+            counts[automation_type]['absent'] += 1
+            sent_at = last_sent.get(student.id)
+            if sent_at and sent_at >= now - timedelta(days=cooldowns[automation_type]):
+                counts[automation_type]['recently_contacted'] += 1
+                continue
+            batches[automation_type].append(student)
+            counts[automation_type]['ready'] += 1
+        timings['bucket_ms'] = round((time.perf_counter() - t0) * 1000, 2)
+
+        return {'batches': batches, 'counts': counts, 'timings_ms': timings}
+
+    def preview_recovery(self) -> dict:
+        """Dry-run das réguas de recuperação: contagens e tempos, sem enviar."""
+        start = time.perf_counter()
+        result = self.build_recovery_batches()
+        return {
+            'counts': result['counts'],
+            'timings_ms': dict(result['timings_ms'],
+                               total_ms=round((time.perf_counter() - start) * 1000, 2))
+        }
+
+    def send_light_recovery(self, candidates=None) -> int:
+        """Recuperação leve: 5 dias sem check-in."""
+        if candidates is None:
+            candidates = self.build_recovery_batches()['batches']['RECOVERY_LIGHT']
         
-        sent_count = 0
+        messages = []
         
-        for student in students_absent:
-            # Pegar ultimo checkin
-            from app.models.booking import Booking
-            last_booking = Booking.query.filter(
-                Booking.user_id == student.id,
-                Booking.status == 'COMPLETED'
-            ).order_by(Booking.checked_in_at.desc()).first()
-            
-            if not last_booking or not last_booking.checked_in_at:
-                continue
-                
-            days_absent = (datetime.utcnow() - last_booking.checked_in_at).days
-            
-            if days_absent == 5:
-                # Verificar log recente
-                if self._sent_recovery_recently(student.id, days=3):
-                    continue
+        for student in candidates:
+            try:
+                buttons = [
+                    Button(id='yes_tomorrow', title='✅ Vou amanhã!'),
+                    Button(id='reschedule_me', title='📅 Reagendar'),
+                    Button(id='im_ok', title='😊 Está tudo bem')
+                ]
                 
-                try:
-                    buttons = [
-                        Button(id='yes_tomorrow', title='✅ Vou amanhã!'),
-                        Button(id='reschedule_me', title='📅 Reagendar'),
-                        Button(id='im_ok', title='😊 Está tudo bem')
-                    ]
-                    
-                    message = f"""
+                message = f"""
 Olá {student.name.split()[0]}! 
 
 Sentimos sua falta por aqui! Faz 5 dias que você não vem treinar. 
@@ -247,115 +309,69 @@ Sentimos sua falta por aqui! Faz 5 dias que você não vem treinar.
 Sabemos que a rotina é corrida, mas lembre-se: cada treino te deixa mais perto dos seus objetivos! 💪
 
 Quando podemos te esperar?
-                    """.strip()
-                    
-                    result = megaapi.send_buttons(
-                        phone=student.phone,
-                        message=message,
-                        buttons=buttons,
-                        user_id=student.id
-                    )
-                    
-                    if result.get('success'):
-                        self._log_automation('RECOVERY_LIGHT', student.id)
-                        sent_count += 1
-                        
-                except Exception as e:
-                    logger.error(f"Erro em recuperação leve para {student.id}: {e}")
-        
-        return sent_count
-    
-    def send_critical_recovery(self) -> int:
-        """Recuperação crítica D+10: PRD botões [Agendar aula agora] [Preciso de ajuda] [Pausar meu plano]."""
-        students_critical = db.session.query(User).filter(
-            User.role == 'student',
-            User.is_active == True,
-            User.phone.isnot(None)
-        ).all()
+                """.strip()
+                
+                messages.append({
+                    'phone': student.phone,
+                    'message': message,
+                    'buttons': buttons,
+                    'user_id': student.id
+                })
 
-        sent_count = 0
+            except Exception as e:
+                logger.error(f"Erro em recuperação leve para {student.id}: {e}")
 
-        for student in students_critical:
-            from app.models.booking import Booking
-            last_booking = Booking.query.filter(
-                Booking.user_id == student.id,
-                Booking.status == 'COMPLETED'
-            ).order_by(Booking.checked_in_at.desc()).first()
+        return self._dispatch('RECOVERY_LIGHT', messages, megaapi.send_buttons)
+    
+    def send_critical_recovery(self, candidates=None) -> int:
+        """Recuperação crítica D+10: PRD botões [Agendar aula agora] [Preciso de ajuda] [Pausar meu plano]."""
+        if candidates is None:
+            candidates = self.build_recovery_batches()['batches']['RECOVERY_CRITICAL']
 
-            if not last_booking or not last_booking.checked_in_at:
-                continue
+        messages = []
 
-            days_absent = (datetime.utcnow() - last_booking.checked_in_at).days
+        for student in candidates:
+            try:
+                buttons = [
+                    Button(id='schedule_now', title='Agendar aula agora'),
+                    Button(id='need_help', title='Preciso de ajuda'),
+                    Button(id='pause_plan', title='Pausar meu plano')
+                ]
 
-            if days_absent == 10:
-                if self._sent_recovery_recently(student.id, days=5):
-                    continue
+                first_name = student.name.split()[0]
+                message = (f"Oi {first_name}, tudo bem? Notamos que você "
+                           f"não treinou esta semana.\n\n"
+                           f"Estamos aqui para ajudar você a voltar "
+                           f"aos treinos! Escolha uma opção:")
+
+                messages.append({
+                    'phone': student.phone,
+                    'message': message,
+                    'buttons': buttons,
+                    'user_id': student.id
+                })
 
-                try:
-                    buttons = [
-                        Button(id='schedule_now', title='Agendar aula agora'),
-                        Button(id='need_help', title='Preciso de ajuda'),
-                        Button(id='pause_plan', title='Pausar meu plano')
-                    ]
-
-                    first_name = student.name.split()[0]
-                    message = (f"Oi {first_name}, tudo bem? Notamos que você "
-                               f"não treinou esta semana.\n\n"
-                               f"Estamos aqui para ajudar você a voltar "
-                               f"aos treinos! Escolha uma opção:")
-
-                    result = megaapi.send_buttons(
-                        phone=student.phone,
-                        message=message,
-                        buttons=buttons,
-                        user_id=student.id
-                    )
-
-                    if result.get('success'):
-                        self._log_automation('RECOVERY_CRITICAL', student.id)
-                        sent_count += 1
-
-                except Exception as e:
-                    logger.error(f"Erro em recuperação crítica para {student.id}: {e}")
+            except Exception as e:
+                logger.error(f"Erro em recuperação crítica para {student.id}: {e}")
 
-        return sent_count
+        return self._dispatch('RECOVERY_CRITICAL', messages, megaapi.send_buttons)
     
-    def send_last_attempt(self) -> int:
+    def send_last_attempt(self, candidates=None) -> int:
         """Última tentativa: 20 dias sem check-in + desconto."""
-        twenty_days_ago = datetime.utcnow() - timedelta(days=20)
+        if candidates is None:
+            candidates = self.build_recovery_batches()['batches']['LAST_ATTEMPT']
         
-        students_last = db.session.query(User).filter(
-            User.role == 'student',
-            User.is_active == True,
-            User.phone.isnot(None)
-        ).all()
+        messages = []
         
-        sent_count = 0
-        
-        for student in students_last:
-            from app.models.booking import Booking
-            last_booking = Booking.query.filter(
-                Booking.user_id == student.id,
-                Booking.status == 'COMPLETED'
-            ).order_by(Booking.checked_in_at.desc()).first()
-            
-            if not last_booking or not last_booking.checked_in_at:
-                continue
+        for student in candidates:
+            try:
+                buttons = [
+                    Button(id='claim_discount', title='💰 Quero o desconto'),
+                    Button(id='schedule_call', title='📞 Agendar ligação'),
+                    Button(id='cancel_membership', title='😢 Cancelar matrícula')
+                ]
                 
-            days_absent = (datetime.utcnow() - last_booking.checked_in_at).days
-            
-            if days_absent == 20:
-                if self._sent_recovery_recently(student.id, days=10):
-                    continue
-
-                try:
-                    buttons = [
-                        Button(id='claim_discount', title='💰 Quero o desconto'),
-                        Button(id='schedule_call', title='📞 Agendar ligação'),
-                        Button(id='cancel_membership', title='😢 Cancelar matrícula')
-                    ]
-                    
-                    message = f"""
+                message = f"""
 {student.name.split()[0]}, queremos MUITO você de volta! 😊
 
 Preparamos uma condição ESPECIAL só para você:
@@ -364,23 +380,19 @@ Preparamos uma condição ESPECIAL só para você:
 🎁 1 mês de personal trainer grátis
 
 Sua saúde e bem-estar são nossa prioridade! Volte a treinar hoje mesmo! 💪
-                    """.strip()
-                    
-                    result = megaapi.send_buttons(
-                        phone=student.phone,
-                        message=message,
-                        buttons=buttons,
-                        user_id=student.id
-                    )
-                    
-                    if result.get('success'):
-                        self._log_automation('LAST_ATTEMPT', student.id)
-                        sent_count += 1
-                        
-                except Exception as e:
-                    logger.error(f"Erro em última tentativa para {student.id}: {e}")
-        
-        return sent_count
+                """.strip()
+                
+                messages.append({
+                    'phone': student.phone,
+                    'message': message,
+                    'buttons': buttons,
+                    'user_id': student.id
+                })
+
+            except Exception as e:
+                logger.error(f"Erro em última tentativa para {student.id}: {e}")
+
+        return self._dispatch('LAST_ATTEMPT', messages, megaapi.send_buttons)
     
     def send_plan_renewal(self) -> int:
         """PRD: Renovação de Plano (3 dias antes do vencimento).
@@ -398,7 +410,7 @@ Sua saúde e bem-estar são nossa prioridade! Volte a treinar hoje mesmo! 💪
             Subscription.end_date <= target_end
         ).all()
 
-        sent_count = 0
+        messages = []
 
         for sub in expiring_subs:
             user = sub.user
@@ -426,21 +438,17 @@ Sua saúde e bem-estar são nossa prioridade! Volte a treinar hoje mesmo! 💪
                            f"Renove e continue evoluindo!\n\n"
                            f"Não perca seu progresso e seus créditos!")
 
-                result = megaapi.send_buttons(
-                    phone=user.phone,
-                    message=message,
-                    buttons=buttons,
-                    user_id=user.id
-                )
-
-                if result.get('success'):
-                    self._log_automation('PLAN_RENEWAL', user.id)
-                    sent_count += 1
+                messages.append({
+                    'phone': user.phone,
+                    'message': message,
+                    'buttons': buttons,
+                    'user_id': user.id
+                })
 
             except Exception as e:
                 logger.error(f"Erro em renovação de plano para {user.id}: {e}")
 
-        return sent_count
+        return self._dispatch('PLAN_RENEWAL', messages, megaapi.send_buttons)
 
     def send_nps_survey(self) -> int:
         """PRD: Pesquisa NPS mensal.
@@ -458,7 +466,7 @@ Sua saúde e bem-estar são nossa prioridade! Volte a treinar hoje mesmo! 💪
             User.created_at <= thirty_days_ago
         ).all()
 
-        sent_count = 0
+        messages = []
 
         for student in students:
             # Verifica se já enviou NPS nos últimos 30 dias
@@ -487,24 +495,44 @@ Sua saúde e bem-estar são nossa prioridade! Volte a treinar hoje mesmo! 💪
                 text = (f"Olá {first_name}! Como você avalia sua "
                         f"experiência este mês no studio?")
 
-                result = megaapi.send_list_message(
-                    phone=student.phone,
-                    text=text,
-                    button_text="Avaliar",
-                    sections=sections,
-                    user_id=student.id
-                )
-
-                if result.get('success'):
-                    self._log_automation('NPS_SURVEY', student.id)
-                    sent_count += 1
+                messages.append({
+                    'phone': student.phone,
+                    'text': text,
+                    'button_text': "Avaliar",
+                    'sections': sections,
+                    'user_id': student.id
+                })
 
             except Exception as e:
                 logger.error(f"Erro ao enviar NPS para {student.id}: {e}")
 
-        return sent_count
+        return self._dispatch('NPS_SURVEY', messages, megaapi.send_list_message)
 
     # ================= MÉTODOS AUXILIARES =================
+
+    def _dispatch(self, automation_type: str, messages: list, send) -> int:
+        """
+        Envia as mensagens de uma régua em paralelo (WhatsAppDispatcher)
+        e registra no AutomationLog os envios confirmados.
+        """
+        from app.services.whatsapp_dispatcher import dispatcher
+
+        if not messages:
+            return 0
+
+        report = dispatcher.dispatch(messages, lambda m: send(**m))
+
+        sent_count = 0
+        for entry in report['results']:
+            user_id = entry['message']['user_id']
+            if entry['success'] and (entry['result'] or {}).get('success'):
+                self._log_automation(automation_type, user_id)
+                sent_count += 1
+            elif entry['error']:
+                logger.error(f"Erro em {automation_type} para {user_id}: {entry['error']}")
+
+        logger.info(f"{automation_type}: {report['metrics']}")
+        return sent_count
     
     def _log_automation(self, automation_type: str, user_id: int):
         """Registra envio de automação."""
@@ -519,15 +547,3 @@ Sua saúde e bem-estar são nossa prioridade! Volte a treinar hoje mesmo! 💪
         except Exception as e:
             db.session.rollback()
             logger.error(f"Erro ao logar automação: {e}")
-    
-    def _sent_recovery_recently(self, user_id: int, days: int) -> bool:
-        """Verifica se já enviou mensagem de recuperação recentemente."""
-        cutoff = datetime.utcnow() - timedelta(days=days)
-        
-        recent_log = AutomationLog.query.filter(
-            AutomationLog.user_id == user_id,
-            AutomationLog.automation_type.in_(['RECOVERY_LIGHT', 'RECOVERY_CRITICAL', 'LAST_ATTEMPT']),
-            AutomationLog.sent_at >= cutoff
-        ).first()
-        
-        return recent_log is not None
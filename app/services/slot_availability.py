@@ -0,0 +1,512 @@
+# app/services/slot_availability.py
+"""
+Disponibilidade de horarios para o calendario do aluno.
+
+/student/api/slots e /student/api/availability/summary percorriam cada
+data e cada horario fazendo um COUNT de reservas, uma busca de
+`user_booked` e as consultas de genero do slot: um heatmap de um mes
+passava de mil queries. Aqui o intervalo inteiro e resolvido com um
+numero fixo de consultas:
+
+    1. horarios ativos/aprovados (com modalidade e instrutor)
+    2. reservas confirmadas agrupadas por (schedule_id, date), servidas
+       pelo cache de vagas (app/services/availability_cache.py) quando ativo
+    3. reservas confirmadas do proprio aluno no intervalo
+    4. generos de slot (ScheduleSlotGender) no intervalo
+
+e a resposta e montada em memoria. A unica excecao e o slot segregado
+ainda sem genero definido: ai continua valendo
+GenderDistributionService.can_user_book_slot, que decide e grava o
+genero do slot.
+"""
+
+import logging
+import time
+from collections import defaultdict
+from datetime import date, datetime, timedelta
+from typing import Dict, List, Optional, Set, Tuple
+
+from sqlalchemy import event, func
+from sqlalchemy.orm import joinedload
+
+from app import db
+from app.models import Booking, BookingStatus, ClassSchedule
+from app.models.schedule_slot_gender import ScheduleSlotGender
+from app.models.user import Gender
+from app.services.availability_cache import availability_cache
+
+logger = logging.getLogger(__name__)
+
+WEEKDAY_NAMES = ['Segunda', 'Terca', 'Quarta', 'Quinta', 'Sexta', 'Sabado', 'Domingo']
+EMS_KEYWORDS = ('Eletroestimulacao', 'FES', 'Eletrolipo')
+
+
+def weekday_db(target_date: date) -> int:
+    """Dia da semana no formato de ClassSchedule.weekday (0=Dom, 6=Sab)."""
+    weekday = target_date.weekday()
+    return 0 if weekday == 6 else weekday + 1
+
+
+def _date_range(start_date: date, end_date: date, today: date) -> List[date]:
+    """Datas do intervalo, ignorando as que ja passaram."""
+    current = max(start_date, today)
+    dates = []
+    while current <= end_date:
+        dates.append(current)
+        current += timedelta(days=1)
+    return dates
+
+
+def _gender_message(slot_gender) -> str:
+    gender_label = 'masculino' if slot_gender == Gender.MALE else 'feminino'
+    return f'Este horário é exclusivo para público {gender_label}'
+
+
+class SlotAvailabilityService:
+    """Monta disponibilidade de um intervalo de datas com consultas em lote."""
+
+    # =========================================================================
+    # Consultas em lote
+    # =========================================================================
+
+    @staticmethod
+    def load_schedules(with_relations: bool = True) -> Dict[int, List[ClassSchedule]]:
+        """Horarios ativos e aprovados agrupados por weekday (ordem de inicio)."""
+        query = ClassSchedule.query.filter_by(is_active=True, is_approved=True)
+        if with_relations:
+            query = query.options(
+                joinedload(ClassSchedule.modality),
+                joinedload(ClassSchedule.instructor)
+            )
+
+        by_weekday = defaultdict(list)
+        for sched in query.order_by(ClassSchedule.start_time, ClassSchedule.id).all():
+            by_weekday[sched.weekday].append(sched)
+        return by_weekday
+
+    @staticmethod
+    def booking_counts(start_date: date, end_date: date) -> Dict[Tuple[int, date], int]:
+        """Reservas confirmadas por (schedule_id, date) no intervalo."""
+        rows = db.session.query(
+            Booking.schedule_id, Booking.date, func.count(Booking.id)
+        ).filter(
+            Booking.status == BookingStatus.CONFIRMED,
+            Booking.date >= start_date,
+            Booking.date <= end_date
+        ).group_by(Booking.schedule_id, Booking.date).all()
+        return {(schedule_id, day): count for schedule_id, day, count in rows}
+
+    def confirmed_counts(self, schedules: Dict[int, List[ClassSchedule]],
+                         dates: List[date]) -> Dict[Tuple[int, date], int]:
+        """Contagens dos horarios/dias pedidos, via cache de vagas quando ativo."""
+        keys = [(sched.id, day) for day in dates for sched in schedules.get(weekday_db(day), ())]
+        return availability_cache.get_counts(keys, self.booking_counts)
+
+    @staticmethod
+    def user_bookings(user_id: int, start_date: date, end_date: date) -> Set[Tuple[int, date]]:
+        """Pares (schedule_id, date) com reserva confirmada do aluno."""
+        rows = db.session.query(Booking.schedule_id, Booking.date).filter(
+            Booking.user_id == user_id,
+            Booking.status == BookingStatus.CONFIRMED,
+            Booking.date >= start_date,
+            Booking.date <= end_date
+        ).all()
+        return {(schedule_id, day) for schedule_id, day in rows}
+
+    @staticmethod
+    def slot_genders(start_date: date, end_date: date) -> Dict[Tuple[int, date], Gender]:
+        """Genero definido por (schedule_id, date) no intervalo."""
+        rows = db.session.query(
+            ScheduleSlotGender.schedule_id, ScheduleSlotGender.date, ScheduleSlotGender.gender
+        ).filter(
+            ScheduleSlotGender.date >= start_date,
+            ScheduleSlotGender.date <= end_date
+        ).all()
+        return {(schedule_id, day): gender for schedule_id, day, gender in rows}
+
+    # =========================================================================
+    # Respostas
+    # =========================================================================
+
+    def get_summary(self, start_date: date, end_date: date,
+                    today: Optional[date] = None) -> Dict[str, Dict]:
+        """
+        Vagas por dia para o heatmap do calendario.
+
+        Returns:
+            {'YYYY-MM-DD': {'spots': int, 'status': 'full'|'few'|'available'}}
+            (dias sem horarios ficam de fora)
+        """
+        today = today or datetime.now().date()
+        dates = _date_range(start_date, end_date, today)
+        if not dates:
+            return {}
+
+        schedules = self.load_schedules(with_relations=False)
+        counts = self.confirmed_counts(schedules, dates)
+
+        summary = {}
+        for current_date in dates:
+            total_spots_day = 0
+            total_capacity = 0
+            for sched in schedules.get(weekday_db(current_date), ()):
+                spots = sched.capacity - counts.get((sched.id, current_date), 0)
+                total_spots_day += max(0, spots)
+                total_capacity += sched.capacity
+
+            if total_capacity == 0:
+                continue
+            elif total_spots_day == 0:
+                status = 'full'
+            elif total_spots_day <= (total_capacity * 0.2):
+                status = 'few'
+            else:
+                status = 'available'
+
+            summary[current_date.strftime('%Y-%m-%d')] = {
+                'spots': total_spots_day,
+                'status': status
+            }
+
+        return summary
+
+    def get_slots(self, user, start_date: date, end_date: date,
+                  ems_ok: bool = False, parq_ok: bool = False, has_credits: bool = False,
+                  today: Optional[date] = None) -> List[Dict]:
+        """
+        Horarios detalhados por dia, com vagas e restricoes do aluno.
+
+        Args:
+            ems_ok, parq_ok, has_credits: Flags do aluno repetidas em cada slot
+
+        Returns:
+            Lista de {'date', 'date_formatted', 'weekday_name', 'slots'}
+        """
+        from app.services.gender_distribution_service import GenderDistributionService
+
+        today = today or datetime.now().date()
+        dates = _date_range(start_date, end_date, today)
+        if not dates:
+            return []
+
+        schedules = self.load_schedules()
+        counts = self.confirmed_counts(schedules, dates)
+        booked = self.user_bookings(user.id, dates[0], dates[-1])
+        genders = self.slot_genders(dates[0], dates[-1])
+
+        slots_data = []
+        for current_date in dates:
+            day_slots = []
+            for sched in schedules.get(weekday_db(current_date), ()):
+                modality = sched.modality
+                key = (sched.id, current_date)
+
+                gender_restricted = False
+                gender_message = ""
+                slot_gender_val = None
+                if modality.requires_gender_segregation:
+                    slot_gender = genders.get(key)
+                    if not user.gender:
+                        can_book, msg = False, 'Você precisa definir seu sexo no perfil para agendar esta modalidade'
+                    elif slot_gender is not None:
+                        can_book = slot_gender == user.gender
+                        msg = 'OK' if can_book else _gender_message(slot_gender)
+                    else:
+                        # Slot sem genero: a distribuicao decide (e grava) agora
+                        can_book, msg = GenderDistributionService.can_user_book_slot(
+                            user, sched.id, current_date
+                        )
+                        genders.update(self.slot_genders(current_date, current_date))
+                        slot_gender = genders.get(key)
+
+                    if not can_book:
+                        gender_restricted = True
+                        gender_message = msg
+                    if slot_gender:
+                        slot_gender_val = slot_gender.value
+
+                day_slots.append({
+                    'id': sched.id,
+                    'start_time': sched.start_time.strftime('%H:%M'),
+                    'end_time': sched.end_time.strftime('%H:%M'),
+                    'modality_name': modality.name,
+                    'modality_icon': modality.icon or '',
+                    'modality_requires_gender': modality.requires_gender_segregation,
+                    'slot_gender': slot_gender_val,
+                    'instructor_name': sched.instructor.name,
+                    'available_spots': sched.capacity - counts.get(key, 0),
+                    'capacity': sched.capacity,
+                    'user_booked': key in booked,
+                    'gender_restricted': gender_restricted,
+                    'gender_message': gender_message,
+                    'requires_ems': any(word in modality.name for word in EMS_KEYWORDS),
+                    'ems_ok': ems_ok,
+                    'parq_ok': parq_ok,
+                    'has_credits': has_credits,
+                    'credits_cost': modality.credits_cost
+                })
+
+            if day_slots:
+                slots_data.append({
+                    'date': current_date.strftime('%Y-%m-%d'),
+                    'date_formatted': current_date.strftime('%d/%m/%Y'),
+                    'weekday_name': WEEKDAY_NAMES[current_date.weekday()],
+                    'slots': day_slots
+                })
+
+        return slots_data
+
+
+# Singleton
+slot_availability = SlotAvailabilityService()
+
+
+# =============================================================================
+# Benchmark
+# =============================================================================
+
+def _legacy_summary(start_date: date, end_date: date, today: date) -> Dict[str, Dict]:
+    """Implementacao anterior do heatmap (um COUNT por horario/dia)."""
+    summary = {}
+    for current_date in _date_range(start_date, end_date, today):
+        schedules = ClassSchedule.query.filter_by(
+            weekday=weekday_db(current_date), is_active=True, is_approved=True
+        ).all()
+
+        total_spots_day = 0
+        total_capacity = 0
+        for sched in schedules:
+            current_bookings = Booking.query.filter_by(
+                schedule_id=sched.id, date=current_date, status=BookingStatus.CONFIRMED
+            ).count()
+            total_spots_day += max(0, sched.capacity - current_bookings)
+            total_capacity += sched.capacity
+
+        if total_capacity == 0:
+            continue
+        elif total_spots_day == 0:
+            status = 'full'
+        elif total_spots_day <= (total_capacity * 0.2):
+            status = 'few'
+        else:
+            status = 'available'
+        summary[current_date.strftime('%Y-%m-%d')] = {'spots': total_spots_day, 'status': status}
+    return summary
+
+
+def _legacy_slots(user, start_date: date, end_date: date, today: date) -> List[Dict]:
+    """Implementacao anterior de /api/slots (COUNT, user_booked e genero por slot)."""
+    from app.services.gender_distribution_service import GenderDistributionService
+
+    slots_data = []
+    for current_date in _date_range(start_date, end_date, today):
+        schedules = ClassSchedule.query.filter_by(
+            weekday=weekday_db(current_date), is_active=True, is_approved=True
+        ).order_by(ClassSchedule.start_time, ClassSchedule.id).all()
+
+        day_slots = []
+        for sched in schedules:
+            current_bookings = Booking.query.filter_by(
+                schedule_id=sched.id, date=current_date, status=BookingStatus.CONFIRMED
+            ).count()
+            user_booked = Booking.query.filter_by(
+                user_id=user.id, schedule_id=sched.id, date=current_date,
+                status=BookingStatus.CONFIRMED
+            ).first() is not None
+
+            gender_restricted = False
+            gender_message = ""
+            slot_gender_val = None
+            if sched.modality.requires_gender_segregation:
+                can_book, msg = GenderDistributionService.can_user_book_slot(user, sched.id, current_date)
+                if not can_book:
+                    gender_restricted = True
+                    gender_message = msg
+                sg = ScheduleSlotGender.get_slot_gender(sched.id, current_date)
+                if sg:
+                    slot_gender_val = sg.value
+
+            day_slots.append({
+                'id': sched.id,
+                'start_time': sched.start_time.strftime('%H:%M'),
+                'end_time': sched.end_time.strftime('%H:%M'),
+                'modality_name': sched.modality.name,
+                'modality_icon': sched.modality.icon or '',
+                'modality_requires_gender': sched.modality.requires_gender_segregation,
+                'slot_gender': slot_gender_val,
+                'instructor_name': sched.instructor.name,
+                'available_spots': sched.capacity - current_bookings,
+                'capacity': sched.capacity,
+                'user_booked': user_booked,
+                'gender_restricted': gender_restricted,
+                'gender_message': gender_message,
+                'requires_ems': any(word in sched.modality.name for word in EMS_KEYWORDS),
+                'ems_ok': False,
+                'parq_ok': False,
+                'has_credits': False,
+                'credits_cost': sched.modality.credits_cost
+            })
+
+        if day_slots:
+            slots_data.append({
+                'date': current_date.strftime('%Y-%m-%d'),
+                'date_formatted': current_date.strftime('%d/%m/%Y'),
+                'weekday_name': WEEKDAY_NAMES[current_date.weekday()],
+                'slots': day_slots
+            })
+    return slots_data
+
+
+def _seed_benchmark_data(schedules: int, days: int, today: date, seed: int = 0) -> int:
+    """
+    Cria uma modalidade com `schedules` horarios e reservas confirmadas
+    aleatorias para os proximos `days` dias. Retorna o id da modalidade.
+    """
+    import random
+    from datetime import time as dtime
+    from app.models import Modality, User
+
+    rng = random.Random(seed)
+    user_ids = [row[0] for row in db.session.query(User.id).order_by(User.id).limit(500)]
+    if not user_ids:
+        raise ValueError("Benchmark precisa de ao menos um usuario cadastrado")
+
+    modality = Modality(name='Benchmark disponibilidade', credits_cost=1, default_duration=60)
+    db.session.add(modality)
+    db.session.flush()
+
+    created = []
+    for i in range(schedules):
+        hour = 6 + (i // 7) % 16
+        sched = ClassSchedule(
+            modality_id=modality.id, instructor_id=user_ids[0], weekday=i % 7,
+            start_time=dtime(hour), end_time=dtime(hour + 1),
+            capacity=rng.randint(8, 20), is_active=True, is_approved=True
+        )
+        db.session.add(sched)
+        created.append(sched)
+    db.session.flush()
+
+    rows = []
+    for offset in range(days):
+        current_date = today + timedelta(days=offset)
+        for sched in created:
+            if sched.weekday != weekday_db(current_date):
+                continue
+            for user_id in rng.sample(user_ids, min(len(user_ids), rng.randint(0, sched.capacity))):
+                rows.append({
+                    'user_id': user_id, 'schedule_id': sched.id, 'date': current_date,
+                    'status': BookingStatus.CONFIRMED, 'cost_at_booking': 1,
+                    'created_at': datetime.utcnow()
+                })
+    db.session.bulk_insert_mappings(Booking, rows)
+    db.session.commit()
+    return modality.id
+
+
+def _drop_benchmark_data(modality_id: int):
+    """Remove modalidade, horarios e reservas criados por _seed_benchmark_data."""
+    from app.models import Modality
+
+    schedule_ids = [row[0] for row in db.session.query(ClassSchedule.id).filter_by(modality_id=modality_id)]
+    if schedule_ids:
+        Booking.query.filter(Booking.schedule_id.in_(schedule_ids)).delete(synchronize_session=False)
+        ScheduleSlotGender.query.filter(
+            ScheduleSlotGender.schedule_id.in_(schedule_ids)
+        ).delete(synchronize_session=False)
+        ClassSchedule.query.filter(ClassSchedule.id.in_(schedule_ids)).delete(synchronize_session=False)
+    Modality.query.filter_by(id=modality_id).delete(synchronize_session=False)
+    db.session.commit()
+
+
+def benchmark_availability(days: int = 30, user_id: Optional[int] = None,
+                           seed_schedules: int = 0, repeat: int = 3) -> List[Dict]:
+    """
+    Compara as rotas legadas com o SlotAvailabilityService no banco atual:
+    'lote' sem cache e 'cache' com um MemoryBackend temporario.
+
+    Com `seed_schedules` cria horarios e reservas sinteticos para o
+    periodo (apagados no fim). Cada variante roda `repeat` vezes; o
+    tempo reportado e a mediana. Tambem confere se as respostas sao
+    identicas.
+
+    Returns:
+        Lista com endpoint, modo, queries, tempo e paridade
+    """
+    from app.models import User
+
+    today = datetime.now().date()
+    end_date = today + timedelta(days=days - 1)
+
+    user_id = user_id or db.session.query(User.id).filter_by(role='student').order_by(User.id).limit(1).scalar() \
+        or db.session.query(User.id).order_by(User.id).limit(1).scalar()
+    if user_id is None:
+        raise ValueError("Benchmark precisa de ao menos um usuario cadastrado")
+    user = db.session.get(User, user_id)
+
+    modality_id = _seed_benchmark_data(seed_schedules, days, today) if seed_schedules else None
+
+    queries = [0]
+
+    def count_query(*args):
+        queries[0] += 1
+
+    engine = db.engine
+    event.listen(engine, 'before_cursor_execute', count_query)
+
+    def measure(endpoint, mode, fn):
+        timings = []
+        output = None
+        for _ in range(repeat):
+            db.session.expire_all()
+            queries[0] = 0
+            start = time.perf_counter()
+            output = fn()
+            timings.append(time.perf_counter() - start)
+        timings.sort()
+        return {
+            'endpoint': endpoint,
+            'mode': mode,
+            'queries': queries[0],
+            'elapsed_ms': round(timings[len(timings) // 2] * 1000, 2),
+            '_output': output,
+        }
+
+    from app.services.availability_cache import MemoryBackend
+
+    service = SlotAvailabilityService()
+    original_backend = availability_cache.backend
+    results = []
+
+    def with_backend(backend, fn):
+        def run():
+            availability_cache.backend = backend
+            return fn()
+        return run
+
+    try:
+        for endpoint, legacy, engine_fn in (
+            ('summary',
+             lambda: _legacy_summary(today, end_date, today),
+             lambda: service.get_summary(today, end_date, today=today)),
+            ('slots',
+             lambda: _legacy_slots(user, today, end_date, today),
+             lambda: service.get_slots(user, today, end_date, today=today)),
+        ):
+            old = measure(endpoint, 'legado', legacy)
+            rows = [old]
+            rows.append(measure(endpoint, 'lote', with_backend(None, engine_fn)))
+            # Cache em memoria temporario (aquecido na primeira repeticao)
+            rows.append(measure(endpoint, 'cache', with_backend(MemoryBackend(), engine_fn)))
+            for row in rows:
+                row['identical'] = row['_output'] == old['_output']
+            results.extend(rows)
+    finally:
+        availability_cache.backend = original_backend
+        event.remove(engine, 'before_cursor_execute', count_query)
+        if modality_id is not None:
+            _drop_benchmark_data(modality_id)
+
+    for result in results:
+        result.pop('_output')
+    return results
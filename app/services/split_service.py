@@ -12,7 +12,10 @@ Responsavel por:
 import logging
 from datetime import datetime, date, timedelta
 from decimal import Decimal
-from typing import List, Dict, Optional, Tuple
+from typing import Callable, Iterator, List, Dict, Optional, Tuple
+
+from sqlalchemy import and_, exists, func
+from sqlalchemy.exc import IntegrityError
 
 from app import db
 from app.models.booking import Booking, BookingStatus
@@ -45,6 +48,72 @@ class SplitService:
     # Processamento de Comissoes
     # =========================================================================
 
+    def _commission_values(
+        self,
+        booking_id: int,
+        booking_status: BookingStatus,
+        cost_at_booking: int,
+        instructor_id: int,
+        raw_type,
+        split: Optional[Tuple[Decimal, Decimal, DemandLevel]],
+        current_split_rate: Optional[Decimal],
+        credit_value_reais: Optional[Decimal] = None
+    ) -> Optional[Dict]:
+        """
+        Colunas da CommissionEntry de um booking finalizado.
+
+        Usado tanto no processamento individual quanto no lote
+        (`credit_value_reais` evita reler as configuracoes a cada booking).
+
+        Returns:
+            dict de colunas ou None se o booking nao gera comissao
+        """
+        # Determinar tipo de profissional (converter para o enum de commission.py)
+        prof_type = ProfessionalType(raw_type.value if raw_type else 'instructor')
+
+        # Regra: Nutricionista NAO recebe em No-Show
+        if booking_status == BookingStatus.NO_SHOW and prof_type == ProfessionalType.NUTRITIONIST:
+            return None
+
+        # Obter valor do credito
+        if credit_value_reais is None:
+            credit_value_reais = self.get_settings().credit_value_reais
+        # Aula gratuita (XP/Experimental): usa valor nominal como custo de marketing
+        if cost_at_booking == 0:
+            credit_value = credit_value_reais
+            is_incentive = True
+        else:
+            credit_value = credit_value_reais * cost_at_booking
+            is_incentive = False
+
+        # Obter split configuration
+        if split:
+            academy_pct, prof_pct, demand = split
+        else:
+            # Usar split do schedule ou padrao
+            prof_pct = current_split_rate or Decimal('60.00')
+            academy_pct = Decimal('100.00') - prof_pct
+            demand = DemandLevel.STANDARD
+
+        # Calcular valores
+        amount_academy = (credit_value * academy_pct / 100).quantize(Decimal('0.01'))
+        amount_professional = (credit_value * prof_pct / 100).quantize(Decimal('0.01'))
+
+        return {
+            'booking_id': booking_id,
+            'professional_id': instructor_id,
+            'credit_value': credit_value,
+            'academy_percentage': academy_pct,
+            'professional_percentage': prof_pct,
+            'amount_academy': amount_academy,
+            'amount_professional': amount_professional,
+            'booking_status': booking_status.value,
+            'professional_type': prof_type,
+            'demand_level': demand,
+            'status': CommissionStatus.PENDING,
+            'notes': "Aula de Incentivo (Subsidiada)" if is_incentive else None
+        }
+
     def process_booking_commission(self, booking: Booking) -> Optional[CommissionEntry]:
         """
         Processa comissao para um booking finalizado.
@@ -78,100 +147,160 @@ class SplitService:
             logger.error(f"Schedule {schedule.id} sem instrutor")
             return None
 
-        # Determinar tipo de profissional (converter para o enum de commission.py)
-        raw_type = instructor.professional_type
-        prof_type = ProfessionalType(raw_type.value if raw_type else 'instructor')
-
-        # Regra: Nutricionista NAO recebe em No-Show
-        if booking.status == BookingStatus.NO_SHOW and prof_type == ProfessionalType.NUTRITIONIST:
-            logger.info(f"Booking {booking.id}: No-Show de nutricionista, sem comissao")
-            return None
-
-        # Obter valor do credito
-        settings = self.get_settings()
-        # Aula gratuita (XP/Experimental): usa valor nominal como custo de marketing
-        if booking.cost_at_booking == 0:
-            credit_value = settings.credit_value_reais
-            is_incentive = True
-        else:
-            credit_value = settings.credit_value_reais * booking.cost_at_booking
-            is_incentive = False
-
-        # Obter split configuration
         split_config = schedule.split_config
+        split = None
         if split_config:
-            academy_pct = split_config.academy_percentage
-            prof_pct = split_config.professional_percentage
-            demand = split_config.demand_level
-        else:
-            # Usar split do schedule ou padrao
-            prof_pct = schedule.current_split_rate or Decimal('60.00')
-            academy_pct = Decimal('100.00') - prof_pct
-            demand = DemandLevel.STANDARD
-
-        # Calcular valores
-        amount_academy = (credit_value * academy_pct / 100).quantize(Decimal('0.01'))
-        amount_professional = (credit_value * prof_pct / 100).quantize(Decimal('0.01'))
-
-        # Criar entrada de comissao
-        entry = CommissionEntry(
-            booking_id=booking.id,
-            professional_id=instructor.id,
-            credit_value=credit_value,
-            academy_percentage=academy_pct,
-            professional_percentage=prof_pct,
-            amount_academy=amount_academy,
-            amount_professional=amount_professional,
-            booking_status=booking.status.value,
-            professional_type=prof_type,
-            demand_level=demand,
-            status=CommissionStatus.PENDING,
-            notes="Aula de Incentivo (Subsidiada)" if is_incentive else None
+            split = (split_config.academy_percentage,
+                     split_config.professional_percentage,
+                     split_config.demand_level)
+
+        values = self._commission_values(
+            booking.id, booking.status, booking.cost_at_booking,
+            instructor.id, instructor.professional_type,
+            split, schedule.current_split_rate
         )
+        if values is None:
+            logger.info(f"Booking {booking.id}: No-Show de nutricionista, sem comissao")
+            return None
 
+        entry = CommissionEntry(**values)
         db.session.add(entry)
         db.session.commit()
 
         logger.info(
             f"Comissao criada: Booking {booking.id}, "
             f"Instrutor {instructor.name}, "
-            f"R${amount_professional} ({prof_pct}%)"
+            f"R${entry.amount_professional} ({entry.professional_percentage}%)"
         )
 
         return entry
 
-    def process_pending_bookings(self) -> Dict:
+    @staticmethod
+    def _pending_filter():
+        """Bookings finalizados ainda sem CommissionEntry."""
+        return and_(
+            Booking.status.in_([BookingStatus.COMPLETED, BookingStatus.NO_SHOW]),
+            ~exists().where(CommissionEntry.booking_id == Booking.id)
+        )
+
+    def process_pending_bookings(
+        self,
+        chunk_size: int = None,
+        progress: Callable[[Dict], None] = None
+    ) -> Dict:
         """
-        Processa todos os bookings finalizados sem comissao.
+        Processa todos os bookings finalizados sem comissao, em lotes.
+
+        Cada lote e lido com uma consulta (booking + horario + instrutor +
+        split) em ordem de id, calculado em memoria e gravado com bulk
+        insert numa transacao propria. Rodar de novo continua de onde
+        parou: so entram bookings sem CommissionEntry (indice unico em
+        booking_id garante uma comissao por booking).
 
-        Retorna estatisticas do processamento.
+        Args:
+            chunk_size: Bookings por lote (padrao: SPLIT_COMMISSION_CHUNK_SIZE)
+            progress: Callback chamado apos cada lote com as estatisticas
+
+        Returns:
+            Estatisticas do processamento
         """
-        # Buscar bookings finalizados sem comissao
-        bookings = Booking.query.filter(
-            Booking.status.in_([BookingStatus.COMPLETED, BookingStatus.NO_SHOW]),
-            ~Booking.id.in_(
-                db.session.query(CommissionEntry.booking_id)
-            )
-        ).all()
+        from flask import current_app
+
+        chunk_size = chunk_size or current_app.config.get('SPLIT_COMMISSION_CHUNK_SIZE', 500)
+        credit_value_reais = self.get_settings().credit_value_reais
 
         stats = {
-            'total': len(bookings),
+            'total': Booking.query.filter(self._pending_filter()).count(),
             'processed': 0,
             'skipped': 0,
-            'errors': 0
+            'errors': 0,
+            'chunks': 0
         }
 
-        for booking in bookings:
-            try:
-                entry = self.process_booking_commission(booking)
-                if entry:
-                    stats['processed'] += 1
+        last_id = 0
+        retried = False
+        while True:
+            rows = db.session.query(
+                Booking.id, Booking.status, Booking.cost_at_booking,
+                ClassSchedule.id, ClassSchedule.current_split_rate,
+                User.id, User.professional_type,
+                SplitConfiguration.academy_percentage,
+                SplitConfiguration.professional_percentage,
+                SplitConfiguration.demand_level
+            ).select_from(Booking).outerjoin(
+                ClassSchedule, Booking.schedule_id == ClassSchedule.id
+            ).outerjoin(
+                User, ClassSchedule.instructor_id == User.id
+            ).outerjoin(
+                SplitConfiguration, SplitConfiguration.schedule_id == ClassSchedule.id
+            ).filter(
+                self._pending_filter(),
+                Booking.id > last_id
+            ).order_by(Booking.id).limit(chunk_size).all()
+
+            if not rows:
+                break
+
+            mappings = []
+            chunk = {'skipped': 0, 'errors': 0}
+            seen = set()
+            for (booking_id, status, cost, schedule_id, current_split_rate,
+                 instructor_id, raw_type, academy_pct, prof_pct, demand) in rows:
+                # Horario com mais de uma configuracao: vale a primeira
+                if booking_id in seen:
+                    continue
+                seen.add(booking_id)
+
+                if schedule_id is None or instructor_id is None:
+                    logger.error(f"Booking {booking_id} sem schedule/instrutor associado")
+                    chunk['skipped'] += 1
+                    continue
+
+                split = (academy_pct, prof_pct, demand) if academy_pct is not None else None
+                try:
+                    values = self._commission_values(
+                        booking_id, status, cost or 0, instructor_id, raw_type,
+                        split, current_split_rate, credit_value_reais
+                    )
+                except Exception as e:
+                    logger.error(f"Erro ao processar booking {booking_id}: {e}")
+                    chunk['errors'] += 1
+                    continue
+
+                if values is None:
+                    chunk['skipped'] += 1
                 else:
-                    stats['skipped'] += 1
+                    mappings.append(values)
+
+            try:
+                # render_nulls: notes None nao quebra o executemany em varios grupos
+                db.session.bulk_insert_mappings(CommissionEntry, mappings, render_nulls=True)
+                db.session.commit()
+                chunk['processed'] = len(mappings)
+            except IntegrityError as e:
+                db.session.rollback()
+                if not retried:
+                    # Outro processamento gravou parte do lote: le o lote de novo
+                    retried = True
+                    continue
+                logger.error(f"Lote de comissoes apos booking {last_id} descartado: {e}")
+                chunk['errors'] += len(mappings)
             except Exception as e:
                 db.session.rollback()
-                logger.error(f"Erro ao processar booking {booking.id}: {e}")
-                stats['errors'] += 1
+                logger.error(f"Lote de comissoes apos booking {last_id} descartado: {e}")
+                chunk['errors'] += len(mappings)
+
+            for key, value in chunk.items():
+                stats[key] += value
+            retried = False
+            last_id = rows[-1][0]
+            stats['chunks'] += 1
+            logger.info(
+                f"Comissoes: lote {stats['chunks']} ate booking {last_id} - "
+                f"{stats['processed'] + stats['skipped'] + stats['errors']}/{stats['total']}"
+            )
+            if progress:
+                progress(dict(stats))
 
         logger.info(f"Processamento de comissoes: {stats}")
         return stats
@@ -282,79 +411,66 @@ class SplitService:
     # Extrato do Colaborador
     # =========================================================================
 
-    def get_collaborator_statement(
-        self,
-        professional_id: int,
-        month: int = None,
-        year: int = None
-    ) -> Dict:
-        """
-        Gera extrato de comissoes do colaborador.
-
-        Args:
-            professional_id: ID do colaborador
-            month: Mes (opcional, padrao: mes atual)
-            year: Ano (opcional, padrao: ano atual)
-
-        Returns:
-            Dict com dados do extrato
-        """
+    @staticmethod
+    def _statement_period(month: int = None, year: int = None) -> Tuple[int, int, date, date]:
+        """(mes, ano, inicio, fim exclusivo) do extrato; padrao: mes atual."""
         if not month:
             month = datetime.now().month
         if not year:
             year = datetime.now().year
 
-        professional = User.query.get(professional_id)
-        if not professional:
-            raise ValueError(f"Colaborador {professional_id} nao encontrado")
-
-        # Periodo
         start_date = date(year, month, 1)
         if month == 12:
             end_date = date(year + 1, 1, 1)
         else:
             end_date = date(year, month + 1, 1)
+        return month, year, start_date, end_date
 
-        # Buscar comissoes
-        entries = CommissionEntry.query.filter(
+    @staticmethod
+    def _statement_filter(professional_id: int, start_date: date, end_date: date):
+        return and_(
             CommissionEntry.professional_id == professional_id,
             CommissionEntry.processed_at >= datetime.combine(start_date, datetime.min.time()),
             CommissionEntry.processed_at < datetime.combine(end_date, datetime.min.time())
-        ).order_by(CommissionEntry.processed_at).all()
+        )
 
-        # Calcular totais
-        total_gross = sum(e.credit_value for e in entries)
-        total_academy = sum(e.amount_academy for e in entries)
-        total_professional = sum(e.amount_professional for e in entries)
+    def get_statement_header(
+        self,
+        professional_id: int,
+        month: int = None,
+        year: int = None
+    ) -> Dict:
+        """
+        Cabecalho do extrato (colaborador, periodo e totais).
+
+        Os totais vem de uma consulta agrupada por status; as entradas
+        nao sao carregadas (ver iter_statement_entries).
+        """
+        month, year, start_date, end_date = self._statement_period(month, year)
 
-        # Agrupar por status
+        professional = User.query.get(professional_id)
+        if not professional:
+            raise ValueError(f"Colaborador {professional_id} nao encontrado")
+
+        rows = db.session.query(
+            CommissionEntry.status,
+            func.count(CommissionEntry.id),
+            func.coalesce(func.sum(CommissionEntry.credit_value), 0),
+            func.coalesce(func.sum(CommissionEntry.amount_academy), 0),
+            func.coalesce(func.sum(CommissionEntry.amount_professional), 0)
+        ).filter(
+            self._statement_filter(professional_id, start_date, end_date)
+        ).group_by(CommissionEntry.status).all()
+
+        total_entries = 0
+        total_gross = total_academy = total_professional = Decimal('0.00')
         by_status = {}
-        for entry in entries:
-            status = entry.status.value
-            if status not in by_status:
-                by_status[status] = {'count': 0, 'amount': Decimal('0.00')}
-            by_status[status]['count'] += 1
-            by_status[status]['amount'] += entry.amount_professional
-
-        # Detalhes das entradas
-        details = []
-        for entry in entries:
-            booking = entry.booking
-            schedule = booking.schedule if booking else None
-            modality = schedule.modality if schedule else None
-
-            details.append({
-                'id': entry.id,
-                'date': booking.date if booking else None,
-                'time': schedule.start_time if schedule else None,
-                'client_name': booking.user.name if booking and booking.user else 'N/A',
-                'modality': modality.name if modality else 'N/A',
-                'status': entry.booking_status,
-                'credit_value': float(entry.credit_value),
-                'split_pct': float(entry.professional_percentage),
-                'amount': float(entry.amount_professional),
-                'commission_status': entry.status.value
-            })
+        for status, count, gross, academy, prof_amount in sorted(rows, key=lambda r: r[0].value):
+            total_entries += count
+            total_gross += Decimal(gross)
+            total_academy += Decimal(academy)
+            total_professional += Decimal(prof_amount)
+            by_status[status.value] = {'count': count, 'amount': float(prof_amount)}
 
         return {
             'professional': {
@@ -371,15 +487,94 @@ class SplitService:
                 'end_date': (end_date - timedelta(days=1)).isoformat()
             },
             'summary': {
-                'total_entries': len(entries),
+                'total_entries': total_entries,
                 'total_gross': float(total_gross),
                 'total_academy': float(total_academy),
                 'total_professional': float(total_professional),
-                'by_status': {k: {'count': v['count'], 'amount': float(v['amount'])} for k, v in by_status.items()}
-            },
-            'entries': details
+                'by_status': by_status
+            }
         }
 
+    def iter_statement_entries(
+        self,
+        professional_id: int,
+        month: int = None,
+        year: int = None,
+        batch_size: int = 500
+    ) -> Iterator[Dict]:
+        """
+        Linhas de detalhe do extrato, em ordem de processamento.
+
+        Uma consulta com os joins (booking, horario, modalidade, cliente)
+        lida em blocos de `batch_size` (yield_per), sem montar a lista.
+        """
+        from sqlalchemy.orm import aliased
+        from app.models.modality import Modality
+
+        month, year, start_date, end_date = self._statement_period(month, year)
+        client = aliased(User)
+
+        query = db.session.query(
+            CommissionEntry.id, Booking.date, ClassSchedule.start_time,
+            client.name, Modality.name, CommissionEntry.booking_status,
+            CommissionEntry.credit_value, CommissionEntry.professional_percentage,
+            CommissionEntry.amount_professional, CommissionEntry.status
+        ).select_from(CommissionEntry).outerjoin(
+            Booking, CommissionEntry.booking_id == Booking.id
+        ).outerjoin(
+            ClassSchedule, Booking.schedule_id == ClassSchedule.id
+        ).outerjoin(
+            Modality, ClassSchedule.modality_id == Modality.id
+        ).outerjoin(
+            client, Booking.user_id == client.id
+        ).filter(
+            self._statement_filter(professional_id, start_date, end_date)
+        ).order_by(
+            CommissionEntry.processed_at, CommissionEntry.id
+        ).execution_options(yield_per=batch_size)
+
+        for (entry_id, booking_date, start_time, client_name, modality_name, booking_status,
+             credit_value, split_pct, amount, status) in query:
+            yield {
+                'id': entry_id,
+                'date': booking_date,
+                'time': start_time,
+                'client_name': client_name or 'N/A',
+                'modality': modality_name or 'N/A',
+                'status': booking_status,
+                'credit_value': float(credit_value),
+                'split_pct': float(split_pct),
+                'amount': float(amount),
+                'commission_status': status.value
+            }
+
+    def get_collaborator_statement(
+        self,
+        professional_id: int,
+        month: int = None,
+        year: int = None
+    ) -> Dict:
+        """
+        Gera extrato de comissoes do colaborador.
+
+        Para PDF/CSV de meses grandes use get_statement_header +
+        iter_statement_entries (app/services/statement_export.py).
+
+        Args:
+            professional_id: ID do colaborador
+            month: Mes (opcional, padrao: mes atual)
+            year: Ano (opcional, padrao: ano atual)
+
+        Returns:
+            Dict com dados do extrato
+        """
+        statement = self.get_statement_header(professional_id, month, year)
+        period = statement['period']
+        statement['entries'] = list(
+            self.iter_statement_entries(professional_id, period['month'], period['year'])
+        )
+        return statement
+
     # =========================================================================
     # Creditos Expirados (Lucro Academia)
     # =========================================================================
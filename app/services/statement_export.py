@@ -0,0 +1,298 @@
+# app/services/statement_export.py
+"""
+Exportacao de extratos de colaboradores (PDF e CSV).
+
+get_collaborator_statement montava todas as entradas do mes em memoria e
+o PDF era construido inteiro num BytesIO dentro da requisicao. Aqui:
+
+- totais vem do SQL (SplitService.get_statement_header) e as linhas de
+  detalhe de um gerador (iter_statement_entries, lido em blocos)
+- PDF: escrito incrementalmente num arquivo temporario, que a rota envia
+  em blocos e apaga ao final
+- CSV: gerado linha a linha direto na resposta
+- lote: todos os extratos de um mes gravados em disco por um pool de
+  processos (CLI `flask split statements` ou job mensal). Cada arquivo e
+  escrito num temporario do mesmo diretorio e trocado com os.replace, entao
+  execucoes concorrentes nunca deixam um extrato truncado; o job mensal
+  ainda reserva o periodo (claim_period) para rodar uma vez so
+"""
+
+import csv
+import io
+import logging
+import multiprocessing
+import os
+import re
+import tempfile
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime
+from typing import Callable, Dict, Iterable, Iterator, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+CSV_HEADER = [
+    'data', 'horario', 'cliente', 'modalidade', 'status',
+    'bruto', 'split_pct', 'liquido', 'status_comissao'
+]
+
+# Linhas acumuladas antes de enviar um bloco do CSV
+CSV_FLUSH_ROWS = 500
+
+# Tamanho dos blocos ao enviar o PDF gravado em disco
+FILE_CHUNK_BYTES = 64 * 1024
+
+# Permissao dos extratos gravados em lote (mkstemp cria com 0600)
+STATEMENT_FILE_MODE = 0o644
+
+
+def statement_filename(statement: Dict, ext: str) -> str:
+    """Nome do arquivo do extrato (ex: extrato_Joao_Silva_03_2026.pdf)."""
+    prof_name = re.sub(r'[^\w.-]', '_', statement['professional']['name'] or '')
+    period = statement['period']
+    return f"extrato_{prof_name}_{period['month']:02d}_{period['year']}.{ext}"
+
+
+# =============================================================================
+# PDF / CSV de um extrato
+# =============================================================================
+
+def write_statement_pdf(professional_id: int, month: int = None, year: int = None,
+                        path: Optional[str] = None, statement: Optional[Dict] = None) -> Tuple[str, Dict]:
+    """
+    Grava o PDF do extrato em `path` (ou num arquivo temporario).
+    `statement` reaproveita um cabecalho ja calculado.
+
+    Returns:
+        (caminho do arquivo, cabecalho do extrato)
+    """
+    from app.services.pdf_generator import pdf_generator
+    from app.services.split_service import split_service
+
+    statement = statement or split_service.get_statement_header(professional_id, month, year)
+    period = statement['period']
+    entries = split_service.iter_statement_entries(professional_id, period['month'], period['year'])
+
+    if path is None:
+        fd, path = tempfile.mkstemp(prefix='extrato_', suffix='.pdf')
+        os.close(fd)
+
+    try:
+        pdf_generator.write_statement_pdf(statement, entries, path)
+    except Exception:
+        os.remove(path)
+        raise
+    return path, statement
+
+
+def iter_file_chunks(path: str, remove: bool = True) -> Iterator[bytes]:
+    """
+    Conteudo do arquivo em blocos; com `remove`, apaga o arquivo ao final
+    (inclusive se o cliente desconectar no meio do envio).
+    """
+    try:
+        with open(path, 'rb') as f:
+            while True:
+                chunk = f.read(FILE_CHUNK_BYTES)
+                if not chunk:
+                    break
+                yield chunk
+    finally:
+        if remove and os.path.exists(path):
+            os.remove(path)
+
+
+def iter_statement_csv(statement: Dict, entries: Iterable[Dict]) -> Iterator[str]:
+    """Blocos de texto do CSV (separador ';') a partir das linhas do extrato."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, delimiter=';')
+    writer.writerow(CSV_HEADER)
+
+    pending = 0
+    for e in entries:
+        writer.writerow([
+            e['date'].isoformat() if e['date'] else '',
+            e['time'].strftime('%H:%M') if e['time'] else '',
+            e['client_name'],
+            e['modality'],
+            e['status'],
+            f"{e['credit_value']:.2f}",
+            f"{e['split_pct']:.2f}",
+            f"{e['amount']:.2f}",
+            e['commission_status']
+        ])
+        pending += 1
+        if pending >= CSV_FLUSH_ROWS:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+            pending = 0
+
+    yield buffer.getvalue()
+
+
+def write_statement_csv(professional_id: int, month: int = None, year: int = None,
+                        path: Optional[str] = None, statement: Optional[Dict] = None) -> Tuple[str, Dict]:
+    """Grava o CSV do extrato em `path` (ou num arquivo temporario)."""
+    from app.services.split_service import split_service
+
+    statement = statement or split_service.get_statement_header(professional_id, month, year)
+    period = statement['period']
+    entries = split_service.iter_statement_entries(professional_id, period['month'], period['year'])
+
+    if path is None:
+        fd, path = tempfile.mkstemp(prefix='extrato_', suffix='.csv')
+        os.close(fd)
+
+    with open(path, 'w', encoding='utf-8', newline='') as f:
+        for chunk in iter_statement_csv(statement, entries):
+            f.write(chunk)
+    return path, statement
+
+
+# =============================================================================
+# Lote: todos os extratos do mes
+# =============================================================================
+
+_worker_app = None
+
+
+def _write_atomic(path: str, write: Callable[[str], object]):
+    """
+    Chama `write(tmp)` num temporario do mesmo diretorio e troca pelo
+    arquivo final com os.replace (leitores nunca veem arquivo parcial).
+    """
+    directory, name = os.path.split(path)
+    fd, tmp = tempfile.mkstemp(prefix=f'.{name}.', suffix='.tmp', dir=directory or '.')
+    os.close(fd)
+    try:
+        write(tmp)
+        os.chmod(tmp, STATEMENT_FILE_MODE)
+        os.replace(tmp, path)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+
+
+def claim_period(output_dir: str, month: int, year: int) -> Optional[str]:
+    """
+    Reserva a geracao do periodo criando um marcador exclusivo (O_EXCL) em
+    `output_dir`: o job mensal dispara ao mesmo tempo em todos os workers e
+    so o primeiro segue.
+
+    Returns:
+        Caminho do marcador, ou None se outro processo ja reservou
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    marker = os.path.join(output_dir, f'.extratos_{month:02d}_{year}.lock')
+    try:
+        fd = os.open(marker, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+    except FileExistsError:
+        return None
+    with os.fdopen(fd, 'w') as f:
+        f.write(f"{os.getpid()} {datetime.utcnow().isoformat()}\n")
+    return marker
+
+
+def _init_worker():
+    """Inicializador dos processos do pool: uma app por processo."""
+    global _worker_app
+    from app import create_app
+    _worker_app = create_app()
+
+
+def _export_statement(professional_id: int, month: int, year: int,
+                      output_dir: str, formats: Tuple[str, ...]) -> Dict:
+    """Gera os arquivos de um colaborador (roda no processo do pool ou inline)."""
+    from flask import has_app_context
+
+    def run():
+        from app.services.split_service import split_service
+
+        statement = split_service.get_statement_header(professional_id, month, year)
+        files = []
+        for fmt in formats:
+            path = os.path.join(output_dir, statement_filename(statement, fmt))
+            writer = write_statement_pdf if fmt == 'pdf' else write_statement_csv
+            _write_atomic(path, lambda tmp: writer(professional_id, month, year, tmp, statement))
+            files.append(path)
+        return {
+            'professional_id': professional_id,
+            'entries': statement['summary']['total_entries'],
+            'files': files
+        }
+
+    if has_app_context():
+        return run()
+    with _worker_app.app_context():
+        return run()
+
+
+def generate_monthly_statements(month: int, year: int, output_dir: str,
+                                workers: int = 0, formats: Tuple[str, ...] = ('pdf',),
+                                progress: Optional[Callable[[Dict], None]] = None) -> Dict:
+    """
+    Gera os extratos de todos os colaboradores com comissoes no mes.
+
+    Args:
+        month, year: Periodo
+        output_dir: Diretorio de saida (criado se nao existir)
+        workers: Processos do pool (0 = no processo atual)
+        formats: 'pdf' e/ou 'csv'
+        progress: Callback chamado a cada extrato concluido
+
+    Returns:
+        dict com generated, failed e a lista de arquivos
+    """
+    from app import db
+    from app.models.commission import CommissionEntry
+    from app.services.split_service import split_service
+
+    _, _, start_date, end_date = split_service._statement_period(month, year)
+    professional_ids = [pid for (pid,) in db.session.query(
+        CommissionEntry.professional_id
+    ).filter(
+        CommissionEntry.processed_at >= datetime.combine(start_date, datetime.min.time()),
+        CommissionEntry.processed_at < datetime.combine(end_date, datetime.min.time())
+    ).distinct().order_by(CommissionEntry.professional_id)]
+
+    os.makedirs(output_dir, exist_ok=True)
+    results = {'total': len(professional_ids), 'generated': 0, 'failed': 0, 'files': []}
+
+    def collect(pid, outcome=None, error=None):
+        if error is not None:
+            results['failed'] += 1
+            logger.error(f"Extrato do colaborador {pid} ({month:02d}/{year}) falhou: {error}")
+        else:
+            results['generated'] += 1
+            results['files'].extend(outcome['files'])
+        if progress:
+            progress({'professional_id': pid, 'error': error, **results})
+
+    if workers <= 0 or len(professional_ids) <= 1:
+        for pid in professional_ids:
+            try:
+                collect(pid, _export_statement(pid, month, year, output_dir, formats))
+            except Exception as e:
+                db.session.rollback()
+                collect(pid, error=e)
+        return results
+
+    # Processos novos (spawn): cada um cria sua app e conexoes
+    with ProcessPoolExecutor(
+        max_workers=workers,
+        mp_context=multiprocessing.get_context('spawn'),
+        initializer=_init_worker
+    ) as executor:
+        futures = {
+            executor.submit(_export_statement, pid, month, year, output_dir, formats): pid
+            for pid in professional_ids
+        }
+        for future in as_completed(futures):
+            pid = futures[future]
+            try:
+                collect(pid, future.result())
+            except Exception as e:
+                collect(pid, error=e)
+
+    return results
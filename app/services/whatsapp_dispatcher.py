@@ -0,0 +1,184 @@
+# app/services/whatsapp_dispatcher.py
+"""
+Disparo concorrente de mensagens WhatsApp.
+
+Campanhas, reguas de retencao e lembretes enviavam uma mensagem por vez,
+esperando cada POST na Megaapi; 2.000 destinatarios prendiam um worker
+web por varios minutos. O dispatcher executa os envios num pool de
+threads limitado, enquanto o MegapiService garante o ritmo do provedor
+(token bucket compartilhado) e o retry com backoff.
+
+Uso:
+    report = dispatcher.dispatch(messages, lambda m: megaapi.send_custom_message(**m))
+    report['results']  # um resultado por mensagem, na ordem de entrada
+    report['metrics']  # sent, failed, messages_per_sec, error_rate...
+
+Cada envio roda no seu proprio app context (sessao do banco propria).
+As mensagens devem ser dados simples (dicts); objetos ORM da sessao
+principal nao devem ser lidos dentro das threads.
+
+Com WHATSAPP_QUEUE_ENABLED os send_* apenas enfileiram: o dispatch roda
+entao na thread e na sessao do chamador, em sequencia (um INSERT por
+mensagem, uma unica transacao), e a concorrencia fica com o worker da fila.
+Threads gravando ao mesmo tempo no SQLite dariam "database is locked".
+"""
+
+import logging
+import os
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Iterable, List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class TokenBucket:
+    """
+    Limitador de taxa (token bucket) thread-safe.
+
+    `rate` tokens por segundo, acumulando ate `capacity` (rajada maxima).
+    """
+
+    def __init__(self, rate: float, capacity: Optional[float] = None):
+        self.rate = float(rate)
+        self.capacity = float(capacity or max(1.0, rate))
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, tokens: float = 1.0) -> float:
+        """
+        Bloqueia ate haver `tokens` disponiveis.
+
+        Returns:
+            Tempo esperado, em segundos
+        """
+        if self.rate <= 0:
+            return 0.0
+
+        waited = 0.0
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= tokens:
+                    self._tokens -= tokens
+                    return waited
+                wait = (tokens - self._tokens) / self.rate
+            time.sleep(wait)
+            waited += wait
+
+
+def backoff_delay(attempt: int, base: float = 0.5, cap: float = 30.0) -> float:
+    """Backoff exponencial com jitter completo: U(0, min(cap, base * 2^attempt))."""
+    return random.uniform(0, min(cap, base * (2 ** attempt)))
+
+
+class WhatsAppDispatcher:
+    """Executor de envios em lote com metricas por disparo e acumuladas."""
+
+    def __init__(self):
+        self.max_workers = int(os.getenv('MEGAAPI_DISPATCH_WORKERS', 8))
+        self._lock = threading.Lock()
+        self._stats = {
+            'dispatches': 0,
+            'sent': 0,
+            'failed': 0,
+            'elapsed_s': 0.0,
+        }
+
+    def dispatch(self, messages: Iterable[Dict], send: Callable[[Dict], Dict],
+                 max_workers: Optional[int] = None, inline: Optional[bool] = None) -> Dict:
+        """
+        Envia `messages` em paralelo chamando `send(message)` para cada uma.
+
+        Um envio conta como falha se `send` levantar excecao ou retornar
+        {'success': False}.
+
+        `inline`: None = na thread do chamador quando a fila WhatsApp esta
+        ativa (send_* so enfileira); False forca o pool (worker da fila, que
+        envia direto com megaapi.deliver).
+
+        Returns:
+            dict com results (message, success, result/error, elapsed_ms)
+            e metrics
+        """
+        from flask import current_app
+        from app.services.outbound_queue import outbound_queue
+
+        messages = list(messages)
+        app = current_app._get_current_object()
+        if inline is None:
+            inline = outbound_queue.enabled()
+        workers = 1 if inline else max(1, min(max_workers or self.max_workers, len(messages) or 1))
+
+        def call(message, entry):
+            try:
+                result = send(message)
+                entry['result'] = result
+                entry['success'] = not (isinstance(result, dict) and result.get('success') is False)
+                if not entry['success']:
+                    entry['error'] = result.get('error')
+            except Exception as e:
+                entry['error'] = str(e)
+
+        def run(message):
+            started = time.perf_counter()
+            entry = {'message': message, 'success': False, 'result': None, 'error': None}
+            if inline:
+                call(message, entry)
+            else:
+                with app.app_context():
+                    call(message, entry)
+            entry['elapsed_ms'] = round((time.perf_counter() - started) * 1000, 1)
+            return entry
+
+        started = time.perf_counter()
+        if workers == 1:
+            results = [run(message) for message in messages]
+        else:
+            with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='whatsapp') as pool:
+                results = list(pool.map(run, messages))
+        elapsed = time.perf_counter() - started
+
+        metrics = self._metrics(results, elapsed, workers)
+        with self._lock:
+            self._stats['dispatches'] += 1
+            self._stats['sent'] += metrics['sent']
+            self._stats['failed'] += metrics['failed']
+            self._stats['elapsed_s'] += elapsed
+
+        if metrics['failed']:
+            logger.warning(f"Disparo WhatsApp: {metrics['failed']}/{metrics['total']} falhas")
+        return {'results': results, 'metrics': metrics}
+
+    @staticmethod
+    def _metrics(results: List[Dict], elapsed: float, workers: int) -> Dict:
+        total = len(results)
+        sent = sum(1 for r in results if r['success'])
+        return {
+            'total': total,
+            'sent': sent,
+            'failed': total - sent,
+            'workers': workers,
+            'elapsed_s': round(elapsed, 3),
+            'messages_per_sec': round(total / elapsed, 2) if elapsed > 0 else 0.0,
+            'error_rate': round((total - sent) / total, 4) if total else 0.0,
+        }
+
+    def get_stats(self) -> Dict:
+        """Contadores acumulados desde o inicio do processo."""
+        with self._lock:
+            stats = dict(self._stats)
+        total = stats['sent'] + stats['failed']
+        stats['messages_per_sec'] = round(total / stats['elapsed_s'], 2) if stats['elapsed_s'] else 0.0
+        stats['error_rate'] = round(stats['failed'] / total, 4) if total else 0.0
+        stats['elapsed_s'] = round(stats['elapsed_s'], 3)
+        return stats
+
+
+# Singleton
+dispatcher = WhatsAppDispatcher()
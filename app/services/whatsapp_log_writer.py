@@ -0,0 +1,233 @@
+# app/services/whatsapp_log_writer.py
+"""
+Escrita em lote de WhatsAppLog e dos contadores de envio de templates.
+
+Cada envio fazia um INSERT + COMMIT do log e, em send_template_message,
+outro COMMIT so para `template.send_count += 1`: dois commits por
+mensagem durante campanhas. Aqui os logs vao para uma fila em memoria
+(limitada) e um worker em background faz bulk insert a cada N registros
+ou T milissegundos; os contadores de template sao somados em memoria e
+aplicados no mesmo flush (um UPDATE por template). Na parada do processo
+a fila e descarregada.
+"""
+
+import atexit
+import logging
+import queue
+import threading
+import time
+from collections import Counter
+from typing import Dict, List
+
+from sqlalchemy import func
+
+logger = logging.getLogger(__name__)
+
+
+class WhatsAppLogWriter:
+    """
+    Sink de WhatsAppLog com fila limitada.
+
+    Se a fila estiver cheia o registro e descartado (contador `dropped`)
+    em vez de bloquear o envio.
+    """
+
+    def __init__(self, batch_size: int = 100, flush_interval_ms: int = 1000,
+                 max_queue: int = 10000):
+        """
+        Args:
+            batch_size: Registros por bulk insert
+            flush_interval_ms: Intervalo maximo entre flushes
+            max_queue: Capacidade da fila em memoria
+        """
+        self.batch_size = batch_size
+        self.flush_interval_ms = flush_interval_ms
+        self.max_queue = max_queue
+
+        self._queue = None
+        self._app = None
+        self._thread = None
+        self._stop = threading.Event()
+        self._start_lock = threading.Lock()
+        self._write_lock = threading.Lock()
+        self._counter_lock = threading.Lock()
+        self._template_counts = Counter()
+        self._atexit_registered = False
+        self._stats = {
+            'enqueued': 0,
+            'flushed': 0,
+            'dropped': 0,
+            'failed': 0,
+            'batches': 0,
+            'template_updates': 0,
+            'last_flush_ms': 0.0,
+        }
+
+    # =========================================================================
+    # Ciclo de vida
+    # =========================================================================
+
+    def start(self, app):
+        """Inicia o worker em background (idempotente)."""
+        with self._start_lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+
+            self._app = app
+            self.batch_size = app.config.get('WHATSAPP_LOG_BATCH_SIZE', self.batch_size)
+            self.flush_interval_ms = app.config.get('WHATSAPP_LOG_FLUSH_MS', self.flush_interval_ms)
+            self.max_queue = app.config.get('WHATSAPP_LOG_QUEUE_SIZE', self.max_queue)
+            if self._queue is None:
+                self._queue = queue.Queue(maxsize=self.max_queue)
+
+            self._stop.clear()
+            self._thread = threading.Thread(
+                target=self._run, name='whatsapp-log-writer', daemon=True
+            )
+            self._thread.start()
+
+            # Descarregar a fila ao encerrar o processo
+            if not self._atexit_registered:
+                atexit.register(self.shutdown)
+                self._atexit_registered = True
+
+            logger.info(f"WhatsAppLogWriter iniciado (batch={self.batch_size}, "
+                        f"intervalo={self.flush_interval_ms}ms, fila={self.max_queue})")
+
+    def shutdown(self, timeout: float = 5.0):
+        """Para o worker e grava o que restou na fila."""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=timeout)
+            self._thread = None
+        self.flush()
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def _ensure_started(self):
+        if not self.running:
+            from flask import current_app
+            self.start(current_app._get_current_object())
+
+    # =========================================================================
+    # Produtor
+    # =========================================================================
+
+    def submit(self, row: Dict) -> bool:
+        """
+        Enfileira um registro de WhatsAppLog (dict com as colunas).
+
+        Returns:
+            False se a fila estiver cheia (registro descartado)
+        """
+        self._ensure_started()
+
+        try:
+            self._queue.put_nowait(row)
+        except queue.Full:
+            self._stats['dropped'] += 1
+            return False
+
+        self._stats['enqueued'] += 1
+        return True
+
+    def count_template(self, template_id: int, amount: int = 1):
+        """Soma envios de um template; aplicado no proximo flush."""
+        self._ensure_started()
+        with self._counter_lock:
+            self._template_counts[template_id] += amount
+
+    # =========================================================================
+    # Consumidor
+    # =========================================================================
+
+    def _run(self):
+        """Loop do worker: agrupa registros por tamanho ou tempo."""
+        batch = []
+        deadline = time.monotonic() + self.flush_interval_ms / 1000
+
+        while not self._stop.is_set():
+            timeout = max(0.0, deadline - time.monotonic())
+            try:
+                batch.append(self._queue.get(timeout=timeout))
+            except queue.Empty:
+                pass
+
+            if len(batch) >= self.batch_size or time.monotonic() >= deadline:
+                if batch or self._template_counts:
+                    self._write(batch)
+                    batch = []
+                deadline = time.monotonic() + self.flush_interval_ms / 1000
+
+        if batch:
+            self._write(batch)
+
+    def flush(self) -> int:
+        """Grava imediatamente tudo o que estiver na fila (e os contadores)."""
+        if self._queue is None:
+            return 0
+
+        rows = []
+        while True:
+            try:
+                rows.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+
+        for i in range(0, len(rows), self.batch_size):
+            self._write(rows[i:i + self.batch_size])
+        if self._template_counts:
+            self._write([])
+        return len(rows)
+
+    def _write(self, rows: List[Dict]):
+        """Bulk insert de um lote de logs + contadores de template pendentes."""
+        from app import db
+        from app.models import WhatsAppLog, WhatsAppTemplate
+
+        with self._counter_lock:
+            counts, self._template_counts = self._template_counts, Counter()
+
+        start = time.perf_counter()
+        with self._write_lock, self._app.app_context():
+            try:
+                if rows:
+                    db.session.bulk_insert_mappings(WhatsAppLog, rows)
+                for template_id, amount in counts.items():
+                    WhatsAppTemplate.query.filter_by(id=template_id).update(
+                        {WhatsAppTemplate.send_count: func.coalesce(WhatsAppTemplate.send_count, 0) + amount},
+                        synchronize_session=False
+                    )
+                db.session.commit()
+                self._stats['flushed'] += len(rows)
+                self._stats['batches'] += 1
+                self._stats['template_updates'] += len(counts)
+            except Exception as e:
+                db.session.rollback()
+                self._stats['failed'] += len(rows)
+                # Contadores voltam para o proximo flush (somados aos que chegaram nesse meio tempo)
+                with self._counter_lock:
+                    self._template_counts.update(counts)
+                logger.error(f"Erro ao gravar lote de {len(rows)} logs de WhatsApp: {e}")
+            finally:
+                db.session.remove()
+
+        self._stats['last_flush_ms'] = round((time.perf_counter() - start) * 1000, 2)
+
+    # =========================================================================
+    # Estatisticas
+    # =========================================================================
+
+    def get_stats(self) -> Dict:
+        """Retorna contadores do sink."""
+        stats = dict(self._stats)
+        stats['queue_size'] = self._queue.qsize() if self._queue is not None else 0
+        stats['pending_template_counts'] = sum(self._template_counts.values())
+        stats['running'] = self.running
+        return stats
+
+
+# Singleton
+whatsapp_log_writer = WhatsAppLogWriter()
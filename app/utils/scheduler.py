@@ -51,12 +51,14 @@ def init_scheduler(app):
             window_start = two_hours_later.time()
             window_end = (two_hours_later + timedelta(minutes=30)).time()
 
+            from app.services.megaapi import megaapi, Button
+            from app.services.whatsapp_dispatcher import dispatcher
+
+            messages = []
             for booking in bookings:
                 schedule_time = booking.schedule.start_time
                 if window_start <= schedule_time <= window_end:
                     try:
-                        from app.services.megaapi import megaapi, Button
-
                         instructor_name = booking.schedule.instructor.name if booking.schedule.instructor else 'Instrutor'
                         first_name = booking.user.name.split()[0]
                         modality = booking.schedule.modality.name
@@ -72,17 +74,23 @@ def init_scheduler(app):
                                 f"*{modality}* hoje às *{hora}*!\n\n"
                                 f"Instrutor: {instructor_name}")
 
-                        megaapi.send_buttons(
-                            phone=booking.user.phone,
-                            message=text,
-                            buttons=buttons,
-                            user_id=booking.user_id
-                        )
-
-                        booking.reminder_2h_sent = True
+                        messages.append({'booking': booking, 'phone': booking.user.phone,
+                                         'message': text, 'buttons': buttons,
+                                         'user_id': booking.user_id,
+                                         'idempotency_key': f'reminder_2h:{booking.id}'})
                     except Exception as e:
                         print(f"Erro ao enviar lembrete 2h: {e}")
 
+            report = dispatcher.dispatch(messages, lambda m: megaapi.send_buttons(
+                phone=m['phone'], message=m['message'], buttons=m['buttons'], user_id=m['user_id'],
+                idempotency_key=m['idempotency_key']
+            ))
+            for entry in report['results']:
+                if entry['success']:
+                    entry['message']['booking'].reminder_2h_sent = True
+                else:
+                    print(f"Erro ao enviar lembrete 2h: {entry['error']}")
+
             db.session.commit()
 
     # Lembretes de aula 24h antes (diario as 18h)
@@ -101,14 +109,16 @@ def init_scheduler(app):
                 Booking.reminder_24h_sent == False
             ).all()
 
+            from app.services.megaapi import megaapi
+            from app.services.whatsapp_dispatcher import dispatcher
+
+            messages = []
             for booking in bookings:
                 try:
-                    from app.services.megaapi import megaapi
-
-                    megaapi.send_template_message(
-                        phone=booking.user.phone,
-                        template_name='lembrete_aula_24h',
-                        variables=[
+                    messages.append({
+                        'booking': booking,
+                        'phone': booking.user.phone,
+                        'variables': [
                             booking.user.name.split()[0],
                             tomorrow.strftime('%d/%m'),
                             booking.schedule.start_time.strftime('%H:%M'),
@@ -116,13 +126,25 @@ def init_scheduler(app):
                             booking.schedule.instructor.name if booking.schedule.instructor else 'Instrutor',
                             'Academia Fitness'
                         ],
-                        user_id=booking.user_id
-                    )
-
-                    booking.reminder_24h_sent = True
+                        'user_id': booking.user_id,
+                        'idempotency_key': f'reminder_24h:{booking.id}'
+                    })
                 except Exception as e:
                     print(f"Erro ao enviar lembrete 24h: {e}")
 
+            report = dispatcher.dispatch(messages, lambda m: megaapi.send_template_message(
+                phone=m['phone'],
+                template_name='lembrete_aula_24h',
+                variables=m['variables'],
+                user_id=m['user_id'],
+                idempotency_key=m['idempotency_key']
+            ))
+            for entry in report['results']:
+                if entry['success']:
+                    entry['message']['booking'].reminder_24h_sent = True
+                else:
+                    print(f"Erro ao enviar lembrete 24h: {entry['error']}")
+
             db.session.commit()
 
     # Renovação de Plano - 3 dias antes (diário às 8h) - PRD
@@ -151,8 +173,8 @@ def init_scheduler(app):
             except Exception as e:
                 print(f"[SCHEDULER] Erro em pesquisas NPS: {e}")
 
-    # Verificar conquistas (a cada hora)
-    @scheduler.scheduled_job(IntervalTrigger(hours=1))
+    # Verificar conquistas - reconciliacao (check-in e XP ja avaliam na hora)
+    @scheduler.scheduled_job(IntervalTrigger(minutes=app.config.get('ACHIEVEMENT_SWEEP_INTERVAL_MINUTES', 60)))
     def check_achievements():
         with app.app_context():
             print(f"[SCHEDULER] Verificando conquistas...")
@@ -418,7 +440,7 @@ def init_scheduler(app):
             
             db.session.commit()
 
-    # Calcular Health Score (diario as 4h da manha)
+    # Calcular Health Score (diario as 4h da manha) - reconciliacao completa
     @scheduler.scheduled_job(CronTrigger(hour=4, minute=0))
     def calculate_health_scores():
         with app.app_context():
@@ -431,6 +453,57 @@ def init_scheduler(app):
             except Exception as e:
                 print(f"[SCHEDULER] Erro ao calcular Health Scores: {e}")
 
+    # Health Score incremental (alunos com check-in/pagamento/treino recentes)
+    @scheduler.scheduled_job(IntervalTrigger(minutes=app.config.get('HEALTH_SCORE_DIRTY_INTERVAL_MINUTES', 5)))
+    def recalculate_dirty_health_scores():
+        with app.app_context():
+            from app.services.health_score_calculator import HealthScoreCalculator
+            try:
+                results = HealthScoreCalculator().recalculate_dirty()
+                if results['dirty']:
+                    print(f"[SCHEDULER] Health Scores incrementais: {results}")
+            except Exception as e:
+                print(f"[SCHEDULER] Erro no recalculo incremental de Health Scores: {e}")
+
+    # Fila de WhatsApp (outbound_messages): envia o que foi enfileirado pelas rotas
+    if app.config.get('WHATSAPP_QUEUE_ENABLED'):
+        @scheduler.scheduled_job(IntervalTrigger(seconds=app.config.get('WHATSAPP_QUEUE_INTERVAL_SECONDS', 10)))
+        def process_whatsapp_queue():
+            with app.app_context():
+                from app.services.outbound_queue import outbound_queue
+                try:
+                    results = outbound_queue.drain()
+                    if results['claimed']:
+                        print(f"[SCHEDULER] Fila WhatsApp: {results}")
+                except Exception as e:
+                    print(f"[SCHEDULER] Erro ao processar fila WhatsApp: {e}")
+
+    # Reconciliacao do cache de vagas com o banco
+    if app.config.get('AVAILABILITY_CACHE_BACKEND', 'none') != 'none':
+        @scheduler.scheduled_job(IntervalTrigger(minutes=app.config.get('AVAILABILITY_RECONCILE_MINUTES', 10)))
+        def reconcile_availability_cache():
+            with app.app_context():
+                from app.services.availability_cache import availability_cache
+                try:
+                    results = availability_cache.reconcile(app.config.get('AVAILABILITY_RECONCILE_DAYS', 30))
+                    if results['drift']:
+                        print(f"[SCHEDULER] Cache de vagas reconciliado: {results}")
+                except Exception as e:
+                    print(f"[SCHEDULER] Erro ao reconciliar cache de vagas: {e}")
+
+    # Snapshots diarios dos KPIs (dias encerrados + recalculo dos recentes)
+    @scheduler.scheduled_job(IntervalTrigger(minutes=app.config.get('METRIC_SNAPSHOT_INTERVAL_MINUTES', 60)))
+    def refresh_metric_snapshots():
+        with app.app_context():
+            from app.services.metric_snapshots import metric_snapshots
+            try:
+                results = metric_snapshots.refresh()
+                if results['rows']:
+                    print(f"[SCHEDULER] Snapshots de metricas: {results['start']} a {results['end']} "
+                          f"({results['rows']} linhas)")
+            except Exception as e:
+                print(f"[SCHEDULER] Erro nos snapshots de metricas: {e}")
+
     # Automações de Retenção (diario as 10h da manha)
     @scheduler.scheduled_job(CronTrigger(hour=10, minute=0))
     def run_retention_automations():
@@ -495,6 +568,38 @@ def init_scheduler(app):
             except Exception as e:
                 print(f"[SCHEDULER] Erro ao processar comissoes: {e}")
 
+    # Extratos do mes anterior de todos os colaboradores (dia 1 as 3h)
+    if app.config.get('SPLIT_STATEMENTS_DIR'):
+        @scheduler.scheduled_job(CronTrigger(day=1, hour=3, minute=0))
+        def generate_monthly_statements():
+            with app.app_context():
+                print("[SCHEDULER] Gerando extratos mensais de colaboradores...")
+                import os
+                from datetime import date, timedelta
+                from app.services.statement_export import claim_period, generate_monthly_statements as generate
+
+                previous = date.today().replace(day=1) - timedelta(days=1)
+                output_dir = app.config['SPLIT_STATEMENTS_DIR']
+                # Um scheduler por worker: so quem criar o marcador do periodo gera
+                marker = claim_period(output_dir, previous.month, previous.year)
+                if marker is None:
+                    print(f"[SCHEDULER] Extratos {previous.month:02d}/{previous.year} ja em geracao por outro processo")
+                    return
+                try:
+                    formats = tuple(f.strip() for f in app.config['SPLIT_STATEMENTS_FORMATS'].split(',') if f.strip())
+                    results = generate(
+                        previous.month, previous.year,
+                        output_dir=output_dir,
+                        workers=app.config.get('SPLIT_STATEMENTS_WORKERS', 2),
+                        formats=formats
+                    )
+                    print(f"[SCHEDULER] Extratos {previous.month:02d}/{previous.year}: "
+                          f"{results['generated']} gerados, {results['failed']} falhas")
+                except Exception as e:
+                    # Libera o periodo para nova tentativa (ex: flask split statements)
+                    os.remove(marker)
+                    print(f"[SCHEDULER] Erro ao gerar extratos mensais: {e}")
+
     # Processar creditos expirados como receita (diario as 1h)
     @scheduler.scheduled_job(CronTrigger(hour=1, minute=0))
     def process_expired_credits_revenue():
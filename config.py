@@ -18,6 +18,27 @@ class Config:
     # MegaAPI (WhatsApp)
     MEGAAPI_TOKEN = os.environ.get('MEGAAPI_TOKEN')
     MEGAAPI_BASE_URL = os.environ.get('MEGAAPI_BASE_URL', 'https://api.megaapi.com.br/v1')
+    # Disparo: limite do provedor (msgs/s e rajada), retries e threads por lote
+    MEGAAPI_RATE_PER_SECOND = float(os.environ.get('MEGAAPI_RATE_PER_SECOND', 10))
+    MEGAAPI_RATE_BURST = float(os.environ.get('MEGAAPI_RATE_BURST', 20))
+    MEGAAPI_MAX_RETRIES = int(os.environ.get('MEGAAPI_MAX_RETRIES', 3))
+    MEGAAPI_BACKOFF_BASE = float(os.environ.get('MEGAAPI_BACKOFF_BASE', 0.5))
+    MEGAAPI_DISPATCH_WORKERS = int(os.environ.get('MEGAAPI_DISPATCH_WORKERS', 8))
+    MEGAAPI_POOL_SIZE = int(os.environ.get('MEGAAPI_POOL_SIZE', 16))  # Conexoes keep-alive
+
+    # WhatsApp - fila persistente (outbound_messages) processada em background
+    WHATSAPP_QUEUE_ENABLED = os.environ.get('WHATSAPP_QUEUE_ENABLED', 'true').lower() == 'true'
+    WHATSAPP_QUEUE_INTERVAL_SECONDS = int(os.environ.get('WHATSAPP_QUEUE_INTERVAL_SECONDS', 10))
+    WHATSAPP_QUEUE_BATCH_SIZE = int(os.environ.get('WHATSAPP_QUEUE_BATCH_SIZE', 100))
+    WHATSAPP_QUEUE_MAX_ATTEMPTS = int(os.environ.get('WHATSAPP_QUEUE_MAX_ATTEMPTS', 5))
+    WHATSAPP_QUEUE_RETRY_BASE_SECONDS = int(os.environ.get('WHATSAPP_QUEUE_RETRY_BASE_SECONDS', 30))
+    WHATSAPP_QUEUE_LOCK_TIMEOUT = int(os.environ.get('WHATSAPP_QUEUE_LOCK_TIMEOUT', 300))
+
+    # WhatsApp - log de envios em lote (background) e contadores de template agregados
+    WHATSAPP_LOG_ASYNC = os.environ.get('WHATSAPP_LOG_ASYNC', 'true').lower() == 'true'
+    WHATSAPP_LOG_BATCH_SIZE = int(os.environ.get('WHATSAPP_LOG_BATCH_SIZE', 100))
+    WHATSAPP_LOG_FLUSH_MS = int(os.environ.get('WHATSAPP_LOG_FLUSH_MS', 1000))
+    WHATSAPP_LOG_QUEUE_SIZE = int(os.environ.get('WHATSAPP_LOG_QUEUE_SIZE', 10000))
 
     # NuPay Configuration (Pagamentos PIX)
     NUPAY_BASE_URL = os.environ.get('NUPAY_BASE_URL', 'https://api.spinpay.com.br')
@@ -25,6 +46,80 @@ class Config:
     NUPAY_MERCHANT_TOKEN = os.environ.get('NUPAY_MERCHANT_TOKEN')
     NUPAY_WEBHOOK_SECRET = os.environ.get('NUPAY_WEBHOOK_SECRET')
 
+    # Reconhecimento Facial - busca na galeria
+    # 'exact' (forca bruta vetorizada) ou 'ivf' (aproximada, para galerias grandes)
+    FACE_MATCH_MODE = os.environ.get('FACE_MATCH_MODE', 'exact')
+    FACE_ANN_MIN_GALLERY = int(os.environ.get('FACE_ANN_MIN_GALLERY', 2000))
+    FACE_ANN_NLIST = int(os.environ.get('FACE_ANN_NLIST', 0))  # 0 = automatico (~sqrt(N))
+    FACE_ANN_NPROBE = int(os.environ.get('FACE_ANN_NPROBE', 8))
+    FACE_ANN_RERANK_K = int(os.environ.get('FACE_ANN_RERANK_K', 10))
+
+    # Reconhecimento Facial - deteccao em imagem reduzida (maior lado, em px; 0 = original)
+    FACE_DETECTION_MAX_SIDE = int(os.environ.get('FACE_DETECTION_MAX_SIDE', 640))
+
+    # Reconhecimento Facial - pool de processos para dlib (0 = inline na requisicao)
+    FACE_ENCODER_WORKERS = int(os.environ.get('FACE_ENCODER_WORKERS', 0))
+    FACE_ENCODER_MAX_PENDING = int(os.environ.get('FACE_ENCODER_MAX_PENDING', 0))  # 0 = 2x workers
+    FACE_ENCODER_TIMEOUT = float(os.environ.get('FACE_ENCODER_TIMEOUT', 10))
+
+    # Reconhecimento Facial - formato de armazenamento dos encodings
+    # 'v1' (float64, legado) ou 'v2' (float32). Com NORMALIZE os encodings sao
+    # normalizados (L2) no cadastro e na galeria; distancias mudam de escala,
+    # revisar tolerancia/thresholds ao ativar. Com a flag desligada, encodings
+    # 'v2n' ficam fora da galeria (migrar todos antes de ligar/desligar).
+    FACE_ENCODING_VERSION = os.environ.get('FACE_ENCODING_VERSION', 'v2')
+    FACE_ENCODING_NORMALIZE = os.environ.get('FACE_ENCODING_NORMALIZE', 'false').lower() == 'true'
+
+    # Reconhecimento Facial - cadastro com multiplos frames (centroide + dispersao)
+    # threshold individual = distancia esperada de um frame novo x MULTIPLIER,
+    # limitado a [MIN, MAX]. MAX (teto) pode passar do 0.6 padrao: usuarios que
+    # variam muito entre fotos ganham folga, no maximo ate este valor.
+    FACE_ENROLL_MAX_SAMPLES = int(os.environ.get('FACE_ENROLL_MAX_SAMPLES', 10))
+    FACE_THRESHOLD_SPREAD_MULTIPLIER = float(os.environ.get('FACE_THRESHOLD_SPREAD_MULTIPLIER', 1.5))
+    FACE_THRESHOLD_MIN = float(os.environ.get('FACE_THRESHOLD_MIN', 0.45))
+    FACE_THRESHOLD_MAX = float(os.environ.get('FACE_THRESHOLD_MAX', 0.65))
+
+    # Reconhecimento Facial - log de tentativas em lote (background)
+    FACE_LOG_ASYNC = os.environ.get('FACE_LOG_ASYNC', 'true').lower() == 'true'
+    FACE_LOG_BATCH_SIZE = int(os.environ.get('FACE_LOG_BATCH_SIZE', 50))
+    FACE_LOG_FLUSH_MS = int(os.environ.get('FACE_LOG_FLUSH_MS', 500))
+    FACE_LOG_QUEUE_SIZE = int(os.environ.get('FACE_LOG_QUEUE_SIZE', 10000))
+
+    # CRM - intervalo do recalculo incremental de health scores (minutos)
+    HEALTH_SCORE_DIRTY_INTERVAL_MINUTES = int(os.environ.get('HEALTH_SCORE_DIRTY_INTERVAL_MINUTES', 5))
+
+    # Cache em processo de SystemConfig/WhatsAppTemplate (0 = desligado)
+    LOOKUP_CACHE_TTL = int(os.environ.get('LOOKUP_CACHE_TTL', 300))
+    LOOKUP_CACHE_VERSION_CHECK_SECONDS = float(os.environ.get('LOOKUP_CACHE_VERSION_CHECK_SECONDS', 5))
+
+    # Cache de vagas por horario/dia (none, memory ou redis)
+    # redis: compartilhado entre workers gunicorn (padrao se AVAILABILITY_CACHE_URL
+    # estiver definido); memory: por processo, so para um unico worker
+    AVAILABILITY_CACHE_BACKEND = os.environ.get(
+        'AVAILABILITY_CACHE_BACKEND', 'redis' if os.environ.get('AVAILABILITY_CACHE_URL') else 'none'
+    )
+    AVAILABILITY_CACHE_URL = os.environ.get('AVAILABILITY_CACHE_URL', 'redis://localhost:6379/0')
+    AVAILABILITY_CACHE_TTL = int(os.environ.get('AVAILABILITY_CACHE_TTL', 120))
+    AVAILABILITY_RECONCILE_MINUTES = int(os.environ.get('AVAILABILITY_RECONCILE_MINUTES', 10))
+    AVAILABILITY_RECONCILE_DAYS = int(os.environ.get('AVAILABILITY_RECONCILE_DAYS', 30))
+
+    # Conquistas: avaliacao no check-in/ganho de XP + varredura de reconciliacao
+    ACHIEVEMENT_EVENTS_ENABLED = os.environ.get('ACHIEVEMENT_EVENTS_ENABLED', 'true').lower() == 'true'
+    ACHIEVEMENT_SWEEP_INTERVAL_MINUTES = int(os.environ.get('ACHIEVEMENT_SWEEP_INTERVAL_MINUTES', 60))
+
+    # Snapshots diarios dos KPIs do dashboard estrategico
+    METRIC_SNAPSHOT_INTERVAL_MINUTES = int(os.environ.get('METRIC_SNAPSHOT_INTERVAL_MINUTES', 60))
+    METRIC_SNAPSHOT_SETTLE_DAYS = int(os.environ.get('METRIC_SNAPSHOT_SETTLE_DAYS', 2))  # dias recalculados
+    METRIC_SNAPSHOT_BACKFILL_DAYS = int(os.environ.get('METRIC_SNAPSHOT_BACKFILL_DAYS', 400))
+
+    # Split: bookings por lote no processamento de comissoes
+    SPLIT_COMMISSION_CHUNK_SIZE = int(os.environ.get('SPLIT_COMMISSION_CHUNK_SIZE', 500))
+
+    # Split: extratos mensais em lote (vazio = job mensal desligado)
+    SPLIT_STATEMENTS_DIR = os.environ.get('SPLIT_STATEMENTS_DIR', '')
+    SPLIT_STATEMENTS_WORKERS = int(os.environ.get('SPLIT_STATEMENTS_WORKERS', 2))  # 0 = sem pool
+    SPLIT_STATEMENTS_FORMATS = os.environ.get('SPLIT_STATEMENTS_FORMATS', 'pdf,csv')
+
     # Base URL for callbacks (usado em webhooks e redirecionamentos)
     BASE_URL = os.environ.get('BASE_URL', 'http://localhost:5000')
 
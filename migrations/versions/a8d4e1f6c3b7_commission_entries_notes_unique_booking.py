@@ -0,0 +1,26 @@
+"""Add notes and unique booking index to commission_entries
+
+Revision ID: a8d4e1f6c3b7
+Revises: f7c2a4e8b1d3
+Create Date: 2026-10-18
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a8d4e1f6c3b7'
+down_revision = 'f7c2a4e8b1d3'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('commission_entries', sa.Column('notes', sa.Text(), nullable=True))
+    op.create_index('uq_commission_entries_booking_id', 'commission_entries', ['booking_id'], unique=True)
+
+
+def downgrade():
+    op.drop_index('uq_commission_entries_booking_id', table_name='commission_entries')
+    op.drop_column('commission_entries', 'notes')
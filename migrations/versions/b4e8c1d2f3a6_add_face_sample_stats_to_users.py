@@ -0,0 +1,31 @@
+"""Add multi-sample face enrollment stats to users
+
+Revision ID: b4e8c1d2f3a6
+Revises: a9f1e2b3c4d5
+Create Date: 2026-10-18
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b4e8c1d2f3a6'
+down_revision = 'a9f1e2b3c4d5'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('users', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('face_sample_count', sa.Integer(), nullable=True))
+        batch_op.add_column(sa.Column('face_encoding_spread', sa.Float(), nullable=True))
+
+    # Cadastros existentes foram feitos com um unico frame
+    op.execute("UPDATE users SET face_sample_count = 1 WHERE face_encoding IS NOT NULL")
+
+
+def downgrade():
+    with op.batch_alter_table('users', schema=None) as batch_op:
+        batch_op.drop_column('face_encoding_spread')
+        batch_op.drop_column('face_sample_count')
@@ -0,0 +1,37 @@
+"""Add checkin_count to user_daily_activity
+
+Revision ID: b5c9e2f7a4d1
+Revises: a8d4e1f6c3b7
+Create Date: 2026-10-18
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b5c9e2f7a4d1'
+down_revision = 'a8d4e1f6c3b7'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('user_daily_activity',
+                  sa.Column('checkin_count', sa.Integer(), nullable=False, server_default='0'))
+
+    # Aulas concluidas com check-in registrado, por usuario/dia
+    op.execute("""
+        UPDATE user_daily_activity
+        SET checkin_count = (
+            SELECT COUNT(*) FROM bookings
+            WHERE bookings.user_id = user_daily_activity.user_id
+              AND bookings.date = user_daily_activity.activity_date
+              AND bookings.status = 'COMPLETED'
+              AND bookings.checkin_at IS NOT NULL
+        )
+    """)
+
+
+def downgrade():
+    op.drop_column('user_daily_activity', 'checkin_count')
@@ -0,0 +1,24 @@
+"""Add claim_token to outbound_messages
+
+Revision ID: c4f1a7d9e2b6
+Revises: b5c9e2f7a4d1
+Create Date: 2026-10-18
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c4f1a7d9e2b6'
+down_revision = 'b5c9e2f7a4d1'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('outbound_messages', sa.Column('claim_token', sa.String(length=32), nullable=True))
+
+
+def downgrade():
+    op.drop_column('outbound_messages', 'claim_token')
@@ -0,0 +1,28 @@
+"""Add health score dirty flag to users
+
+Revision ID: c7d2e9f4a1b8
+Revises: b4e8c1d2f3a6
+Create Date: 2026-10-18
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c7d2e9f4a1b8'
+down_revision = 'b4e8c1d2f3a6'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('users', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('health_score_dirty_at', sa.DateTime(), nullable=True))
+        batch_op.create_index('ix_users_health_score_dirty_at', ['health_score_dirty_at'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('users', schema=None) as batch_op:
+        batch_op.drop_index('ix_users_health_score_dirty_at')
+        batch_op.drop_column('health_score_dirty_at')
@@ -0,0 +1,54 @@
+"""Add user_daily_activity rollup table
+
+Revision ID: d3f6a8b2c9e1
+Revises: c7d2e9f4a1b8
+Create Date: 2026-10-18
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd3f6a8b2c9e1'
+down_revision = 'c7d2e9f4a1b8'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('user_daily_activity',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('user_id', sa.Integer(), nullable=False),
+        sa.Column('activity_date', sa.Date(), nullable=False),
+        sa.Column('completed_count', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('no_show_count', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('cancelled_count', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('last_checkin_at', sa.DateTime(), nullable=True),
+        sa.Column('updated_at', sa.DateTime(), nullable=True),
+        sa.ForeignKeyConstraint(['user_id'], ['users.id'], ),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('user_id', 'activity_date', name='uq_user_daily_activity_user_date')
+    )
+    op.create_index('ix_user_daily_activity_date', 'user_daily_activity', ['activity_date'], unique=False)
+
+    # Popular a partir do historico de bookings (equivalente a `flask activity backfill`)
+    op.execute("""
+        INSERT INTO user_daily_activity
+            (user_id, activity_date, completed_count, no_show_count, cancelled_count,
+             last_checkin_at, updated_at)
+        SELECT user_id, date,
+               SUM(CASE WHEN status = 'COMPLETED' THEN 1 ELSE 0 END),
+               SUM(CASE WHEN status = 'NO_SHOW' THEN 1 ELSE 0 END),
+               SUM(CASE WHEN status = 'CANCELLED' THEN 1 ELSE 0 END),
+               MAX(CASE WHEN status = 'COMPLETED' THEN checkin_at END),
+               CURRENT_TIMESTAMP
+        FROM bookings
+        WHERE status IN ('COMPLETED', 'NO_SHOW', 'CANCELLED')
+        GROUP BY user_id, date
+    """)
+
+
+def downgrade():
+    op.drop_index('ix_user_daily_activity_date', table_name='user_daily_activity')
+    op.drop_table('user_daily_activity')
@@ -0,0 +1,35 @@
+"""Unique (user_id, achievement_id) on user_achievements
+
+Revision ID: d8a3f5c1b7e4
+Revises: c4f1a7d9e2b6
+Create Date: 2026-10-18
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd8a3f5c1b7e4'
+down_revision = 'c4f1a7d9e2b6'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Desbloqueios duplicados (avaliacoes concorrentes): fica o mais antigo
+    op.execute("""
+        DELETE FROM user_achievements
+        WHERE id NOT IN (
+            SELECT keep_id FROM (
+                SELECT MIN(id) AS keep_id FROM user_achievements
+                GROUP BY user_id, achievement_id
+            ) AS first_unlocks
+        )
+    """)
+    op.create_index('uq_user_achievements_user_achievement', 'user_achievements',
+                    ['user_id', 'achievement_id'], unique=True)
+
+
+def downgrade():
+    op.drop_index('uq_user_achievements_user_achievement', table_name='user_achievements')
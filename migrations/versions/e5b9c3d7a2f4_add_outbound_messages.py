@@ -0,0 +1,46 @@
+"""Add outbound_messages queue table
+
+Revision ID: e5b9c3d7a2f4
+Revises: d3f6a8b2c9e1
+Create Date: 2026-10-18
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e5b9c3d7a2f4'
+down_revision = 'd3f6a8b2c9e1'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('outbound_messages',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('kind', sa.String(length=50), nullable=False),
+        sa.Column('payload', sa.JSON(), nullable=False),
+        sa.Column('user_id', sa.Integer(), nullable=True),
+        sa.Column('phone', sa.String(length=20), nullable=True),
+        sa.Column('idempotency_key', sa.String(length=150), nullable=True),
+        sa.Column('status', sa.Enum('PENDING', 'SENDING', 'SENT', 'FAILED', name='outboundstatus'), nullable=False),
+        sa.Column('attempts', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('max_attempts', sa.Integer(), nullable=False, server_default='5'),
+        sa.Column('next_attempt_at', sa.DateTime(), nullable=False),
+        sa.Column('locked_at', sa.DateTime(), nullable=True),
+        sa.Column('message_id', sa.String(length=100), nullable=True),
+        sa.Column('last_error', sa.Text(), nullable=True),
+        sa.Column('sent_at', sa.DateTime(), nullable=True),
+        sa.Column('created_at', sa.DateTime(), nullable=True),
+        sa.ForeignKeyConstraint(['user_id'], ['users.id'], ),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('idempotency_key')
+    )
+    op.create_index('ix_outbound_messages_status_next', 'outbound_messages',
+                    ['status', 'next_attempt_at'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_outbound_messages_status_next', table_name='outbound_messages')
+    op.drop_table('outbound_messages')
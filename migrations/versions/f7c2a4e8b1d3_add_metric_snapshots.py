@@ -0,0 +1,34 @@
+"""Add metric_snapshots table
+
+Revision ID: f7c2a4e8b1d3
+Revises: e5b9c3d7a2f4
+Create Date: 2026-10-18
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f7c2a4e8b1d3'
+down_revision = 'e5b9c3d7a2f4'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('metric_snapshots',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('metric', sa.String(length=50), nullable=False),
+        sa.Column('day', sa.Date(), nullable=False),
+        sa.Column('value', sa.Numeric(precision=14, scale=2), nullable=False, server_default='0'),
+        sa.Column('computed_at', sa.DateTime(), nullable=True),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('metric', 'day', name='uq_metric_snapshots_metric_day')
+    )
+    op.create_index('ix_metric_snapshots_day', 'metric_snapshots', ['day'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_metric_snapshots_day', table_name='metric_snapshots')
+    op.drop_table('metric_snapshots')
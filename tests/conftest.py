@@ -0,0 +1,22 @@
+# tests/conftest.py
+
+import os
+
+import pytest
+
+# Banco em memoria antes de importar a configuracao
+os.environ['DATABASE_URL'] = 'sqlite://'
+
+
+@pytest.fixture
+def app():
+    from app import create_app, db
+
+    app = create_app()
+    app.config.update(TESTING=True)
+
+    with app.app_context():
+        db.create_all()
+        yield app
+        db.session.remove()
+        db.drop_all()
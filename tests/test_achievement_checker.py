@@ -0,0 +1,24 @@
+# tests/test_achievement_checker.py
+
+from app import db
+from app.models import Achievement, CriteriaType, User, UserAchievement
+from app.models.achievement import CachedAchievement
+from app.services.achievement_checker import AchievementChecker
+
+
+def test_overlapping_unlocks_insert_and_reward_once(app):
+    user = User(name='Aluno', email='a@test', phone='1', password_hash='x', role='student', xp=20)
+    achievement = Achievement(name='Primeiros pontos', criteria_type=CriteriaType.XP_THRESHOLD,
+                              criteria_value=10, xp_reward=50)
+    db.session.add_all([user, achievement])
+    db.session.commit()
+
+    cached = CachedAchievement(achievement.id, achievement.criteria_type, 10, None, 50)
+    # Duas avaliacoes (check-in e varredura) chegaram ao mesmo desbloqueio
+    first = AchievementChecker._unlock({user.id: [cached]})
+    second = AchievementChecker._unlock({user.id: [cached]})
+
+    assert first == {user.id: [cached]}
+    assert second == {}
+    assert UserAchievement.query.filter_by(user_id=user.id).count() == 1
+    assert db.session.get(User, user.id).xp == 70
@@ -0,0 +1,43 @@
+# tests/test_availability_cache.py
+
+from datetime import date
+
+from app.services.availability_cache import AvailabilityCache, MemoryBackend
+
+KEY = (1, date(2026, 10, 19))
+
+
+def _cache():
+    cache = AvailabilityCache()
+    cache.backend = MemoryBackend()
+    cache.ttl = 60
+    return cache
+
+
+def test_fill_skips_keys_written_during_the_query():
+    cache = _cache()
+    confirmed = {'count': 3}
+
+    def racing_loader(start, end):
+        snapshot = {KEY: confirmed['count']}
+        # Reserva confirmada entre a consulta e a gravacao no cache:
+        # o write-through nao encontra a chave, mas muda a versao
+        confirmed['count'] += 1
+        cache.apply({KEY: 1})
+        return snapshot
+
+    assert cache.get_counts([KEY], racing_loader) == {KEY: 3}
+    assert cache.get_stats()['stale_fills'] == 1
+
+    # A contagem antiga nao ficou no cache: a proxima leitura recarrega
+    assert cache.get_counts([KEY], lambda start, end: {KEY: confirmed['count']}) == {KEY: 4}
+    assert cache.get_counts([KEY], lambda start, end: {}) == {KEY: 4}
+
+
+def test_write_through_after_fill():
+    cache = _cache()
+    assert cache.get_counts([KEY], lambda start, end: {KEY: 2}) == {KEY: 2}
+
+    cache.apply({KEY: 1})
+    assert cache.get_counts([KEY], lambda start, end: {}) == {KEY: 3}
+    assert cache.get_stats()['stale_fills'] == 0
@@ -0,0 +1,30 @@
+# tests/test_face_api.py
+
+import pytest
+
+from app import db
+from app.models.user import User
+
+
+@pytest.fixture
+def client(app):
+    user = User(name='Aluno', email='a@test', phone='1', password_hash='x', role='student')
+    db.session.add(user)
+    db.session.commit()
+
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session['_user_id'] = str(user.id)
+        session['_fresh'] = True
+    return client
+
+
+@pytest.mark.parametrize('payload', [
+    {'images': [123]},
+    {'images': ['abc', {'data': 'abc'}]},
+    {'image': 42},
+])
+def test_enroll_rejects_non_string_frames(client, payload):
+    response = client.post('/api/face/enroll', json=payload)
+    assert response.status_code == 400
+    assert response.get_json()['success'] is False
@@ -0,0 +1,33 @@
+# tests/test_face_enrollment.py
+
+import numpy as np
+import pytest
+
+from app.services.face_enrollment import summarize_samples, tune_threshold
+
+
+def _samples(spread, count):
+    """Amostras simetricas em volta da origem, todas a `spread` do centroide."""
+    axes = np.eye(128)[:count // 2]
+    return np.vstack([axes * spread, -axes * spread])
+
+
+@pytest.mark.parametrize('spread, count', [(0.1, 4), (0.25, 6), (0.4, 10)])
+def test_summary_of_known_spread(spread, count):
+    summary = summarize_samples(_samples(spread, count))
+    assert summary['sample_count'] == count
+    assert summary['rejected'] == 0
+    assert summary['spread'] == pytest.approx(spread)
+    assert np.allclose(summary['centroid'], 0.0)
+
+
+@pytest.mark.parametrize('spread, count, expected', [
+    (0.10, 5, 0.45),      # consistente: piso (mais rigoroso que 0.6)
+    (0.30, 5, 0.551),     # 0.30 x sqrt(6/4) x 1.5
+    (0.35, 5, 0.643),     # varia muito: acima do 0.6 antigo
+    (0.50, 5, 0.65),      # teto documentado (FACE_THRESHOLD_MAX)
+    (0.30, 2, 0.6),       # poucas amostras: default
+    (None, 1, 0.6),
+])
+def test_tune_threshold_from_known_spreads(spread, count, expected):
+    assert tune_threshold(spread, count) == pytest.approx(expected, abs=1e-3)
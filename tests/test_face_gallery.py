@@ -0,0 +1,137 @@
+# tests/test_face_gallery.py
+
+import numpy as np
+import pytest
+
+from app import db
+from app.models.user import User
+from app.services.face_gallery import FaceGalleryIndex
+from app.services.face_service import FaceRecognitionService
+
+
+def _raw_encoding(seed):
+    """Encoding bruto com norma bem diferente de 1 (como sai do dlib)."""
+    rng = np.random.default_rng(seed)
+    return rng.normal(0, 0.25, 128)
+
+
+def _add_user(user_id, encoding, version):
+    db.session.add(User(
+        id=user_id, name=f'User {user_id}', email=f'u{user_id}@test',
+        phone=str(user_id), password_hash='x', role='student',
+        face_encoding=FaceRecognitionService._encoding_to_bytes(encoding, version),
+        face_encoding_version=version
+    ))
+
+
+@pytest.fixture
+def mixed_users(app):
+    """Um usuario por formato: v1 (float64), v2 (float32) e v2n (normalizado)."""
+    encodings = {1: _raw_encoding(1), 2: _raw_encoding(2), 3: _raw_encoding(3)}
+    _add_user(1, encodings[1], 'v1')
+    _add_user(2, encodings[2], 'v2')
+    _add_user(3, encodings[3], 'v2n')
+    db.session.commit()
+    return encodings
+
+
+def test_mixed_versions_match_with_flag_on(app, mixed_users):
+    app.config['FACE_ENCODING_NORMALIZE'] = True
+    gallery = FaceGalleryIndex(max_age_seconds=0)
+
+    assert gallery.rebuild() == 3
+    assert gallery.normalize is True
+
+    for user_id, encoding in mixed_users.items():
+        match = gallery.match(encoding)
+        assert match['user_id'] == user_id
+        assert match['matched']
+        assert match['distance'] < 1e-3
+
+    batch = gallery.match_batch(np.vstack(list(mixed_users.values())))
+    assert [m['user_id'] for m in batch] == list(mixed_users)
+    assert all(m['matched'] for m in batch)
+
+
+def test_flag_off_skips_v2n_rows(app, mixed_users):
+    app.config['FACE_ENCODING_NORMALIZE'] = False
+    gallery = FaceGalleryIndex(max_age_seconds=0)
+
+    assert gallery.rebuild() == 2
+    assert gallery.normalize is False
+    assert gallery.get_stats()['skipped_rows'] == 1
+
+    for user_id in (1, 2):
+        match = gallery.match(mixed_users[user_id])
+        assert match['user_id'] == user_id
+        assert match['matched']
+    assert gallery.match(mixed_users[3])['user_id'] != 3
+
+
+def test_v2n_user_does_not_change_other_results(app):
+    app.config['FACE_ENCODING_NORMALIZE'] = False
+    encodings = {1: _raw_encoding(1), 2: _raw_encoding(2)}
+    _add_user(1, encodings[1], 'v2')
+    _add_user(2, encodings[2], 'v1')
+    db.session.get(User, 1).face_confidence_threshold = 0.5
+    db.session.commit()
+
+    # Consultas na escala bruta: uma dentro do threshold do usuario 1, outra fora
+    rng = np.random.default_rng(7)
+    noise = rng.normal(0, 1, 128)
+    noise /= np.linalg.norm(noise)
+    queries = np.vstack([encodings[1] + 0.45 * noise, encodings[1] + 0.55 * noise])
+
+    gallery = FaceGalleryIndex(max_age_seconds=0)
+    gallery.rebuild()
+    before = gallery.match_batch(queries)
+    assert [m['matched'] for m in before] == [True, False]
+
+    _add_user(3, _raw_encoding(3), 'v2n')
+    db.session.commit()
+    gallery.rebuild()
+    assert gallery.match_batch(queries) == before
+
+
+def test_upsert_v2n_with_flag_off_leaves_the_gallery(app):
+    app.config['FACE_ENCODING_NORMALIZE'] = False
+    encodings = {1: _raw_encoding(1), 3: _raw_encoding(3)}
+    _add_user(1, encodings[1], 'v2')
+    _add_user(3, encodings[3], 'v2')
+    db.session.commit()
+
+    gallery = FaceGalleryIndex(max_age_seconds=0)
+    gallery.rebuild()
+    assert gallery.match(encodings[3])['user_id'] == 3
+
+    # Recadastro gravado como v2n: a linha antiga sai, o modo nao muda
+    gallery.upsert(3, encodings[3], version='v2n')
+    assert gallery.normalize is False
+    assert gallery.size == 1
+    assert gallery.match(encodings[1])['user_id'] == 1
+    assert gallery.match(encodings[3])['user_id'] != 3
+
+    gallery.upsert(3, encodings[3], version='v2')
+    assert gallery.match(encodings[3])['user_id'] == 3
+
+
+def test_match_reloads_gallery_after_stale_candidates(app):
+    from app.services.face_gallery import face_gallery
+
+    app.config['FACE_ENCODING_NORMALIZE'] = False
+    base = _raw_encoding(10)
+    rng = np.random.default_rng(11)
+    for user_id in range(1, 5):
+        _add_user(user_id, base + rng.normal(0, 0.001, 128), 'v2')
+    _add_user(5, base + rng.normal(0, 0.01, 128), 'v2')
+    db.session.commit()
+    face_gallery.rebuild()
+
+    # Desativados direto no banco, sem avisar a galeria
+    User.query.filter(User.id < 5).update({User.is_active: False})
+    db.session.commit()
+
+    user, distance, threshold = FaceRecognitionService()._match_encoding(base)
+    assert user.id == 5
+    assert distance <= threshold
+    assert face_gallery.size == 1
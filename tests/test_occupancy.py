@@ -0,0 +1,65 @@
+# tests/test_occupancy.py
+"""Convencao de dia da semana (0=Domingo ... 6=Sabado) e taxa de ocupacao."""
+
+from datetime import date, time, timedelta
+from decimal import Decimal
+
+import numpy as np
+import pytest
+
+from app import db
+from app.models import Booking, BookingStatus, ClassSchedule, Modality, User
+from app.services.occupancy import occupancy_engine, weekday_from_ordinal
+from app.services.slot_availability import weekday_db
+
+# (data, ClassSchedule.weekday esperado, nome)
+KNOWN_DATES = [
+    (date(2024, 1, 7), 0, 'Domingo'),
+    (date(2024, 1, 8), 1, 'Segunda'),
+    (date(2024, 1, 9), 2, 'Terca'),
+    (date(2024, 1, 10), 3, 'Quarta'),
+    (date(2024, 1, 11), 4, 'Quinta'),
+    (date(2024, 1, 12), 5, 'Sexta'),
+    (date(2024, 1, 13), 6, 'Sabado'),
+    (date(2000, 2, 29), 2, 'Terca'),
+    (date(1999, 12, 31), 5, 'Sexta'),
+    (date(2026, 10, 18), 0, 'Domingo'),
+]
+
+
+@pytest.mark.parametrize('day, weekday, name', KNOWN_DATES)
+def test_weekday_conventions_agree(day, weekday, name):
+    assert int(weekday_from_ordinal(day.toordinal())) == weekday
+    assert weekday_db(day) == weekday
+    assert ClassSchedule(weekday=weekday).weekday_name == name
+
+
+def test_weekday_from_ordinal_vectorized():
+    days = [day for day, _, _ in KNOWN_DATES]
+    ordinals = np.array([d.toordinal() for d in days], dtype=np.int64)
+    assert weekday_from_ordinal(ordinals).tolist() == [w for _, w, _ in KNOWN_DATES]
+
+
+def test_rate_counts_only_schedule_weekday(app):
+    instructor = User(name='Instrutor', email='i@test', phone='1', password_hash='x', role='instructor')
+    student = User(name='Aluno', email='a@test', phone='2', password_hash='x', role='student')
+    modality = Modality(name='Funcional')
+    db.session.add_all([instructor, student, modality])
+    db.session.commit()
+
+    # Segunda-feira (weekday=1), capacidade 4
+    schedule = ClassSchedule(modality_id=modality.id, instructor_id=instructor.id, weekday=1,
+                             start_time=time(8), end_time=time(9), capacity=4)
+    db.session.add(schedule)
+    db.session.commit()
+
+    today = date(2024, 1, 14)                      # domingo; janela de 7 dias tem 1 segunda
+    monday = date(2024, 1, 8)
+    for day, status in [(monday, BookingStatus.COMPLETED), (monday, BookingStatus.NO_SHOW),
+                        (monday, BookingStatus.CANCELLED), (monday + timedelta(days=1), BookingStatus.CONFIRMED)]:
+        db.session.add(Booking(user_id=student.id, schedule_id=schedule.id, date=day, status=status))
+    db.session.commit()
+
+    rate = occupancy_engine.rate(schedule, days=7, today=today)
+    assert rate == Decimal('50.00')
+    assert rate == occupancy_engine._legacy_rate(schedule, 7, today)
@@ -0,0 +1,147 @@
+# tests/test_outbound_queue.py
+
+from datetime import datetime, timedelta
+
+import pytest
+import requests
+from urllib3.exceptions import MaxRetryError, NewConnectionError
+
+from app import db
+from app.models.outbound_message import OutboundMessage, OutboundStatus
+from app.services.megaapi import is_retryable_send_error, megaapi
+from app.services.outbound_queue import outbound_queue
+
+
+def _http_error(status):
+    response = requests.Response()
+    response.status_code = status
+    return requests.exceptions.HTTPError(response=response)
+
+
+def _wrapped(error):
+    """Como os send_*: relancam o erro HTTP como Exception generica."""
+    try:
+        raise error
+    except Exception as e:
+        try:
+            raise Exception(f"Erro ao enviar mensagem: {e}")
+        except Exception as wrapped:
+            return wrapped
+
+
+@pytest.mark.parametrize('error, retryable', [
+    (_http_error(429), True),
+    (requests.exceptions.ConnectTimeout(), True),
+    (requests.exceptions.ConnectionError(MaxRetryError(None, '/', NewConnectionError(None, 'recusada'))), True),
+    (_http_error(500), False),
+    (_http_error(400), False),
+    (requests.exceptions.ReadTimeout(), False),
+    (requests.exceptions.ConnectionError('conexao encerrada'), False),
+    (Exception("Template 'x' nao encontrado ou inativo"), False),
+])
+def test_retryable_send_error(error, retryable):
+    assert is_retryable_send_error(error) is retryable
+    assert is_retryable_send_error(_wrapped(error)) is retryable
+
+
+def _message(kind):
+    message = OutboundMessage(kind=kind, payload={}, status=OutboundStatus.PENDING, attempts=0,
+                              max_attempts=5, next_attempt_at=datetime.utcnow() - timedelta(seconds=1))
+    db.session.add(message)
+    db.session.commit()
+    return message.id
+
+
+def test_process_reschedules_only_retryable_failures(app, monkeypatch):
+    outcomes = {
+        'ok': {'success': True, 'message_id': 'abc', 'response': {}},
+        'throttled': {'success': False, 'retryable': True, 'error': '429'},
+        'timeout': {'success': False, 'retryable': False, 'error': 'read timeout'},
+        'missing_template': {'success': False, 'retryable': False, 'error': 'template inexistente'},
+    }
+    ids = {kind: _message(kind) for kind in outcomes}
+    monkeypatch.setattr(megaapi, 'deliver', lambda kind, payload: outcomes[kind])
+
+    summary = outbound_queue.process()
+    assert (summary['sent'], summary['retried'], summary['failed']) == (1, 1, 2)
+
+    status = {kind: db.session.get(OutboundMessage, i).status for kind, i in ids.items()}
+    assert status == {
+        'ok': OutboundStatus.SENT,
+        'throttled': OutboundStatus.PENDING,
+        'timeout': OutboundStatus.FAILED,
+        'missing_template': OutboundStatus.FAILED,
+    }
+    assert db.session.get(OutboundMessage, ids['ok']).message_id == 'abc'
+
+
+def test_claim_skips_rows_taken_by_another_worker(app, monkeypatch):
+    ids = [_message('send_custom_message') for _ in range(3)]
+
+    # Outro worker atualiza a primeira linha entre a selecao e o UPDATE
+    real_query = db.session.query
+
+    def racing_query(*entities):
+        query = real_query(*entities)
+        if len(entities) == 1 and entities[0] is OutboundMessage.id:
+            OutboundMessage.query.filter_by(id=ids[0]).update(
+                {OutboundMessage.status: OutboundStatus.SENDING,
+                 OutboundMessage.locked_at: datetime.utcnow(),
+                 OutboundMessage.claim_token: 'outro-worker'},
+                synchronize_session=False)
+        return query
+
+    monkeypatch.setattr(db.session, 'query', racing_query)
+    claimed = outbound_queue.claim_batch(10)
+
+    assert [m.id for m in claimed] == ids[1:]
+    assert all(m.attempts == 1 for m in claimed)
+    assert db.session.get(OutboundMessage, ids[0]).claim_token == 'outro-worker'
+    assert outbound_queue.claim_batch(10) == []
+
+
+def test_enqueue_joins_the_caller_transaction(app):
+    def enqueue(key):
+        outbound_queue.enqueue('send_custom_message', {'phone': '5511999999999'}, idempotency_key=key)
+
+    with app.app_context():
+        enqueue('rollback')
+        db.session.rollback()
+
+    with pytest.raises(RuntimeError):
+        with app.app_context():
+            enqueue('erro')
+            raise RuntimeError('falha depois de enfileirar')
+
+    with app.app_context():
+        enqueue('sem-commit')  # confirmada no fim do app context
+
+    with app.app_context():
+        enqueue('commit')
+        db.session.commit()
+
+    keys = sorted(m.idempotency_key for m in OutboundMessage.query)
+    assert keys == ['commit', 'sem-commit']
+
+
+def test_dispatch_enqueues_on_the_calling_thread(app, monkeypatch):
+    import threading
+    from app.services.whatsapp_dispatcher import dispatcher
+
+    app.config['WHATSAPP_QUEUE_ENABLED'] = True
+    threads = set()
+    real_enqueue = outbound_queue.enqueue
+
+    def enqueue(*args, **kwargs):
+        threads.add(threading.get_ident())
+        return real_enqueue(*args, **kwargs)
+
+    monkeypatch.setattr(outbound_queue, 'enqueue', enqueue)
+    messages = [{'phone': f'55119999900{i:02d}', 'message': 'oi', 'user_id': None} for i in range(20)]
+    report = dispatcher.dispatch(messages, lambda m: megaapi.send_custom_message(**m))
+
+    assert report['metrics']['sent'] == 20
+    assert report['metrics']['workers'] == 1
+    assert threads == {threading.get_ident()}
+    db.session.rollback()  # mesma transacao do chamador
+    assert OutboundMessage.query.count() == 0
@@ -0,0 +1,32 @@
+# tests/test_statement_export.py
+
+import os
+
+import pytest
+
+from app.services.statement_export import _write_atomic, claim_period
+
+
+def test_write_atomic_keeps_previous_file_on_failure(tmp_path):
+    path = str(tmp_path / 'extrato.csv')
+    _write_atomic(path, lambda tmp: open(tmp, 'w').write('v1'))
+
+    def broken(tmp):
+        with open(tmp, 'w') as f:
+            f.write('parcial')
+        raise RuntimeError('falha no meio')
+
+    with pytest.raises(RuntimeError):
+        _write_atomic(path, broken)
+
+    assert open(path).read() == 'v1'
+    assert os.listdir(tmp_path) == ['extrato.csv']
+
+
+def test_claim_period_runs_once(tmp_path):
+    output_dir = str(tmp_path / 'extratos')
+    marker = claim_period(output_dir, 3, 2026)
+
+    assert marker and os.path.exists(marker)
+    assert claim_period(output_dir, 3, 2026) is None
+    assert claim_period(output_dir, 4, 2026) is not None
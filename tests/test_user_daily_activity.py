@@ -0,0 +1,91 @@
+# tests/test_user_daily_activity.py
+
+from datetime import date, datetime, time, timedelta
+
+import pytest
+from sqlalchemy import case, func
+
+from app import db
+from app.models import Booking, BookingStatus, ClassSchedule, Modality, User, UserDailyActivity
+
+
+@pytest.fixture
+def schedule(app):
+    instructor = User(name='Instrutor', email='i@test', phone='1', password_hash='x', role='instructor')
+    modality = Modality(name='Funcional')
+    db.session.add_all([instructor, modality])
+    db.session.commit()
+    schedule = ClassSchedule(modality_id=modality.id, instructor_id=instructor.id, weekday=1,
+                             start_time=time(8), end_time=time(9))
+    db.session.add(schedule)
+    db.session.commit()
+    return schedule
+
+
+def _student(n):
+    user = User(name=f'Aluno {n}', email=f'a{n}@test', phone=str(n), password_hash='x', role='student')
+    db.session.add(user)
+    db.session.commit()
+    return user
+
+
+def _legacy_stats(since):
+    """Consulta anterior ao rollup (Booking.checkin_at >= since)."""
+    rows = db.session.query(
+        Booking.user_id,
+        func.sum(case((Booking.checkin_at >= since, 1), else_=0)),
+        func.max(Booking.checkin_at)
+    ).filter(
+        Booking.status == BookingStatus.COMPLETED,
+        Booking.checkin_at.isnot(None)
+    ).group_by(Booking.user_id)
+    return {uid: {'completed_since': int(count), 'last_checkin_at': last} for uid, count, last in rows}
+
+
+def test_checkin_stats_matches_checkin_at_window(app, schedule):
+    user = _student(1)
+    today = date.today()
+    now = datetime.utcnow()
+
+    def book(days_ago, status, checkin_at=None):
+        db.session.add(Booking(user_id=user.id, schedule_id=schedule.id,
+                               date=today - timedelta(days=days_ago), status=status,
+                               checkin_at=checkin_at))
+
+    book(2, BookingStatus.COMPLETED, now - timedelta(days=2))
+    book(10, BookingStatus.COMPLETED, now - timedelta(days=10))
+    book(10, BookingStatus.COMPLETED)                   # concluida sem check-in (instrutor)
+    book(40, BookingStatus.COMPLETED, now - timedelta(days=40))
+    book(5, BookingStatus.NO_SHOW)
+    db.session.commit()
+
+    since = now - timedelta(days=30)
+    assert UserDailyActivity.checkin_stats(since) == _legacy_stats(since)
+    assert UserDailyActivity.checkin_stats(since)[user.id]['completed_since'] == 2
+
+
+def test_checkin_after_completion_and_rebuild(app, schedule):
+    user = _student(2)
+    booking = Booking(user_id=user.id, schedule_id=schedule.id, date=date.today(),
+                      status=BookingStatus.CONFIRMED)
+    db.session.add(booking)
+    db.session.commit()
+
+    # Concluida pelo instrutor e so depois com check-in registrado
+    booking.status = BookingStatus.COMPLETED
+    db.session.commit()
+    assert UserDailyActivity.checkin_stats(datetime.utcnow() - timedelta(days=30)) == {}
+
+    booking.checkin_at = datetime.utcnow()
+    db.session.commit()
+
+    def snapshot():
+        db.session.expire_all()
+        return [(r.completed_count, r.checkin_count, r.last_checkin_at) for r in UserDailyActivity.query]
+
+    live = snapshot()
+    assert live[0][:2] == (1, 1)
+
+    UserDailyActivity.rebuild()
+    db.session.commit()
+    assert snapshot() == live